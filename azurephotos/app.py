@@ -2,43 +2,168 @@ from flask import Flask
 from azure.identity import DefaultAzureCredential
 from azure.storage.blob import BlobServiceClient
 from azure.data.tables import TableServiceClient
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import os
+import tempfile
 import src.view.view as view
 import src.api.api as api
+import src.cli.cli as cli
+from src.api.health import dependency_checks, PROBE_INTERVAL, PROBE_TIMEOUT
+from src.lib.album_index import AlbumIndex
+from src.lib.disk_cache import DiskCache
+from src.lib.health_prober import HealthProber
+from src.lib.instrumented import instrument, record_response
+from src.lib.storage.azure_storage import AzureBlobStorage, pooled_transport
+from src.lib.storage.base import BlobStorage, EntityStorage, TieredBlobStorage, TieredEntityStorage
+from src.lib.storage.local import LocalBlobStorage, LocalEntityStorage
+from src.lib.versioning import VersionStamps, ALBUMS_SCOPE, flush_changed_scopes
+
+def create_app(
+    blob_service_client: BlobServiceClient | None = None,
+    table_service_client: TableServiceClient | None = None,
+    account_name: str = "wboylesbackups",
+    offline: bool = False,
+    local_storage_dir: str | None = None,
+) -> Flask:
+    """
+    Create the app.
+    Storage clients can be passed in, like the in-memory fakes the benchmarks use.
+    Otherwise, they are created for the storage account using Azure credentials.
+
+    :param blob_service_client: Client for the account's blob storage
+    :param table_service_client: Client for the account's table storage
+    :param account_name: Name of the storage account
+    :param offline: Keep every blob and table on local disk instead of in Azure, e.g. to develop or profile without an account
+    :param local_storage_dir: Where blobs and tables kept on local disk are. Defaults to ``storage`` in the instance folder.
+    """
 
-def create_app() -> Flask:
     app = Flask(__name__)
 
+    # Threads each gunicorn worker serves requests on. Set by startup.sh, which passes the same value to gunicorn,
+    # so the connection pool and the view executor always grow with the workers' threads.
+    request_threads = int(os.environ.get("THREADS_PER_WORKER", "32"))
+
     with app.app_context():
-        credential = DefaultAzureCredential(exclude_cli_credential=True)
-        account_name = "wboylesbackups"
+        # Hot data kept on local disk, while everything else stays in Azure. Only for a single instance,
+        # since other instances can't see it. Thumbnails can be rebuilt with `flask thumbnails backfill`.
+        local_containers: frozenset[str] = frozenset()  # e.g. {"thumbnails"}
+        local_tables: frozenset[str] = frozenset()  # e.g. {"Albums2"}
+
+        local_storage_dir = local_storage_dir or os.path.join(app.instance_path, "storage")
+        local_blobs_dir = os.path.join(local_storage_dir, "blobs")
+        local_tables_dir = os.path.join(local_storage_dir, "tables")
+
+        credential = None
+        local_blob_storage = None
+        blob_storage: BlobStorage
+        entity_storage: EntityStorage
+        if offline:
+            # Every storage call is recorded for /api/metrics
+            blob_storage = local_blob_storage = instrument(LocalBlobStorage(local_blobs_dir), "local_blob")
+            entity_storage = instrument(LocalEntityStorage(local_tables_dir), "local_table")
+        else:
+            if blob_service_client is None or table_service_client is None:
+                credential = DefaultAzureCredential(exclude_cli_credential=True)
+            # Each gunicorn worker serves many requests at once on threads. See startup.sh.
+            # Sized for every request thread plus the blocks an upload stages in parallel.
+            transport = pooled_transport(connections=request_threads * 2)
+
+            if blob_service_client is None:
+                blob_service_client = BlobServiceClient(
+                    f"https://{account_name}.blob.core.windows.net",
+                    credential=credential,
+                    transport=transport,
+                    raw_response_hook=record_response,
+                )
+            # Every storage call is recorded for /api/metrics
+            blob_storage = AzureBlobStorage(instrument(blob_service_client, "blob"))
 
-        blob_account_url = f"https://{account_name}.blob.core.windows.net"
-        blob_service_client = BlobServiceClient(blob_account_url, credential=credential)
-        photos_container_client = blob_service_client.get_container_client("photos")
-        videos_container_client = blob_service_client.get_container_client("videos")
-        thumbnails_container_client = blob_service_client.get_container_client("thumbnails")
+            if table_service_client is None:
+                table_service_client = TableServiceClient(
+                    f"https://{account_name}.table.core.windows.net",
+                    credential=credential,
+                    transport=transport,
+                    raw_response_hook=record_response,
+                )
+            entity_storage = instrument(table_service_client, "table")
 
-        table_account_url = f"https://{account_name}.table.core.windows.net"
-        albums_table_client = TableServiceClient(
-            table_account_url, credential=credential
-        ).get_table_client("Albums2")
+            if local_containers:
+                local_blob_storage = instrument(LocalBlobStorage(local_blobs_dir), "local_blob")
+                blob_storage = TieredBlobStorage(blob_storage, {name: local_blob_storage for name in local_containers})
+            if local_tables:
+                local_entity_storage = instrument(LocalEntityStorage(local_tables_dir), "local_table")
+                entity_storage = TieredEntityStorage(entity_storage, {name: local_entity_storage for name in local_tables})
+
+        photos_container_client = blob_storage.get_container_client("photos")
+        videos_container_client = blob_storage.get_container_client("videos")
+        thumbnails_container_client = blob_storage.get_container_client("thumbnails")
+
+        albums_table_client = entity_storage.get_table_client("Albums2")
+        meta_table_client = entity_storage.get_table_client("AlbumsMeta")
+        membership_table_client = entity_storage.get_table_client("AlbumMembership")
+        thumbnail_jobs_table_client = entity_storage.get_table_client("ThumbnailJobs")
+
+        # Version stamps are polled at most every few seconds, so other workers see changes quickly
+        version_stamps = VersionStamps(meta_table_client, poll_interval=timedelta(seconds=5))
+        # Other workers and instances may change albums, so only trust what we loaded for a few minutes
+        album_index = AlbumIndex(max_albums=256, max_age=timedelta(minutes=5))
+        version_stamps.subscribe(ALBUMS_SCOPE, album_index.adopt_version)
+
+        # Serve thumbnails from a disk cache shared by this instance's workers, instead of redirecting to blob storage
+        thumbnail_proxy_enabled = False
+        thumbnail_cache = DiskCache(
+            os.path.join(tempfile.gettempdir(), "azurephotos-thumbnails"),
+            max_bytes=1024 * 1024 * 1024,  # 1 GB
+        ) if thumbnail_proxy_enabled else None
 
         app.config.update(
             credential=credential,
             account_name=account_name,
-            blob_account_url=blob_account_url,
-            blob_service_client=blob_service_client,
+            blob_storage=blob_storage,
+            entity_storage=entity_storage,
+            local_blob_storage=local_blob_storage,
             photos_container_client=photos_container_client,
             videos_container_client=videos_container_client,
             thumbnails_container_client=thumbnails_container_client,
             albums_table_client=albums_table_client,
+            meta_table_client=meta_table_client,
+            membership_table_client=membership_table_client,
+            thumbnail_jobs_table_client=thumbnail_jobs_table_client,
+            version_stamps=version_stamps,
+            album_index=album_index,
+            thumbnail_cache=thumbnail_cache,
+            # Runs the slow listings of pages while their header renders. See view.py.
+            # One thread per request thread, so a listing never queues behind another request's.
+            view_executor=ThreadPoolExecutor(max_workers=request_threads, thread_name_prefix="view"),
+            REQUEST_THREADS=request_threads,
             SEND_FILE_MAX_AGE_DEFAULT=86400,
             MAX_CONTENT_LENGTH=200 * 1024 * 1024,  # 200 MB
+            # Generate thumbnails in `flask thumbnails worker` instead of during upload requests
+            THUMBNAIL_QUEUE_ENABLED=True,
+            # Files from one upload request processed at once
+            UPLOAD_CONCURRENCY=4,
+            # Most bytes of each uploaded file held in memory at once. Larger files are streamed to blob storage in blocks.
+            UPLOAD_BUFFER_SIZE=16 * 1024 * 1024,  # 16 MB
+            # Size of each chunk of a resumable upload. Must stay under MAX_CONTENT_LENGTH.
+            UPLOAD_CHUNK_SIZE=8 * 1024 * 1024,  # 8 MB
+            # Processes encoding thumbnails during upload requests. None uses every CPU.
+            THUMBNAIL_PROCESSES=None,
+            # Long edge of the previews shown instead of fullsize photos, in pixels
+            PREVIEW_WIDTHS=(768, 1600, 2560),
+            THUMBNAIL_PROXY_ENABLED=thumbnail_proxy_enabled,
         )
+        # Started by the first health request, so CLI commands don't probe
+        app.config["health_prober"] = HealthProber(dependency_checks(app.config), PROBE_INTERVAL, PROBE_TIMEOUT)
+
         for blueprint in view.blueprints:
             app.register_blueprint(blueprint)
         for blueprint in api.blueprints:
             app.register_blueprint(blueprint)
+        for command in cli.commands:
+            app.cli.add_command(command)
+
+        app.teardown_request(flush_changed_scopes)
 
     return app
 
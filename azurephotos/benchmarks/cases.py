@@ -0,0 +1,266 @@
+"""
+The benchmarks, by group.
+Each group is a function taking the :class:`Environment` and yielding a :class:`Result` per benchmark.
+"""
+
+import json
+import os
+import random
+from collections.abc import Iterator
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from typing import Callable
+
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from src.api.albums import NONE_ALBUM_NAME, is_valid_album_name, list_album
+from src.api.catalog import AlbumSummary
+from src.api.media_cache import _media_at, all_media
+from src.lib import thumbnails
+from src.lib.models.media import MediaRecord, MediaType, PHOTO_EXTENSIONS, VIDEO_EXTENSIONS
+from src.lib.sorting import merge
+
+from .harness import ROOT, Environment, Result
+
+Group = Callable[[Environment], Iterator[Result]]
+
+groups = dict[str, Group]()
+"""
+Every group of benchmarks, by name
+"""
+
+RECORD_COUNT = 100_000
+"""
+Records made and sorted, about the size of a large library
+"""
+
+ALBUM_SIZE = 10_000
+"""
+Entries in the album that is listed
+"""
+
+NON_ALBUM_SIZE = 50_000
+"""
+Entries in no album, which the home page lists
+"""
+
+ALBUM_NAME_COUNT = 10_000
+
+UPLOAD_BATCH_SIZE = 8
+"""
+Files in each upload request
+"""
+
+VIDEO_ICON_PATH = os.path.join(ROOT, "static", "video_icon.png")
+
+BENCHMARK_ALBUM = "Benchmark"
+
+
+def group(name: str) -> Callable[[Group], Group]:
+    """
+    Register a group of benchmarks.
+    """
+
+    def decorator(func: Group) -> Group:
+        groups[name] = func
+        return func
+
+    return decorator
+
+
+def _filenames(count: int, rng: random.Random) -> list[tuple[datetime, str]]:
+    """
+    ``(date taken, filename)`` pairs spread over ten years, mostly photos, like a real library.
+    """
+
+    photo_extensions = sorted(PHOTO_EXTENSIONS)
+    video_extensions = sorted(VIDEO_EXTENSIONS)
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    span = int(timedelta(days=3650).total_seconds())
+
+    pairs = list[tuple[datetime, str]]()
+    for i in range(count):
+        extensions = video_extensions if rng.random() < 0.1 else photo_extensions
+        pairs.append((start + timedelta(seconds=rng.randrange(span)), f"IMG_{i:07d}{rng.choice(extensions)}"))
+
+    return pairs
+
+
+def _create_album(env: Environment, album_name: str) -> None:
+    """
+    Seed an empty album, with its row in the albums table and its catalog entry.
+    """
+
+    created = datetime.now(timezone.utc)
+    env.seed("albums_table_client", [{"PartitionKey": album_name, "RowKey": "", "Created": created}])
+    env.seed("meta_table_client", [AlbumSummary(album_name, created=created).to_entity()])
+
+
+def _album_entities(album_name: str, pairs: list[tuple[datetime, str]]) -> list[dict[str, object]]:
+    return [{"PartitionKey": album_name, "RowKey": filename, "Created": created} for created, filename in pairs]
+
+
+@group("thumbnails")
+def photo_thumbnails(env: Environment) -> Iterator[Result]:
+    for corpus_file in env.corpus:
+        if corpus_file.media_type != MediaType.PHOTO:
+            continue
+
+        data = corpus_file.read()
+        yield env.measure(
+            f"thumbnail[{corpus_file.format}]",
+            lambda _: thumbnails.thumbnail(BytesIO(data)),
+            params={"bytes": len(data)},
+        )
+
+    if not any(corpus_file.format == "heic" for corpus_file in env.corpus):
+        env.skip("thumbnail[heic]", "pillow_heif is not installed")
+
+
+@group("video_thumbnails")
+def video_thumbnails(env: Environment) -> Iterator[Result]:
+    videos = [corpus_file for corpus_file in env.corpus if corpus_file.media_type == MediaType.VIDEO]
+    if not videos:
+        env.skip("video_thumbnail", "ffmpeg is not installed")
+
+    for video in videos:
+        yield env.measure(
+            f"video_thumbnail[{video.format}]",
+            lambda _: thumbnails.video_thumbnail(video.path, VIDEO_ICON_PATH),
+            repeat=5,
+            params={"bytes": os.path.getsize(video.path)},
+        )
+
+
+@group("records")
+def media_records(env: Environment) -> Iterator[Result]:
+    pairs = _filenames(RECORD_COUNT, random.Random(1))
+
+    yield env.measure(
+        "media_record.from_filename",
+        lambda _: [MediaRecord.from_filename(created, filename) for created, filename in pairs],
+        items=RECORD_COUNT,
+    )
+
+    records = [record for created, filename in pairs if (record := MediaRecord.from_filename(created, filename)) is not None]
+    yield env.measure(
+        "media_record.sort",
+        lambda _: sorted(records, reverse=True),
+        items=len(records),
+    )
+
+
+@group("merge")
+def sorted_merge(env: Environment) -> Iterator[Result]:
+    records = [
+        record for created, filename in _filenames(RECORD_COUNT, random.Random(2))
+        if (record := MediaRecord.from_filename(created, filename)) is not None
+    ]
+    # Newest first, like every listing
+    first = sorted(records[::2], reverse=True)
+    second = sorted(records[1::2], reverse=True)
+
+    yield env.measure(
+        "sorting.merge",
+        lambda _: merge(first, second, key=lambda record: record, reverse=True),
+        items=len(records),
+    )
+
+
+@group("album_names")
+def album_names(env: Environment) -> Iterator[Result]:
+    rng = random.Random(3)
+    # Mostly short names, plus some at the length limit and some that are invalid
+    names = [f"Trip {i}" for i in range(ALBUM_NAME_COUNT)]
+    for i in range(0, ALBUM_NAME_COUNT, 10):
+        names[i] = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz ÄÖÜ日本") for _ in range(1024))
+    for i in range(5, ALBUM_NAME_COUNT, 50):
+        names[i] = f"Trip/{i}"
+
+    yield env.measure(
+        "is_valid_album_name",
+        lambda _: [is_valid_album_name(name) for name in names],
+        items=len(names),
+    )
+
+
+@group("list_album")
+def list_album_rebuild(env: Environment) -> Iterator[Result]:
+    _create_album(env, BENCHMARK_ALBUM)
+    env.seed("albums_table_client", _album_entities(BENCHMARK_ALBUM, _filenames(ALBUM_SIZE, random.Random(4))))
+
+    album_index = env.app.config["album_index"]
+    with env.app.app_context():
+        # The index is dropped first so every iteration loads the album from the table
+        yield env.measure(
+            "list_album.rebuild",
+            lambda _: list_album(BENCHMARK_ALBUM),
+            setup=album_index.clear,
+            items=ALBUM_SIZE,
+        )
+
+        yield env.measure("list_album.cached", lambda _: list_album(BENCHMARK_ALBUM), items=ALBUM_SIZE)
+
+
+@group("all_media")
+def all_media_rebuild(env: Environment) -> Iterator[Result]:
+    env.seed("albums_table_client", _album_entities(NONE_ALBUM_NAME, _filenames(NON_ALBUM_SIZE, random.Random(5))))
+
+    with env.app.app_context():
+        yield env.measure("all_media.rebuild", lambda _: all_media(), setup=_media_at.clear, items=NON_ALBUM_SIZE)
+        yield env.measure("all_media.cached", lambda _: all_media(), items=NON_ALBUM_SIZE)
+
+
+@group("upload")
+def upload(env: Environment) -> Iterator[Result]:
+    files = [(corpus_file, corpus_file.read()) for corpus_file in env.corpus]
+    batch = [files[i % len(files)] for i in range(UPLOAD_BATCH_SIZE)]
+    batch_bytes = sum(len(data) for _, data in batch)
+
+    _create_album(env, BENCHMARK_ALBUM)
+    client = env.app.test_client()
+    uploads = 0
+
+    def request(album_name: str) -> Callable[[], Request]:
+        def setup() -> Request:
+            nonlocal uploads
+            # Only keep the blobs of one request around
+            for config_key in ("photos_container_client", "videos_container_client", "thumbnails_container_client"):
+                env.clear(config_key)
+
+            # Every file needs a new name, and the multipart body is built here so encoding it isn't timed
+            uploads += 1
+            data = {
+                "upload": [
+                    (BytesIO(body), f"upload{uploads}-{i}{os.path.splitext(corpus_file.name)[1]}")
+                    for i, (corpus_file, body) in enumerate(batch)
+                ],
+                "dateTaken": [datetime.now(timezone.utc).isoformat()] * len(batch),
+            }
+            path = "/upload" if album_name == NONE_ALBUM_NAME else f"/upload/{album_name}"
+            return EnvironBuilder(path=path, method="POST", data=data).get_request()
+
+        return setup
+
+    def send(upload_request: Request) -> None:
+        response = client.open(upload_request)
+        results = json.loads(response.get_data(as_text=True)) if response.status_code == 207 else None
+        if results is None or any(result["status_code"] != 201 for result in results):
+            raise RuntimeError(f"Upload failed with HTTP {response.status_code}: {response.get_data(as_text=True)}")
+
+    for queued in (True, False):
+        env.app.config["THUMBNAIL_QUEUE_ENABLED"] = queued
+        mode = "queued" if queued else "inline"
+        for album_name in (NONE_ALBUM_NAME, BENCHMARK_ALBUM):
+            target = "none" if album_name == NONE_ALBUM_NAME else "album"
+            yield env.measure(
+                f"upload[{mode},{target}]",
+                send,
+                setup=request(album_name),
+                repeat=5,
+                items=len(batch),
+                params={"bytes": batch_bytes, "formats": [corpus_file.format for corpus_file, _ in batch]},
+            )
+
+    env.app.config["THUMBNAIL_QUEUE_ENABLED"] = True
@@ -0,0 +1,66 @@
+"""
+Compare two benchmark results files, e.g. from before and after a change::
+
+    python -m benchmarks.compare benchmarks/results/1b4fe03.json benchmarks/results/6c2d9aa.json
+
+Exits with status 1 if any benchmark got slower by more than the threshold, so it can gate CI.
+"""
+
+import json
+from typing import Any
+
+import click
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def _load(path: str) -> dict[str, Any]:
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+@click.command()
+@click.argument("baseline", type=click.Path(exists=True, dir_okay=False))
+@click.argument("current", type=click.Path(exists=True, dir_okay=False))
+@click.option("--threshold", default=0.1, show_default=True, help="Slowdown of a median, as a fraction, that counts as a regression.")
+def compare(baseline: str, current: str, threshold: float) -> None:
+    """
+    Compare the medians of two benchmark runs.
+    """
+
+    before, after = _load(baseline), _load(current)
+    if before.get("config") != after.get("config"):
+        click.echo(f"Warning: runs used different settings, {before.get('config')} and {after.get('config')}", err=True)
+    if before.get("platform") != after.get("platform") or before.get("cpu_count") != after.get("cpu_count"):
+        click.echo("Warning: runs were on different machines", err=True)
+
+    regressions = list[str]()
+    for name in sorted(before["results"].keys() | after["results"].keys()):
+        old, new = before["results"].get(name), after["results"].get(name)
+        if old is None or new is None:
+            click.echo(f"{name:<40} {'only in ' + ('current' if old is None else 'baseline'):>30}")
+            continue
+
+        change = new["median"] / old["median"] - 1
+        marker = ""
+        if change > threshold:
+            marker = "  REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            marker = "  improved"
+        click.echo(
+            f"{name:<40} {format_seconds(old['median']):>9} -> {format_seconds(new['median']):>9} {change:>+8.1%}{marker}"
+        )
+
+    if regressions:
+        click.echo(f"{len(regressions)} benchmark(s) slower by more than {threshold:.0%}: {', '.join(regressions)}", err=True)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    compare()
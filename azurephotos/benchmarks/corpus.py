@@ -0,0 +1,151 @@
+"""
+Generated photos and videos to benchmark with.
+
+Photos are made with Pillow from a fixed seed, so every run benchmarks the same bytes. Videos are made with ffmpeg's test source.
+Everything is written once to a cache directory and reused by later runs.
+Formats that can't be made here, like HEIC without ``pillow_heif`` or videos without ffmpeg, are left out.
+"""
+
+import os
+import random
+import shutil
+import subprocess
+from functools import cache
+from dataclasses import dataclass
+from io import BytesIO
+from PIL import Image
+from typing import Callable
+
+from src.lib.models.media import MediaType
+from src.lib.thumbnails import SUPPORTED_FORMATS
+
+CORPUS_VERSION = "1"
+"""
+Bump whenever what is generated changes, so cached corpora are regenerated
+"""
+
+PHOTO_SIZE = (4032, 3024)
+"""
+12 MP, like a phone camera
+"""
+
+GIF_SIZE = (800, 600)
+GIF_FRAMES = 8
+
+VIDEO_SIZE = (1280, 720)
+VIDEO_SECONDS = 3
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+@dataclass(frozen=True)
+class CorpusFile:
+    """
+    One generated file.
+    """
+
+    name: str
+    path: str
+    media_type: MediaType
+    format: str
+    """Short name of the format, e.g. ``jpeg`` or ``mp4-faststart``"""
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as corpus_file:
+            return corpus_file.read()
+
+
+def _write_atomically(path: str, data: bytes) -> None:
+    # An interrupted run must not leave a truncated file that later runs would reuse
+    partial_path = f"{path}.partial"
+    with open(partial_path, "wb") as partial_file:
+        _ = partial_file.write(data)
+    os.replace(partial_path, path)
+
+
+def _photo(size: tuple[int, int], seed: int) -> Image.Image:
+    """
+    Smooth random color blobs with fine grain on top, which compress about as well as a real photo.
+    Pure noise would be far larger than any real photo of its size.
+    """
+
+    rng = random.Random(seed)
+    width, height = size
+    coarse_size = (width // 64, height // 64)
+    coarse = Image.frombytes("RGB", coarse_size, rng.randbytes(coarse_size[0] * coarse_size[1] * 3))
+    img = coarse.resize(size, Image.Resampling.BICUBIC)
+
+    grain = Image.frombytes("L", size, rng.randbytes(width * height)).convert("RGB")
+    return Image.blend(img, grain, 0.08)
+
+
+def _write_photos(directory: str) -> list[CorpusFile]:
+    files = list[CorpusFile]()
+
+    def save(name: str, media_format: str, save_image: Callable[[BytesIO], None]) -> None:
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            buffer = BytesIO()
+            save_image(buffer)
+            _write_atomically(path, buffer.getvalue())
+        files.append(CorpusFile(name, path, MediaType.PHOTO, media_format))
+
+    # Only made if some file that needs it isn't cached yet
+    photo = cache(lambda: _photo(PHOTO_SIZE, seed=1))
+    frames = cache(lambda: [_photo(GIF_SIZE, seed=2 + i).quantize(colors=256) for i in range(GIF_FRAMES)])
+
+    # Phones store photos sideways and rotate them with EXIF, which thumbnails have to undo
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION_TAG] = 6
+    save("photo.jpg", "jpeg", lambda buffer: photo().save(buffer, "JPEG", quality=90, exif=exif))
+    save("photo.png", "png", lambda buffer: photo().save(buffer, "PNG"))
+
+    if "HEIC" in SUPPORTED_FORMATS:
+        save("photo.heic", "heic", lambda buffer: photo().save(buffer, "HEIF", quality=90))
+
+    save("photo.gif", "gif", lambda buffer: frames()[0].save(buffer, "GIF", save_all=True, append_images=frames()[1:], duration=100, loop=0))
+
+    return files
+
+
+def _write_videos(directory: str) -> list[CorpusFile]:
+    ffmpeg_path = shutil.which("ffmpeg")
+    if ffmpeg_path is None:
+        return []
+
+    files = list[CorpusFile]()
+    width, height = VIDEO_SIZE
+    # With faststart the moov box comes first, so the video can be decoded as it streams in.
+    # Without it, like most phone videos, the whole video has to be on disk first.
+    for name, media_format, movflags in (
+        ("video-faststart.mp4", "mp4-faststart", ["-movflags", "+faststart"]),
+        ("video.mp4", "mp4", []),
+    ):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            partial_path = f"{path}.partial.mp4"
+            _ = subprocess.run(
+                [
+                    ffmpeg_path, "-hide_banner", "-loglevel", "error", "-y",
+                    "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate=30:duration={VIDEO_SECONDS}",
+                    "-pix_fmt", "yuv420p", *movflags, partial_path,
+                ],
+                check=True,
+            )
+            os.replace(partial_path, path)
+        files.append(CorpusFile(name, path, MediaType.VIDEO, media_format))
+
+    return files
+
+
+def generate(directory: str) -> list[CorpusFile]:
+    """
+    Make the corpus, or reuse it if it was made before.
+
+    :param directory: Where to keep the corpus. A subdirectory is used per :obj:`CORPUS_VERSION`.
+    :return: Every file in the corpus
+    """
+
+    directory = os.path.join(directory, f"v{CORPUS_VERSION}")
+    os.makedirs(directory, exist_ok=True)
+    return _write_photos(directory) + _write_videos(directory)
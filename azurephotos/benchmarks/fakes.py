@@ -0,0 +1,727 @@
+"""
+In-memory stand-ins for the Azure Blob and Table clients the app uses, so its code paths run without a storage account.
+
+Every call that would be a request to storage sleeps for a configurable latency first, and transfers can be throttled,
+so benchmarks can show how code behaves against a slow or distant account as well as how much CPU it uses.
+Only the methods and arguments the app calls are implemented.
+"""
+
+import base64
+import itertools
+import os
+import time
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Any, Callable, Generic, TypeVar
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from azure.data.tables import TableEntity, TableTransactionError, UpdateMode
+from azure.storage.blob import ContentSettings, UserDelegationKey
+
+from src.lib.storage import odata
+
+T = TypeVar("T")
+
+DEFAULT_PAGE_SIZE = 1000
+"""
+Most items Azure returns in one page of a listing or query
+"""
+
+
+@dataclass(frozen=True)
+class Latency:
+    """
+    Delay added to every simulated request.
+    """
+
+    request: timedelta = timedelta(0)
+    """Round trip time of every request"""
+    bytes_per_second: float | None = None
+    """Transfer speed of request and response bodies. None for unlimited."""
+
+    def wait(self, size: int = 0) -> None:
+        """
+        Sleep for as long as a request transferring ``size`` bytes would take.
+        """
+
+        seconds = self.request.total_seconds()
+        if self.bytes_per_second:
+            seconds += size / self.bytes_per_second
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+_etags = itertools.count(1)
+
+
+def _new_etag() -> str:
+    return f'W/"{next(_etags):016x}"'
+
+
+class FakePaged(Generic[T]):
+    """
+    Lazy listing like ``ItemPaged``. Each page is a separate request, so waits once per page.
+    """
+
+    def __init__(self, fetch: Callable[[int, int], tuple[list[T], int | None]], page_size: int, latency: Latency) -> None:
+        """
+        :param fetch: Gets the items starting at an offset, at most ``page_size`` of them, and the offset of the next page if any
+        """
+
+        self._fetch = fetch
+        self._page_size = page_size
+        self._latency = latency
+        self._items: Iterator[T] | None = None
+
+    def _pages(self, offset: int | None) -> Iterator[Iterator[T]]:
+        while offset is not None:
+            self._latency.wait()
+            items, offset = self._fetch(offset, self._page_size)
+            self.continuation_token = None if offset is None else str(offset)
+            yield iter(items)
+
+    def by_page(self, continuation_token: str | None = None) -> "FakePager[T]":
+        return FakePager(self._pages(int(continuation_token or 0)), self)
+
+    def __iter__(self) -> Iterator[T]:
+        return self
+
+    def __next__(self) -> T:
+        if self._items is None:
+            self._items = itertools.chain.from_iterable(self._pages(0))
+        return next(self._items)
+
+
+class FakePager(Generic[T]):
+    """
+    Pages of a :class:`FakePaged`, with the token to resume after the last page fetched.
+    """
+
+    def __init__(self, pages: Iterator[Iterator[T]], paged: FakePaged[T]) -> None:
+        self._pages = pages
+        self._paged = paged
+
+    @property
+    def continuation_token(self) -> str | None:
+        return getattr(self._paged, "continuation_token", None)
+
+    def __iter__(self) -> Iterator[Iterator[T]]:
+        return self
+
+    def __next__(self) -> Iterator[T]:
+        return next(self._pages)
+
+
+# Blobs
+
+
+@dataclass
+class FakeBlobProperties:
+    """
+    The parts of ``BlobProperties`` the app reads.
+    """
+
+    name: str
+    container: str
+    size: int
+    metadata: dict[str, str]
+    content_settings: ContentSettings
+    last_modified: datetime
+    etag: str
+
+
+@dataclass
+class _Blob:
+    data: bytes
+    metadata: dict[str, str]
+    content_settings: ContentSettings
+    last_modified: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    etag: str = field(default_factory=_new_etag)
+
+
+class FakeDownloader:
+    """
+    Like ``StorageStreamDownloader``, over bytes that are already in memory.
+    """
+
+    def __init__(self, data: bytes, properties: FakeBlobProperties, latency: Latency) -> None:
+        self._data = data
+        self.properties = properties
+        self.size = len(data)
+        self.name = properties.name
+        self._latency = latency
+
+    def readall(self) -> bytes:
+        self._latency.wait(len(self._data))
+        return self._data
+
+    def readinto(self, stream: Any) -> int:
+        _ = stream.write(self.readall())
+        return len(self._data)
+
+    def chunks(self) -> Iterator[bytes]:
+        data = self.readall()
+        for start in range(0, len(data), 4 * 1024 * 1024):
+            yield data[start:start + 4 * 1024 * 1024]
+
+
+@dataclass(frozen=True)
+class FakeBatchResponse:
+    """
+    Outcome of one sub-request of a blob batch.
+    """
+
+    status_code: int
+    reason: str
+
+
+def _read(data: bytes | str | Any, length: int | None = None) -> bytes:
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, str):
+        return data.encode()
+    return data.read() if length is None else data.read(length)
+
+
+class FakeContainerClient:
+    """
+    In-memory ``ContainerClient``.
+    """
+
+    def __init__(self, account_url: str, container_name: str, latency: Latency) -> None:
+        self.container_name = container_name
+        self.url = f"{account_url}/{container_name}"
+        self.latency = latency
+
+        self._lock = Lock()
+        self._blobs = dict[str, _Blob]()
+        self._staged = dict[str, dict[str, bytes]]()
+
+    def clear(self) -> None:
+        """
+        Delete every blob, without simulating any requests.
+        """
+
+        with self._lock:
+            self._blobs.clear()
+            self._staged.clear()
+
+    def blob_names(self) -> list[str]:
+        """
+        Names of every blob, without simulating any requests.
+        """
+
+        with self._lock:
+            return list(self._blobs)
+
+    def _properties(self, name: str, blob: _Blob) -> FakeBlobProperties:
+        return FakeBlobProperties(
+            name, self.container_name, len(blob.data), dict(blob.metadata), blob.content_settings, blob.last_modified, blob.etag
+        )
+
+    def _put(self, name: str, blob: _Blob, overwrite: bool) -> dict[str, Any]:
+        with self._lock:
+            if not overwrite and name in self._blobs:
+                raise ResourceExistsError(f"The specified blob {name} already exists")
+            self._blobs[name] = blob
+            self._staged.pop(name, None)
+
+        return {"etag": blob.etag, "last_modified": blob.last_modified}
+
+    def get_blob_client(self, blob: str) -> "FakeBlobClient":
+        return FakeBlobClient(self, blob)
+
+    def get_container_properties(self, **kwargs: Any) -> dict[str, Any]:
+        self.latency.wait()
+        return {"name": self.container_name}
+
+    def exists(self, **kwargs: Any) -> bool:
+        self.latency.wait()
+        return True
+
+    def upload_blob(
+        self,
+        name: str,
+        data: bytes | str | Any,
+        overwrite: bool = False,
+        metadata: dict[str, str] | None = None,
+        content_settings: ContentSettings | None = None,
+        length: int | None = None,
+        **kwargs: Any,
+    ) -> dict[str, Any]:
+        body = _read(data, length)
+        self.latency.wait(len(body))
+        return self._put(name, _Blob(body, dict(metadata or {}), content_settings or ContentSettings()), overwrite)
+
+    def download_blob(self, blob: str, offset: int | None = None, length: int | None = None, **kwargs: Any) -> FakeDownloader:
+        with self._lock:
+            stored = self._blobs.get(blob)
+        if stored is None:
+            self.latency.wait()
+            raise ResourceNotFoundError(f"The specified blob {blob} does not exist")
+
+        data = stored.data
+        if offset is not None:
+            data = data[offset:] if length is None else data[offset:offset + length]
+        return FakeDownloader(data, self._properties(blob, stored), self.latency)
+
+    def get_blob_properties(self, blob: str, **kwargs: Any) -> FakeBlobProperties:
+        self.latency.wait()
+        with self._lock:
+            stored = self._blobs.get(blob)
+        if stored is None:
+            raise ResourceNotFoundError(f"The specified blob {blob} does not exist")
+        return self._properties(blob, stored)
+
+    def delete_blob(self, blob: str, **kwargs: Any) -> None:
+        self.latency.wait()
+        with self._lock:
+            if self._blobs.pop(blob, None) is None:
+                raise ResourceNotFoundError(f"The specified blob {blob} does not exist")
+
+    def delete_blobs(self, *blobs: str, raise_on_any_failure: bool = True, **kwargs: Any) -> Iterator[FakeBatchResponse]:
+        # One batch request for all of them
+        self.latency.wait()
+        responses = list[FakeBatchResponse]()
+        with self._lock:
+            for blob in blobs:
+                if self._blobs.pop(blob, None) is None:
+                    responses.append(FakeBatchResponse(404, "The specified blob does not exist."))
+                else:
+                    responses.append(FakeBatchResponse(202, "Accepted"))
+
+        if raise_on_any_failure and any(response.status_code >= 300 for response in responses):
+            raise ResourceNotFoundError("There is a partial failure in the batch operation.")
+        return iter(responses)
+
+    def list_blobs(
+        self,
+        name_starts_with: str | None = None,
+        include: Sequence[str] | str | None = None,
+        results_per_page: int | None = None,
+        **kwargs: Any,
+    ) -> FakePaged[FakeBlobProperties]:
+        def fetch(offset: int, page_size: int) -> tuple[list[FakeBlobProperties], int | None]:
+            with self._lock:
+                # Listings are in name order
+                names = sorted(name for name in self._blobs if name.startswith(name_starts_with or ""))
+                page = [self._properties(name, self._blobs[name]) for name in names[offset:offset + page_size]]
+            next_offset = offset + page_size
+            return page, next_offset if next_offset < len(names) else None
+
+        return FakePaged(fetch, results_per_page or 5000, self.latency)
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "FakeContainerClient":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+
+class FakeBlobClient:
+    """
+    In-memory ``BlobClient``, for one blob of a :class:`FakeContainerClient`.
+    """
+
+    def __init__(self, container: FakeContainerClient, blob_name: str) -> None:
+        self._container = container
+        self.container_name = container.container_name
+        self.blob_name = blob_name
+        self.url = f"{container.url}/{blob_name}"
+
+    def upload_blob(self, data: bytes | str | Any, **kwargs: Any) -> dict[str, Any]:
+        return self._container.upload_blob(self.blob_name, data, **kwargs)
+
+    def download_blob(self, **kwargs: Any) -> FakeDownloader:
+        return self._container.download_blob(self.blob_name, **kwargs)
+
+    def get_blob_properties(self, **kwargs: Any) -> FakeBlobProperties:
+        return self._container.get_blob_properties(self.blob_name)
+
+    def delete_blob(self, **kwargs: Any) -> None:
+        self._container.delete_blob(self.blob_name)
+
+    def stage_block(self, block_id: str, data: bytes | str | Any, length: int | None = None, **kwargs: Any) -> None:
+        body = _read(data, length)
+        self._container.latency.wait(len(body))
+        with self._container._lock:
+            self._container._staged.setdefault(self.blob_name, {})[block_id] = body
+
+    def commit_block_list(
+        self,
+        block_list: Iterable[Any],
+        metadata: dict[str, str] | None = None,
+        content_settings: ContentSettings | None = None,
+        match_condition: MatchConditions | None = None,
+        **kwargs: Any,
+    ) -> dict[str, Any]:
+        self._container.latency.wait()
+        container = self._container
+        with container._lock:
+            if match_condition == MatchConditions.IfMissing and self.blob_name in container._blobs:
+                raise ResourceModifiedError(f"The specified blob {self.blob_name} already exists")
+
+            staged = container._staged.get(self.blob_name, {})
+            try:
+                data = b"".join(staged[block.id] for block in block_list)
+            except KeyError as e:
+                raise ResourceNotFoundError(f"The specified block list is invalid: {e}") from e
+
+            # Checked and committed under one lock, so only one of two racing commits wins
+            blob = container._blobs[self.blob_name] = _Blob(data, dict(metadata or {}), content_settings or ContentSettings())
+            _ = container._staged.pop(self.blob_name, None)
+
+        return {"etag": blob.etag, "last_modified": blob.last_modified}
+
+    def close(self) -> None:
+        pass
+
+
+class FakeBlobServiceClient:
+    """
+    In-memory ``BlobServiceClient``. Containers exist as soon as they are asked for.
+    """
+
+    def __init__(self, account_name: str, latency: Latency) -> None:
+        self.account_name = account_name
+        self.url = f"https://{account_name}.blob.core.windows.net"
+        self.latency = latency
+
+        self._lock = Lock()
+        self._containers = dict[str, FakeContainerClient]()
+
+    def get_container_client(self, container: str) -> FakeContainerClient:
+        with self._lock:
+            if container not in self._containers:
+                self._containers[container] = FakeContainerClient(self.url, container, self.latency)
+            return self._containers[container]
+
+    def get_user_delegation_key(self, key_start_time: datetime, key_expiry_time: datetime, **kwargs: Any) -> UserDelegationKey:
+        self.latency.wait()
+        key = UserDelegationKey()
+        key.signed_oid = "00000000-0000-0000-0000-000000000000"
+        key.signed_tid = "00000000-0000-0000-0000-000000000000"
+        key.signed_start = key_start_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        key.signed_expiry = key_expiry_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        key.signed_service = "b"
+        key.signed_version = "2021-08-06"
+        key.value = base64.b64encode(os.urandom(32)).decode()
+        return key
+
+    def close(self) -> None:
+        pass
+
+
+# Tables
+
+
+@dataclass
+class _Row:
+    properties: dict[str, Any]
+    etag: str
+    timestamp: datetime
+
+
+class _Partition:
+    """
+    Rows of one partition. Kept unsorted, and sorted by row key only when listed after a change,
+    so bulk inserts stay cheap and repeated queries don't pay for sorting.
+    """
+
+    def __init__(self) -> None:
+        self.rows = dict[str, _Row]()
+        self._sorted: list[str] | None = None
+
+    def changed(self) -> None:
+        self._sorted = None
+
+    def row_keys(self) -> list[str]:
+        if self._sorted is None:
+            self._sorted = sorted(self.rows)
+        return self._sorted
+
+
+def _entity(row: _Row, select: Sequence[str] | None) -> TableEntity:
+    entity = TableEntity()
+    if select is None:
+        entity.update(row.properties)
+    else:
+        entity.update((key, row.properties[key]) for key in select if key in row.properties)
+    entity._metadata = {"etag": row.etag, "timestamp": row.timestamp}  # type: ignore[typeddict-item]
+    return entity
+
+
+def _stored(properties: Mapping[str, Any]) -> dict[str, Any]:
+    # The SDK sends naive datetimes as UTC, and always reads datetimes back with a timezone
+    return {
+        key: value.replace(tzinfo=timezone.utc) if isinstance(value, datetime) and value.tzinfo is None else value
+        for key, value in properties.items()
+    }
+
+
+def _select(select: Sequence[str] | str | None) -> Sequence[str] | None:
+    if isinstance(select, str):
+        return [key.strip() for key in select.split(",")]
+    return select
+
+
+class FakeTableClient:
+    """
+    In-memory ``TableClient``. Query filters are evaluated by :mod:`odata`.
+    """
+
+    def __init__(self, account_url: str, table_name: str, latency: Latency) -> None:
+        self.table_name = table_name
+        self.url = f"{account_url}/{table_name}"
+        self.latency = latency
+
+        self._lock = Lock()
+        self._partitions = dict[str, _Partition]()
+
+    def seed(self, entities: Iterable[Mapping[str, Any]]) -> None:
+        """
+        Insert or replace entities, without simulating any requests.
+        """
+
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            for entity in entities:
+                partition = self._partitions.setdefault(entity["PartitionKey"], _Partition())
+                partition.rows[entity["RowKey"]] = _Row(_stored(entity), _new_etag(), now)
+                partition.changed()
+
+    def clear(self) -> None:
+        """
+        Delete every entity, without simulating any requests.
+        """
+
+        with self._lock:
+            self._partitions.clear()
+
+    def _get_row(self, partition_key: str, row_key: str) -> _Row | None:
+        partition = self._partitions.get(partition_key)
+        return None if partition is None else partition.rows.get(row_key)
+
+    def _set_row(self, properties: Mapping[str, Any]) -> dict[str, Any]:
+        row = _Row(_stored(properties), _new_etag(), datetime.now(timezone.utc))
+        partition = self._partitions.setdefault(row.properties["PartitionKey"], _Partition())
+        if row.properties["RowKey"] not in partition.rows:
+            partition.changed()
+        partition.rows[row.properties["RowKey"]] = row
+        return {"etag": row.etag, "date": row.timestamp}
+
+    def _delete_row(self, partition_key: str, row_key: str) -> None:
+        partition = self._partitions.get(partition_key)
+        if partition is not None and partition.rows.pop(row_key, None) is not None:
+            partition.changed()
+
+    def _check_etag(self, row: _Row, etag: str | None, match_condition: MatchConditions | None) -> None:
+        if match_condition == MatchConditions.IfNotModified and etag != row.etag:
+            raise ResourceModifiedError("The update condition specified in the request was not satisfied.")
+
+    def create_table_if_not_exists(self, **kwargs: Any) -> "FakeTableClient":
+        self.latency.wait()
+        return self
+
+    def create_entity(self, entity: Mapping[str, Any], **kwargs: Any) -> dict[str, Any]:
+        self.latency.wait()
+        with self._lock:
+            if self._get_row(entity["PartitionKey"], entity["RowKey"]) is not None:
+                raise ResourceExistsError("The specified entity already exists.")
+            return self._set_row(entity)
+
+    def upsert_entity(self, entity: Mapping[str, Any], mode: UpdateMode = UpdateMode.MERGE, **kwargs: Any) -> dict[str, Any]:
+        self.latency.wait()
+        with self._lock:
+            existing = self._get_row(entity["PartitionKey"], entity["RowKey"])
+            if existing is not None and mode == UpdateMode.MERGE:
+                return self._set_row({**existing.properties, **entity})
+            return self._set_row(entity)
+
+    def update_entity(
+        self,
+        entity: Mapping[str, Any],
+        mode: UpdateMode = UpdateMode.MERGE,
+        etag: str | None = None,
+        match_condition: MatchConditions | None = None,
+        **kwargs: Any,
+    ) -> dict[str, Any]:
+        self.latency.wait()
+        with self._lock:
+            existing = self._get_row(entity["PartitionKey"], entity["RowKey"])
+            if existing is None:
+                raise ResourceNotFoundError("The specified resource does not exist.")
+            self._check_etag(existing, etag, match_condition)
+            return self._set_row({**existing.properties, **entity} if mode == UpdateMode.MERGE else entity)
+
+    def get_entity(self, partition_key: str, row_key: str, select: Sequence[str] | str | None = None, **kwargs: Any) -> TableEntity:
+        self.latency.wait()
+        with self._lock:
+            row = self._get_row(partition_key, row_key)
+            if row is None:
+                raise ResourceNotFoundError("The specified resource does not exist.")
+            return _entity(row, _select(select))
+
+    def delete_entity(self, *args: Any, etag: str | None = None, match_condition: MatchConditions | None = None, **kwargs: Any) -> None:
+        # Either (partition_key, row_key) or (entity,), positionally or by keyword, like the SDK
+        if args and isinstance(args[0], Mapping):
+            partition_key, row_key = args[0]["PartitionKey"], args[0]["RowKey"]
+        elif "entity" in kwargs:
+            partition_key, row_key = kwargs["entity"]["PartitionKey"], kwargs["entity"]["RowKey"]
+        else:
+            partition_key = args[0] if args else kwargs["partition_key"]
+            row_key = args[1] if len(args) > 1 else kwargs["row_key"]
+
+        self.latency.wait()
+        with self._lock:
+            row = self._get_row(partition_key, row_key)
+            if row is None:
+                # The SDK ignores entities that are already gone
+                return
+            self._check_etag(row, etag, match_condition)
+            self._delete_row(partition_key, row_key)
+
+    def _paged(
+        self,
+        query_filter: str | None,
+        parameters: Mapping[str, Any] | None,
+        select: Sequence[str] | str | None,
+        results_per_page: int | None,
+    ) -> FakePaged[TableEntity]:
+        parsed = odata.parse(query_filter) if query_filter else None
+        parameters = dict(parameters or {})
+        columns = _select(select)
+
+        def rows() -> Iterator[_Row]:
+            # Snapshot the keys under the lock. Rows are replaced rather than changed in place, so reading them later is safe.
+            with self._lock:
+                partition_key = parsed.partition_key({}, parameters) if parsed and parsed.partition_key else None
+                if partition_key is not None:
+                    partition = self._partitions.get(partition_key)
+                    keys = [] if partition is None else [(partition, row_key) for row_key in partition.row_keys()]
+                else:
+                    keys = [
+                        (partition, row_key)
+                        for _, partition in sorted(self._partitions.items())
+                        for row_key in partition.row_keys()
+                    ]
+
+            for partition, row_key in keys:
+                row = partition.rows.get(row_key)
+                if row is not None and (parsed is None or parsed.matches(row.properties, parameters)):
+                    yield row
+
+        matches: list[_Row] | None = None
+
+        def fetch(offset: int, page_size: int) -> tuple[list[TableEntity], int | None]:
+            nonlocal matches
+            if matches is None:
+                matches = list(rows())
+
+            page = [_entity(row, columns) for row in matches[offset:offset + page_size]]
+            next_offset = offset + page_size
+            return page, next_offset if next_offset < len(matches) else None
+
+        return FakePaged(fetch, min(results_per_page or DEFAULT_PAGE_SIZE, DEFAULT_PAGE_SIZE), self.latency)
+
+    def query_entities(
+        self,
+        query_filter: str,
+        parameters: Mapping[str, Any] | None = None,
+        select: Sequence[str] | str | None = None,
+        results_per_page: int | None = None,
+        **kwargs: Any,
+    ) -> FakePaged[TableEntity]:
+        return self._paged(query_filter, parameters, select, results_per_page)
+
+    def list_entities(
+        self,
+        select: Sequence[str] | str | None = None,
+        results_per_page: int | None = None,
+        **kwargs: Any,
+    ) -> FakePaged[TableEntity]:
+        return self._paged(None, None, select, results_per_page)
+
+    def submit_transaction(self, operations: Iterable[tuple[Any, ...]], **kwargs: Any) -> list[dict[str, Any]]:
+        """
+        Apply every operation or none of them, like an entity group transaction.
+        """
+
+        operations = list(operations)
+        self.latency.wait()
+        if len({operation[1]["PartitionKey"] for operation in operations}) > 1:
+            raise ValueError("All operations in a transaction must be in the same partition")
+        if len(operations) > 100:
+            raise ValueError("A transaction can hold at most 100 operations")
+
+        with self._lock:
+            # Check every operation first, so a failure changes nothing
+            for index, operation in enumerate(operations):
+                kind, entity = str(operation[0]).lower(), operation[1]
+                options: dict[str, Any] = operation[2] if len(operation) > 2 else {}
+                row = self._get_row(entity["PartitionKey"], entity["RowKey"])
+                if kind == "create" and row is not None:
+                    raise TableTransactionError(message=f"{index}:The specified entity already exists.", index=index)
+                if kind in ("update", "delete") and row is None:
+                    raise TableTransactionError(message=f"{index}:The specified resource does not exist.", index=index)
+                if kind in ("update", "delete") and row is not None:
+                    try:
+                        self._check_etag(row, options.get("etag"), options.get("match_condition"))
+                    except ResourceModifiedError as e:
+                        raise TableTransactionError(message=f"{index}:{e.message}", index=index) from e
+
+            results = list[dict[str, Any]]()
+            for operation in operations:
+                kind, entity = str(operation[0]).lower(), operation[1]
+                options = operation[2] if len(operation) > 2 else {}
+                existing = self._get_row(entity["PartitionKey"], entity["RowKey"])
+                match kind:
+                    case "delete":
+                        self._delete_row(entity["PartitionKey"], entity["RowKey"])
+                        results.append({})
+                    case "upsert" | "update" if existing is not None and options.get("mode", UpdateMode.MERGE) == UpdateMode.MERGE:
+                        results.append(self._set_row({**existing.properties, **entity}))
+                    case "create" | "upsert" | "update":
+                        results.append(self._set_row(entity))
+                    case _:
+                        raise ValueError(f"Unsupported transaction operation {kind!r}")
+
+        return results
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "FakeTableClient":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+
+class FakeTableServiceClient:
+    """
+    In-memory ``TableServiceClient``. Tables exist as soon as they are asked for.
+    """
+
+    def __init__(self, account_name: str, latency: Latency) -> None:
+        self.account_name = account_name
+        self.url = f"https://{account_name}.table.core.windows.net"
+        self.latency = latency
+
+        self._lock = Lock()
+        self._tables = dict[str, FakeTableClient]()
+
+    def get_table_client(self, table_name: str) -> FakeTableClient:
+        with self._lock:
+            if table_name not in self._tables:
+                self._tables[table_name] = FakeTableClient(self.url, table_name, self.latency)
+            return self._tables[table_name]
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,202 @@
+"""
+Timing, results, and the app the benchmarks run against.
+"""
+
+import gc
+import itertools
+import os
+import statistics
+import tempfile
+import time
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any, Callable, TypeVar
+
+from azure.data.tables import UpdateMode
+from flask import Flask
+
+from src.lib.storage.local import LocalBlobStorage, LocalEntityStorage
+from src.lib.table_batch import chunked
+
+from . import corpus
+from .fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+
+T = TypeVar("T")
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+"""
+The ``azurephotos`` directory
+"""
+
+ACCOUNT_NAME = "benchmark"
+
+
+@dataclass(frozen=True)
+class Result:
+    """
+    Timings of one benchmark.
+    """
+
+    name: str
+    samples: list[float]
+    """Seconds taken by each timed iteration"""
+    items: int = 1
+    """Items each iteration processes, e.g. records sorted or files uploaded"""
+    params: dict[str, Any] = field(default_factory=dict)
+    """Anything that affects the timings, e.g. input size"""
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.samples)
+
+    def to_json(self) -> dict[str, Any]:
+        samples = sorted(self.samples)
+        return {
+            "iterations": len(samples),
+            "items": self.items,
+            "min": samples[0],
+            "median": self.median,
+            "mean": statistics.fmean(samples),
+            "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+            # Nearest rank, so it is always one of the samples
+            "p95": samples[min(round(0.95 * len(samples)), len(samples)) - 1],
+            "max": samples[-1],
+            "median_per_item": self.median / self.items,
+            "params": self.params,
+            "samples": self.samples,
+        }
+
+
+def measure(
+    name: str,
+    run: Callable[[T], object],
+    setup: Callable[[], T] = lambda: None,  # type: ignore[assignment, return-value]
+    repeat: int = 10,
+    warmup: int = 1,
+    items: int = 1,
+    params: dict[str, Any] | None = None,
+) -> Result:
+    """
+    Time a function.
+
+    :param name: Name of the benchmark, e.g. ``thumbnail[jpeg]``
+    :param run: What to time. Gets what ``setup`` returned.
+    :param setup: Prepares each iteration, e.g. by clearing a cache. Not timed.
+    :param repeat: Number of timed iterations
+    :param warmup: Number of untimed iterations first, e.g. to start pools or fill OS caches
+    :param items: Items each iteration processes
+    :param params: Anything that affects the timings
+    """
+
+    samples = list[float]()
+    for iteration in range(warmup + repeat):
+        state = setup()
+        # Garbage left by earlier iterations shouldn't be collected on this one's time
+        _ = gc.collect()
+        start = time.perf_counter()
+        _ = run(state)
+        elapsed = time.perf_counter() - start
+        if iteration >= warmup:
+            samples.append(elapsed)
+
+    return Result(name, samples, items, params or {})
+
+
+class Environment:
+    """
+    The app, wired to in-memory storage or to local disk, plus the corpus.
+    """
+
+    def __init__(
+        self,
+        table_latency: Latency,
+        blob_latency: Latency,
+        corpus_dir: str,
+        repeat: int | None = None,
+        backend: str = "memory",
+    ) -> None:
+        """
+        :param table_latency: Latency of every table request. Only for the memory backend.
+        :param blob_latency: Latency of every blob request. Only for the memory backend.
+        :param corpus_dir: Where the corpus is cached
+        :param repeat: Timed iterations of every benchmark, instead of each benchmark's own default
+        :param backend: "memory" for the in-memory fakes, or "local" for the app's offline storage in a temp directory
+        """
+
+        # Imported here so the app isn't created just by importing this module
+        from app import create_app
+
+        self.table_latency = table_latency
+        self.blob_latency = blob_latency
+        self.corpus_dir = corpus_dir
+        self.repeat = repeat
+        self.backend = backend
+        self.skipped = dict[str, str]()
+
+        self.blob_storage: FakeBlobServiceClient | LocalBlobStorage
+        self.entity_storage: FakeTableServiceClient | LocalEntityStorage
+        if backend == "memory":
+            self.blob_storage = FakeBlobServiceClient(ACCOUNT_NAME, blob_latency)
+            self.entity_storage = FakeTableServiceClient(ACCOUNT_NAME, table_latency)
+            self.app: Flask = create_app(self.blob_storage, self.entity_storage, account_name=ACCOUNT_NAME)
+        elif backend == "local":
+            local_storage_dir = tempfile.mkdtemp(prefix="azurephotos-benchmark-storage-")
+            # Opened again without instrumentation, so seeding and clearing aren't recorded
+            self.blob_storage = LocalBlobStorage(os.path.join(local_storage_dir, "blobs"))
+            self.entity_storage = LocalEntityStorage(os.path.join(local_storage_dir, "tables"))
+            self.app = create_app(offline=True, local_storage_dir=local_storage_dir)
+        else:
+            raise ValueError(f"Unknown backend {backend!r}")
+
+    @cached_property
+    def corpus(self) -> list[corpus.CorpusFile]:
+        return corpus.generate(self.corpus_dir)
+
+    def seed(self, config_key: str, entities: Iterable[Mapping[str, Any]]) -> None:
+        """
+        Insert or replace entities in one of the app's tables, without recording metrics or simulating latency.
+
+        :param config_key: e.g. ``albums_table_client``
+        """
+
+        table_name = self.app.config[config_key].table_name
+        match self.entity_storage:
+            case FakeTableServiceClient():
+                self.entity_storage.get_table_client(table_name).seed(entities)
+            case LocalEntityStorage():
+                table_client = self.entity_storage.get_table_client(table_name)
+                entities = sorted(entities, key=lambda entity: entity["PartitionKey"])
+                for _, partition in itertools.groupby(entities, key=lambda entity: entity["PartitionKey"]):
+                    for batch in chunked(partition):
+                        _ = table_client.submit_transaction([("upsert", entity, {"mode": UpdateMode.REPLACE}) for entity in batch])
+
+    def clear(self, config_key: str) -> None:
+        """
+        Delete every blob in one of the app's containers, without recording metrics or simulating latency.
+
+        :param config_key: e.g. ``photos_container_client``
+        """
+
+        container_name = self.app.config[config_key].container_name
+        match self.blob_storage:
+            case FakeBlobServiceClient():
+                self.blob_storage.get_container_client(container_name).clear()
+            case LocalBlobStorage():
+                container_client = self.blob_storage.get_container_client(container_name)
+                names = [blob.name for blob in container_client.list_blobs()]
+                _ = list(container_client.delete_blobs(*names, raise_on_any_failure=False))
+
+    def measure(self, name: str, run: Callable[[T], object], repeat: int = 10, **kwargs: Any) -> Result:
+        """
+        :func:`measure`, with the repeat count given to the environment if any.
+        """
+
+        return measure(name, run, repeat=self.repeat or repeat, **kwargs)
+
+    def skip(self, name: str, reason: str) -> None:
+        """
+        Record a benchmark that couldn't run here, e.g. for lack of ffmpeg.
+        """
+
+        self.skipped[name] = reason
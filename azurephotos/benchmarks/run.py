@@ -0,0 +1,131 @@
+"""
+Run the benchmarks and save the results as JSON.
+
+Run from the ``azurephotos`` directory::
+
+    python -m benchmarks.run
+    python -m benchmarks.run --only thumbnails --only upload --table-latency-ms 20 --blob-latency-ms 30
+    python -m benchmarks.run --backend local
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import click
+
+from src.lib import metrics
+
+from .cases import groups
+from .compare import format_seconds
+from .fakes import Latency
+from .harness import ROOT, Environment, Result
+
+
+def _git(*args: str) -> str | None:
+    try:
+        process = subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return process.stdout.strip()
+
+
+@click.command()
+@click.option("--only", "group_names", multiple=True, type=click.Choice(sorted(groups)), help="Group of benchmarks to run. Can be repeated. Defaults to every group.")
+@click.option("--output", default=None, help="File to write results to. Defaults to benchmarks/results/<commit>.json.")
+@click.option(
+    "--backend",
+    type=click.Choice(["memory", "local"]),
+    default="memory",
+    show_default=True,
+    help="Storage to run against: in-memory fakes, or the app's offline storage on local disk.",
+)
+@click.option("--table-latency-ms", default=0.0, show_default=True, help="Latency added to every table request.")
+@click.option("--blob-latency-ms", default=0.0, show_default=True, help="Latency added to every blob request.")
+@click.option("--blob-mbps", type=float, default=None, help="Blob transfer speed, in megabytes per second. Unlimited by default.")
+@click.option("--repeat", type=int, default=None, help="Timed iterations of every benchmark, instead of each benchmark's default.")
+@click.option(
+    "--corpus-dir",
+    default=os.path.join(tempfile.gettempdir(), "azurephotos-benchmark-corpus"),
+    show_default=True,
+    help="Where generated photos and videos are kept between runs.",
+)
+def run(
+    group_names: tuple[str, ...],
+    output: str | None,
+    backend: str,
+    table_latency_ms: float,
+    blob_latency_ms: float,
+    blob_mbps: float | None,
+    repeat: int | None,
+    corpus_dir: str,
+) -> None:
+    """
+    Run benchmarks against in-memory or local storage and save their timings.
+    """
+
+    if backend == "local" and (table_latency_ms or blob_latency_ms or blob_mbps):
+        raise click.UsageError("Latency and transfer speed can only be simulated with --backend memory")
+
+    # Keep benchmark timings out of the metrics of any app running on this machine
+    metrics.METRICS_DIR = tempfile.mkdtemp(prefix="azurephotos-benchmark-metrics-")
+
+    env = Environment(
+        table_latency=Latency(timedelta(milliseconds=table_latency_ms)),
+        blob_latency=Latency(timedelta(milliseconds=blob_latency_ms), blob_mbps * 1024 * 1024 if blob_mbps else None),
+        corpus_dir=corpus_dir,
+        repeat=repeat,
+        backend=backend,
+    )
+
+    results = list[Result]()
+    for group_name in group_names or sorted(groups):
+        click.echo(f"{group_name}:")
+        for result in groups[group_name](env):
+            summary = result.to_json()
+            click.echo(
+                f"  {result.name:<40} median {format_seconds(summary['median']):>9}"
+                f"  p95 {format_seconds(summary['p95']):>9}"
+                f"  per item {format_seconds(summary['median_per_item']):>9}"
+            )
+            results.append(result)
+
+    for name, reason in env.skipped.items():
+        click.echo(f"Skipped {name}: {reason}", err=True)
+
+    commit = _git("rev-parse", "--short", "HEAD")
+    dirty = bool(_git("status", "--porcelain", "--untracked-files=no"))
+    document = {
+        "commit": commit,
+        "dirty": dirty,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "backend": backend,
+            "table_latency_ms": table_latency_ms,
+            "blob_latency_ms": blob_latency_ms,
+            "blob_mbps": blob_mbps,
+            "repeat": repeat,
+        },
+        "results": {result.name: result.to_json() for result in results},
+        "skipped": env.skipped,
+    }
+
+    if output is None:
+        name = f"{commit or 'unknown'}{'-dirty' if dirty else ''}.json"
+        output = os.path.join(ROOT, "benchmarks", "results", name)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump(document, output_file, indent=2)
+
+    click.echo(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    run()
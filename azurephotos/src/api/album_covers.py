@@ -0,0 +1,149 @@
+"""
+Album covers made from a 2x2 mosaic of an album's newest thumbnails.
+
+Each mosaic is one WebP blob in the thumbnails container, named by album and by a hash of its contents,
+so its URL changes whenever it does and it can be cached forever.
+The catalog records each album's mosaic version, so pages find cover URLs without querying anything per album.
+
+Mosaics are made lazily. Album changes mark the mosaic stale in the catalog and schedule a new one,
+debounced so a burst of changes to an album makes one mosaic.
+Until the first mosaic exists, the cover is the thumbnail of the newest file.
+"""
+
+import hashlib
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import ContentSettings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from flask import current_app
+
+from . import catalog
+from .media_urls import thumbnail_blob_name, thumbnail_url
+from .thumbnail_proxy import IMMUTABLE_CACHE_CONTROL
+from ..lib.debounce import Debouncer
+from ..lib.storage_helper import blob_url, delete_blobs
+from ..lib.thumbnails import MOSAIC_LAYOUTS, mosaic
+from ..lib.versioning import ALBUMS_SCOPE, mark_changed
+from ..lib.storage.base import BlobStore
+
+COVER_PREFIX: str = "album-covers/"
+"""
+Prefix of every cover blob in the thumbnails container.
+Covers are named ``album-covers/<album name>/<version>.webp``. Album names can't contain ``/``, so every album has its own prefix.
+"""
+
+MOSAIC_TILES = max(MOSAIC_LAYOUTS)
+"""
+Most thumbnails in a mosaic
+"""
+
+_debouncer = Debouncer(delay=timedelta(seconds=30), max_delay=timedelta(minutes=5))
+
+
+def _album_prefix(album_name: str) -> str:
+    return f"{COVER_PREFIX}{album_name}/"
+
+
+def cover_blob_name(album_name: str, mosaic_version: str) -> str:
+    """
+    Name of the blob holding a version of an album's cover mosaic.
+    """
+
+    return f"{_album_prefix(album_name)}{mosaic_version}.webp"
+
+
+def cover_url(summary: catalog.AlbumSummary) -> str | None:
+    """
+    URL of an album's cover, or None if the album is empty.
+    Schedules a new mosaic if the album changed since its mosaic was made.
+
+    :param summary: The album's catalog entry
+    """
+
+    if summary.count == 0 or summary.cover is None:
+        return None
+
+    if summary.mosaic_stale or summary.mosaic_version is None:
+        schedule_mosaic(summary.name)
+    if summary.mosaic_version is None:
+        return thumbnail_url(summary.cover)
+
+    return blob_url("thumbnails", cover_blob_name(summary.name, summary.mosaic_version))
+
+
+def schedule_mosaic(album_name: str) -> None:
+    """
+    Make a new mosaic for an album once it stops changing for a while.
+    """
+
+    _debouncer.call(album_name, lambda: make_mosaic(album_name))
+
+
+def make_mosaic(album_name: str) -> None:
+    """
+    Make an album's cover mosaic from the thumbnails of its newest files, and record it in the catalog.
+    Does nothing if the album changes in the meantime, since that schedules another mosaic anyway.
+    """
+
+    from .albums import list_album
+
+    current = catalog.get_album(album_name)
+    if current is None:
+        return
+    summary, etag = current
+
+    medias = list_album(album_name)
+    if not isinstance(medias, list):
+        return
+
+    thumbnails_container_client: BlobStore = current_app.config["thumbnails_container_client"]
+
+    def download(blob_name: str) -> bytes | None:
+        try:
+            return thumbnails_container_client.download_blob(blob_name).readall()
+        except ResourceNotFoundError:
+            # Thumbnail not generated yet. Leave the file out of the mosaic.
+            return None
+
+    # A few extra in case some thumbnails are missing
+    blob_names = [
+        blob_name
+        for media in medias[:MOSAIC_TILES * 2]
+        if (blob_name := thumbnail_blob_name(media.filename)) is not None
+    ]
+    with ThreadPoolExecutor(max_workers=max(len(blob_names), 1)) as executor:
+        thumbnails = [data for data in executor.map(download, blob_names) if data is not None][:MOSAIC_TILES]
+
+    mosaic_version: str | None = None
+    if thumbnails:
+        cover = mosaic(thumbnails)
+        mosaic_version = hashlib.sha256(cover).hexdigest()[:16]
+        _ = thumbnails_container_client.upload_blob(
+            cover_blob_name(album_name, mosaic_version),
+            cover,
+            overwrite=True,
+            content_settings=ContentSettings(content_type="image/webp", cache_control=IMMUTABLE_CACHE_CONTROL),
+        )
+
+    if not catalog.set_mosaic(album_name, mosaic_version, etag):
+        # The album changed or another worker recorded its mosaic first. Nothing refers to ours, unless it is the same mosaic.
+        if mosaic_version is not None:
+            latest = catalog.get_album(album_name)
+            if latest is None or latest[0].mosaic_version != mosaic_version:
+                _ = delete_blobs(thumbnails_container_client, [cover_blob_name(album_name, mosaic_version)])
+        return
+    # Let every worker's cached catalog pick up the new cover
+    mark_changed(ALBUMS_SCOPE)
+
+    if summary.mosaic_version is not None and summary.mosaic_version != mosaic_version:
+        _ = delete_blobs(thumbnails_container_client, [cover_blob_name(album_name, summary.mosaic_version)])
+
+
+def delete_covers(album_name: str) -> None:
+    """
+    Delete every cover mosaic of an album, e.g. after it was deleted or renamed.
+    """
+
+    thumbnails_container_client: BlobStore = current_app.config["thumbnails_container_client"]
+    names = [blob.name for blob in thumbnails_container_client.list_blobs(name_starts_with=_album_prefix(album_name))]
+    _ = delete_blobs(thumbnails_container_client, names)
@@ -4,19 +4,36 @@ API endpoints for managing albums.
 Albums are stored in Azure Table Storage.
 The partition key is the album name, and the row key is the photo filename.
 An empty row key represents the album itself.
+Every mutation also updates the album catalog. See :mod:`catalog`.
 
 :author: William Boyles
 """
 
 from azure.core.exceptions import ResourceNotFoundError, ResourceExistsError
-from azure.data.tables import TableClient
-from datetime import datetime, timezone, timedelta
-from flask import Blueprint, Response, current_app, request, url_for, redirect
-from typing import Any
+from azure.data.tables import TableEntity, UpdateMode
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, Response, current_app, request, redirect, jsonify
+from typing import Any, Iterable, Mapping
 
+from . import album_covers, catalog
+from .bulk import bulk_filenames, item_result, multi_status
 from .media_cache import invalidate_media_cache
-from ..lib.refresher import refreshed
+from .media_urls import media_item
+from .membership import add_memberships, remove_memberships, albums_containing, albums_containing_many, failed_filenames
+from ..lib.album_index import AlbumIndex
+from ..lib.conditional import conditional_on
+from ..lib.versioning import VersionStamps, ALBUMS_SCOPE, mark_changed
 from ..lib.models.media import MediaRecord
+from ..lib.pagination import page_after, parse_page_size
+from ..lib.refresher import cached
+from ..lib.storage.base import EntityStore
+from ..lib.table_batch import (
+    BatchProgress,
+    move_entities,
+    delete_entities,
+    delete_all_entities,
+    get_entities,
+)
 
 api_albums_controller = Blueprint(
     "api_albums_controller",
@@ -44,36 +61,57 @@ def create_album(album_name: str) -> Response | dict[str, Any]:
 
     table_client = current_app.config["albums_table_client"]
 
+    created = datetime.now(timezone.utc)
     new_album = {
         "PartitionKey": album_name,
         "RowKey": "",
-        "Created": datetime.now(timezone.utc),
+        "Created": created,
     }
 
     try:
-        return table_client.create_entity(new_album)  # type: ignore
+        result = table_client.create_entity(new_album)
     except ResourceExistsError:
         return Response("Album already exists", status=409)
+    catalog.add_album(album_name, created)
+
+    album_index = _album_index()
+    album_index.add_album(album_name)
+    mark_changed(ALBUMS_SCOPE)
+
+    return result  # type: ignore
 
 
 @api_albums_controller.route("/albums", methods=["GET"])
-def list_albums() -> list[str]:
+@conditional_on(ALBUMS_SCOPE)
+def get_album_names() -> list[str]:
     """
     List all album names.
+    Answers with 304 while the albums haven't changed since the client's copy.
     """
 
-    table_client: TableClient = current_app.config["albums_table_client"]
+    return list_albums()
 
-    query = "PartitionKey ne @reserved_album_name and RowKey eq ''"
-    parameters = {"reserved_album_name": NONE_ALBUM_NAME}
-    entities = table_client.query_entities(query_filter=query, parameters=parameters)
-    return [row["PartitionKey"] for row in entities]
+
+def list_albums() -> list[str]:
+    """
+    List all album names, from the album catalog.
+    """
+
+    album_index = _album_index()
+    if (album_names := album_index.album_names()) is not None:
+        return album_names
+
+    album_names = [summary.name for summary in catalog.album_summaries()]
+
+    album_index.set_album_names(album_names)
+    return album_names
 
 
 @api_albums_controller.route("/<album_name>/rename/<new_name>", methods=["PUT"])
 def rename_album(album_name: str, new_name: str) -> Response:
     """
     Rename an album.
+    Responds with a :class:`BatchProgress`. If some batches failed, the same request can be sent again to resume.
 
     :param album_name: The name of the album to rename.
     :param new_name: The new name for the album.
@@ -82,6 +120,8 @@ def rename_album(album_name: str, new_name: str) -> Response:
     """
     Since we can't actually update the partition key, we create a copy of the
     old album with the new name and then delete the old album.
+    The album row is copied first and deleted last, so an interrupted rename
+    leaves the old album in place with whatever entries haven't moved yet.
     """
 
     if album_name == NONE_ALBUM_NAME:
@@ -91,30 +131,56 @@ def rename_album(album_name: str, new_name: str) -> Response:
     if not is_valid_album_name(new_name):
         return Response(f"{new_name=} is not allowed due to length or charset restrictions", status=422)
 
-    table_client: TableClient = current_app.config["albums_table_client"]
+    table_client: EntityStore = current_app.config["albums_table_client"]
 
     query = "PartitionKey eq @album_name"
     parameters = {"album_name": album_name}
-    entities = table_client.query_entities(query_filter=query, parameters=parameters)
-    entity = None
-    for entity in entities:
-        photo_copy = {
-            "PartitionKey": new_name,
-            "RowKey": entity["RowKey"],
-            "Created": entity["Created"],
-        }
-        _ = table_client.create_entity(photo_copy)
+    entities = list(table_client.query_entities(query_filter=query, parameters=parameters))
+    if not entities:
+        return Response(f"Album '{album_name}' not found", status=404)
 
+    album_entity = next((e for e in entities if not e["RowKey"]), None)
+    # Whether the new album is left over from an interrupted rename, so it may already hold some entries
+    resuming = False
+    if album_entity is not None:
+        # Only allow writing into an existing album if it is left over from an interrupted rename of this album
         try:
-            table_client.delete_entity(entity["PartitionKey"], entity["RowKey"])
+            existing_album = table_client.get_entity(partition_key=new_name, row_key="")
+            if existing_album.get("RenamedFrom") != album_name:
+                return Response(f"Album '{new_name}' already exists", status=409)
+            resuming = True
         except ResourceNotFoundError:
-            # Entry already deleted
-            pass
-
-    if not entity:  # No results. Loop didn't run
-        return Response(f"Album '{album_name}' not found", status=404)
+            _ = table_client.upsert_entity({
+                "PartitionKey": new_name,
+                "RowKey": "",
+                "Created": album_entity["Created"],
+                "RenamedFrom": album_name,
+            })
+
+    progress, stale = _move_entries([e for e in entities if e["RowKey"]], album_name, new_name)
+
+    album_index = _album_index()
+    mark_changed(ALBUMS_SCOPE)
+    if not progress.done:
+        album_index.clear()
+        catalog.refresh_albums([album_name, new_name])
+        response = jsonify(progress)
+        response.status_code = 500
+        return response
+
+    if album_entity is not None:
+        # The rename is finished, so a later album with the old name must not be able to merge into this one
+        _ = table_client.upsert_entity(
+            {"PartitionKey": new_name, "RowKey": "", "Created": album_entity["Created"]},
+            mode=UpdateMode.REPLACE,
+        )
+        delete_entities(table_client, [album_entity])
 
-    return Response(status=204)
+    catalog.refresh_albums([new_name])
+    catalog.remove_album(album_name)
+    album_covers.delete_covers(album_name)
+    album_index.rename_album(album_name, new_name, merge=resuming)
+    return _finished(progress, stale, album_name)
 
 
 @api_albums_controller.route("/<album_name>", methods=["DELETE"])
@@ -122,6 +188,7 @@ def delete_album(album_name: str) -> Response:
     """
     Delete an album.
     Entries in the album will be moved to the "none" album.
+    Responds with a :class:`BatchProgress`. If some batches failed, the same request can be sent again to resume.
 
     :param album_name: The name of the album to delete.
     """
@@ -131,31 +198,33 @@ def delete_album(album_name: str) -> Response:
     if not is_valid_album_name(album_name):
         return Response(f"{album_name=} is not allowed due to length or charset restrictions", status=422)
 
-    table_client: TableClient = current_app.config["albums_table_client"]
+    table_client: EntityStore = current_app.config["albums_table_client"]
 
     query = "PartitionKey eq @album_name"
     parameters = {"album_name": album_name}
-    entities = table_client.query_entities(query_filter=query, parameters=parameters)
-    entity = None
-    for entity in entities:
-        partition_key = entity["PartitionKey"]
-        row_key = entity["RowKey"]
-        if row_key:
-            new_entity = dict(entity)
-            new_entity["PartitionKey"] = NONE_ALBUM_NAME
-            _ = table_client.create_entity(new_entity)
+    entities = list(table_client.query_entities(query_filter=query, parameters=parameters))
+    if not entities:
+        return Response(f"Album '{album_name}' not found", status=404)
 
-        try:
-            table_client.delete_entity(partition_key, row_key)
-        except ResourceNotFoundError:
-            # Entry already deleted
-            pass
+    progress, stale = _move_entries([e for e in entities if e["RowKey"]], album_name, NONE_ALBUM_NAME)
 
-    if not entity:  # No results. Loop didn't run
-        return Response(f"Album '{album_name}' not found", status=404)
-    
+    album_index = _album_index()
+    mark_changed(ALBUMS_SCOPE)
     invalidate_media_cache()
-    return Response(status=204)
+    if not progress.done:
+        album_index.clear()
+        catalog.refresh_albums([album_name])
+        response = jsonify(progress)
+        response.status_code = 500
+        return response
+
+    # Album row goes last so an interrupted delete can be retried
+    delete_entities(table_client, [e for e in entities if not e["RowKey"]])
+    catalog.remove_album(album_name)
+    album_covers.delete_covers(album_name)
+
+    album_index.remove_album(album_name)
+    return _finished(progress, stale, album_name)
 
 
 @api_albums_controller.route("/<album_name>/<filename>", methods=["POST"])
@@ -180,7 +249,7 @@ def move_to_album(album_name: str, filename: str) -> Response:
     if not is_valid_album_name(current_album):
         return Response(f"{current_album=} is not allowed due to length or charset restrictions", status=422)
 
-    table_client: TableClient = current_app.config["albums_table_client"]
+    table_client: EntityStore = current_app.config["albums_table_client"]
 
     # Find file in current album
     try:
@@ -194,19 +263,20 @@ def move_to_album(album_name: str, filename: str) -> Response:
         )
 
     # Find target album
-    try:
-        _ = table_client.get_entity(partition_key=album_name, row_key="")
-    except ResourceNotFoundError:
+    if not album_exists(album_name):
         return Response(f"{album_name=} does not exist", status=404)
 
     # Add new entity to album
+    if (failure := _membership_failure(add_memberships([(filename, album_name)]))) is not None:
+        return failure
     new_file = dict(current_entity)
     new_file["PartitionKey"] = album_name
+    added = [(filename, new_file["Created"])]
     try:
         _ = table_client.create_entity(new_file)
     except ResourceExistsError:
         # File already exists in album
-        pass
+        added = []
 
     # Delete existing entity
     try:
@@ -214,13 +284,59 @@ def move_to_album(album_name: str, filename: str) -> Response:
     except ResourceNotFoundError:
         # Entry already deleted
         pass
+    removed = remove_memberships([(filename, current_album)])
+
+    album_index = _album_index()
+    album_index.remove_record(current_album, filename)
+    if (media_record := MediaRecord.from_filename(new_file["Created"], filename)) is not None:
+        album_index.add_record(album_name, media_record)
+    _update_catalog({album_name: added}, {current_album: [filename]})
+    mark_changed(ALBUMS_SCOPE)
 
     if current_album == NONE_ALBUM_NAME:
         invalidate_media_cache()
-    
+
+    if (failure := _membership_failure(removed, f"Moved {filename=}, but")) is not None:
+        return failure
     return Response(status=201)
 
 
+@api_albums_controller.route("/<album_name>/bulk", methods=["POST"])
+def move_many_to_album(album_name: str) -> Response:
+    """
+    Move many existing files from one album (by default the "none" album) to another album.
+    The JSON body names the files, e.g. ``{"filenames": ["a.jpg", "b.mp4"], "currentAlbum": "Trip"}``.
+    Responds with HTTP 207 and the outcome for every file.
+
+    :param album_name: The name of the album to add the files to.
+    """
+
+    if album_name == NONE_ALBUM_NAME:
+        return Response(f"{album_name=} is reserved and cannot be added to directly", status=403)
+    if not is_valid_album_name(album_name):
+        return Response(f"{album_name=} is not allowed due to length or charset restrictions", status=422)
+
+    filenames = bulk_filenames()
+    if isinstance(filenames, Response):
+        return filenames
+
+    body = request.get_json(silent=True) or {}
+    current_album = body.get("currentAlbum") or NONE_ALBUM_NAME
+    if current_album == album_name:
+        return multi_status([item_result(filename, 200) for filename in filenames])
+    if not is_valid_album_name(current_album):
+        return Response(f"{current_album=} is not allowed due to length or charset restrictions", status=422)
+
+    if not album_exists(album_name):
+        return Response(f"{album_name=} does not exist", status=404)
+
+    results = _move_many(filenames, current_album, album_name, success_status=201)
+    if current_album == NONE_ALBUM_NAME:
+        invalidate_media_cache()
+
+    return multi_status(results)
+
+
 # Don't invalidate media cache. Caller will decide if they want to do that.
 def upload_to_album(filename: str, date_taken: datetime, album_name: str) -> Response:
     """
@@ -239,15 +355,10 @@ def upload_to_album(filename: str, date_taken: datetime, album_name: str) -> Res
     if not is_valid_album_name(album_name):
         return Response(f"{album_name=} is not allowed due to length or charset restrictions", status=422)
 
-    table_client: TableClient = current_app.config["albums_table_client"]
+    table_client: EntityStore = current_app.config["albums_table_client"]
 
     # Check that album exists
-    # TODO: Could we cache this and avoid checking every time?
-    try:
-        # None album entry doesn't have an empty row key. We can assume it always exists
-        if album_name != NONE_ALBUM_NAME:
-            _ = table_client.get_entity(partition_key=album_name, row_key="")
-    except ResourceNotFoundError:
+    if not album_exists(album_name):
         return Response(f"Album '{album_name}' does not exist", status=404)
 
     new_file = {
@@ -255,12 +366,32 @@ def upload_to_album(filename: str, date_taken: datetime, album_name: str) -> Res
         "RowKey": filename,
         "Created": date_taken,
     }
+    if (failure := _membership_failure(add_memberships([(filename, album_name)]))) is not None:
+        return failure
     _ = table_client.create_entity(new_file)
 
+    album_index = _album_index()
+    if (media_record := MediaRecord.from_filename(date_taken, filename)) is not None:
+        album_index.add_record(album_name, media_record)
+    _update_catalog(added={album_name: [(filename, date_taken)]})
+    mark_changed(ALBUMS_SCOPE)
+
     return Response(status=201)
 
 
 @api_albums_controller.route("/<album_name>", methods=["GET"])
+@conditional_on(ALBUMS_SCOPE)
+def get_album(album_name: str) -> Response | list[MediaRecord]:
+    """
+    List the files in an album, sorted by last modified time.
+    Answers with 304 while the albums haven't changed since the client's copy.
+
+    :param album_name: The name of the album to list files for.
+    """
+
+    return list_album(album_name)
+
+
 def list_album(album_name: str) -> Response | list[MediaRecord]:
     """
     List the files in an album, sorted by last modified time.
@@ -271,17 +402,24 @@ def list_album(album_name: str) -> Response | list[MediaRecord]:
     if not is_valid_album_name(album_name):
         return Response(f"{album_name=} is not allowed due to length or charset restrictions", status=422)
 
-    table_client: TableClient = current_app.config["albums_table_client"]
+    album_index = _album_index()
+    if album_index.exists(album_name) is False:
+        return Response("Album does not exist", status=404)
+    # Flask would treat a tuple as (body, status), so always hand back a list
+    if (cached_medias := album_index.album(album_name)) is not None:
+        return list(cached_medias)
+
+    table_client: EntityStore = current_app.config["albums_table_client"]
 
     query = "PartitionKey eq @album_name"
     parameters = {"album_name": album_name}
     query_results = table_client.query_entities(
         query_filter=query, parameters=parameters
     )
-    album_exists = False
+    found = False
     medias = list[MediaRecord]()
     for entity in query_results:
-        album_exists = True
+        found = True
 
         filename = entity["RowKey"]
         if len(filename) == 0:
@@ -293,12 +431,36 @@ def list_album(album_name: str) -> Response | list[MediaRecord]:
         if media_record:
             medias.append(media_record)
 
-    if not album_exists:
+    if not found:
+        album_index.set_exists(album_name, False)
         return Response("Album does not exist", status=404)
 
+    album_index.set_album(album_name, medias)
     return sorted(medias, reverse=True)
 
 
+@api_albums_controller.route("/<album_name>/page", methods=["GET"])
+def list_album_page(album_name: str) -> Response | dict[str, Any]:
+    """
+    List one page of the files in an album, sorted by last modified time.
+    See :func:`src.api.media.list_media` for the query parameters.
+
+    :param album_name: The name of the album to list files for.
+    """
+
+    files_in_album = list_album(album_name)
+    if isinstance(files_in_album, Response):
+        return files_in_album
+
+    try:
+        limit = parse_page_size(request.args.get("limit"))
+        media, next_cursor = page_after(files_in_album, request.args.get("cursor"), limit)
+    except ValueError as e:
+        return Response(str(e), status=400)
+
+    return {"items": [media_item(record) for record in media], "next": next_cursor}
+
+
 @api_albums_controller.route("/<album_name>/<filename>", methods=["DELETE"])
 def remove_from_album(album_name: str, filename: str) -> Response:
     """
@@ -314,7 +476,7 @@ def remove_from_album(album_name: str, filename: str) -> Response:
     if not is_valid_album_name(album_name):
         return Response(f"{album_name=} is not allowed due to length or charset restrictions", status=422)
 
-    table_client: TableClient = current_app.config["albums_table_client"]
+    table_client: EntityStore = current_app.config["albums_table_client"]
 
     # Get existing entity
     try:
@@ -325,6 +487,8 @@ def remove_from_album(album_name: str, filename: str) -> Response:
         return Response(f"'{filename}' not found in album '{album_name}'", status=404)
 
     # Add new entity to NONE album
+    if (failure := _membership_failure(add_memberships([(filename, NONE_ALBUM_NAME)]))) is not None:
+        return failure
     new_entity = dict(existing_entity)
     new_entity["PartitionKey"] = NONE_ALBUM_NAME
     _ = table_client.create_entity(new_entity)
@@ -335,11 +499,109 @@ def remove_from_album(album_name: str, filename: str) -> Response:
     except ResourceNotFoundError:
         # Entry already removed
         pass
+    removed = remove_memberships([(filename, album_name)])
+
+    album_index = _album_index()
+    album_index.remove_record(album_name, filename)
+    if (media_record := MediaRecord.from_filename(new_entity["Created"], filename)) is not None:
+        album_index.add_record(NONE_ALBUM_NAME, media_record)
+    _update_catalog(removed={album_name: [filename]})
+    mark_changed(ALBUMS_SCOPE)
 
     invalidate_media_cache()
+    if (failure := _membership_failure(removed, f"Removed {filename=}, but")) is not None:
+        return failure
     return Response(status=204)
 
 
+@api_albums_controller.route("/<album_name>/bulk", methods=["DELETE"])
+def remove_many_from_album(album_name: str) -> Response:
+    """
+    Remove many files from an album, putting them back in the "none" album.
+    The JSON body names the files, e.g. ``{"filenames": ["a.jpg", "b.mp4"]}``.
+    Responds with HTTP 207 and the outcome for every file.
+
+    :param album_name: The name of the album to remove the files from.
+    """
+
+    if album_name == NONE_ALBUM_NAME:
+        return Response(f"{album_name=} is reserved and cannot be deleted from", status=403)
+    if not is_valid_album_name(album_name):
+        return Response(f"{album_name=} is not allowed due to length or charset restrictions", status=422)
+
+    filenames = bulk_filenames()
+    if isinstance(filenames, Response):
+        return filenames
+
+    results = _move_many(filenames, album_name, NONE_ALBUM_NAME, success_status=204)
+    invalidate_media_cache()
+
+    return multi_status(results)
+
+
+def _move_many(filenames: list[str], album_name: str, new_album_name: str, success_status: int) -> list[dict[str, str | int]]:
+    """
+    Helper for :func:`move_many_to_album` and :func:`remove_many_from_album`.
+    Looks the files up with a handful of queries and moves them with batched transactions.
+
+    :return: Outcome for every file
+    """
+
+    table_client: EntityStore = current_app.config["albums_table_client"]
+
+    entities = {
+        entity["RowKey"]: entity
+        for entity in get_entities(table_client, filenames, partition_key=album_name)
+    }
+    # The move overwrites files already in the new album, so they don't add to its count
+    already_moved = set[str]()
+    if new_album_name != NONE_ALBUM_NAME:
+        already_moved = {entity["RowKey"] for entity in get_entities(table_client, entities, partition_key=new_album_name)}
+
+    progress, stale = _move_entries(list(entities.values()), album_name, new_album_name)
+    failed = set(progress.failed_row_keys)
+
+    album_index = _album_index()
+    moved = list[tuple[str, datetime]]()
+    for filename, entity in entities.items():
+        if filename in failed:
+            continue
+        moved.append((filename, entity["Created"]))
+        album_index.remove_record(album_name, filename)
+        if (media_record := MediaRecord.from_filename(entity["Created"], filename)) is not None:
+            album_index.add_record(new_album_name, media_record)
+    if progress.completed:
+        _update_catalog(
+            {new_album_name: [(filename, date) for filename, date in moved if filename not in already_moved]},
+            {album_name: [filename for filename, _ in moved]},
+        )
+        mark_changed(ALBUMS_SCOPE)
+
+    results = list[dict[str, str | int]]()
+    for filename in filenames:
+        if filename not in entities:
+            results.append(item_result(filename, 404, f"{filename=} does not exist or is not in {album_name=}"))
+        elif filename in failed:
+            results.append(item_result(filename, 500, "; ".join(progress.errors)))
+        elif filename in stale:
+            results.append(item_result(filename, 500, f"Moved, but could not be removed from the membership index of {album_name=}"))
+        else:
+            results.append(item_result(filename, success_status))
+
+    return results
+
+
+@api_albums_controller.route("/containing/<filename>", methods=["GET"])
+def list_albums_containing(filename: str) -> list[str]:
+    """
+    List the albums a file is in. Files only in the "none" album are in no albums.
+
+    :param filename: The filename to look up
+    """
+
+    return sorted(album_name for album_name in albums_containing(filename) if album_name != NONE_ALBUM_NAME)
+
+
 @api_albums_controller.route("/thumbnail/<album_name>", methods=["GET"])
 def get_album_thumbnail(album_name: str) -> Response:
     """
@@ -351,61 +613,149 @@ def get_album_thumbnail(album_name: str) -> Response:
     if not is_valid_album_name(album_name):
         return Response(f"{album_name=} is not allowed due to length or charset restrictions", status=422)
 
-    table_client: TableClient = current_app.config["albums_table_client"]
+    response = redirect(album_cover_url(album_name))
+    response.headers["Cache-Control"] = "public, max-age=900"
 
-    query = "PartitionKey eq @album_name and RowKey ne ''"
-    parameters = {"album_name": album_name}
-    query_results = table_client.query_entities(
-        query_filter=query, parameters=parameters, results_per_page=1
-    )
+    return response  # type: ignore
 
-    if (result := next(query_results, None)) is None:
-        return redirect(DEFAULT_ALBUM_THUMBNAIL)  # type: ignore
 
-    thumbnail_filename = result["RowKey"]
-    # TODO: Instead if redirecting back to ourselves, should we invoke thumbnail directly?
-    response = redirect(
-        url_for("crud_controller.thumbnail", filename=thumbnail_filename)
-    )
-    response.headers["Cache-Control"] = "public, max-age=900"
+@cached(ttl=timedelta(minutes=10), max_size=2)
+def _catalog_at(stamp: str) -> dict[str, catalog.AlbumSummary]:
+    """
+    Album catalog by album name.
+    Keyed by the albums version stamp so any album change is a miss.
+    """
 
-    return response  # type: ignore
+    return {summary.name: summary for summary in catalog.album_summaries()}
+
+
+def album_cover_url(album_name: str) -> str:
+    """
+    URL of the thumbnail shown as an album's cover.
+
+    :param album_name: Album name
+    """
+
+    return album_cover_urls([album_name])[album_name]
+
+
+def album_cover_urls(album_names: Iterable[str]) -> dict[str, str]:
+    """
+    Same as :func:`album_cover_url` for many albums, from one read of the album catalog.
+    See :mod:`album_covers`.
+
+    :param album_names: Album names
+    :return: Cover URL by album name
+    """
+
+    version_stamps: VersionStamps = current_app.config["version_stamps"]
+    summaries = _catalog_at(version_stamps.current(ALBUMS_SCOPE))
+
+    covers = dict[str, str]()
+    for album_name in album_names:
+        summary = summaries.get(album_name)
+        cover = album_covers.cover_url(summary) if summary is not None else None
+        covers[album_name] = cover or DEFAULT_ALBUM_THUMBNAIL
+
+    return covers
 
 
 # Don't invalidate media cache. Caller will decide if they want to do that.
-def remove_from_all_albums(filename: str) -> set[str]:
+def remove_from_all_albums(filename: str) -> tuple[set[str], bool]:
     """
     Remove an entry from all albums.
     Most likely used when deleting an entry.
 
     :param filename: The filename of the entry to remove.
-    :return: The set of albums that were affected by the removal.
+    :return: The set of albums that were affected by the removal, and whether the membership index still lists any of them.
     """
 
-    table_client: TableClient = current_app.config["albums_table_client"]
+    table_client: EntityStore = current_app.config["albums_table_client"]
 
-    query = "RowKey eq @filename"
-    parameters = {"filename": filename}
-    entities = table_client.query_entities(query_filter=query, parameters=parameters)
+    album_names = albums_containing(filename)
+    if not album_names:
+        # Not in the membership index, e.g. uploaded before the index was built. Fall back to scanning every album.
+        query = "RowKey eq @filename"
+        parameters = {"filename": filename}
+        entities = table_client.query_entities(query_filter=query, parameters=parameters)
+        album_names = {entity["PartitionKey"] for entity in entities}
+
+    album_index = _album_index()
     albums_affected = set[str]()
-    for entity in entities:
+    for album_name in album_names:
         try:
-            table_client.delete_entity(entity)
-            albums_affected.add(entity["PartitionKey"])
+            table_client.delete_entity(partition_key=album_name, row_key=filename)
+            albums_affected.add(album_name)
         except ResourceNotFoundError:
             # Entry already deleted
             pass
+        album_index.remove_record(album_name, filename)
+    removed = remove_memberships([(filename, album_name) for album_name in album_names])
 
-    return albums_affected
+    if albums_affected:
+        _update_catalog(removed={album_name: [filename] for album_name in albums_affected})
+        mark_changed(ALBUMS_SCOPE)
+
+    return albums_affected, not removed.done
+
+
+# Don't invalidate media cache. Caller will decide if they want to do that.
+def remove_many_from_all_albums(filenames: list[str]) -> tuple[dict[str, set[str]], set[str]]:
+    """
+    Remove many entries from all albums.
+    Most likely used when deleting many entries.
+
+    :param filenames: The filenames of the entries to remove.
+    :return: The albums affected for each removed filename, and the filenames that could not be removed
+        from the albums or from the membership index.
+    """
+
+    table_client: EntityStore = current_app.config["albums_table_client"]
+
+    memberships = albums_containing_many(filenames)
+    entities: list[Mapping[str, Any]] = [
+        {"PartitionKey": album_name, "RowKey": filename}
+        for filename, album_names in memberships.items()
+        for album_name in album_names
+    ]
+    # Anything not in the membership index falls back to scanning every album
+    entities.extend(get_entities(table_client, [f for f in filenames if f not in memberships]))
+
+    progress = delete_all_entities(table_client, entities)
+    failed = set(progress.failed_row_keys)
+
+    album_index = _album_index()
+    albums_affected = dict[str, set[str]]()
+    for entity in entities:
+        filename = entity["RowKey"]
+        if filename in failed:
+            continue
+        albums_affected.setdefault(filename, set[str]()).add(entity["PartitionKey"])
+        album_index.remove_record(entity["PartitionKey"], filename)
+    removed = remove_memberships([
+        (filename, album_name)
+        for filename, album_names in albums_affected.items()
+        for album_name in album_names
+    ])
+
+    if albums_affected:
+        removed_by_album = dict[str, list[str]]()
+        for filename, album_names in albums_affected.items():
+            for album_name in album_names:
+                removed_by_album.setdefault(album_name, []).append(filename)
+        _update_catalog(removed=removed_by_album)
+        mark_changed(ALBUMS_SCOPE)
+
+    return albums_affected, failed | failed_filenames(removed)
 
 
-@refreshed(every=timedelta(seconds=30))
 def non_album_file_names() -> list[MediaRecord]:
     """
-    Get all entities not in an album
+    Get all entities not in an album.
+    Callers should go through :func:`media_cache.all_media`, which only calls this when the media version stamp changes.
     """
 
-    table_client: TableClient = current_app.config["albums_table_client"]
+    table_client: EntityStore = current_app.config["albums_table_client"]
 
     query = "PartitionKey eq @reserved_album_name and RowKey ne ''"
     parameters = {"reserved_album_name": NONE_ALBUM_NAME}
@@ -422,6 +772,124 @@ def non_album_file_names() -> list[MediaRecord]:
 
     return results
 
+def _move_entries(entities: list[TableEntity], album_name: str, new_album_name: str) -> tuple[BatchProgress, set[str]]:
+    """
+    Move entries between albums with batched transactions, keeping the membership index up to date.
+    Entries whose new membership can't be recorded are not moved, and count as failed.
+
+    :param entities: Entries to move. All must be in ``album_name``.
+    :param album_name: Album the entries are in
+    :param new_album_name: Album to move the entries to
+    :return: Outcome of the move, and the filenames that were moved but are still listed in ``album_name`` by the membership index
+    """
+
+    table_client: EntityStore = current_app.config["albums_table_client"]
+
+    added = add_memberships([(entity["RowKey"], new_album_name) for entity in entities])
+    unrecorded = failed_filenames(added)
+    progress = move_entities(table_client, [entity for entity in entities if entity["RowKey"] not in unrecorded], new_album_name)
+    progress.total += len(unrecorded)
+    progress.failed_batches += added.failed_batches
+    progress.failed_row_keys.extend(unrecorded)
+    progress.errors.extend(added.errors)
+
+    failed = set(progress.failed_row_keys)
+    removed = remove_memberships([(entity["RowKey"], album_name) for entity in entities if entity["RowKey"] not in failed])
+
+    return progress, failed_filenames(removed)
+
+
+def _finished(progress: BatchProgress, stale: set[str], album_name: str) -> Response:
+    """
+    Response to an album rename or delete that moved every entry, failing it if the membership index wasn't fully updated.
+
+    :param progress: Outcome of the move
+    :param stale: Filenames the membership index still lists in ``album_name``
+    :param album_name: Album the entries were moved out of
+    """
+
+    if stale:
+        progress.errors.append(f"Could not remove {sorted(stale)} from the membership index of {album_name=}")
+    response = jsonify(progress)
+    if stale:
+        response.status_code = 503
+    return response
+
+
+def _membership_failure(progress: BatchProgress, done: str = "Nothing was changed, since") -> Response | None:
+    """
+    Response failing a request whose change to the membership index didn't finish, or None if it did.
+
+    :param progress: Outcome of :func:`add_memberships` or :func:`remove_memberships`
+    :param done: What the request did anyway, starting the message
+    """
+
+    if progress.done:
+        return None
+    return Response(f"{done} the album membership index could not be updated: {'; '.join(progress.errors)}", status=503)
+
+
+def _update_catalog(
+    added: Mapping[str, Iterable[tuple[str, datetime]]] | None = None,
+    removed: Mapping[str, Iterable[str]] | None = None,
+) -> None:
+    """
+    Record files added to and removed from albums in the album catalog, after the albums table was changed.
+    The albums table is already changed by now, so a failure is logged rather than failing the request.
+    ``flask storage build-album-catalog`` corrects anything that drifts.
+
+    :param added: ``(filename, date)`` of each added file, by album name
+    :param removed: Filename of each removed file, by album name
+    """
+
+    added = added or {}
+    removed = removed or {}
+    for album_name in (added.keys() | removed.keys()) - {NONE_ALBUM_NAME}:
+        try:
+            catalog.record_changes(album_name, added.get(album_name, ()), removed.get(album_name, ()))
+        except Exception:
+            current_app.logger.exception(f"Failed to update the catalog entry of {album_name=}")
+        album_covers.schedule_mosaic(album_name)
+
+
+def _album_index() -> AlbumIndex:
+    """
+    Get the album index, dropping its contents first if another worker changed the albums table.
+    """
+
+    album_index: AlbumIndex = current_app.config["album_index"]
+    version_stamps: VersionStamps = current_app.config["version_stamps"]
+    album_index.sync(version_stamps.current(ALBUMS_SCOPE))
+    return album_index
+
+
+def album_exists(album_name: str) -> bool:
+    """
+    Check if an album exists, answering from the album index when possible.
+
+    :param album_name: Album name
+    :return: Whether the album exists
+    """
+
+    # None album entry doesn't have an empty row key. We can assume it always exists
+    if album_name == NONE_ALBUM_NAME:
+        return True
+
+    album_index = _album_index()
+    if (exists := album_index.exists(album_name)) is not None:
+        return exists
+
+    table_client: EntityStore = current_app.config["albums_table_client"]
+    try:
+        _ = table_client.get_entity(partition_key=album_name, row_key="")
+        exists = True
+    except ResourceNotFoundError:
+        exists = False
+
+    album_index.set_exists(album_name, exists)
+    return exists
+
+
 def is_valid_album_name(name: str) -> bool:
     """
     Check if an album name is valid.
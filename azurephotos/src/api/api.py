@@ -1,10 +1,18 @@
 from .crud_controller import crud_controller
 from .albums import api_albums_controller as albums_controller
 from .health import api_health_controller as health_controller
+from .local_storage import api_local_storage_controller as local_storage_controller
+from .media import api_media_controller as media_controller
+from .metrics import api_metrics_controller as metrics_controller
+from .uploads import api_uploads_controller as uploads_controller
 
 blueprints = {
     crud_controller,
     albums_controller,
     health_controller,
+    local_storage_controller,
+    media_controller,
+    metrics_controller,
+    uploads_controller,
 }
 BASE_URL = None
@@ -0,0 +1,50 @@
+"""
+Helpers for endpoints that act on many files in one request.
+"""
+
+from flask import Response, jsonify, request
+
+MAX_BULK_ITEMS = 1000
+"""
+Most files a single bulk request may name
+"""
+
+
+def bulk_filenames() -> list[str] | Response:
+    """
+    Read the ``filenames`` list from the JSON body of a bulk request.
+    Duplicates are dropped, keeping the first occurrence.
+
+    :return: The filenames, or an error response if the body is malformed
+    """
+
+    body = request.get_json(silent=True)
+    filenames = body.get("filenames") if isinstance(body, dict) else None
+    if not isinstance(filenames, list) or not all(isinstance(f, str) and f for f in filenames):
+        return Response("Body must be a JSON object with a 'filenames' list of strings", status=422)
+    if len(filenames) > MAX_BULK_ITEMS:
+        return Response(f"At most {MAX_BULK_ITEMS} files can be named in one request", status=413)
+
+    return list(dict.fromkeys(filenames))
+
+
+def item_result(filename: str, status_code: int, message: str = "") -> dict[str, str | int]:
+    """
+    Outcome of a bulk request for a single file.
+    """
+
+    return {
+        "filename": filename,
+        "status_code": status_code,
+        "message": message,
+    }
+
+
+def multi_status(results: list[dict[str, str | int]]) -> Response:
+    """
+    Respond with HTTP 207 and the outcome for every file.
+    """
+
+    response = jsonify(results)
+    response.status_code = 207
+    return response
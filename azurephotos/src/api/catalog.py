@@ -0,0 +1,314 @@
+"""
+Catalog of albums, with a summary of each album's contents.
+
+Stored in the ``catalog`` partition of the albums meta table, one entity per album with the album name as the row key,
+so listing albums is one small partition read instead of a scan of every partition of the albums table.
+The "none" album is not in the catalog.
+
+Writers change the albums table first and the catalog after.
+Catalog updates are conditional on the entity's ETag, so concurrent writers never overwrite each other's changes.
+Removing an album's newest or oldest file can't be applied incrementally, so that album is summarized again from the albums table,
+as is any album whose update lost a race, since the summary then already includes the other writer's change.
+Any change also marks the album's cover mosaic stale. See :mod:`album_covers`.
+"""
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from azure.data.tables import TableEntity, UpdateMode
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from flask import current_app
+from typing import Any, Iterable, Mapping
+from ..lib.storage.base import EntityStore
+
+CATALOG_PARTITION: str = "catalog"
+"""
+Partition of the meta table holding one summary entity per album
+"""
+
+MAX_UPDATE_ATTEMPTS = 8
+"""
+Times an update is tried before giving up on concurrent writers
+"""
+
+
+def _utc(date: datetime) -> datetime:
+    # Upload dates may come from clients without a time zone
+    return date if date.tzinfo is not None else date.replace(tzinfo=timezone.utc)
+
+
+@dataclass(frozen=True)
+class AlbumSummary:
+    """
+    What the catalog knows about one album.
+    """
+
+    name: str
+    created: datetime | None = None
+    count: int = 0
+    newest_file: str | None = None
+    """Newest file in the album, shown as its cover"""
+    newest: datetime | None = None
+    oldest_file: str | None = None
+    oldest: datetime | None = None
+    mosaic_version: str | None = None
+    """Version of the album's cover mosaic, or None if it has none"""
+    mosaic_stale: bool = False
+    """Whether the album changed since its cover mosaic was made"""
+
+    @property
+    def cover(self) -> str | None:
+        return self.newest_file
+
+    @classmethod
+    def from_entity(cls, entity: Mapping[str, Any]) -> "AlbumSummary":
+        return cls(
+            name=entity["RowKey"],
+            created=entity.get("Created"),
+            count=entity.get("Count", 0),
+            newest_file=entity.get("NewestFile"),
+            newest=entity.get("Newest"),
+            oldest_file=entity.get("OldestFile"),
+            oldest=entity.get("Oldest"),
+            mosaic_version=entity.get("MosaicVersion") or None,
+            mosaic_stale=entity.get("MosaicStale", False),
+        )
+
+    def to_entity(self) -> dict[str, Any]:
+        entity: dict[str, Any] = {
+            "PartitionKey": CATALOG_PARTITION,
+            "RowKey": self.name,
+            "Count": self.count,
+            "MosaicStale": self.mosaic_stale,
+        }
+        # Tables can't store nulls, so leave out whatever an empty album doesn't have
+        optional = {
+            "Created": self.created,
+            "NewestFile": self.newest_file,
+            "Newest": self.newest,
+            "OldestFile": self.oldest_file,
+            "Oldest": self.oldest,
+            "MosaicVersion": self.mosaic_version,
+        }
+        entity.update({key: value for key, value in optional.items() if value is not None})
+        return entity
+
+    def with_added(self, filename: str, date: datetime) -> "AlbumSummary":
+        """
+        Summary after a file is added to the album.
+        """
+
+        date = _utc(date)
+        summary = replace(self, count=self.count + 1, mosaic_stale=True)
+        if summary.newest is None or date > _utc(summary.newest):
+            summary = replace(summary, newest_file=filename, newest=date)
+        if summary.oldest is None or date < _utc(summary.oldest):
+            summary = replace(summary, oldest_file=filename, oldest=date)
+        return summary
+
+    def with_removed(self, filename: str) -> "AlbumSummary | None":
+        """
+        Summary after a file is removed from the album, or None if it was the newest or oldest file,
+        in which case the album must be summarized again.
+        """
+
+        if filename in (self.newest_file, self.oldest_file):
+            return None
+        return replace(self, count=max(self.count - 1, 0), mosaic_stale=True)
+
+
+def summarize(entities: Iterable[Mapping[str, Any]]) -> dict[str, AlbumSummary]:
+    """
+    Summarize albums from their entities in the albums table.
+
+    :param entities: Album entities, with at least their keys and ``Created``
+    :return: Summary by album name. Only albums with an album row (empty row key) are included.
+    """
+
+    summaries = dict[str, AlbumSummary]()
+    files = list[tuple[str, str, datetime]]()
+    for entity in entities:
+        album_name: str = entity["PartitionKey"]
+        if entity["RowKey"]:
+            files.append((album_name, entity["RowKey"], entity["Created"]))
+        else:
+            summaries[album_name] = AlbumSummary(album_name, created=entity.get("Created"))
+
+    for album_name, filename, date in files:
+        if (summary := summaries.get(album_name)) is not None:
+            summaries[album_name] = summary.with_added(filename, date)
+
+    return summaries
+
+
+def _resummarized(album_name: str, previous: AlbumSummary | None) -> AlbumSummary | None:
+    """
+    Summarize an album again, keeping its existing mosaic but marking it stale.
+    """
+
+    summary = _summarize_album(album_name)
+    if summary is None or previous is None:
+        return summary
+    return replace(summary, mosaic_version=previous.mosaic_version, mosaic_stale=True)
+
+
+def _summarize_album(album_name: str) -> AlbumSummary | None:
+    """
+    Summarize one album from the albums table, or None if it doesn't exist.
+    """
+
+    albums_table_client: EntityStore = current_app.config["albums_table_client"]
+    entities = albums_table_client.query_entities(
+        query_filter="PartitionKey eq @album_name",
+        parameters={"album_name": album_name},
+        select=["PartitionKey", "RowKey", "Created"],
+    )
+    return summarize(entities).get(album_name)
+
+
+def album_summaries() -> list[AlbumSummary]:
+    """
+    Get the summary of every album, sorted by name.
+    """
+
+    table_client: EntityStore = current_app.config["meta_table_client"]
+    entities = table_client.query_entities(
+        query_filter="PartitionKey eq @partition",
+        parameters={"partition": CATALOG_PARTITION},
+    )
+    return [AlbumSummary.from_entity(entity) for entity in entities]
+
+
+def get_album(album_name: str) -> tuple[AlbumSummary, str] | None:
+    """
+    Get the summary of one album and its ETag, or None if the album isn't in the catalog.
+    """
+
+    table_client: EntityStore = current_app.config["meta_table_client"]
+    try:
+        entity = table_client.get_entity(CATALOG_PARTITION, album_name)
+    except ResourceNotFoundError:
+        return None
+    return AlbumSummary.from_entity(entity), entity.metadata["etag"]
+
+
+def set_mosaic(album_name: str, mosaic_version: str | None, etag: str) -> bool:
+    """
+    Record a freshly made cover mosaic, unless the album changed since the mosaic was started.
+
+    :param album_name: Album the mosaic is for
+    :param mosaic_version: Version of the new mosaic, or None if the album is empty
+    :param etag: ETag of the summary the mosaic was made from
+    :return: Whether it was recorded
+    """
+
+    table_client: EntityStore = current_app.config["meta_table_client"]
+    try:
+        _ = table_client.update_entity(
+            {
+                "PartitionKey": CATALOG_PARTITION,
+                "RowKey": album_name,
+                # Tables can't remove a property with a merge, so an empty version means none
+                "MosaicVersion": mosaic_version or "",
+                "MosaicStale": False,
+            },
+            mode=UpdateMode.MERGE,
+            etag=etag,
+            match_condition=MatchConditions.IfNotModified,
+        )
+    except (ResourceModifiedError, ResourceNotFoundError):
+        return False
+    return True
+
+
+def add_album(album_name: str, created: datetime) -> None:
+    """
+    Record a new, empty album.
+    """
+
+    table_client: EntityStore = current_app.config["meta_table_client"]
+    try:
+        _ = table_client.create_entity(AlbumSummary(album_name, created=created).to_entity())
+    except ResourceExistsError:
+        # Left over from an interrupted delete. Its contents are the album's contents now.
+        refresh_albums([album_name])
+
+
+def remove_album(album_name: str) -> None:
+    """
+    Forget an album.
+    """
+
+    table_client: EntityStore = current_app.config["meta_table_client"]
+    try:
+        table_client.delete_entity(CATALOG_PARTITION, album_name)
+    except ResourceNotFoundError:
+        pass
+
+
+def refresh_albums(album_names: Iterable[str]) -> None:
+    """
+    Summarize albums again from the albums table, e.g. after an interrupted rename left entries in both albums.
+    Albums that no longer exist are removed from the catalog.
+    """
+
+    table_client: EntityStore = current_app.config["meta_table_client"]
+    for album_name in album_names:
+        previous = get_album(album_name)
+        summary = _resummarized(album_name, previous[0] if previous is not None else None)
+        if summary is None:
+            remove_album(album_name)
+        else:
+            _ = table_client.upsert_entity(summary.to_entity(), mode=UpdateMode.REPLACE)
+
+
+def record_changes(album_name: str, added: Iterable[tuple[str, datetime]] = (), removed: Iterable[str] = ()) -> None:
+    """
+    Record files added to and removed from an album, after the albums table was changed.
+
+    :param album_name: Album that changed
+    :param added: ``(filename, date)`` of each file added to the album
+    :param removed: Filename of each file removed from the album
+    :raises ResourceModifiedError: If other writers kept winning the race to update the album
+    """
+
+    added = list(added)
+    removed = list(removed)
+    if not added and not removed:
+        return
+
+    table_client: EntityStore = current_app.config["meta_table_client"]
+    for attempt in range(MAX_UPDATE_ATTEMPTS):
+        try:
+            entity: TableEntity = table_client.get_entity(CATALOG_PARTITION, album_name)
+        except ResourceNotFoundError:
+            # Album was deleted in the meantime
+            return
+
+        summary: AlbumSummary | None = AlbumSummary.from_entity(entity)
+        # After losing a race, the albums table already reflects the other writer, so only a fresh summary is right
+        if attempt == 0:
+            for filename in removed:
+                summary = summary.with_removed(filename) if summary is not None else None
+            for filename, date in added:
+                summary = summary.with_added(filename, date) if summary is not None else None
+        else:
+            summary = None
+        if summary is None:
+            summary = _resummarized(album_name, AlbumSummary.from_entity(entity))
+            if summary is None:
+                remove_album(album_name)
+                return
+
+        try:
+            _ = table_client.update_entity(
+                summary.to_entity(),
+                mode=UpdateMode.REPLACE,
+                etag=entity.metadata["etag"],
+                match_condition=MatchConditions.IfNotModified,
+            )
+            return
+        except (ResourceModifiedError, ResourceNotFoundError):
+            continue
+
+    raise ResourceModifiedError(f"Gave up updating the catalog entry of {album_name=} after {MAX_UPDATE_ATTEMPTS} attempts")
@@ -3,24 +3,31 @@ Generic API endpoints for handling any media.
 Will delegate to the proper controller per media.
 """
 
+import contextvars
 from azure.core.exceptions import ResourceExistsError
-from datetime import datetime
-from flask import Blueprint, redirect, current_app, request, jsonify
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from flask import Blueprint, redirect, current_app, request
 from werkzeug.wrappers.response import Response
 from werkzeug.datastructures.file_storage import FileStorage
 
 import src.api.photos as photos
 import src.api.videos as videos
 from .media_cache import invalidate_media_cache
+from .media_urls import thumbnail_url, preview_srcset, THUMBNAIL_FAILED_PLACEHOLDER, THUMBNAIL_PENDING_PLACEHOLDER
+from .thumbnail_proxy import serve_thumbnail, discard_thumbnails
 
-from ..lib.storage_helper import get_container_sas
+from ..lib.storage_helper import signing_window, SAS_WINDOW
+from ..lib.thumbnail_queue import discard_jobs, failed_thumbnails, pending_thumbnails
 from ..lib.models.media import MediaType
 
 from .albums import (
     remove_from_all_albums,
+    remove_many_from_all_albums,
     upload_to_album as upload_directly_to_album,
     NONE_ALBUM_NAME
 )
+from .bulk import bulk_filenames, item_result, multi_status
 
 crud_controller = Blueprint(
     "crud_controller",
@@ -30,32 +37,37 @@ crud_controller = Blueprint(
     url_prefix="/",
 )
 
+# Let templates link straight to blob storage
+crud_controller.add_app_template_global(thumbnail_url)
+crud_controller.add_app_template_global(preview_srcset)
+
 
 @crud_controller.route("/thumbnail/<filename>", methods=["GET"])
 def thumbnail(filename: str) -> Response:
     """
     Get the thumbnail for a photo or video.
+    Redirects to blob storage, or serves it from the local disk cache when the thumbnail proxy is enabled.
 
     :param filename: The name of the file
     """
 
-    media_type = MediaType.from_file_extension(filename)
-    match media_type:
-        case MediaType.PHOTO:
-            pass
-        case MediaType.VIDEO:
-            filename += ".webp"
-        case _:
-            return Response(f"Unrecognized {media_type=} for {filename=}", status=404)
+    if MediaType.from_file_extension(filename) is None:
+        return Response(f"Unrecognized media type for {filename=}", status=404)
 
-    blob_account_url: str = current_app.config["blob_account_url"]
-    thumbnails_container_name: str = "thumbnails"
+    url = thumbnail_url(filename)
+    placeholder = url in (THUMBNAIL_PENDING_PLACEHOLDER, THUMBNAIL_FAILED_PLACEHOLDER)
+    if not placeholder and current_app.config["THUMBNAIL_PROXY_ENABLED"]:
+        return serve_thumbnail(filename, request.args.get("v"))
 
-    thumbnails_container_sas: str = get_container_sas(thumbnails_container_name)
-    response = redirect(
-        f"{blob_account_url}/{thumbnails_container_name}/{filename}?{thumbnails_container_sas}"
-    )
-    response.headers["Cache-Control"] = "public, max-age=900"
+    response = redirect(url)
+    if placeholder:
+        # Thumbnail hasn't been generated yet, or may be regenerated. Don't let the browser cache the placeholder.
+        response.headers["Cache-Control"] = "no-store"
+    else:
+        # The URL changes with the next signing window
+        window_end = signing_window() + SAS_WINDOW
+        max_age = int((window_end - datetime.now(timezone.utc)).total_seconds())
+        response.headers["Cache-Control"] = f"public, max-age={max_age}"
 
     return response
 
@@ -78,6 +90,33 @@ def fullsize(filename: str) -> Response:
             return Response(f"Unrecognized media type for {filename=}", status=404)
 
 
+@crud_controller.route("/preview/<filename>", methods=["GET"])
+def preview(filename: str) -> Response:
+    """
+    Get a photo scaled down for display. Videos and photos still waiting on their thumbnail get the full size file.
+
+    Query parameters:
+    - ``w``: Width the photo will be displayed at, in pixels. Defaults to the largest preview.
+
+    :param filename: The name of the file
+    """
+
+    try:
+        width = int(request.args.get("w", 0))
+    except ValueError:
+        return Response("'w' must be an integer", status=400)
+
+    media_type = MediaType.from_file_extension(filename)
+    if media_type is None:
+        return Response(f"Unrecognized media type for {filename=}", status=404)
+    if media_type == MediaType.VIDEO or filename in pending_thumbnails() or filename in failed_thumbnails():
+        return fullsize(filename)
+
+    response = photos.preview(filename, width)
+    response.headers["Cache-Control"] = "public, max-age=900"
+    return response
+
+
 @crud_controller.route("/upload", methods=["POST"])
 def upload() -> Response:
     """
@@ -129,6 +168,8 @@ def _upload_to_album(album_name: str) -> Response:
     Helper for :func:`upload` and :func:`upload_to_album`.
     Skips any checks for reserved album names since those are already handled in the calling functions.
     Clients should not call this function directly, but rather use :func:`upload` or :func:`upload_to_album`.
+    Files are uploaded concurrently, at most ``UPLOAD_CONCURRENCY`` at a time.
+    Responds with HTTP 207 and the outcome for every file.
     """
     
     files = request.files.getlist("upload")
@@ -141,30 +182,32 @@ def _upload_to_album(album_name: str) -> Response:
     if len(files) != len(dates_taken):
         raise ValueError("Number of uploaded files and number of dates do not match")
 
-    # TODO: Consider also tracking successes and then giving back a 207 that the frontend could use to show which files failed and which succeeded.
-    upload_failures = list[dict[str, str | int]]()
-    for file, date_string in zip(files, dates_taken):
+    def upload_one(file: FileStorage, date_string: str) -> dict[str, str | int]:
+        filename = file.filename or "<unknown>"
         try:
             upload_result = _upload(file, date_string, album_name)
-            if upload_result.status_code >= 400:
-                upload_failures.append({
-                    "filename": file.filename or "<unknown>",
-                    "status_code": upload_result.status_code,
-                    "message": upload_result.get_data(as_text=True)
-                })
         except ResourceExistsError as e:
-            upload_failures.append({
-                "filename": file.filename or "<unknown>",
-                "status_code": 409,
-                "message": str(e)
-            })
-
-    if upload_failures:
-        response = jsonify(upload_failures)
-        response.status_code = 400
-        return response
-
-    return Response(status=201)
+            return item_result(filename, 409, str(e))
+        except ValueError as e:
+            return item_result(filename, 422, str(e))
+        except Exception as e:
+            return item_result(filename, 500, str(e))
+
+        if upload_result.status_code >= 400:
+            return item_result(filename, upload_result.status_code, upload_result.get_data(as_text=True))
+        return item_result(filename, 201, upload_result.get_data(as_text=True))
+
+    # Each file runs in a copy of this request's context, so current_app works in the threads
+    # and album changes are still collected into one version bump when the request ends.
+    concurrency: int = current_app.config["UPLOAD_CONCURRENCY"]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(files))) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, upload_one, file, date_string)
+            for file, date_string in zip(files, dates_taken)
+        ]
+        results = [future.result() for future in futures]
+
+    return multi_status(results)
 
 @crud_controller.route("/delete/<filename>", methods=["DELETE"])
 def delete(filename: str) -> Response:
@@ -187,9 +230,72 @@ def delete(filename: str) -> Response:
         case _:
             raise ValueError(f"Unrecognized media type for {filename=}")
 
-    albums_affected = remove_from_all_albums(filename)
+    discard_thumbnails([filename])
+    if not (jobs := discard_jobs([filename])).done:
+        current_app.logger.error(f"Could not remove thumbnail jobs of {filename=}: {jobs.errors}")
+
+    albums_affected, stale = remove_from_all_albums(filename)
     if NONE_ALBUM_NAME in albums_affected:
         invalidate_media_cache()
+    if stale:
+        return Response("Deleted, but could not be removed from the album membership index", status=500)
 
     # Client JS code should remove image from view
     return Response(status=204)
+
+
+@crud_controller.route("/delete", methods=["POST"])
+def delete_many() -> Response:
+    """
+    Delete many entries from the storage account.
+    Blobs are removed with batch requests and album entries with batched transactions.
+    The JSON body names the files, e.g. ``{"filenames": ["a.jpg", "b.mp4"]}``.
+    Responds with HTTP 207 and the outcome for every file.
+    """
+
+    filenames = bulk_filenames()
+    if isinstance(filenames, Response):
+        return filenames
+
+    photo_filenames = list[str]()
+    video_filenames = list[str]()
+    errors = dict[str, str]()
+    for filename in filenames:
+        match MediaType.from_file_extension(filename):
+            case MediaType.PHOTO:
+                photo_filenames.append(filename)
+            case MediaType.VIDEO:
+                video_filenames.append(filename)
+            case _:
+                errors[filename] = f"Unrecognized media type for {filename=}"
+
+    # Delete the main files + thumbnails
+    for filename, error in [
+        *photos.delete_fullsizes(photo_filenames).items(),
+        *photos.delete_thumbnails(photo_filenames).items(),
+        *videos.delete_fullsizes(video_filenames).items(),
+        *videos.delete_thumbnails(video_filenames).items(),
+    ]:
+        errors.setdefault(filename, error)
+
+    discard_thumbnails(filename for filename in filenames if filename not in errors)
+    if not (jobs := discard_jobs(filename for filename in filenames if filename not in errors)).done:
+        current_app.logger.error(f"Could not remove thumbnail jobs of {jobs.failed_row_keys}: {jobs.errors}")
+
+    # Keep album entries for anything that couldn't be deleted so it stays visible and can be retried
+    albums_affected, album_failures = remove_many_from_all_albums(
+        [filename for filename in filenames if filename not in errors]
+    )
+    if any(NONE_ALBUM_NAME in albums for albums in albums_affected.values()):
+        invalidate_media_cache()
+
+    results = list[dict[str, str | int]]()
+    for filename in filenames:
+        if filename in errors:
+            results.append(item_result(filename, 500 if MediaType.from_file_extension(filename) else 422, errors[filename]))
+        elif filename in album_failures:
+            results.append(item_result(filename, 500, "Deleted, but could not be removed from its albums"))
+        else:
+            results.append(item_result(filename, 204))
+
+    return multi_status(results)
@@ -1,12 +1,32 @@
 """
 API endpoints for managing health
 
+Dependencies are checked by a background prober, so none of these endpoints talk to storage themselves.
+
 :author: William Boyles
 """
 
+from datetime import timedelta
 from flask import Blueprint, Response, current_app
-from azure.data.tables import TableClient
-from azure.storage.blob import ContainerClient
+from typing import Any, Callable
+
+from ..lib.health_prober import HealthProber
+from ..lib.storage.base import BlobStore, EntityStore
+
+PROBE_INTERVAL = timedelta(seconds=15)
+"""
+Time between rounds of dependency checks
+"""
+
+PROBE_TIMEOUT = timedelta(seconds=5)
+"""
+How long a dependency may take to answer before it counts as unhealthy
+"""
+
+READY_MAX_AGE = 3 * PROBE_INTERVAL
+"""
+Oldest a passing check may be for the app to count as ready
+"""
 
 api_health_controller = Blueprint(
     "api_health_controller",
@@ -17,27 +37,78 @@ api_health_controller = Blueprint(
 )
 
 
-@api_health_controller.route("/", methods=["GET"])
-def health() -> Response:
-    """
-    If the app is running fine and can talk to storage, respond with HTTP 200.
-    """
-
-    container_clients: list[ContainerClient] = [current_app.config[k] for k in [
-        "photos_container_client",
-        "videos_container_client",
-        "thumbnails_container_client"
-    ]]
-    table_clients: list[TableClient] = [current_app.config[k] for k in [
-        "albums_table_client"
-    ]]
-
-    try:
-        for container_client in container_clients:
-            _ = container_client.get_container_properties(timeout=5)
-        for table_client in table_clients:
-            _ = next(table_client.list_entities(results_per_page=1), None)
-        
+def dependency_checks(config: dict[str, Any]) -> dict[str, Callable[[], None]]:
+    """
+    Check for every storage dependency, by name.
+
+    :param config: App config holding the storage clients
+    """
+
+    def container_check(container_client: BlobStore) -> Callable[[], None]:
+        return lambda: container_client.get_container_properties(timeout=int(PROBE_TIMEOUT.total_seconds()))
+
+    def table_check(table_client: EntityStore) -> Callable[[], None]:
+        return lambda: next(table_client.list_entities(results_per_page=1), None)
+
+    checks = dict[str, Callable[[], None]]()
+    for name in ["photos", "videos", "thumbnails"]:
+        checks[f"blob:{name}"] = container_check(config[f"{name}_container_client"])
+    for name in ["albums", "meta"]:
+        client: EntityStore = config[f"{name}_table_client"]
+        checks[f"table:{client.table_name}"] = table_check(client)
+
+    return checks
+
+
+def _prober() -> HealthProber:
+    prober: HealthProber = current_app.config["health_prober"]
+    return prober
+
+
+@api_health_controller.route("/live", methods=["GET"])
+def live() -> Response:
+    """
+    Respond with HTTP 200 as long as the app can serve requests at all. Never touches storage.
+    """
+
+    return Response("ok", status=200, content_type="text/plain")
+
+
+@api_health_controller.route("/ready", methods=["GET"])
+def ready() -> Response:
+    """
+    Respond with HTTP 200 if every dependency passed its last background check, or 503 if not.
+    """
+
+    prober = _prober()
+    # The first probe of a new worker waits for the first round of checks rather than failing
+    _ = prober.statuses(wait=PROBE_TIMEOUT)
+    if prober.is_ready(READY_MAX_AGE):
         return Response("ok", status=200, content_type="text/plain")
-    except Exception as e:
-        return Response(str(e), status=503, content_type="text/plain")
+    return Response("not ready", status=503, content_type="text/plain")
+
+
+@api_health_controller.route("/", methods=["GET"])
+def health() -> tuple[dict[str, Any], int]:
+    """
+    Status of every dependency from its last background check, with its latency and error.
+    Responds with HTTP 200 if the app is ready, or 503 if not.
+    """
+
+    prober = _prober()
+    statuses = prober.statuses(wait=PROBE_TIMEOUT)
+    is_ready = prober.is_ready(READY_MAX_AGE)
+
+    body = {
+        "ready": is_ready,
+        "dependencies": {
+            status.name: {
+                "healthy": status.healthy,
+                "latencyMs": round(status.latency * 1000, 1) if status.latency is not None else None,
+                "error": status.error,
+                "checkedAt": status.checked_at.isoformat(),
+            }
+            for status in statuses
+        },
+    }
+    return body, 200 if is_ready else 503
@@ -0,0 +1,49 @@
+"""
+API endpoint serving blobs kept on local disk, which is where their :func:`storage_helper.blob_url` points.
+
+:author: William Boyles
+"""
+
+from azure.core.exceptions import ResourceNotFoundError
+from flask import Blueprint, Response, current_app, send_file
+
+from ..lib.storage.local import LocalBlobStorage
+
+api_local_storage_controller = Blueprint(
+    "api_local_storage_controller",
+    __name__,
+    template_folder="templates",
+    static_folder="static",
+    url_prefix="/api/storage",
+)
+
+
+@api_local_storage_controller.route("/<container_name>/<path:blob_name>", methods=["GET"])
+def blob(container_name: str, blob_name: str) -> Response:
+    """
+    Respond with a blob, answering conditional and range requests.
+    Responds with HTTP 404 if the blob doesn't exist, e.g. because its container isn't kept locally.
+
+    :param container_name: Container holding the blob
+    :param blob_name: Name of the blob
+    """
+
+    local_blob_storage: LocalBlobStorage | None = current_app.config["local_blob_storage"]
+    if local_blob_storage is None:
+        return Response("No blobs are kept locally", status=404)
+
+    try:
+        blob_file, properties = local_blob_storage.open(container_name, blob_name)
+    except ResourceNotFoundError:
+        return Response(f"No blob {blob_name} in {container_name}", status=404)
+
+    response = send_file(
+        blob_file,
+        mimetype=properties.content_settings.content_type or "application/octet-stream",
+        etag=properties.etag.strip('"'),
+        last_modified=properties.last_modified,
+        conditional=True,
+    )
+    if properties.content_settings.cache_control:
+        response.headers["Cache-Control"] = properties.content_settings.cache_control
+    return response
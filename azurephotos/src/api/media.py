@@ -0,0 +1,37 @@
+"""
+API endpoints for paging through media that is not in an album.
+"""
+
+from flask import Blueprint, Response, request
+from typing import Any
+
+from .media_cache import all_media
+from .media_urls import media_item
+from ..lib.pagination import page_after, parse_page_size
+
+api_media_controller = Blueprint(
+    "api_media_controller",
+    __name__,
+    template_folder="templates",
+    static_folder="static",
+    url_prefix="/api/media",
+)
+
+
+@api_media_controller.route("/", methods=["GET"])
+def list_media() -> Response | dict[str, Any]:
+    """
+    List one page of files not in an album, sorted by last modified time.
+
+    Query parameters:
+    - ``cursor``: Opaque cursor from the previous page. Omit for the first page.
+    - ``limit``: Max number of items in the page.
+    """
+
+    try:
+        limit = parse_page_size(request.args.get("limit"))
+        media, next_cursor = page_after(all_media(), request.args.get("cursor"), limit)
+    except ValueError as e:
+        return Response(str(e), status=400)
+
+    return {"items": [media_item(record) for record in media], "next": next_cursor}
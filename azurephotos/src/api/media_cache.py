@@ -1,23 +1,41 @@
+from datetime import timedelta
+from flask import current_app
 from typing import Sequence
 
 from ..lib.models.media import MediaRecord
+from ..lib.refresher import cached
+from ..lib.versioning import VersionStamps, MEDIA_SCOPE, mark_changed
 
-media_cache: Sequence[MediaRecord] | None = None
+MEDIA_CACHE_MAX_AGE = timedelta(minutes=10)
 """
-All existing photos and videos not in an album, sorted by last modified time
+Rebuild the cache at least this often, even if the version stamp never changes.
+Covers changes made to the table outside of this app.
 """
 
-def all_media() -> Sequence[MediaRecord]:
+
+@cached(ttl=MEDIA_CACHE_MAX_AGE, refresh_after=MEDIA_CACHE_MAX_AGE * 0.8, max_size=2)
+def _media_at(stamp: str) -> Sequence[MediaRecord]:
+    """
+    All existing photos and videos not in an album, sorted by last modified time, as of a version stamp.
+    Keyed by the stamp so a change anywhere is a miss here, and concurrent misses share one table scan.
+    """
+
     from .albums import non_album_file_names
-    global media_cache
 
-    if media_cache is not None:
-        return media_cache
-    
+    return sorted(non_album_file_names(), reverse=True)
+
+
+def all_media() -> Sequence[MediaRecord]:
+    version_stamps: VersionStamps = current_app.config["version_stamps"]
+
+    # Stamp is read before the table, so a change racing with a rebuild causes another rebuild rather than being lost
+    return _media_at(version_stamps.current(MEDIA_SCOPE))
 
-    media_cache = sorted(non_album_file_names(), reverse=True)
-    return media_cache
 
 def invalidate_media_cache() -> None:
-    global media_cache
-    media_cache = None
+    """
+    Drop this worker's cache and tell every other worker to drop theirs.
+    """
+
+    _media_at.clear()
+    mark_changed(MEDIA_SCOPE)
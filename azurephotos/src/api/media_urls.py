@@ -0,0 +1,97 @@
+"""
+Signed URLs for thumbnails and previews, so pages can point straight at blob storage instead of at a redirect through this app.
+All URLs are stable within a signing window. See :obj:`storage_helper.SAS_WINDOW`.
+"""
+
+import hashlib
+from flask import current_app, url_for
+from typing import Any
+
+from .photos import preview_name
+from ..lib.models.media import MediaRecord, MediaType
+from ..lib.storage_helper import blob_url
+from ..lib.thumbnail_queue import failed_thumbnails, pending_thumbnails
+
+THUMBNAIL_PENDING_PLACEHOLDER: str = "/static/thumbnail_pending.svg"
+
+THUMBNAIL_FAILED_PLACEHOLDER: str = "/static/thumbnail_failed.svg"
+
+
+def thumbnail_blob_name(filename: str) -> str | None:
+    """
+    Name of the blob in the thumbnails container holding the thumbnail for a photo or video.
+
+    :param filename: The name of the file
+    :return: The blob name, or None if the file is neither a photo nor a video
+    """
+
+    match MediaType.from_file_extension(filename):
+        case MediaType.PHOTO:
+            return filename
+        case MediaType.VIDEO:
+            return f"{filename}.webp"
+        case _:
+            return None
+
+
+def thumbnail_version(etag: str) -> str:
+    """
+    Version of a thumbnail for its URL and ETag, derived from its blob's ETag so it changes whenever the thumbnail does.
+
+    :param etag: ETag of the thumbnail blob
+    """
+
+    return hashlib.sha256(etag.encode()).hexdigest()[:16]
+
+
+def thumbnail_url(filename: str) -> str:
+    """
+    URL of the thumbnail for a photo or video, or of a placeholder if it hasn't been generated yet or failed to generate.
+    When the thumbnail proxy is enabled, this is a URL served by this app, versioned by the thumbnail's contents once it is in the disk cache.
+    Until then the URL is unversioned, which browsers revalidate, and the first request caches it.
+    Otherwise it is a signed blob URL.
+
+    :param filename: The name of the file
+    """
+
+    blob_name = thumbnail_blob_name(filename)
+    if blob_name is None or filename in pending_thumbnails():
+        return THUMBNAIL_PENDING_PLACEHOLDER
+    if filename in failed_thumbnails():
+        return THUMBNAIL_FAILED_PLACEHOLDER
+
+    if current_app.config["THUMBNAIL_PROXY_ENABLED"]:
+        # Versioned so browsers can cache it forever, but still see regenerated and replaced thumbnails
+        from .thumbnail_proxy import cached_version
+
+        return url_for("crud_controller.thumbnail", filename=filename, v=cached_version(blob_name))
+
+    return blob_url("thumbnails", blob_name)
+
+
+def preview_srcset(filename: str) -> str:
+    """
+    ``srcset`` of the previews of a photo. Empty for videos and photos whose previews haven't been generated yet or failed to generate.
+
+    :param filename: The name of the file
+    """
+
+    if MediaType.from_file_extension(filename) != MediaType.PHOTO or filename in pending_thumbnails() or filename in failed_thumbnails():
+        return ""
+
+    preview_widths: tuple[int, ...] = current_app.config["PREVIEW_WIDTHS"]
+    return ", ".join(f"{blob_url('thumbnails', preview_name(filename, width))} {width}w" for width in preview_widths)
+
+
+def media_item(record: MediaRecord) -> dict[str, Any]:
+    """
+    A file as listed by the paging APIs, with everything needed to render its card.
+    """
+
+    return {
+        "filename": record.filename,
+        "last_modified": record.last_modified,
+        "type": record.type,
+        "thumbnail": thumbnail_url(record.filename),
+        "srcset": preview_srcset(record.filename),
+    }
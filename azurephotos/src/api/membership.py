@@ -0,0 +1,144 @@
+"""
+Reverse index from filename to the albums holding it.
+
+Stored in its own table so "which albums is this file in" is a single-partition read
+instead of a scan of every partition of the albums table.
+Files are spread over :obj:`BUCKET_COUNT` partitions by a hash of their name, so that writes for many files can still be batched.
+The row key is ``<filename>:<album name>``. Filenames never contain ``:`` since they go through :func:`secure_filename`.
+
+Writers add a membership before writing the album entry and remove it after deleting the album entry,
+so the index may briefly list an album a file was just removed from, but never misses one it is in.
+A writer that can't add a membership fails without writing the album entry,
+and one that can't remove a membership reports it, so the stale entry can be cleaned up by removing the file again.
+"""
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from typing import Any, Iterable
+
+from ..lib.storage.base import EntityStore
+from ..lib.table_batch import (
+    BatchProgress,
+    chunked,
+    upsert_all_entities,
+    delete_all_entities,
+    DEFAULT_MAX_WORKERS,
+    MAX_FILTER_COMPARISONS,
+)
+
+BUCKET_COUNT = 16
+"""
+Number of partitions memberships are spread over
+"""
+
+SEPARATOR = ":"
+"""
+Separates the filename from the album name in a row key
+"""
+
+
+def _bucket(filename: str) -> str:
+    digest = hashlib.sha1(filename.encode()).digest()
+    return f"{digest[0] % BUCKET_COUNT:02x}"
+
+
+def membership_entity(filename: str, album_name: str) -> dict[str, Any]:
+    """
+    Create the entity recording that a file is in an album.
+    """
+
+    return {
+        "PartitionKey": _bucket(filename),
+        "RowKey": f"{filename}{SEPARATOR}{album_name}",
+        "Filename": filename,
+        "Album": album_name,
+    }
+
+
+def add_memberships(memberships: Iterable[tuple[str, str]]) -> BatchProgress:
+    """
+    Record that files are in albums.
+
+    :param memberships: ``(filename, album name)`` pairs
+    """
+
+    table_client: EntityStore = current_app.config["membership_table_client"]
+    return upsert_all_entities(table_client, [membership_entity(f, a) for f, a in memberships])
+
+
+def remove_memberships(memberships: Iterable[tuple[str, str]]) -> BatchProgress:
+    """
+    Record that files are no longer in albums.
+
+    :param memberships: ``(filename, album name)`` pairs
+    """
+
+    table_client: EntityStore = current_app.config["membership_table_client"]
+    return delete_all_entities(table_client, [membership_entity(f, a) for f, a in memberships])
+
+
+def failed_filenames(progress: BatchProgress) -> set[str]:
+    """
+    Get the files whose memberships an :func:`add_memberships` or :func:`remove_memberships` call failed to write.
+    """
+
+    return {row_key.split(SEPARATOR, 1)[0] for row_key in progress.failed_row_keys}
+
+
+def albums_containing(filename: str) -> set[str]:
+    """
+    Get every album, including the "none" album, that holds a file.
+
+    :param filename: Filename to look up
+    """
+
+    return albums_containing_many([filename]).get(filename, set[str]())
+
+
+def albums_containing_many(filenames: Iterable[str], max_workers: int = DEFAULT_MAX_WORKERS) -> dict[str, set[str]]:
+    """
+    Get every album, including the "none" album, that holds each of many files.
+
+    :param filenames: Filenames to look up
+    :return: Albums for each filename. Filenames in no album are left out.
+    """
+
+    table_client: EntityStore = current_app.config["membership_table_client"]
+
+    buckets = dict[str, list[str]]()
+    for filename in dict.fromkeys(filenames):
+        buckets.setdefault(_bucket(filename), []).append(filename)
+
+    # Each filename is a row key range of two comparisons, plus one for the partition key
+    ranges_per_query = (MAX_FILTER_COMPARISONS - 1) // 2
+    queries = [
+        (bucket, chunk)
+        for bucket, bucket_filenames in buckets.items()
+        for chunk in chunked(bucket_filenames, ranges_per_query)
+    ]
+
+    def query_chunk(query: tuple[str, list[str]]) -> list[tuple[str, str]]:
+        bucket, chunk = query
+        parameters: dict[str, Any] = {"bucket": bucket}
+        ranges = list[str]()
+        for i, filename in enumerate(chunk):
+            # ';' sorts right after ':', so this covers exactly the row keys starting with '<filename>:'
+            parameters[f"start{i}"] = f"{filename}{SEPARATOR}"
+            parameters[f"end{i}"] = f"{filename};"
+            ranges.append(f"(RowKey ge @start{i} and RowKey lt @end{i})")
+
+        query_filter = f"PartitionKey eq @bucket and ({' or '.join(ranges)})"
+        entities = table_client.query_entities(query_filter=query_filter, parameters=parameters)
+        return [(entity["Filename"], entity["Album"]) for entity in entities]
+
+    albums = dict[str, set[str]]()
+    if not queries:
+        return albums
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as executor:
+        for memberships in executor.map(query_chunk, queries):
+            for filename, album_name in memberships:
+                albums.setdefault(filename, set[str]()).add(album_name)
+
+    return albums
@@ -0,0 +1,57 @@
+"""
+API endpoint exposing metrics to Prometheus, and the timing of every request.
+
+:author: William Boyles
+"""
+
+import time
+from flask import Blueprint, Response, g, request
+
+from ..lib import metrics
+
+api_metrics_controller = Blueprint(
+    "api_metrics_controller",
+    __name__,
+    template_folder="templates",
+    static_folder="static",
+    url_prefix="/api/metrics",
+)
+
+
+@api_metrics_controller.before_app_request
+def start_request_timer() -> None:
+    g.request_started = time.perf_counter()
+
+
+@api_metrics_controller.after_app_request
+def record_status(response: Response) -> Response:
+    g.response_status = response.status_code
+    return response
+
+
+@api_metrics_controller.teardown_app_request
+def record_request(_: BaseException | None = None) -> None:
+    """
+    Time the request by route, once its body is sent. Streamed pages are timed until their last chunk.
+    """
+
+    started: float | None = g.pop("request_started", None)
+    if started is None:
+        return
+
+    metrics.observe(
+        metrics.HTTP_REQUEST_DURATION,
+        time.perf_counter() - started,
+        route=request.url_rule.rule if request.url_rule is not None else "unmatched",
+        method=request.method,
+        status=str(g.pop("response_status", 500)),
+    )
+
+
+@api_metrics_controller.route("/", methods=["GET"])
+def get_metrics() -> Response:
+    """
+    Metrics of every worker, in the Prometheus text format.
+    """
+
+    return Response(metrics.render(), status=200, content_type="text/plain; version=0.0.4; charset=utf-8")
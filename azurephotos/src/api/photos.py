@@ -4,10 +4,11 @@ API endpoints for handling individual photos.
 :author: William Boyles
 """
 
-from io import BytesIO
+import tempfile
+from typing import IO
 
 from azure.core.exceptions import ResourceNotFoundError
-from azure.storage.blob import ContainerClient, ContentSettings
+from azure.storage.blob import ContentSettings
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from flask import redirect, current_app
@@ -15,8 +16,17 @@ from werkzeug.utils import secure_filename
 from werkzeug.wrappers.response import Response
 from werkzeug.datastructures.file_storage import FileStorage
 
-from ..lib.storage_helper import get_container_sas
-from ..lib.thumbnails import thumbnail as compute_thumbnail
+from ..lib.storage_helper import blob_url, delete_blobs, upload_stream
+from ..lib.thumbnails import (
+    renditions,
+    renditions_bytes,
+    process_pool as thumbnail_process_pool,
+    THUMBNAIL_VERSION,
+    THUMBNAIL_VERSION_METADATA_KEY,
+)
+from ..lib.thumbnail_queue import enqueue as enqueue_thumbnail
+from ..lib.models.media import MediaType
+from ..lib.storage.base import BlobStore
 
 def fullsize(filename: str) -> Response:
     """
@@ -26,13 +36,7 @@ def fullsize(filename: str) -> Response:
     :param filename: The name of the file.
     """
 
-    blob_account_url: str = current_app.config["blob_account_url"]
-    photos_container_name: str = "photos"
-
-    photos_container_sas: str = get_container_sas(photos_container_name)
-    return redirect(
-        f"{blob_account_url}/{photos_container_name}/{filename}?{photos_container_sas}"
-    )
+    return redirect(blob_url("photos", filename))
 
 
 def delete_fullsize(filename: str) -> None:
@@ -42,7 +46,7 @@ def delete_fullsize(filename: str) -> None:
     :param filename: The name of the photo file
     """
 
-    photos_container_client: ContainerClient = current_app.config["photos_container_client"]
+    photos_container_client: BlobStore = current_app.config["photos_container_client"]
 
     try:
         photos_container_client.delete_blob(filename)
@@ -53,23 +57,114 @@ def delete_fullsize(filename: str) -> None:
 
 def delete_thumbnail(filename: str) -> None:
     """
-    Deletes the thumbnail photo from the storage account.
+    Deletes the thumbnail photo and its previews from the storage account.
 
     :param filename: The name of the photo file
     """
 
-    thumbnails_container_client: ContainerClient = current_app.config["thumbnails_container_client"]
+    errors = delete_thumbnails([filename])
+    if errors:
+        raise RuntimeError(errors[filename])
 
-    try:
-        thumbnails_container_client.delete_blob(filename)
-    except ResourceNotFoundError:
-        # Blob already deleted
-        pass
+
+def upload_thumbnail(
+    thumbnails_container_client: BlobStore,
+    filename: str,
+    thumbnail: bytes | IO[bytes],
+    metadata: dict[str, str],
+    overwrite: bool = False,
+) -> None:
+    """
+    Upload an already computed photo thumbnail to blob storage.
+    Takes the container client rather than reading it from the app config so it can run on worker threads.
+
+    :param thumbnails_container_client: Thumbnails container
+    :param filename: The name of the photo file
+    :param thumbnail: Thumbnail image data
+    :param metadata: Blob metadata, same as the fullsize photo
+    :param overwrite: Whether to replace an existing thumbnail
+    """
+
+    thumbnails_container_client.upload_blob(
+        name=filename,
+        data=thumbnail,
+        metadata={**metadata, THUMBNAIL_VERSION_METADATA_KEY: THUMBNAIL_VERSION},
+        overwrite=overwrite,
+        content_settings=ContentSettings(
+            cache_control="public, max-age=31536000, immutable"
+        )
+    )
+
+
+def preview_name(filename: str, width: int) -> str:
+    """
+    Name of the blob in the thumbnails container holding a preview of a photo.
+
+    :param filename: The name of the photo file
+    :param width: Long edge of the preview
+    """
+
+    return f"{filename}@{width}.webp"
+
+
+def upload_previews(
+    thumbnails_container_client: BlobStore,
+    filename: str,
+    previews: dict[int, bytes],
+    metadata: dict[str, str],
+    overwrite: bool = False,
+) -> None:
+    """
+    Upload already computed photo previews to blob storage, next to the thumbnail.
+    Takes the container client rather than reading it from the app config so it can run on worker threads.
+
+    :param thumbnails_container_client: Thumbnails container
+    :param filename: The name of the photo file
+    :param previews: Preview image data by width
+    :param metadata: Blob metadata, same as the fullsize photo
+    :param overwrite: Whether to replace existing previews
+    """
+
+    if not previews:
+        return
+
+    def upload_preview(width: int) -> None:
+        thumbnails_container_client.upload_blob(
+            name=preview_name(filename, width),
+            data=previews[width],
+            metadata={**metadata, THUMBNAIL_VERSION_METADATA_KEY: THUMBNAIL_VERSION},
+            overwrite=overwrite,
+            content_settings=ContentSettings(
+                content_type="image/webp",
+                cache_control="public, max-age=31536000, immutable"
+            )
+        )
+
+    with ThreadPoolExecutor(max_workers=len(previews)) as executor:
+        for _ in executor.map(upload_preview, previews):
+            pass
+
+
+def preview(filename: str, width: int) -> Response:
+    """
+    Get the smallest preview of a photo at least as wide as requested, or the largest preview if none are.
+
+    :param filename: The name of the photo file
+    :param width: Width the client wants to display the photo at
+    """
+
+    preview_widths: tuple[int, ...] = current_app.config["PREVIEW_WIDTHS"]
+    if not preview_widths:
+        return fullsize(filename)
+    best_width = min((w for w in preview_widths if w >= width), default=max(preview_widths))
+
+    return redirect(blob_url("thumbnails", preview_name(filename, best_width)))
 
 
 def upload(file: FileStorage, date_taken: datetime) -> str:
     """
     Upload photos to blob storage.
+    When the thumbnail queue is enabled, only the fullsize photo is uploaded here and the thumbnail is generated later.
 
     :raises:
         ResourceExistsError when blob with filename already exists
@@ -77,37 +172,71 @@ def upload(file: FileStorage, date_taken: datetime) -> str:
 
     save_filename = secure_filename(str(file.filename))
     metadata = {"lastModified": date_taken.isoformat()}
-    data = file.stream.read()
-
-    def upload_thumbnail(client: ContainerClient) -> None:
-        thumbnail = compute_thumbnail(BytesIO(data))
-        client.upload_blob(
-            name=save_filename,
-            data=thumbnail,
-            metadata=metadata,
-            content_settings=ContentSettings(
-                cache_control="public, max-age=31536000, immutable"
-            )
-        )
 
-    def upload_fullsize(client: ContainerClient) -> None:
-        client.upload_blob(
-            name=save_filename,
-            data=BytesIO(data),
-            length=len(data),
-            max_concurrency=4,
-            metadata=metadata
-        )
+    photos_container_client: BlobStore = current_app.config["photos_container_client"]
+    buffer_size: int = current_app.config["UPLOAD_BUFFER_SIZE"]
+
+    if current_app.config["THUMBNAIL_QUEUE_ENABLED"]:
+        _ = upload_stream(photos_container_client, save_filename, file.stream, metadata, buffer_size)
+        enqueue_thumbnail(save_filename, MediaType.PHOTO)
+        return save_filename
+
+    thumbnails_container_client: BlobStore = current_app.config["thumbnails_container_client"]
+    pool = thumbnail_process_pool(current_app.config["THUMBNAIL_PROCESSES"])
+    preview_widths: tuple[int, ...] = current_app.config["PREVIEW_WIDTHS"]
+
+    # Keep a copy for the thumbnailer, moving it to disk once it outgrows the upload buffer
+    with tempfile.SpooledTemporaryFile(max_size=buffer_size) as spool:
+        size = upload_stream(photos_container_client, save_filename, file.stream, metadata, buffer_size, tee=spool)
+        _ = spool.seek(0)
+
+        try:
+            if size <= buffer_size:
+                thumbnail, previews = pool.submit(renditions_bytes, spool.read(), preview_widths).result()
+            else:
+                # Too big to send to the pool without reading it all into memory. Decode it from disk here instead.
+                thumbnail, previews = renditions(spool, preview_widths)
+        except Exception:
+            # Don't keep a fullsize photo that can never be shown
+            photos_container_client.delete_blob(save_filename)
+            raise
+
+    # Only uploaded once the fullsize is committed, so a failed upload doesn't leave an orphaned thumbnail
+    upload_previews(thumbnails_container_client, save_filename, previews, metadata)
+    upload_thumbnail(thumbnails_container_client, save_filename, thumbnail, metadata)
 
-    photos_container_client: ContainerClient = current_app.config["photos_container_client"]
-    thumbnails_container_client: ContainerClient = current_app.config["thumbnails_container_client"]
+    return save_filename
 
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        thumbnail_future = executor.submit(upload_thumbnail, thumbnails_container_client)
-        fullsize_future = executor.submit(upload_fullsize, photos_container_client)
 
-        _ = thumbnail_future.result()
-        _ = fullsize_future.result()
-        # TODO: Try to delete thumbnail blob if fullsize upload failed
+def delete_fullsizes(filenames: list[str]) -> dict[str, str]:
+    """
+    Deletes many fullsize photos from the storage account using batch requests.
 
-    return save_filename
+    :param filenames: The names of the photo files
+    :return: Error message for every file that could not be deleted
+    """
+
+    photos_container_client: BlobStore = current_app.config["photos_container_client"]
+
+    return delete_blobs(photos_container_client, filenames)
+
+
+def delete_thumbnails(filenames: list[str]) -> dict[str, str]:
+    """
+    Deletes many photo thumbnails and their previews from the storage account using batch requests.
+
+    :param filenames: The names of the photo files
+    :return: Error message for every file whose thumbnail could not be deleted
+    """
+
+    thumbnails_container_client: BlobStore = current_app.config["thumbnails_container_client"]
+
+    preview_widths: tuple[int, ...] = current_app.config["PREVIEW_WIDTHS"]
+
+    # Previews are deleted along with the thumbnail
+    thumbnail_filenames = {filename: filename for filename in filenames}
+    thumbnail_filenames.update(
+        (preview_name(filename, width), filename) for filename in filenames for width in preview_widths
+    )
+    errors = delete_blobs(thumbnails_container_client, list(thumbnail_filenames))
+    return {thumbnail_filenames[name]: error for name, error in errors.items()}
@@ -0,0 +1,128 @@
+"""
+Serve thumbnails through this app from a local disk cache, instead of redirecting to blob storage.
+
+Thumbnail URLs are versioned by the thumbnail's blob ETag, so they only change when the thumbnail does.
+Browsers keep them cached across visits, and repeat requests from any user are served from local disk.
+Enabled by ``THUMBNAIL_PROXY_ENABLED``.
+"""
+
+from azure.core.exceptions import ResourceNotFoundError
+from flask import current_app, send_file
+from typing import Iterable
+from werkzeug.wrappers.response import Response
+
+from .media_urls import thumbnail_blob_name, thumbnail_version
+from ..lib.disk_cache import DiskCache
+from ..lib.storage.base import BlobStore
+
+IMMUTABLE_CACHE_CONTROL: str = "public, max-age=31536000, immutable"
+
+REVALIDATE_CACHE_CONTROL: str = "public, no-cache"
+"""
+For thumbnails requested without a version. Browsers keep them, but check their ETag before each use.
+"""
+
+
+def _cache_key(blob_name: str, version: str) -> str:
+    # The version comes from the blob's ETag, so the contents for a key never change
+    return f"{blob_name}@{version}"
+
+
+def cached_version(blob_name: str) -> str | None:
+    """
+    Version of a thumbnail most recently fetched into the disk cache, or None if it isn't cached.
+    Thumbnails are only cached under the version their blob has when fetched, so this is the newest version this instance has seen.
+
+    :param blob_name: Name of the thumbnail blob
+    """
+
+    thumbnail_cache: DiskCache | None = current_app.config["thumbnail_cache"]
+    if thumbnail_cache is None or (key := thumbnail_cache.newest_key(blob_name)) is None:
+        return None
+    return key.rpartition("@")[2]
+
+
+def serve_thumbnail(filename: str, version: str | None = None) -> Response:
+    """
+    Respond with the thumbnail for a photo or video, fetching it into the disk cache on a miss.
+    Concurrent misses for the same thumbnail share one download.
+    A response for the version the thumbnail has now may be cached forever.
+    Without a version, or with one the thumbnail no longer has, browsers must revalidate the response.
+
+    :param filename: The name of the file
+    :param version: The thumbnail's version from :func:`media_urls.thumbnail_url`, if any
+    """
+
+    blob_name = thumbnail_blob_name(filename)
+    if blob_name is None:
+        return Response(f"Unrecognized media type for {filename=}", status=404)
+
+    if version is not None and (response := _serve_version(blob_name, version, IMMUTABLE_CACHE_CONTROL)) is not None:
+        return response
+
+    # No version, or the thumbnail was regenerated since, so serve whatever the thumbnail is now
+    thumbnails_container_client: BlobStore = current_app.config["thumbnails_container_client"]
+    try:
+        properties = thumbnails_container_client.get_blob_client(blob_name).get_blob_properties()
+    except ResourceNotFoundError:
+        return Response(f"No thumbnail for {filename=}", status=404)
+
+    response = _serve_version(blob_name, thumbnail_version(properties.etag), REVALIDATE_CACHE_CONTROL)
+    if response is None:
+        return Response(f"Could not cache thumbnail for {filename=}", status=503)
+    return response
+
+
+def _serve_version(blob_name: str, version: str, cache_control: str) -> Response | None:
+    """
+    Respond with one version of a thumbnail, or None if the thumbnail doesn't have that version (anymore).
+    """
+
+    thumbnail_cache: DiskCache = current_app.config["thumbnail_cache"]
+    thumbnails_container_client: BlobStore = current_app.config["thumbnails_container_client"]
+
+    def fetch() -> bytes | None:
+        try:
+            downloader = thumbnails_container_client.download_blob(blob_name)
+        except ResourceNotFoundError:
+            return None
+        if thumbnail_version(downloader.properties.etag) != version:
+            # Never store other contents under this version
+            return None
+        return downloader.readall()
+
+    key = _cache_key(blob_name, version)
+    for _ in range(2):
+        entry = thumbnail_cache.get(key, fetch, tag=blob_name)
+        if entry is None:
+            return None
+
+        try:
+            thumbnail_file = open(entry.path, "rb")
+        except FileNotFoundError:
+            # Evicted by another worker since it was looked up. Fetch it again.
+            thumbnail_cache.discard(key)
+            continue
+
+        # Answers If-None-Match with 304
+        response = send_file(thumbnail_file, mimetype="image/webp", etag=version, conditional=True)
+        response.headers["Cache-Control"] = cache_control
+        return response
+
+    return None
+
+
+def discard_thumbnails(filenames: Iterable[str]) -> None:
+    """
+    Remove deleted or regenerated files' thumbnails from the disk cache, every version of them. Does nothing if the proxy is disabled.
+
+    :param filenames: The names of the files
+    """
+
+    thumbnail_cache: DiskCache | None = current_app.config["thumbnail_cache"]
+    if thumbnail_cache is None:
+        return
+
+    for filename in filenames:
+        if (blob_name := thumbnail_blob_name(filename)) is not None:
+            thumbnail_cache.discard_tag(blob_name)
@@ -0,0 +1,96 @@
+"""
+Generate thumbnails for originals that are already in blob storage.
+Used by the thumbnail worker and by uploads that finish without the original passing through this app in one piece.
+"""
+
+import tempfile
+from concurrent.futures import Executor
+from flask import current_app
+
+import src.api.photos as photos
+import src.api.videos as videos
+from .thumbnail_proxy import discard_thumbnails
+from ..lib.models.media import MediaType
+from ..lib.thumbnails import renditions_bytes, video_thumbnail, is_streamable_video, VIDEO_PROBE_SIZE
+from ..lib.storage.base import BlobStore
+
+VIDEO_HEAD_SIZE = 16 * 1024 * 1024
+"""
+Bytes downloaded from the start of a video to find its thumbnail frame, when the whole video isn't needed
+"""
+
+
+def generate_thumbnail(
+    filename: str,
+    media_type: MediaType,
+    process_pool: Executor,
+    video_icon_path: str,
+    overwrite: bool = True,
+) -> int:
+    """
+    Download an original, compute its thumbnail, and upload it. Photos also get their previews.
+    Photos are encoded on the process pool. Videos already run in their own ffmpeg process.
+    For videos that can be decoded front to back, only the first :obj:`VIDEO_HEAD_SIZE` bytes are downloaded.
+    Safe to call from worker threads.
+
+    :param filename: Name of the original blob
+    :param media_type: Whether the original is a photo or a video
+    :param process_pool: Pool for CPU bound encoding
+    :param video_icon_path: Path to the play button icon overlaid on video thumbnails
+    :param overwrite: Whether to replace an existing thumbnail
+    :return: Number of bytes downloaded
+    """
+
+    thumbnails_container_client: BlobStore = current_app.config["thumbnails_container_client"]
+
+    match media_type:
+        case MediaType.PHOTO:
+            photos_container_client: BlobStore = current_app.config["photos_container_client"]
+            downloader = photos_container_client.download_blob(filename, max_concurrency=4)
+            data = downloader.readall()
+            preview_widths: tuple[int, ...] = current_app.config["PREVIEW_WIDTHS"]
+            thumbnail, previews = process_pool.submit(renditions_bytes, data, preview_widths).result()
+            photos.upload_previews(
+                thumbnails_container_client, filename, previews, downloader.properties.metadata, overwrite=overwrite
+            )
+            photos.upload_thumbnail(
+                thumbnails_container_client, filename, thumbnail, downloader.properties.metadata, overwrite=overwrite
+            )
+            # So URLs stop naming the old version. The next request caches the new one.
+            discard_thumbnails([filename])
+            return len(data)
+        case MediaType.VIDEO:
+            videos_container_client: BlobStore = current_app.config["videos_container_client"]
+            with tempfile.NamedTemporaryFile(suffix=".video") as temp_file:
+                # Only the first second is needed, so try the start of the video before downloading all of it
+                downloader = videos_container_client.download_blob(filename, offset=0, length=VIDEO_HEAD_SIZE)
+                size = downloader.readinto(temp_file)
+                temp_file.flush()
+
+                total_size = downloader.properties.size
+                thumbnail = None
+                if size >= total_size:
+                    thumbnail = video_thumbnail(temp_file.name, video_icon_path)
+                else:
+                    with open(temp_file.name, "rb") as head:
+                        streamable = is_streamable_video(head.read(VIDEO_PROBE_SIZE))
+                    if streamable:
+                        try:
+                            thumbnail = video_thumbnail(temp_file.name, video_icon_path)
+                        except RuntimeError:
+                            # First second didn't fit in the head
+                            pass
+
+                if thumbnail is None:
+                    _ = temp_file.seek(0)
+                    _ = temp_file.truncate()
+                    downloader = videos_container_client.download_blob(filename, max_concurrency=4)
+                    size += downloader.readinto(temp_file)
+                    temp_file.flush()
+                    thumbnail = video_thumbnail(temp_file.name, video_icon_path)
+
+            videos.upload_thumbnail(
+                thumbnails_container_client, filename, thumbnail, downloader.properties.metadata, overwrite=overwrite
+            )
+            discard_thumbnails([filename])
+            return size
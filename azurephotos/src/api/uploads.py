@@ -0,0 +1,353 @@
+"""
+API endpoints for resumable uploads of large files.
+
+A client opens a session, PUTs numbered chunks, and then commits the session.
+Each chunk is staged directly as a block of the final blob, so nothing is spooled by this app,
+and a client that loses its connection can ask which chunks already landed and send only the rest.
+Sessions live in the ``upload`` partition of the albums meta table.
+Azure discards uncommitted blocks after a week, so sessions expire then. ``flask storage sweep-uploads`` removes expired sessions.
+A session is only removed once its file is in its album, so a commit that failed partway can be sent again.
+
+:author: William Boyles
+"""
+
+import os
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from azure.data.tables import TableEntity
+from azure.storage.blob import BlobBlock
+from base64 import b64encode
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, Response, current_app, request
+from typing import Any, Iterator
+from uuid import uuid4
+from werkzeug.utils import secure_filename
+
+import src.api.photos as photos
+import src.api.videos as videos
+from .albums import upload_to_album, album_exists, NONE_ALBUM_NAME
+from .media_cache import invalidate_media_cache
+from .membership import albums_containing
+from .thumbnail_proxy import discard_thumbnails
+from .thumbnailer import generate_thumbnail
+from ..lib.models.media import MediaType
+from ..lib.thumbnail_queue import enqueue as enqueue_thumbnail
+from ..lib.thumbnails import process_pool as thumbnail_process_pool
+from ..lib.storage.base import BlobHandle, BlobStore, EntityStore
+
+UPLOAD_PARTITION: str = "upload"
+"""
+Partition of the albums meta table holding upload sessions
+"""
+
+MAX_BLOCKS = 50_000
+"""
+Most blocks Azure allows in one block blob
+"""
+
+SESSION_LIFETIME = timedelta(days=7)
+"""
+How long a session can be committed for. Azure discards uncommitted blocks after a week.
+"""
+
+SESSION_METADATA_KEY = "uploadSession"
+"""
+Blob metadata naming the session that committed a blob, so a commit that failed after committing the blob can be resumed
+"""
+
+api_uploads_controller = Blueprint(
+    "api_uploads_controller",
+    __name__,
+    template_folder="templates",
+    static_folder="static",
+    url_prefix="/api/uploads",
+)
+
+
+def _block_id(session_id: str, index: int) -> str:
+    # Same for every attempt at a chunk, so re-sending a chunk replaces the block instead of adding another
+    return b64encode(f"{session_id}{index:08d}".encode()).decode()
+
+
+def _expires(session: TableEntity) -> datetime:
+    # Sessions from before expiry was recorded expire a week after they were created
+    return session.get("Expires") or session["Created"] + SESSION_LIFETIME
+
+
+def _get_session(session_id: str) -> TableEntity | None:
+    """
+    Get a session, or None if it doesn't exist or has expired.
+    """
+
+    table_client: EntityStore = current_app.config["meta_table_client"]
+    try:
+        session = table_client.get_entity(UPLOAD_PARTITION, session_id)
+    except ResourceNotFoundError:
+        return None
+    if _expires(session) <= datetime.now(timezone.utc):
+        return None
+    return session
+
+
+def _blob_client(session: TableEntity) -> BlobHandle:
+    container_client: BlobStore = current_app.config[
+        "photos_container_client" if MediaType(session["MediaType"]) == MediaType.PHOTO else "videos_container_client"
+    ]
+    return container_client.get_blob_client(session["Filename"])
+
+
+def _received_chunks(session: TableEntity) -> list[int]:
+    """
+    Find which chunks of a session are staged, asking blob storage rather than keeping track in the table.
+    """
+
+    try:
+        _, uncommitted = _blob_client(session).get_block_list("uncommitted")
+    except ResourceNotFoundError:
+        # No blocks staged yet
+        return []
+
+    block_ids = {_block_id(session["RowKey"], i): i for i in range(session["Chunks"])}
+    return sorted(block_ids[block.id] for block in uncommitted if block.id in block_ids)
+
+
+def _committed_by(session: TableEntity) -> bool:
+    """
+    Whether the session's blob was already committed by this session, e.g. by an earlier attempt at committing it.
+    """
+
+    try:
+        properties = _blob_client(session).get_blob_properties()
+    except ResourceNotFoundError:
+        return False
+    return (properties.metadata or {}).get(SESSION_METADATA_KEY) == session["RowKey"]
+
+
+def _session_status(session: TableEntity) -> dict[str, Any]:
+    return {
+        "id": session["RowKey"],
+        "filename": session["Filename"],
+        "expires": _expires(session).isoformat(),
+        "size": session["Size"],
+        "chunkSize": session["ChunkSize"],
+        "chunks": session["Chunks"],
+        "received": _received_chunks(session),
+    }
+
+
+@api_uploads_controller.route("/", methods=["POST"])
+def create_session() -> Response | tuple[dict[str, Any], int]:
+    """
+    Open an upload session. It can be committed for :obj:`SESSION_LIFETIME`.
+
+    The JSON body describes the file, e.g. ``{"filename": "a.mp4", "size": 123456, "dateTaken": "2024-01-01T00:00:00Z", "album": "Trip"}``.
+    ``album`` is optional. Without it, the file is uploaded to the "none" album.
+    Responds with the session id and how the file must be split into chunks.
+    """
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return Response("Body must be a JSON object", status=422)
+
+    filename = secure_filename(str(body.get("filename") or ""))
+    size = body.get("size")
+    album_name = body.get("album") or NONE_ALBUM_NAME
+    try:
+        date_taken = datetime.fromisoformat(str(body.get("dateTaken")).strip())
+    except ValueError:
+        return Response("'dateTaken' must be an ISO 8601 date", status=422)
+
+    media_type = MediaType.from_file_extension(filename)
+    if media_type is None:
+        return Response(f"Unrecognized media type for {filename=}", status=422)
+    if not isinstance(size, int) or size < 0:
+        return Response("'size' must be a non-negative integer", status=422)
+    if "album" in body and album_name == NONE_ALBUM_NAME:
+        return Response(f"Album name '{NONE_ALBUM_NAME}' is reserved and cannot be uploaded to directly", status=403)
+    if album_name != NONE_ALBUM_NAME and not album_exists(album_name):
+        return Response(f"Album '{album_name}' does not exist", status=404)
+
+    chunk_size: int = current_app.config["UPLOAD_CHUNK_SIZE"]
+    chunks = (size + chunk_size - 1) // chunk_size
+    if chunks > MAX_BLOCKS:
+        return Response(f"Files can be at most {MAX_BLOCKS * chunk_size} bytes", status=413)
+
+    created = datetime.now(timezone.utc)
+    session: dict[str, Any] = {
+        "PartitionKey": UPLOAD_PARTITION,
+        "RowKey": uuid4().hex,
+        "Filename": filename,
+        "MediaType": media_type.value,
+        "Album": album_name,
+        "DateTaken": date_taken,
+        "Size": size,
+        "ChunkSize": chunk_size,
+        "Chunks": chunks,
+        "Created": created,
+        "Expires": created + SESSION_LIFETIME,
+    }
+
+    # Fail now rather than after the whole file is sent
+    if _blob_client(TableEntity(session)).exists():
+        return Response(f"{filename} already exists", status=409)
+
+    table_client: EntityStore = current_app.config["meta_table_client"]
+    _ = table_client.create_entity(session)
+
+    return _session_status(TableEntity(session)), 201
+
+
+@api_uploads_controller.route("/<session_id>", methods=["GET"])
+def session_status(session_id: str) -> Response | dict[str, Any]:
+    """
+    Get an upload session, including which chunks were already received.
+
+    :param session_id: Id from :func:`create_session`
+    """
+
+    session = _get_session(session_id)
+    if session is None:
+        return Response(f"Upload session {session_id} does not exist", status=404)
+
+    return _session_status(session)
+
+
+@api_uploads_controller.route("/<session_id>/chunks/<int:index>", methods=["PUT"])
+def put_chunk(session_id: str, index: int) -> Response:
+    """
+    Upload one chunk of a file. The request body is the raw bytes of the chunk.
+    Every chunk except the last must be exactly the session's chunk size.
+    Sending a chunk again replaces it.
+
+    :param session_id: Id from :func:`create_session`
+    :param index: Zero-based chunk number
+    """
+
+    session = _get_session(session_id)
+    if session is None:
+        return Response(f"Upload session {session_id} does not exist", status=404)
+
+    chunks: int = session["Chunks"]
+    chunk_size: int = session["ChunkSize"]
+    if not 0 <= index < chunks:
+        return Response(f"Chunk {index} is out of range for {chunks} chunks", status=416)
+
+    expected_length = min(chunk_size, session["Size"] - index * chunk_size)
+    if request.content_length != expected_length:
+        return Response(f"Chunk {index} must be {expected_length} bytes", status=422)
+
+    # Streamed straight from the request into the block
+    _blob_client(session).stage_block(_block_id(session_id, index), request.stream, length=expected_length)
+
+    return Response(status=204)
+
+
+@api_uploads_controller.route("/<session_id>/commit", methods=["POST"])
+def commit_session(session_id: str) -> Response:
+    """
+    Finish an upload once every chunk is received.
+    Commits the blob, starts generating its thumbnail, and adds it to its album.
+    The session is only removed once the file is in its album, so if that fails, the commit can be sent again.
+
+    :param session_id: Id from :func:`create_session`
+    """
+
+    session = _get_session(session_id)
+    if session is None:
+        return Response(f"Upload session {session_id} does not exist", status=404)
+
+    filename: str = session["Filename"]
+    media_type = MediaType(session["MediaType"])
+    date_taken: datetime = session["DateTaken"]
+    metadata = {"lastModified": date_taken.isoformat(), SESSION_METADATA_KEY: session_id}
+
+    chunks: int = session["Chunks"]
+    missing = sorted(set(range(chunks)) - set(_received_chunks(session)))
+    # Committing the blob discards its blocks, so a resumed commit has none left
+    if missing and not _committed_by(session):
+        return Response(f"Missing chunks {missing}", status=409)
+
+    if not missing:
+        try:
+            _ = _blob_client(session).commit_block_list(
+                [BlobBlock(block_id=_block_id(session_id, i)) for i in range(chunks)],
+                metadata=metadata,
+                match_condition=MatchConditions.IfMissing,
+            )
+        except (ResourceExistsError, ResourceModifiedError):
+            return Response(f"{filename} already exists", status=409)
+
+    if current_app.config["THUMBNAIL_QUEUE_ENABLED"]:
+        enqueue_thumbnail(filename, media_type)
+    else:
+        video_icon_path = os.path.join(str(current_app.static_folder), "video_icon.png")
+        pool = thumbnail_process_pool(current_app.config["THUMBNAIL_PROCESSES"])
+        try:
+            _ = generate_thumbnail(filename, media_type, pool, video_icon_path, overwrite=False)
+        except Exception:
+            # The file is already committed, so don't fail the upload. Let a worker retry the thumbnail.
+            enqueue_thumbnail(filename, media_type)
+
+    album_name: str = session["Album"]
+    try:
+        upload_to_album_result = upload_to_album(filename, date_taken, album_name)
+    except ResourceExistsError:
+        # Added by an earlier attempt that failed to remove the session
+        upload_to_album_result = Response(status=201)
+    if upload_to_album_result.status_code >= 400:
+        return upload_to_album_result
+
+    table_client: EntityStore = current_app.config["meta_table_client"]
+    table_client.delete_entity(UPLOAD_PARTITION, session_id)
+
+    if album_name == NONE_ALBUM_NAME:
+        invalidate_media_cache()
+
+    return Response(filename, status=201)
+
+
+def expired_sessions() -> Iterator[TableEntity]:
+    """
+    Get every upload session that expired, including ones from before expiry was recorded.
+    """
+
+    table_client: EntityStore = current_app.config["meta_table_client"]
+    sessions = table_client.query_entities(
+        query_filter="PartitionKey eq @upload and Created lt @oldest",
+        parameters={"upload": UPLOAD_PARTITION, "oldest": datetime.now(timezone.utc) - SESSION_LIFETIME},
+    )
+    for session in sessions:
+        if _expires(session) <= datetime.now(timezone.utc):
+            yield session
+
+
+def discard_session(session: TableEntity) -> bool:
+    """
+    Remove an expired session, its staged chunks, and its file if it was committed but never added to its album.
+
+    :return: Whether a committed file was deleted
+    """
+
+    filename: str = session["Filename"]
+    media_type = MediaType(session["MediaType"])
+
+    orphaned = _committed_by(session) and not albums_containing(filename)
+    if orphaned:
+        media = photos if media_type == MediaType.PHOTO else videos
+        media.delete_fullsize(filename)
+        media.delete_thumbnail(filename)
+        discard_thumbnails([filename])
+    elif not _blob_client(session).exists():
+        try:
+            # Drops the staged chunks where the backend doesn't discard them on its own
+            _blob_client(session).delete_blob()
+        except ResourceNotFoundError:
+            pass
+
+    table_client: EntityStore = current_app.config["meta_table_client"]
+    try:
+        table_client.delete_entity(UPLOAD_PARTITION, session["RowKey"])
+    except ResourceNotFoundError:
+        pass
+
+    return orphaned
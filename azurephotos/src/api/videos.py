@@ -9,16 +9,27 @@ import shutil
 import tempfile
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import IO
 
 from azure.core.exceptions import ResourceNotFoundError
-from azure.storage.blob import ContainerClient, ContentSettings
+from azure.storage.blob import ContentSettings
 from flask import redirect, current_app
 from werkzeug.utils import secure_filename
 from werkzeug.wrappers.response import Response
 from werkzeug.datastructures.file_storage import FileStorage
 
-from ..lib.thumbnails import video_thumbnail as compute_thumbnail
-from ..lib.storage_helper import get_container_sas
+from ..lib.thumbnails import (
+    video_thumbnail as compute_thumbnail,
+    is_streamable_video,
+    VideoThumbnailPipe,
+    VIDEO_PROBE_SIZE,
+    THUMBNAIL_VERSION,
+    THUMBNAIL_VERSION_METADATA_KEY,
+)
+from ..lib.thumbnail_queue import enqueue as enqueue_thumbnail
+from ..lib.models.media import MediaType
+from ..lib.storage_helper import blob_url, delete_blobs, upload_stream
+from ..lib.storage.base import BlobStore
 
 def fullsize(filename: str) -> Response:
     """
@@ -27,59 +38,130 @@ def fullsize(filename: str) -> Response:
     :param filename: The name of the file.
     """
 
-    blob_account_url: str = current_app.config["blob_account_url"]
-    videos_container_name: str = "videos"
+    return redirect(blob_url("videos", filename))
 
-    videos_container_sas = get_container_sas(videos_container_name)
-    return redirect(
-        f"{blob_account_url}/{videos_container_name}/{filename}?{videos_container_sas}"
+
+def upload_thumbnail(
+    thumbnails_container_client: BlobStore,
+    filename: str,
+    thumbnail: bytes,
+    metadata: dict[str, str],
+    overwrite: bool = False,
+) -> None:
+    """
+    Upload an already computed video thumbnail to blob storage.
+    Takes the container client rather than reading it from the app config so it can run on worker threads.
+
+    :param thumbnails_container_client: Thumbnails container
+    :param filename: The name of the video file
+    :param thumbnail: Thumbnail image data
+    :param metadata: Blob metadata, same as the fullsize video
+    :param overwrite: Whether to replace an existing thumbnail
+    """
+
+    _ = thumbnails_container_client.upload_blob(
+        name=f"{filename}.webp",
+        data=thumbnail,
+        metadata={**metadata, THUMBNAIL_VERSION_METADATA_KEY: THUMBNAIL_VERSION},
+        overwrite=overwrite,
+        content_settings=ContentSettings(
+            cache_control="public, max-age=31536000, immutable"
+        ),
     )
 
 
 def upload(file: FileStorage, date_taken: datetime) -> str:
     """
     Upload videos to blob storage.
+    When the thumbnail queue is enabled, the video is streamed straight to blob storage and the thumbnail is generated later.
+    Otherwise, the video is streamed to blob storage and ffmpeg at the same time, falling back to a temp file if ffmpeg would need to seek.
 
     :raises:
         ResourceExistsError when blob with filename already exists
     """
 
-    videos_container_client: ContainerClient = current_app.config["videos_container_client"]
-    thumbnails_container_client: ContainerClient = current_app.config["thumbnails_container_client"]
+    videos_container_client: BlobStore = current_app.config["videos_container_client"]
+    buffer_size: int = current_app.config["UPLOAD_BUFFER_SIZE"]
 
     save_filename = secure_filename(str(file.filename))
     metadata = {"lastModified": date_taken.isoformat()}
 
+    if current_app.config["THUMBNAIL_QUEUE_ENABLED"]:
+        _ = upload_stream(videos_container_client, save_filename, file.stream, metadata, buffer_size)
+        enqueue_thumbnail(save_filename, MediaType.VIDEO)
+        return save_filename
+
+    video_icon_path = os.path.join(str(current_app.static_folder), "video_icon.png")
+
+    head = file.stream.read(VIDEO_PROBE_SIZE)
+    if file.stream.seekable() and is_streamable_video(head):
+        _ = file.stream.seek(0)
+        _upload_streaming(file.stream, save_filename, metadata, video_icon_path)
+    else:
+        _upload_from_temp_file(head, file.stream, save_filename, metadata, video_icon_path)
+
+    return save_filename
+
+
+def _upload_streaming(stream: IO[bytes], save_filename: str, metadata: dict[str, str], video_icon_path: str) -> None:
+    """
+    Upload a video while ffmpeg reads the same bytes to find a thumbnail frame, so the video is only read once.
+    """
+
+    videos_container_client: BlobStore = current_app.config["videos_container_client"]
+    thumbnails_container_client: BlobStore = current_app.config["thumbnails_container_client"]
+    buffer_size: int = current_app.config["UPLOAD_BUFFER_SIZE"]
+
+    thumbnail_pipe = VideoThumbnailPipe(video_icon_path)
+    try:
+        _ = upload_stream(videos_container_client, save_filename, stream, metadata, buffer_size, tee=thumbnail_pipe)
+    except BaseException:
+        thumbnail_pipe.close()
+        raise
+
+    try:
+        thumbnail = thumbnail_pipe.result()
+    except RuntimeError:
+        # No frame in the first second, or ffmpeg couldn't decode the stream.
+        # The video is already uploaded, so generate the thumbnail from it later instead of failing.
+        enqueue_thumbnail(save_filename, MediaType.VIDEO)
+        return
+
+    upload_thumbnail(thumbnails_container_client, save_filename, thumbnail, metadata)
+
+
+def _upload_from_temp_file(
+    head: bytes,
+    stream: IO[bytes],
+    save_filename: str,
+    metadata: dict[str, str],
+    video_icon_path: str,
+) -> None:
+    """
+    Upload a video that ffmpeg has to seek through, like an MP4 with its ``moov`` box at the end,
+    by copying it to a temp file first.
+    """
+
+    videos_container_client: BlobStore = current_app.config["videos_container_client"]
+    thumbnails_container_client: BlobStore = current_app.config["thumbnails_container_client"]
+    buffer_size: int = current_app.config["UPLOAD_BUFFER_SIZE"]
+
     with tempfile.NamedTemporaryFile(delete=False, suffix=".video") as temp_file:
-        shutil.copyfileobj(file.stream, temp_file)   
+        _ = temp_file.write(head)
+        shutil.copyfileobj(stream, temp_file)
         temp_file.flush()
-        temp_path = temp_file.name       
-    file_size = os.path.getsize(temp_path)                                  
+        temp_path = temp_file.name
 
     try:
-        def upload_thumbnail(client: ContainerClient) -> None:
-            thumbnail_bytes = compute_thumbnail(temp_path)
-            _ = client.upload_blob(
-                name=f"{save_filename}.webp",
-                data=thumbnail_bytes,
-                metadata=metadata,
-                content_settings=ContentSettings(
-                    cache_control="public, max-age=31536000, immutable"
-                ),
-            )
-
-        def upload_fullsize(client: ContainerClient) -> None:
+        def upload_computed_thumbnail(client: BlobStore) -> None:
+            upload_thumbnail(client, save_filename, compute_thumbnail(temp_path, video_icon_path), metadata)
+
+        def upload_fullsize(client: BlobStore) -> None:
             with open(temp_path, "rb") as full:
-                _ = client.upload_blob(
-                    name=save_filename,
-                    data=full,
-                    length=file_size,
-                    max_concurrency=4,
-                    metadata=metadata
-                )
+                _ = upload_stream(client, save_filename, full, metadata, buffer_size)
 
         with ThreadPoolExecutor(max_workers=2) as executor:
-            thumbnails_future = executor.submit(upload_thumbnail, thumbnails_container_client)
+            thumbnails_future = executor.submit(upload_computed_thumbnail, thumbnails_container_client)
             fullsize_future = executor.submit(upload_fullsize, videos_container_client)
 
             # TODO: Try to delete thumbnail blob if fullsize upload failed
@@ -91,8 +173,6 @@ def upload(file: FileStorage, date_taken: datetime) -> str:
         except OSError:
             pass
 
-    return save_filename
-
 
 def delete_fullsize(filename: str) -> None:
     """
@@ -101,7 +181,7 @@ def delete_fullsize(filename: str) -> None:
     :param filename: The name of the video file
     """
 
-    videos_container_client: ContainerClient = current_app.config["videos_container_client"]
+    videos_container_client: BlobStore = current_app.config["videos_container_client"]
 
     try:
         videos_container_client.delete_blob(filename)
@@ -116,7 +196,7 @@ def delete_thumbnail(filename: str) -> None:
 
     :param filename: The name of the photo file
     """
-    thumbnails_container_client: ContainerClient = current_app.config["thumbnails_container_client"]
+    thumbnails_container_client: BlobStore = current_app.config["thumbnails_container_client"]
 
     thumbnail_filename = filename + ".webp"
 
@@ -125,3 +205,31 @@ def delete_thumbnail(filename: str) -> None:
     except ResourceNotFoundError:
         # Blob already deleted
         pass
+
+
+def delete_fullsizes(filenames: list[str]) -> dict[str, str]:
+    """
+    Deletes many fullsize videos from the storage account using batch requests.
+
+    :param filenames: The names of the video files
+    :return: Error message for every file that could not be deleted
+    """
+
+    videos_container_client: BlobStore = current_app.config["videos_container_client"]
+
+    return delete_blobs(videos_container_client, filenames)
+
+
+def delete_thumbnails(filenames: list[str]) -> dict[str, str]:
+    """
+    Deletes many video thumbnails from the storage account using batch requests.
+
+    :param filenames: The names of the video files
+    :return: Error message for every file whose thumbnail could not be deleted
+    """
+
+    thumbnails_container_client: BlobStore = current_app.config["thumbnails_container_client"]
+
+    thumbnail_filenames = {filename + ".webp": filename for filename in filenames}
+    errors = delete_blobs(thumbnails_container_client, list(thumbnail_filenames))
+    return {thumbnail_filenames[name]: error for name, error in errors.items()}
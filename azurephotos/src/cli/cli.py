@@ -0,0 +1,7 @@
+from .storage import storage_cli
+from .thumbnails import thumbnails_cli
+
+commands = {
+    storage_cli,
+    thumbnails_cli,
+}
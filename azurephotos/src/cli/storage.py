@@ -0,0 +1,127 @@
+"""
+Commands for provisioning and maintaining storage.
+
+Run from the azurephotos directory, e.g. ``flask storage init``
+"""
+
+import click
+from dataclasses import replace
+from flask import current_app
+from flask.cli import AppGroup
+
+from ..api.albums import NONE_ALBUM_NAME
+from ..api.catalog import CATALOG_PARTITION, album_summaries, summarize
+from ..api.membership import add_memberships
+from ..api.uploads import discard_session, expired_sessions
+from ..lib.storage.base import EntityStorage, EntityStore
+from ..lib.table_batch import chunked, upsert_all_entities, delete_all_entities
+
+storage_cli = AppGroup("storage", help="Provision and maintain storage.")
+
+TABLE_NAMES: tuple[str, ...] = (
+    "Albums2",
+    "AlbumsMeta",
+    "AlbumMembership",
+    "ThumbnailJobs",
+)
+"""
+Every table the app expects to exist
+"""
+
+
+@storage_cli.command("init")
+def init() -> None:
+    """
+    Create any missing tables.
+    """
+
+    entity_storage: EntityStorage = current_app.config["entity_storage"]
+
+    for table_name in TABLE_NAMES:
+        _ = entity_storage.create_table_if_not_exists(table_name)
+        click.echo(f"Table {table_name} ready")
+
+
+@storage_cli.command("build-membership-index")
+def build_membership_index() -> None:
+    """
+    Build the filename to albums index from the albums table.
+    Safe to run again; existing memberships are overwritten.
+    """
+
+    albums_table_client: EntityStore = current_app.config["albums_table_client"]
+
+    entities = albums_table_client.query_entities(query_filter="RowKey ne ''", select=["PartitionKey", "RowKey"])
+    indexed = 0
+    failed = 0
+    # Write in chunks so the scan doesn't have to fit in memory
+    for chunk in chunked(entities, 5000):
+        progress = add_memberships([(entity["RowKey"], entity["PartitionKey"]) for entity in chunk])
+        indexed += progress.completed
+        failed += progress.total - progress.completed
+        click.echo(f"Indexed {indexed} memberships")
+
+    if failed:
+        raise click.ClickException(f"{failed} memberships could not be written. Run again to retry.")
+
+
+@storage_cli.command("build-album-catalog")
+def build_album_catalog() -> None:
+    """
+    Build the album catalog from the albums table.
+    Safe to run again; every summary is recomputed, and entries for albums that no longer exist are removed.
+    """
+
+    albums_table_client: EntityStore = current_app.config["albums_table_client"]
+    meta_table_client: EntityStore = current_app.config["meta_table_client"]
+
+    entities = albums_table_client.query_entities(
+        query_filter="PartitionKey ne @reserved_album_name",
+        parameters={"reserved_album_name": NONE_ALBUM_NAME},
+        select=["PartitionKey", "RowKey", "Created"],
+    )
+    summaries = summarize(entities)
+    click.echo(f"Summarized {len(summaries)} albums")
+
+    stale = list[dict[str, str]]()
+    for existing in album_summaries():
+        if existing.name not in summaries:
+            stale.append({"PartitionKey": CATALOG_PARTITION, "RowKey": existing.name})
+        else:
+            # Keep the current cover until a new mosaic is made
+            summaries[existing.name] = replace(
+                summaries[existing.name], mosaic_version=existing.mosaic_version, mosaic_stale=True
+            )
+
+    progress = upsert_all_entities(meta_table_client, [summary.to_entity() for summary in summaries.values()])
+    failed = progress.total - progress.completed
+    progress = delete_all_entities(meta_table_client, stale)
+    failed += progress.total - progress.completed
+    click.echo(f"Removed {progress.completed} albums that no longer exist")
+
+    if failed:
+        raise click.ClickException(f"{failed} catalog entries could not be written. Run again to retry.")
+
+
+@storage_cli.command("sweep-uploads")
+def sweep_uploads() -> None:
+    """
+    Remove expired upload sessions and their staged chunks.
+    Files committed by a session that never made it into an album are deleted too.
+    Safe to run at any time, e.g. daily.
+    """
+
+    removed = 0
+    orphans = 0
+    failed = 0
+    for session in expired_sessions():
+        try:
+            orphans += discard_session(session)
+            removed += 1
+        except Exception as e:
+            failed += 1
+            click.echo(f"Could not remove upload session {session['RowKey']} of {session['Filename']}: {e}", err=True)
+
+    click.echo(f"Removed {removed} expired upload sessions, and {orphans} files that never reached an album")
+    if failed:
+        raise click.ClickException(f"{failed} upload sessions could not be removed. Run again to retry.")
@@ -0,0 +1,180 @@
+"""
+Commands for generating thumbnails outside of upload requests.
+
+Run from the azurephotos directory, e.g. ``flask thumbnails worker`` or ``flask thumbnails backfill``
+"""
+
+import click
+import json
+import os
+import time
+from azure.data.tables import TableEntity
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED, Future
+from flask import current_app
+from flask.cli import AppGroup
+
+from ..api.album_covers import COVER_PREFIX
+from ..api.thumbnailer import generate_thumbnail
+from ..lib import thumbnail_queue
+from ..lib.models.media import MediaType
+from ..lib.thumbnails import THUMBNAIL_VERSION, THUMBNAIL_VERSION_METADATA_KEY
+from ..lib.storage.base import BlobStore
+
+thumbnails_cli = AppGroup("thumbnails", help="Generate thumbnails.")
+
+
+@thumbnails_cli.command("worker")
+@click.option("--processes", default=os.cpu_count() or 1, show_default=True, help="Processes encoding photo thumbnails.")
+@click.option("--concurrency", default=8, show_default=True, help="Jobs in flight at once.")
+@click.option("--poll-interval", default=2.0, show_default=True, help="Seconds to wait when the queue is empty.")
+@click.option("--once", is_flag=True, help="Exit once the queue is empty instead of polling forever.")
+def worker(processes: int, concurrency: int, poll_interval: float, once: bool) -> None:
+    """
+    Process queued thumbnail jobs.
+    """
+
+    app = current_app._get_current_object()  # type: ignore[attr-defined]
+    video_icon_path = os.path.join(str(app.static_folder), "video_icon.png")
+
+    def process(job: TableEntity) -> None:
+        with app.app_context():
+            try:
+                _ = generate_thumbnail(job["RowKey"], MediaType(job["MediaType"]), process_pool, video_icon_path)
+                thumbnail_queue.complete(job)
+                click.echo(f"Generated thumbnail for {job['RowKey']}")
+            except Exception as e:
+                thumbnail_queue.fail(job, e)
+                click.echo(f"Failed to generate thumbnail for {job['RowKey']} (attempt {job['Attempts']}): {e}", err=True)
+
+    with ProcessPoolExecutor(max_workers=processes) as process_pool, ThreadPoolExecutor(max_workers=concurrency) as io_pool:
+        in_flight = set[Future[None]]()
+        while True:
+            if len(in_flight) < concurrency:
+                jobs = thumbnail_queue.claim(concurrency - len(in_flight))
+                in_flight.update(io_pool.submit(process, job) for job in jobs)
+
+            if not in_flight:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            _, in_flight = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+
+
+def _thumbnail_versions(thumbnails_container_client: BlobStore) -> dict[str, str]:
+    """
+    Get the version of every thumbnail, by the name of its original.
+    Thumbnails from before versions were recorded have version "".
+    """
+
+    versions = dict[str, str]()
+    for blob in thumbnails_container_client.list_blobs(include=["metadata"]):
+        name: str = blob.name
+        if "@" in name or name.startswith(COVER_PREFIX):
+            # Preview, regenerated along with its thumbnail, or album cover
+            continue
+        if MediaType.from_file_extension(name.removesuffix(".webp")) == MediaType.VIDEO:
+            name = name.removesuffix(".webp")
+        versions[name] = (blob.metadata or {}).get(THUMBNAIL_VERSION_METADATA_KEY, "")
+
+    return versions
+
+
+def _read_checkpoint(path: str) -> dict[str, str | None]:
+    try:
+        with open(path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_checkpoint(path: str, checkpoint: dict[str, str | None]) -> None:
+    # Replace atomically so an interrupted write can't corrupt the checkpoint
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(temp_path, path)
+
+
+@thumbnails_cli.command("backfill")
+@click.option("--media", type=click.Choice(["all", "photos", "videos"]), default="all", show_default=True, help="Containers to go through.")
+@click.option("--force", is_flag=True, help="Regenerate thumbnails even if they are up to date.")
+@click.option("--checkpoint", "checkpoint_path", default=".thumbnails-backfill.json", show_default=True, help="File recording progress, so an interrupted run resumes.")
+@click.option("--processes", default=os.cpu_count() or 1, show_default=True, help="Processes encoding photo thumbnails.")
+@click.option("--concurrency", default=8, show_default=True, help="Files in flight at once.")
+@click.option("--page-size", default=500, show_default=True, help="Blobs per listing page. Progress is checkpointed after each page.")
+def backfill(media: str, force: bool, checkpoint_path: str, processes: int, concurrency: int, page_size: int) -> None:
+    """
+    Generate missing thumbnails and regenerate ones from an older thumbnail version.
+    """
+
+    app = current_app._get_current_object()  # type: ignore[attr-defined]
+    video_icon_path = os.path.join(str(app.static_folder), "video_icon.png")
+
+    containers = {
+        "photos": (MediaType.PHOTO, app.config["photos_container_client"]),
+        "videos": (MediaType.VIDEO, app.config["videos_container_client"]),
+    }
+    if media != "all":
+        containers = {media: containers[media]}
+
+    click.echo("Listing existing thumbnails")
+    versions = {} if force else _thumbnail_versions(app.config["thumbnails_container_client"])
+    checkpoint = _read_checkpoint(checkpoint_path)
+
+    generated = failed = skipped = downloaded = 0
+    started = time.monotonic()
+
+    def report() -> None:
+        elapsed = max(time.monotonic() - started, 1e-9)
+        click.echo(
+            f"{generated} generated, {skipped} up to date, {failed} failed"
+            f" | {generated / elapsed:.1f} items/s, {downloaded / elapsed / 1024 / 1024:.1f} MB/s"
+        )
+
+    def process(filename: str, media_type: MediaType) -> int:
+        with app.app_context():
+            return generate_thumbnail(filename, media_type, process_pool, video_icon_path, overwrite=True)
+
+    with ProcessPoolExecutor(max_workers=processes) as process_pool, ThreadPoolExecutor(max_workers=concurrency) as io_pool:
+        for container_name, (media_type, container_client) in containers.items():
+            if checkpoint.get(container_name, "") is None:
+                click.echo(f"Already finished {container_name}")
+                continue
+
+            # Resume from the page after the last one finished
+            pages = container_client.list_blobs(results_per_page=page_size).by_page(
+                continuation_token=checkpoint.get(container_name) or None
+            )
+            for page in pages:
+                filenames = list[str]()
+                for blob in page:
+                    if not force and versions.get(blob.name) == THUMBNAIL_VERSION:
+                        skipped += 1
+                    else:
+                        filenames.append(blob.name)
+
+                futures = {io_pool.submit(process, filename, media_type): filename for filename in filenames}
+                for future, filename in futures.items():
+                    try:
+                        downloaded += future.result()
+                        generated += 1
+                    except Exception as e:
+                        failed += 1
+                        click.echo(f"Failed to generate thumbnail for {filename}: {e}", err=True)
+
+                # None marks the container as finished
+                checkpoint[container_name] = pages.continuation_token
+                _write_checkpoint(checkpoint_path, checkpoint)
+                report()
+
+    # These containers are done, so the next run should start them over
+    for container_name in containers:
+        _ = checkpoint.pop(container_name, None)
+    if checkpoint:
+        _write_checkpoint(checkpoint_path, checkpoint)
+    elif os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    report()
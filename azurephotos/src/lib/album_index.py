@@ -0,0 +1,244 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from threading import RLock
+from typing import Sequence
+
+from .models.media import MediaRecord
+
+
+class AlbumIndex:
+    """
+    Bounded, in-process, write-through index of the albums table.
+
+    Holds the list of album names, the sorted contents of recently used albums,
+    and whether an album exists (including negative entries for albums that don't).
+    Anything loaded from storage is trusted for at most ``max_age``, or until :meth:`sync` sees a new version stamp.
+    Mutations made through this process update the index in place, so they are visible immediately.
+    """
+
+    def __init__(self, max_albums: int, max_age: timedelta) -> None:
+        """
+        :param max_albums: Max number of album listings to keep. Least recently used albums are evicted first.
+        :param max_age: How long a listing loaded from storage may be served before it is loaded again
+        """
+
+        self.max_albums = max_albums
+        self.max_age = max_age
+
+        self._lock = RLock()
+        self._version: str | None = None
+        self._names: tuple[list[str], datetime] | None = None
+        self._albums = OrderedDict[str, tuple[tuple[MediaRecord, ...], datetime]]()
+        self._exists = OrderedDict[str, tuple[bool, datetime]]()
+
+    def _is_fresh(self, loaded_at: datetime) -> bool:
+        return datetime.now(timezone.utc) - loaded_at < self.max_age
+
+    def sync(self, version: str) -> None:
+        """
+        Drop everything if the albums table changed somewhere else since the index was built.
+
+        :param version: Current version stamp of the albums table
+        """
+
+        with self._lock:
+            if self._version is not None and self._version != version:
+                self._clear()
+            self._version = version
+
+    def adopt_version(self, version: str) -> None:
+        """
+        Accept a new version stamp without dropping anything.
+        Used after this process changed the albums table and already updated the index in place.
+        """
+
+        with self._lock:
+            self._version = version
+
+    def album_names(self) -> list[str] | None:
+        """
+        Get all album names, or None if they need to be loaded from storage.
+        """
+
+        with self._lock:
+            if self._names is None or not self._is_fresh(self._names[1]):
+                return None
+
+            return list(self._names[0])
+
+    def set_album_names(self, names: Sequence[str]) -> None:
+        """
+        Store album names freshly loaded from storage.
+        """
+
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            self._names = (list(names), now)
+            for name in names:
+                self._set_exists(name, True, now)
+
+    def album(self, album_name: str) -> Sequence[MediaRecord] | None:
+        """
+        Get the contents of an album sorted newest first, or None if it needs to be loaded from storage.
+        """
+
+        with self._lock:
+            entry = self._albums.get(album_name)
+            if entry is None or not self._is_fresh(entry[1]):
+                return None
+
+            self._albums.move_to_end(album_name)
+            return entry[0]
+
+    def set_album(self, album_name: str, records: Sequence[MediaRecord]) -> None:
+        """
+        Store the contents of an album freshly loaded from storage.
+        """
+
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            self._set_album(album_name, tuple(sorted(records, reverse=True)), now)
+            self._set_exists(album_name, True, now)
+
+    def _set_album(self, album_name: str, records: tuple[MediaRecord, ...], loaded_at: datetime) -> None:
+        self._albums[album_name] = (records, loaded_at)
+        self._albums.move_to_end(album_name)
+        while len(self._albums) > self.max_albums:
+            self._albums.popitem(last=False)
+
+    def exists(self, album_name: str) -> bool | None:
+        """
+        Whether an album exists, or None if that isn't known.
+        """
+
+        with self._lock:
+            entry = self._exists.get(album_name)
+            if entry is None or not self._is_fresh(entry[1]):
+                return None
+
+            self._exists.move_to_end(album_name)
+            return entry[0]
+
+    def set_exists(self, album_name: str, exists: bool) -> None:
+        """
+        Store whether an album exists, as freshly checked against storage.
+        """
+
+        with self._lock:
+            self._set_exists(album_name, exists, datetime.now(timezone.utc))
+
+    def _set_exists(self, album_name: str, exists: bool, loaded_at: datetime) -> None:
+        self._exists[album_name] = (exists, loaded_at)
+        self._exists.move_to_end(album_name)
+        # Existence entries are tiny, so keep more of them than album listings
+        while len(self._exists) > self.max_albums * 16:
+            self._exists.popitem(last=False)
+
+    def add_album(self, album_name: str) -> None:
+        """
+        Record that an album was created.
+        """
+
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            if self._names is not None and album_name not in self._names[0]:
+                self._names[0].append(album_name)
+            self._set_album(album_name, (), now)
+            self._set_exists(album_name, True, now)
+
+    def remove_album(self, album_name: str) -> None:
+        """
+        Record that an album was deleted.
+        """
+
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            if self._names is not None and album_name in self._names[0]:
+                self._names[0].remove(album_name)
+            self._albums.pop(album_name, None)
+            self._set_exists(album_name, False, now)
+
+    def rename_album(self, album_name: str, new_name: str, merge: bool = False) -> None:
+        """
+        Record that an album was renamed.
+
+        :param merge: Whether the entries were added to an album that already existed, e.g. when resuming an interrupted rename
+        """
+
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            if self._names is not None:
+                names = self._names[0]
+                if album_name in names:
+                    names[names.index(album_name)] = new_name
+                elif new_name not in names:
+                    names.append(new_name)
+
+            entry = self._albums.pop(album_name, None)
+            if not merge:
+                if entry is not None:
+                    self._set_album(new_name, *entry)
+            elif (target := self._albums.pop(new_name, None)) is not None and entry is not None:
+                # Either listing alone is incomplete. Without both, the album is loaded from storage next time.
+                filenames = {record.filename for record in entry[0]}
+                records = entry[0] + tuple(record for record in target[0] if record.filename not in filenames)
+                self._set_album(new_name, tuple(sorted(records, reverse=True)), min(entry[1], target[1]))
+
+            self._set_exists(album_name, False, now)
+            self._set_exists(new_name, True, now)
+
+    def add_record(self, album_name: str, record: MediaRecord) -> None:
+        """
+        Record that a file was added to an album.
+        """
+
+        with self._lock:
+            entry = self._albums.get(album_name)
+            if entry is None:
+                return
+
+            records, loaded_at = entry
+            records = tuple(r for r in records if r.filename != record.filename)
+
+            # Records are sorted in descending order. Find the first one older than the new record.
+            lo, hi = 0, len(records)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if records[mid] > record:
+                    lo = mid + 1
+                else:
+                    hi = mid
+
+            self._albums[album_name] = (records[:lo] + (record,) + records[lo:], loaded_at)
+
+    def remove_record(self, album_name: str, filename: str) -> MediaRecord | None:
+        """
+        Record that a file was removed from an album.
+
+        :return: The removed record, if the album was indexed and contained the file
+        """
+
+        with self._lock:
+            entry = self._albums.get(album_name)
+            if entry is None:
+                return None
+
+            records, loaded_at = entry
+            removed = next((r for r in records if r.filename == filename), None)
+            if removed is not None:
+                self._albums[album_name] = (tuple(r for r in records if r is not removed), loaded_at)
+
+            return removed
+
+    def clear(self) -> None:
+        """
+        Drop everything in the index.
+        """
+
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._names = None
+        self._albums.clear()
+        self._exists.clear()
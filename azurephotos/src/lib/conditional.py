@@ -0,0 +1,105 @@
+"""
+Conditional GETs for responses that only change when a version stamp does.
+
+A response's ETag is derived from the version stamps of the scopes it is built from, rather than from its body,
+so a request whose ``If-None-Match`` still matches is answered with 304 before the view runs any query.
+"""
+
+import hashlib
+import os
+from flask import Flask, current_app, make_response, request
+from functools import wraps
+from threading import Lock
+from typing import Any, Callable, TypeVar
+from werkzeug.wrappers.response import Response
+
+from .storage_helper import signing_window
+from .thumbnail_queue import failed_thumbnails, pending_thumbnails
+from .versioning import VersionStamps
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+REVALIDATE_CACHE_CONTROL: str = "private, no-cache"
+"""
+Lets browsers keep a response, but makes them check its ETag before every use
+"""
+
+_templates_fingerprints = dict[str, str]()
+_templates_fingerprints_lock = Lock()
+
+
+def _templates_fingerprint(app: Flask) -> str:
+    """
+    Hash of the app's templates, so a deploy that changes pages changes their ETags even if no data did.
+    Computed once per process. Every worker of a deploy gets the same value.
+    """
+
+    template_folder = os.path.join(app.root_path, str(app.template_folder))
+    with _templates_fingerprints_lock:
+        if (fingerprint := _templates_fingerprints.get(template_folder)) is not None:
+            return fingerprint
+
+        digest = hashlib.sha1()
+        for directory, _, filenames in sorted(os.walk(template_folder)):
+            for filename in sorted(filenames):
+                with open(os.path.join(directory, filename), "rb") as template_file:
+                    digest.update(filename.encode())
+                    digest.update(template_file.read())
+
+        fingerprint = _templates_fingerprints[template_folder] = digest.hexdigest()
+        return fingerprint
+
+
+def version_etag(scopes: tuple[str, ...], signed_urls: bool) -> str:
+    """
+    ETag of a response built from the given scopes.
+
+    :param scopes: Version stamp scopes the response depends on
+    :param signed_urls: Whether the response embeds signed URLs and thumbnail placeholders,
+        in which case it also changes with the signing window and with which thumbnails are pending or failed
+    """
+
+    version_stamps: VersionStamps = current_app.config["version_stamps"]
+
+    digest = hashlib.sha1()
+    digest.update(_templates_fingerprint(current_app).encode())
+    for scope in scopes:
+        digest.update(f"{scope}={version_stamps.current(scope)};".encode())
+    if signed_urls:
+        digest.update(signing_window().isoformat().encode())
+        for filename in sorted(pending_thumbnails()):
+            digest.update(f"{filename};".encode())
+        for filename in sorted(failed_thumbnails()):
+            digest.update(f"!{filename};".encode())
+
+    return digest.hexdigest()
+
+
+def conditional_on(*scopes: str, signed_urls: bool = False) -> Callable[[F], F]:
+    """
+    Give a GET view's responses an ETag derived from version stamps, and answer a matching ``If-None-Match`` with 304
+    without calling the view.
+
+    :param scopes: Version stamp scopes the view's response depends on, e.g. :obj:`versioning.ALBUMS_SCOPE`
+    :param signed_urls: Whether the response embeds signed URLs. See :func:`version_etag`.
+    """
+
+    def decorator(view: F) -> F:
+        @wraps(view)
+        def wrapper(*args: Any, **kwargs: Any) -> Response:
+            etag = version_etag(scopes, signed_urls)
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            # Weak, since the ETag names a version of the data rather than exact bytes
+            response.set_etag(etag, weak=True)
+            response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+            return response
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
@@ -0,0 +1,64 @@
+from datetime import timedelta
+from flask import Flask, current_app, has_app_context
+from threading import Lock, Timer, current_thread
+from time import monotonic
+from typing import Callable, Hashable
+
+
+class Debouncer:
+    """
+    Runs a function for a key once calls for that key stop for a while, so a burst of calls runs it once.
+    A key that keeps being called still runs at least every ``max_delay``.
+    Functions run on a timer thread, inside the app context of the first call if there was one.
+    """
+
+    def __init__(self, delay: timedelta, max_delay: timedelta) -> None:
+        """
+        :param delay: How long calls for a key must stop before its function runs
+        :param max_delay: Longest a key's function may be put off by repeated calls
+        """
+
+        self._delay = delay.total_seconds()
+        self._max_delay = max_delay.total_seconds()
+        self._lock = Lock()
+        # First call of the pending run, and the timer for it
+        self._pending = dict[Hashable, tuple[float, Timer]]()
+
+    def call(self, key: Hashable, func: Callable[[], None]) -> None:
+        """
+        Schedule ``func`` to run for ``key``, replacing any run already scheduled for it.
+
+        :param key: What the function is for, e.g. an album name
+        :param func: What to run
+        """
+
+        app: Flask | None = current_app._get_current_object() if has_app_context() else None  # type: ignore[attr-defined]
+        now = monotonic()
+
+        with self._lock:
+            first_call = now
+            if (pending := self._pending.get(key)) is not None:
+                first_call, timer = pending
+                timer.cancel()
+
+            delay = max(0.0, min(self._delay, first_call + self._max_delay - now))
+            timer = Timer(delay, self._run, args=(key, func, app))
+            timer.daemon = True
+            self._pending[key] = (first_call, timer)
+            timer.start()
+
+    def _run(self, key: Hashable, func: Callable[[], None], app: Flask | None) -> None:
+        with self._lock:
+            # A newer call may have replaced this run just as its timer fired. The newer run covers this one.
+            if (pending := self._pending.get(key)) is None or pending[1] is not current_thread():
+                return
+            del self._pending[key]
+
+        if app is None:
+            func()
+            return
+        with app.app_context():
+            try:
+                func()
+            except Exception:
+                app.logger.exception(f"Debounced call for {key=} failed")
@@ -0,0 +1,245 @@
+"""
+Size-bounded cache of immutable blobs on local disk.
+
+Entries are files named by a hash of their key, so every worker process pointed at the same directory shares them.
+Their sizes and last use are kept in an SQLite index in the same directory, in WAL mode,
+so the size limit holds for all the workers together, and eviction always removes whatever any of them used least recently.
+"""
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Iterator
+
+INDEX_NAME = ".index.db"
+"""
+Name of the index in the cache directory. Starts with a dot so it is never mistaken for an entry.
+"""
+
+TOUCH_INTERVAL_SECONDS = 60.0
+"""
+How often a hit records its use in the index. Hits in between don't write, so eviction order is only this precise.
+"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored REAL NOT NULL,
+    used REAL NOT NULL,
+    tag TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+CREATE INDEX IF NOT EXISTS entries_tag ON entries (tag, stored);
+"""
+
+
+@dataclass(frozen=True)
+class CachedFile:
+    """
+    A cache entry on disk.
+    """
+
+    path: str
+    size: int
+    etag: str
+    """Hash of the key. Usable as a strong ETag, since the contents for a key never change."""
+
+
+class DiskCache:
+    """
+    LRU cache of bytes stored as files in a directory.
+    Concurrent misses for the same key in one process share one fetch.
+    The contents for a key must never change, e.g. by putting a version in the key.
+    """
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        """
+        :param directory: Where to store entries. Created if missing. Entries already in it are reused.
+        :param max_bytes: Total size of entries to keep, across every process using the directory,
+            before evicting the least recently used ones
+        """
+
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._lock = Lock()
+        self._in_flight = dict[str, Future[CachedFile | None]]()
+        self._local = threading.local()
+
+        os.makedirs(directory, exist_ok=True)
+        _ = self._connection.executescript(_SCHEMA)
+        self._remove_unindexed()
+
+    def _remove_unindexed(self) -> None:
+        """
+        Delete entries the index doesn't count, e.g. left by an older version of the cache, so they can't exceed the size limit.
+        """
+
+        with self._transaction() as connection:
+            indexed = {name for name, in connection.execute("SELECT name FROM entries")}
+            for name in os.listdir(self._directory):
+                if not name.startswith(".") and name not in indexed and os.path.isfile(os.path.join(self._directory, name)):
+                    self._remove(name)
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        connection: sqlite3.Connection | None = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit, so transactions are only what _transaction() starts
+            connection = sqlite3.connect(os.path.join(self._directory, INDEX_NAME), timeout=30, isolation_level=None)
+            _ = connection.execute("PRAGMA journal_mode=WAL")
+            _ = connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Hold the index's write lock until the block exits, then commit, or roll back if it raised.
+        """
+
+        connection = self._connection
+        _ = connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            _ = connection.execute("ROLLBACK")
+            raise
+        _ = connection.execute("COMMIT")
+
+    def _name(self, key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _lookup(self, name: str) -> CachedFile | None:
+        row = self._connection.execute("SELECT size, used FROM entries WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+
+        path = os.path.join(self._directory, name)
+        if not os.path.exists(path):
+            return None
+
+        size, used = row
+        now = time.time()
+        if now - used >= TOUCH_INTERVAL_SECONDS:
+            _ = self._connection.execute("UPDATE entries SET used = ? WHERE name = ?", (now, name))
+        return CachedFile(path, size, name)
+
+    def get(self, key: str, fetch: Callable[[], bytes | None], tag: str | None = None) -> CachedFile | None:
+        """
+        Get an entry, fetching and storing it on a miss.
+
+        :param key: Cache key
+        :param fetch: Gets the bytes for the key, or None if there are none. Not cached if it returns None or raises.
+        :param tag: Stored with a new entry, so every entry with the same tag can be removed together. See :meth:`discard_tag`.
+        :return: The entry, or None if ``fetch`` returned None
+        """
+
+        name = self._name(key)
+        if (entry := self._lookup(name)) is not None:
+            return entry
+
+        with self._lock:
+            future = self._in_flight.get(name)
+            leader = future is None
+            if future is None:
+                future = Future[CachedFile | None]()
+                self._in_flight[name] = future
+
+        if leader:
+            try:
+                # Another worker may have fetched it in the meantime
+                entry = self._lookup(name)
+                if entry is None:
+                    data = fetch()
+                    entry = None if data is None else self._store(key, name, data, tag)
+                future.set_result(entry)
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    _ = self._in_flight.pop(name, None)
+
+        return future.result()
+
+    def _store(self, key: str, name: str, data: bytes, tag: str | None) -> CachedFile:
+        path = os.path.join(self._directory, name)
+
+        # Write to a temp file first so no reader ever sees a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self._directory, prefix=".")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                _ = temp_file.write(data)
+
+            with self._transaction() as connection:
+                os.replace(temp_path, path)
+                now = time.time()
+                _ = connection.execute(
+                    "INSERT OR REPLACE INTO entries (name, key, size, stored, used, tag) VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, key, len(data), now, now, tag),
+                )
+                self._evict(connection)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        return CachedFile(path, len(data), name)
+
+    def newest_key(self, tag: str) -> str | None:
+        """
+        Key of the entry most recently stored with a tag, e.g. the newest version of a thumbnail, or None if there is none.
+        """
+
+        row = self._connection.execute(
+            "SELECT key FROM entries WHERE tag = ? ORDER BY stored DESC, rowid DESC LIMIT 1", (tag,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def discard(self, key: str) -> None:
+        """
+        Remove an entry, e.g. because what it was fetched from was deleted.
+        """
+
+        name = self._name(key)
+        with self._transaction() as connection:
+            _ = connection.execute("DELETE FROM entries WHERE name = ?", (name,))
+            self._remove(name)
+
+    def discard_tag(self, tag: str) -> None:
+        """
+        Remove every entry stored with a tag, e.g. every version of a thumbnail that was deleted.
+        """
+
+        with self._transaction() as connection:
+            names = [name for name, in connection.execute("SELECT name FROM entries WHERE tag = ?", (tag,))]
+            _ = connection.execute("DELETE FROM entries WHERE tag = ?", (tag,))
+            for name in names:
+                self._remove(name)
+
+    def _remove(self, name: str) -> None:
+        try:
+            os.remove(os.path.join(self._directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        # Must be in a transaction
+        total: int = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        while total > self._max_bytes:
+            oldest = connection.execute("SELECT name, size FROM entries ORDER BY used LIMIT 64").fetchall()
+            if not oldest:
+                return
+            for name, size in oldest:
+                if total <= self._max_bytes:
+                    return
+                _ = connection.execute("DELETE FROM entries WHERE name = ?", (name,))
+                self._remove(name)
+                total -= size
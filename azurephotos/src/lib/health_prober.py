@@ -0,0 +1,128 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from threading import Event, Lock, Thread
+from time import perf_counter, sleep
+from typing import Callable
+
+
+@dataclass(frozen=True)
+class DependencyStatus:
+    """
+    Outcome of the last check of one dependency.
+    """
+
+    name: str
+    healthy: bool
+    latency: float | None
+    """Seconds the check took, or None if it timed out or hasn't finished"""
+    error: str | None
+    checked_at: datetime
+
+
+class HealthProber:
+    """
+    Checks dependencies in parallel on an interval, on a background thread, and keeps the latest results.
+    Health endpoints answer from the results, so probes never wait on, or add load to, the dependencies themselves.
+    """
+
+    def __init__(self, checks: dict[str, Callable[[], None]], interval: timedelta, timeout: timedelta) -> None:
+        """
+        :param checks: Function checking each dependency by name. Raises if the dependency is unhealthy.
+        :param interval: Time between rounds of checks
+        :param timeout: How long a check may take before it counts as failed
+        """
+
+        self.checks = checks
+        self.interval = interval
+        self.timeout = timeout
+
+        self._lock = Lock()
+        self._statuses = dict[str, DependencyStatus]()
+        self._in_flight = dict[str, Future[float]]()
+        self._executor = ThreadPoolExecutor(max_workers=max(len(checks), 1), thread_name_prefix="health-check")
+        self._started = False
+        self._first_round = Event()
+
+    def start(self) -> None:
+        """
+        Start checking in the background, if not started already.
+        """
+
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        Thread(target=self._run, daemon=True, name="health-prober").start()
+
+    def _run(self) -> None:
+        while True:
+            self.probe()
+            self._first_round.set()
+            sleep(self.interval.total_seconds())
+
+    def probe(self) -> None:
+        """
+        Check every dependency once, in parallel, and wait at most the timeout for them.
+        A check still running from an earlier round is not started again, and keeps counting as timed out.
+        """
+
+        def timed(check: Callable[[], None]) -> float:
+            start = perf_counter()
+            check()
+            return perf_counter() - start
+
+        with self._lock:
+            for name, check in self.checks.items():
+                if name not in self._in_flight:
+                    self._in_flight[name] = self._executor.submit(timed, check)
+            in_flight = dict(self._in_flight)
+
+        deadline = perf_counter() + self.timeout.total_seconds()
+        for name, future in in_flight.items():
+            try:
+                latency = future.result(timeout=max(deadline - perf_counter(), 0))
+                # A check left over from an earlier round may have finished, but too slowly
+                slow = latency > self.timeout.total_seconds()
+                error = f"Took {latency:.1f}s, longer than the {self.timeout.total_seconds():g}s timeout" if slow else None
+                status = DependencyStatus(name, not slow, latency, error, datetime.now(timezone.utc))
+            except TimeoutError:
+                status = DependencyStatus(
+                    name, False, None, f"Timed out after {self.timeout.total_seconds():g}s", datetime.now(timezone.utc)
+                )
+            except Exception as e:
+                status = DependencyStatus(name, False, None, f"{type(e).__name__}: {e}", datetime.now(timezone.utc))
+
+            with self._lock:
+                self._statuses[name] = status
+                if future.done():
+                    _ = self._in_flight.pop(name, None)
+
+    def statuses(self, wait: timedelta | None = None) -> list[DependencyStatus]:
+        """
+        Latest status of every dependency that has been checked.
+
+        :param wait: How long to wait for the first round of checks, if it hasn't finished yet
+        """
+
+        self.start()
+        if wait is not None:
+            _ = self._first_round.wait(wait.total_seconds())
+
+        with self._lock:
+            return [self._statuses[name] for name in self.checks if name in self._statuses]
+
+    def is_ready(self, max_age: timedelta) -> bool:
+        """
+        Whether every dependency passed its last check, and that check is recent.
+
+        :param max_age: Oldest a passing check may be. Guards against the prober itself being stuck.
+        """
+
+        statuses = self.statuses()
+        if len(statuses) < len(self.checks):
+            return False
+
+        now = datetime.now(timezone.utc)
+        return all(status.healthy and now - status.checked_at <= max_age for status in statuses)
@@ -0,0 +1,161 @@
+"""
+Azure SDK clients that record metrics for every call.
+
+:func:`instrument` wraps a client in a proxy that times each method call and counts calls and errors per operation.
+Listings are lazy, so they are timed until they are exhausted.
+Clients handed out by a proxied client, like a container client from a service client, are proxied too.
+
+Bytes and retries are only visible per HTTP response, so they come from :func:`record_response`,
+which must be passed as ``raw_response_hook`` when the service client is created.
+It attributes each response to the operation in progress on its thread.
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+
+from . import metrics
+
+RETRIED_STATUSES: frozenset[int] = frozenset({408, 429, 500, 502, 503, 504})
+"""
+Statuses the Azure SDK retry policies retry
+"""
+
+UNINSTRUMENTED_METHODS: frozenset[str] = frozenset({"close", "blob_url", "get_container_sas"})
+"""
+Methods that make no requests
+"""
+
+CLIENT_FACTORIES: frozenset[str] = frozenset({"get_blob_client", "get_container_client", "get_table_client"})
+"""
+Methods that make no requests and return a client, which is proxied too
+"""
+
+_operation = ContextVar[tuple[str, str] | None]("storage_operation", default=None)
+
+
+def record_response(pipeline_response: Any) -> None:
+    """
+    Count the bytes and retries of one HTTP response from Azure Storage.
+    Pass as ``raw_response_hook`` when creating a service client.
+    """
+
+    service, operation = _operation.get() or ("storage", "other")
+    request = pipeline_response.http_request
+    response = pipeline_response.http_response
+
+    if response.status_code in RETRIED_STATUSES:
+        metrics.inc(metrics.STORAGE_RETRIES, service=service, operation=operation)
+
+    sent = int(request.headers.get("Content-Length") or 0)
+    received = int(response.headers.get("Content-Length") or 0)
+    if sent:
+        metrics.inc(metrics.STORAGE_BYTES_SENT, sent, service=service, operation=operation)
+    if received:
+        metrics.inc(metrics.STORAGE_BYTES_RECEIVED, received, service=service, operation=operation)
+
+
+class _InstrumentedPager:
+    """
+    Lazy listing, like ``ItemPaged`` or one of its pages, that records the time spent fetching it once it is exhausted.
+    """
+
+    def __init__(self, pager: Any, labels: dict[str, str]) -> None:
+        self._pager = pager
+        self._iterator: Iterator[Any] | None = None
+        self._labels = labels
+        self._elapsed = 0.0
+
+    def __getattr__(self, name: str) -> Any:
+        # e.g. continuation_token
+        return getattr(self._pager, name)
+
+    def __iter__(self) -> "_InstrumentedPager":
+        return self
+
+    def __next__(self) -> Any:
+        if self._iterator is None:
+            self._iterator = iter(self._pager)
+
+        token = _operation.set((self._labels["service"], self._labels["operation"]))
+        start = time.perf_counter()
+        try:
+            item = next(self._iterator)
+        except StopIteration:
+            self._elapsed += time.perf_counter() - start
+            metrics.observe(metrics.STORAGE_CALL_DURATION, self._elapsed, **self._labels)
+            raise
+        finally:
+            _operation.reset(token)
+
+        self._elapsed += time.perf_counter() - start
+        return item
+
+    def by_page(self, *args: Any, **kwargs: Any) -> "_InstrumentedPager":
+        pages = self._pager.by_page(*args, **kwargs)
+        return _InstrumentedPager(pages, self._labels)
+
+
+class _InstrumentedClient:
+    """
+    Proxy of an Azure SDK client. See :func:`instrument`.
+    """
+
+    def __init__(self, client: Any, service: str) -> None:
+        self._client = client
+        self._service = service
+        self._target: str = getattr(client, "container_name", None) or getattr(client, "table_name", None) or ""
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._client, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+        if name in UNINSTRUMENTED_METHODS:
+            return attribute
+        if name in CLIENT_FACTORIES:
+            return lambda *args, **kwargs: _InstrumentedClient(attribute(*args, **kwargs), self._service)
+
+        return self._wrap(name, attribute)
+
+    def _wrap(self, operation: str, method: Callable[..., Any]) -> Callable[..., Any]:
+        labels = {"service": self._service, "target": self._target, "operation": operation}
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            metrics.inc(metrics.STORAGE_CALLS, **labels)
+            token = _operation.set((self._service, operation))
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                metrics.inc(metrics.STORAGE_ERRORS, **labels, error=type(e).__name__)
+                raise
+            finally:
+                _operation.reset(token)
+
+            if hasattr(result, "by_page"):
+                # Only the first page may have been fetched so far
+                return _InstrumentedPager(result, labels)
+
+            metrics.observe(metrics.STORAGE_CALL_DURATION, time.perf_counter() - start, **labels)
+            return result
+
+        return call
+
+    def __enter__(self) -> "_InstrumentedClient":
+        _ = self._client.__enter__()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self._client.__exit__(*args)
+
+
+def instrument(client: Any, service: str) -> Any:
+    """
+    Wrap an Azure SDK client so every call is recorded in :mod:`metrics`.
+    The proxy can be used anywhere the client could.
+
+    :param client: Service, container, blob, or table client, or a backend shaped like one. See :mod:`storage.base`.
+    :param service: Label for the kind of storage, e.g. "blob" or "local_table"
+    """
+
+    return _InstrumentedClient(client, service)
@@ -0,0 +1,407 @@
+"""
+Counters and latency histograms, exposed in the Prometheus text format.
+
+Every process records into its own registry and periodically writes a snapshot of it to :obj:`METRICS_DIR`.
+Reading metrics sums the snapshots of every process, so gunicorn workers, the thumbnail worker,
+and thumbnail encoding processes are all counted, whichever worker answers the scrape.
+Snapshots of processes that exited are merged into one retired snapshot, so totals never go down
+but the number of files stays at about the number of live processes.
+"""
+
+import atexit
+import fcntl
+import json
+import os
+import tempfile
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import wraps
+from threading import Lock
+from typing import Any, Callable, Literal, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+METRICS_DIR: str = os.path.join(tempfile.gettempdir(), "azurephotos-metrics")
+"""
+Where every process writes its snapshot
+"""
+
+RETIRED_SNAPSHOT_NAME: str = "retired.json"
+"""
+Snapshot holding the sum of every process that exited, and the names of the snapshots added to it
+"""
+
+SNAPSHOT_INTERVAL_SECONDS = 5.0
+"""
+Longest a process goes between snapshots while it is recording
+"""
+
+LATENCY_BUCKETS: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+"""
+Upper bounds of latency histogram buckets, in seconds
+"""
+
+
+@dataclass(frozen=True)
+class Metric:
+    """
+    Definition of a metric.
+    """
+
+    name: str
+    kind: Literal["counter", "histogram"]
+    help: str
+
+
+HTTP_REQUEST_DURATION = Metric(
+    "azurephotos_http_request_duration_seconds", "histogram",
+    "Time to handle a request, including streaming its body, by route, method, and status.",
+)
+STORAGE_CALL_DURATION = Metric(
+    "azurephotos_storage_call_duration_seconds", "histogram",
+    "Time spent in Azure SDK calls, by service, target container or table, and operation. Listings include paging through the results.",
+)
+STORAGE_CALLS = Metric(
+    "azurephotos_storage_calls_total", "counter",
+    "Azure SDK calls, by service, target, and operation.",
+)
+STORAGE_ERRORS = Metric(
+    "azurephotos_storage_errors_total", "counter",
+    "Azure SDK calls that raised, by service, target, operation, and exception type.",
+)
+STORAGE_RETRIES = Metric(
+    "azurephotos_storage_retries_total", "counter",
+    "Responses from Azure Storage with a status the SDK retries, by service and operation.",
+)
+STORAGE_BYTES_SENT = Metric(
+    "azurephotos_storage_bytes_sent_total", "counter",
+    "Request body bytes sent to Azure Storage, by service and operation.",
+)
+STORAGE_BYTES_RECEIVED = Metric(
+    "azurephotos_storage_bytes_received_total", "counter",
+    "Response body bytes received from Azure Storage, by service and operation.",
+)
+THUMBNAIL_ENCODE_DURATION = Metric(
+    "azurephotos_thumbnail_encode_duration_seconds", "histogram",
+    "Time to encode thumbnails and previews, by kind.",
+)
+CACHE_EVENTS = Metric(
+    "azurephotos_cache_events_total", "counter",
+    "Hits, misses, background refreshes, evictions, and errors of cached functions, by cache and event.",
+)
+
+METRICS: tuple[Metric, ...] = (
+    HTTP_REQUEST_DURATION,
+    STORAGE_CALL_DURATION,
+    STORAGE_CALLS,
+    STORAGE_ERRORS,
+    STORAGE_RETRIES,
+    STORAGE_BYTES_SENT,
+    STORAGE_BYTES_RECEIVED,
+    THUMBNAIL_ENCODE_DURATION,
+    CACHE_EVENTS,
+)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class _Registry:
+    """
+    Metrics recorded by this process.
+    Histograms are stored as per-bucket counts followed by the sum and the count, so snapshots can be added up.
+    """
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.values = dict[str, dict[Labels, float | list[float]]]()
+        self.pid = os.getpid()
+        # Distinguishes this process's snapshot from one left by an earlier process with the same pid
+        self.snapshot_name = f"{self.pid}-{time.time_ns()}.json"
+        self.last_snapshot = time.monotonic()
+        atexit.register(write_snapshot)
+
+    def inc(self, metric: Metric, labels: Labels, amount: float) -> None:
+        with self.lock:
+            series = self.values.setdefault(metric.name, {})
+            series[labels] = float(series.get(labels, 0.0)) + amount  # type: ignore[arg-type]
+
+    def observe(self, metric: Metric, labels: Labels, value: float) -> None:
+        with self.lock:
+            series = self.values.setdefault(metric.name, {})
+            histogram = series.get(labels)
+            if not isinstance(histogram, list):
+                histogram = series[labels] = [0.0] * (len(LATENCY_BUCKETS) + 2)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self) -> dict[str, list[tuple[Labels, float | list[float]]]]:
+        with self.lock:
+            return {
+                name: [(labels, value if not isinstance(value, list) else list(value)) for labels, value in series.items()]
+                for name, series in self.values.items()
+            }
+
+
+_registry: _Registry | None = None
+_registry_lock = Lock()
+
+
+def _current_registry() -> _Registry:
+    global _registry
+    with _registry_lock:
+        # A forked process starts with its parent's registry, which it must not write as its own
+        if _registry is None or _registry.pid != os.getpid():
+            _registry = _Registry()
+        return _registry
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(metric: Metric, amount: float = 1, **labels: str) -> None:
+    """
+    Add to a counter.
+    """
+
+    registry = _current_registry()
+    registry.inc(metric, _labels(labels), amount)
+    _snapshot_if_due(registry)
+
+
+def observe(metric: Metric, seconds: float, **labels: str) -> None:
+    """
+    Record a duration in a histogram.
+    """
+
+    registry = _current_registry()
+    registry.observe(metric, _labels(labels), seconds)
+    _snapshot_if_due(registry)
+
+
+@contextmanager
+def timer(metric: Metric, **labels: str) -> Iterator[None]:
+    """
+    Record how long a block takes in a histogram, whether or not it raises.
+    """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(metric, time.perf_counter() - start, **labels)
+
+
+def timed(metric: Metric, **labels: str) -> Callable[[F], F]:
+    """
+    Record how long every call of a function takes in a histogram.
+    """
+
+    def decorator(func: F) -> F:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with timer(metric, **labels):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def _snapshot_if_due(registry: _Registry) -> None:
+    now = time.monotonic()
+    if now - registry.last_snapshot < SNAPSHOT_INTERVAL_SECONDS:
+        return
+    registry.last_snapshot = now
+    write_snapshot()
+
+
+def write_snapshot() -> None:
+    """
+    Write this process's metrics where every process can read them.
+    """
+
+    registry = _current_registry()
+    snapshot = {name: [[list(map(list, labels)), value] for labels, value in series] for name, series in registry.snapshot().items()}
+
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        # Write to a temp file first so no reader ever sees a partial snapshot
+        fd, temp_path = tempfile.mkstemp(dir=METRICS_DIR, prefix=".")
+        with os.fdopen(fd, "w") as temp_file:
+            json.dump(snapshot, temp_file)
+        os.replace(temp_path, os.path.join(METRICS_DIR, registry.snapshot_name))
+    except OSError:
+        # Metrics must never break what they measure
+        pass
+
+
+Snapshot = dict[str, list[list[Any]]]
+
+
+def _read_json(name: str) -> Any:
+    try:
+        with open(os.path.join(METRICS_DIR, name)) as snapshot_file:
+            return json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _add(totals: dict[str, dict[Labels, float | list[float]]], snapshot: Snapshot) -> None:
+    for metric_name, series in snapshot.items():
+        metric_totals = totals.setdefault(metric_name, {})
+        for raw_labels, value in series:
+            labels: Labels = tuple((key, val) for key, val in raw_labels)
+            total = metric_totals.get(labels)
+            if isinstance(value, list):
+                metric_totals[labels] = value if total is None else [a + b for a, b in zip(total, value)]  # type: ignore[arg-type]
+            else:
+                metric_totals[labels] = value + (total or 0.0)  # type: ignore[operator]
+
+
+def _is_running(snapshot_name: str) -> bool:
+    try:
+        os.kill(int(snapshot_name.split("-", 1)[0]), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running as another user
+        return True
+    except ValueError:
+        # Not named by a pid
+        return True
+    return True
+
+
+def _retire_exited(names: list[str]) -> None:
+    """
+    Merge the snapshots of processes that exited into the retired snapshot, and delete them.
+    Does nothing if another process is already doing it.
+    Readers skip snapshots the retired snapshot lists, so nothing is counted twice while they are being deleted.
+    """
+
+    exited = [name for name in names if not _is_running(name)]
+    if not exited:
+        return
+
+    try:
+        lock_file = open(os.path.join(METRICS_DIR, ".retire.lock"), "w")
+    except OSError:
+        return
+    with lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+
+        retired: dict[str, Any] = _read_json(RETIRED_SNAPSHOT_NAME) or {"merged": [], "metrics": {}}
+        merged = set[str](retired["merged"])
+        totals = dict[str, dict[Labels, float | list[float]]]()
+        _add(totals, retired["metrics"])
+        for name in exited:
+            if name in merged:
+                continue
+            snapshot: Snapshot | None = _read_json(name)
+            if snapshot is None:
+                continue
+            _add(totals, snapshot)
+            merged.add(name)
+
+        # Only names still on disk need listing, so the list stays short
+        on_disk = set(os.listdir(METRICS_DIR))
+        retired = {
+            "merged": sorted(name for name in merged if name in on_disk),
+            "metrics": {name: [[list(map(list, labels)), value] for labels, value in series.items()] for name, series in totals.items()},
+        }
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=METRICS_DIR, prefix=".")
+            with os.fdopen(fd, "w") as temp_file:
+                json.dump(retired, temp_file)
+            os.replace(temp_path, os.path.join(METRICS_DIR, RETIRED_SNAPSHOT_NAME))
+            for name in retired["merged"]:
+                os.remove(os.path.join(METRICS_DIR, name))
+        except OSError:
+            # Metrics must never break what they measure. Deleting is finished next time.
+            pass
+
+
+def _aggregate() -> dict[str, dict[Labels, float | list[float]]]:
+    """
+    Sum the snapshots of every process, retiring the snapshots of processes that exited.
+    """
+
+    totals = dict[str, dict[Labels, float | list[float]]]()
+    try:
+        names = [
+            name for name in os.listdir(METRICS_DIR)
+            if name.endswith(".json") and not name.startswith(".") and name != RETIRED_SNAPSHOT_NAME
+        ]
+    except FileNotFoundError:
+        return totals
+
+    _retire_exited(names)
+
+    retired: dict[str, Any] | None = _read_json(RETIRED_SNAPSHOT_NAME)
+    merged = set[str]()
+    if retired is not None:
+        merged.update(retired["merged"])
+        _add(totals, retired["metrics"])
+
+    for name in names:
+        if name in merged:
+            continue
+        snapshot: Snapshot | None = _read_json(name)
+        if snapshot is not None:
+            _add(totals, snapshot)
+
+    return totals
+
+
+def _format_value(value: float) -> str:
+    # Counters grow large, so never fall back to scientific notation for them
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: tuple[str, str] | None = None) -> str:
+    pairs = list(labels) + ([extra] if extra is not None else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def render() -> str:
+    """
+    Metrics of every process, in the Prometheus text exposition format.
+    """
+
+    write_snapshot()
+    totals = _aggregate()
+
+    lines = list[str]()
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in sorted(totals.get(metric.name, {}).items()):
+            if not isinstance(value, list):
+                lines.append(f"{metric.name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+
+            cumulative = 0.0
+            for bound, count in zip(LATENCY_BUCKETS, value):
+                cumulative += count
+                lines.append(f"{metric.name}_bucket{_format_labels(labels, ('le', repr(bound)))} {_format_value(cumulative)}")
+            lines.append(f"{metric.name}_bucket{_format_labels(labels, ('le', '+Inf'))} {_format_value(value[-1])}")
+            lines.append(f"{metric.name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+            lines.append(f"{metric.name}_count{_format_labels(labels)} {_format_value(value[-1])}")
+
+    return "\n".join(lines) + "\n"
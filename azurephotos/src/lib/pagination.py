@@ -0,0 +1,105 @@
+import base64
+import json
+from datetime import datetime
+from typing import Sequence
+
+from .models.media import MediaRecord
+
+DEFAULT_PAGE_SIZE = 120
+"""
+Number of records in a page when the client does not ask for a specific size
+"""
+
+MAX_PAGE_SIZE = 500
+"""
+Upper bound on the page size a client can ask for
+"""
+
+
+def encode_cursor(record: MediaRecord) -> str:
+    """
+    Create an opaque cursor pointing just past a record.
+
+    :param record: Last record of the current page
+    :return: URL-safe cursor string
+    """
+
+    payload = json.dumps([record.last_modified.isoformat(), record.filename])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """
+    Decode a cursor created by :func:`encode_cursor`.
+
+    :param cursor: Cursor string
+    :return: The ``(last_modified, filename)`` key of the record the cursor points past
+    :raises ValueError: when the cursor is malformed, or its time has no timezone
+    """
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_modified, filename = json.loads(base64.urlsafe_b64decode(padded))
+        timestamp = datetime.fromisoformat(last_modified)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Malformed cursor {cursor=}") from e
+
+    # Records are timezone-aware, and can't be compared with a naive time
+    if timestamp.tzinfo is None:
+        raise ValueError(f"Malformed cursor {cursor=}: time has no timezone")
+    return timestamp, str(filename)
+
+
+def page_after(
+    records: Sequence[MediaRecord], cursor: str | None, limit: int
+) -> tuple[Sequence[MediaRecord], str | None]:
+    """
+    Get one page of records from a list sorted newest first.
+
+    The position of the cursor is found with a binary search on the
+    ``(last_modified, filename)`` ordering of :class:`MediaRecord`,
+    so every page costs the same no matter how deep into the list it is.
+
+    :param records: Records sorted in descending order
+    :param cursor: Cursor from a previous page, or None for the first page
+    :param limit: Max number of records in the page
+    :return: The page and the cursor for the next page, or None if this is the last page
+    :raises ValueError: when the cursor is malformed
+    """
+
+    start = 0
+    if cursor:
+        key = decode_cursor(cursor)
+        lo, hi = 0, len(records)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (records[mid].last_modified, records[mid].filename) >= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = lo
+
+    page = records[start:start + limit]
+    next_cursor = None
+    if page and start + limit < len(records):
+        next_cursor = encode_cursor(page[-1])
+
+    return page, next_cursor
+
+
+def parse_page_size(value: str | None) -> int:
+    """
+    Parse a client supplied page size, clamping it to :obj:`MAX_PAGE_SIZE`.
+
+    :param value: Raw query string value
+    :raises ValueError: when the value is not a positive integer
+    """
+
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+
+    limit = int(value)
+    if limit <= 0:
+        raise ValueError(f"Page size must be positive, got {limit}")
+
+    return min(limit, MAX_PAGE_SIZE)
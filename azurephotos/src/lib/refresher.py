@@ -1,36 +1,216 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
-from typing import Callable, Any, TypeVar
-from functools import wraps
+from flask import Flask, current_app, has_app_context
+from functools import update_wrapper
+from threading import Lock, Thread
+from typing import Any, Callable, Generic, Hashable, Literal, TypeVar
 
-MIN_UTC_TIME = datetime(
-    year=1, month=1, day=1, hour=0, minute=0, second=0, tzinfo=timezone.utc
-)
+from .metrics import CACHE_EVENTS, inc
 
 T = TypeVar("T")
 
 
-def refreshed(every: timedelta) -> Callable[[Callable[..., T]], Callable[..., T]]:
+CacheEvent = Literal["hit", "miss", "refresh", "eviction", "error"]
+"""
+What :obj:`metrics.CACHE_EVENTS` counts for a cached function:
+
+- ``hit``: Call answered from the cache
+- ``miss``: Call that had to wait for the function, including one that joined a call already in flight
+- ``refresh``: Background refresh started before an entry expired
+- ``eviction``: Entry dropped to stay under the max size
+- ``error``: Call of the function that raised
+"""
+
+
+@dataclass
+class _Entry(Generic[T]):
+    value: T
+    computed_at: datetime
+
+
+class CachedFunction(Generic[T]):
+    """
+    A function whose results are cached per arguments. Created with :func:`cached`.
+
+    - Only one call computes a missing or expired entry. Concurrent callers for the same arguments wait for it instead of computing it too.
+    - An entry older than ``refresh_after`` is recomputed in the background while callers keep getting the current value,
+      so busy entries never expire in front of a caller.
+    - The least recently used entries are dropped past ``max_size``.
+    - ``None`` is cached like any other result. Exceptions are not cached.
+    - Hits, misses, and the like are counted in :obj:`metrics.CACHE_EVENTS`, labelled with the function's qualified name.
+    """
+
+    def __init__(
+        self,
+        func: Callable[..., T],
+        ttl: timedelta,
+        refresh_after: timedelta | None,
+        max_size: int,
+    ) -> None:
+        self._func = func
+        self._ttl = ttl
+        self._refresh_after = refresh_after
+        self._max_size = max_size
+
+        self._lock = Lock()
+        self._entries = OrderedDict[Hashable, _Entry[T]]()
+        self._in_flight = dict[Hashable, Future[T]]()
+        # Bumped on invalidation, so a computation that started before it doesn't store its now outdated result
+        self._generation = 0
+        self._cache_name = f"{func.__module__}.{func.__qualname__}"
+
+        _ = update_wrapper(self, func)
+
+    @staticmethod
+    def _key(args: tuple[Any, ...], kwargs: dict[str, Any]) -> Hashable:
+        return (args, tuple(sorted(kwargs.items())))
+
+    def __call__(self, *args: Any, **kwargs: Any) -> T:
+        key = self._key(args, kwargs)
+        now = datetime.now(timezone.utc)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.computed_at < self._ttl:
+                self._entries.move_to_end(key)
+
+                stale = self._refresh_after is not None and now - entry.computed_at >= self._refresh_after
+                refresh = stale and key not in self._in_flight
+                if refresh:
+                    future = self._start(key)
+                    self._refresh_in_background(future, self._generation, key, args, kwargs)
+                value = entry.value
+            else:
+                future = self._in_flight.get(key)
+                leader = future is None
+                if future is None:
+                    future = self._start(key)
+                generation = self._generation
+
+        # Counted outside the lock, since recording may write a metrics snapshot
+        if entry is not None and now - entry.computed_at < self._ttl:
+            self._count("hit")
+            if refresh:
+                self._count("refresh")
+            return value
+
+        self._count("miss")
+        if leader:
+            self._compute(future, generation, key, args, kwargs)
+
+        return future.result()
+
+    def _count(self, event: CacheEvent, amount: int = 1) -> None:
+        inc(CACHE_EVENTS, amount, cache=self._cache_name, event=event)
+
+    def _start(self, key: Hashable) -> Future[T]:
+        # Must hold the lock
+        future = Future[T]()
+        self._in_flight[key] = future
+        return future
+
+    def _finish(self, key: Hashable, future: Future[T]) -> None:
+        # Must hold the lock. An invalidation may have replaced the future with a newer computation's, which must stay.
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+
+    def _compute(
+        self,
+        future: Future[T],
+        generation: int,
+        key: Hashable,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> None:
+        """
+        :param generation: Generation when the computation was started. Its result is only stored if nothing was invalidated since.
+        """
+
+        try:
+            value = self._func(*args, **kwargs)
+        except BaseException as e:
+            with self._lock:
+                self._finish(key, future)
+            self._count("error")
+            future.set_exception(e)
+            return
+
+        evictions = 0
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = _Entry(value, datetime.now(timezone.utc))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self._max_size:
+                    _ = self._entries.popitem(last=False)
+                    evictions += 1
+            self._finish(key, future)
+        if evictions:
+            self._count("eviction", evictions)
+        future.set_result(value)
+
+    def _refresh_in_background(
+        self,
+        future: Future[T],
+        generation: int,
+        key: Hashable,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> None:
+        # Most cached functions read clients from the app config, so carry the app over to the refresh thread
+        app: Flask | None = current_app._get_current_object() if has_app_context() else None  # type: ignore[attr-defined]
+
+        def refresh() -> None:
+            if app is None:
+                self._compute(future, generation, key, args, kwargs)
+                return
+            with app.app_context():
+                self._compute(future, generation, key, args, kwargs)
+
+        Thread(target=refresh, daemon=True, name=f"refresh-{self.__name__}").start()
+
+    def invalidate(self, *args: Any, **kwargs: Any) -> None:
+        """
+        Drop the entry for these arguments, so the next call with them computes it again.
+        A computation already in flight for them is left to finish for its callers, but later calls don't wait for it.
+        """
+
+        key = self._key(args, kwargs)
+        with self._lock:
+            _ = self._entries.pop(key, None)
+            _ = self._in_flight.pop(key, None)
+            self._generation += 1
+
+    def clear(self) -> None:
+        """
+        Drop every entry, and stop later calls from waiting for computations already in flight.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._in_flight.clear()
+            self._generation += 1
+
+
+def cached(
+    ttl: timedelta,
+    refresh_after: timedelta | None = None,
+    max_size: int = 128,
+) -> Callable[[Callable[..., T]], CachedFunction[T]]:
     """
-    Caches function calls for a certain duration.
-    The next call after a given time span will call the function fresh again.
+    Caches function calls for a certain duration. See :class:`CachedFunction`.
+    Arguments must be hashable.
+
+    :param ttl: How long a result may be used for
+    :param refresh_after: Age after which a result is recomputed in the background. Should be less than ``ttl``. None to never refresh ahead.
+    :param max_size: Max number of results to keep
     """
-    
-    def decorator(func: Callable[..., T]) -> Callable[..., T]:
-        cache = dict[tuple[Any, Any], tuple[T, datetime]]()
-
-        @wraps(func)
-        def wrapper(*args: Any, **kwargs: Any) -> T:
-            now = datetime.now(timezone.utc)
-            (result, last_called) = cache.get(
-                (args, tuple(kwargs.items())), (None, MIN_UTC_TIME)
-            )
-            if result is None or now - last_called >= every:
-                result = func(*args, **kwargs)
-                last_called = now
-                cache[(args, tuple(kwargs.items()))] = (result, last_called)
-
-            return result
-
-        return wrapper
+
+    if refresh_after is not None and refresh_after >= ttl:
+        raise ValueError(f"{refresh_after=} must be less than {ttl=}")
+
+    def decorator(func: Callable[..., T]) -> CachedFunction[T]:
+        return CachedFunction(func, ttl, refresh_after, max_size)
 
     return decorator
@@ -0,0 +1,93 @@
+"""
+Blob storage in an Azure Storage account, read by browsers through URLs signed with a user delegation key.
+Table storage needs no wrapper, since ``TableServiceClient`` already is a :class:`base.EntityStorage`.
+"""
+
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient, ContainerClient, ContainerSasPermissions, UserDelegationKey, generate_container_sas
+from datetime import datetime
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote
+
+from ..refresher import cached
+from ..storage_helper import SAS_CLOCK_SKEW, SAS_WINDOW, signing_window
+
+
+def pooled_transport(connections: int) -> RequestsTransport:
+    """
+    HTTP transport that keeps up to ``connections`` connections open to each storage endpoint,
+    so that many request threads can call storage at once without each opening a new connection.
+    The SDK's default keeps 10, and throws away any connection returned beyond that.
+
+    :param connections: Most connections kept open per endpoint. Should be at least the number of request threads.
+    """
+
+    session = Session()
+    # Retries are left to the SDK's retry policy
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=connections, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # Shared by every client, so no single client may close it
+    return RequestsTransport(session=session, session_owner=False)
+
+
+@cached(ttl=2 * SAS_WINDOW, max_size=2)
+def _user_delegation_key(service_client: BlobServiceClient, window_start: datetime) -> UserDelegationKey:
+    """
+    One key signs every container's URLs for a window, so there is only one key request per window per worker.
+    """
+
+    return service_client.get_user_delegation_key(
+        key_start_time=window_start - SAS_CLOCK_SKEW,
+        key_expiry_time=window_start + 2 * SAS_WINDOW,
+    )
+
+
+@cached(ttl=2 * SAS_WINDOW, max_size=16)
+def _container_sas(service_client: BlobServiceClient, container_name: str, window_start: datetime) -> str:
+    return generate_container_sas(
+        account_name=str(service_client.account_name),
+        container_name=container_name,
+        user_delegation_key=_user_delegation_key(service_client, window_start),
+        permission=ContainerSasPermissions(read=True),
+        start=window_start - SAS_CLOCK_SKEW,
+        expiry=window_start + 2 * SAS_WINDOW,
+    )
+
+
+class AzureBlobStorage:
+    """
+    Every container of a storage account.
+    """
+
+    def __init__(self, service_client: BlobServiceClient) -> None:
+        """
+        :param service_client: Client for the account's blob storage
+        """
+
+        self.service_client = service_client
+        self.account_url = service_client.url.rstrip("/")
+
+    def get_container_client(self, container: str) -> ContainerClient:
+        return self.service_client.get_container_client(container)
+
+    def get_container_sas(self, container_name: str) -> str:
+        """
+        Read-only SAS token for a container, the same for every call in a signing window.
+
+        :param container_name: Container to sign for
+        """
+
+        return _container_sas(self.service_client, container_name, signing_window())
+
+    def blob_url(self, container_name: str, blob_name: str) -> str:
+        """
+        Signed URL that reads a blob directly from storage, without going through this app.
+        Stable within a signing window. See :obj:`storage_helper.SAS_WINDOW`.
+
+        :param container_name: Container holding the blob
+        :param blob_name: Name of the blob
+        """
+
+        return f"{self.account_url}/{container_name}/{quote(blob_name)}?{self.get_container_sas(container_name)}"
@@ -0,0 +1,228 @@
+"""
+Interfaces of the blob and entity stores the app keeps its files and tables in.
+
+They are shaped like the parts of the Azure SDK the app uses, so Azure clients implement them as they are,
+and every backend raises the same ``azure.core`` exceptions and takes the same OData filters:
+
+- :class:`BlobStore` is a ``ContainerClient``, and :class:`EntityStore` a ``TableClient``.
+- :class:`BlobStorage` hands out blob stores by container name and makes URLs browsers can read blobs from.
+  See :class:`azure_storage.AzureBlobStorage` and :class:`local.LocalBlobStorage`.
+- :class:`EntityStorage` hands out entity stores by table name. ``TableServiceClient`` implements it,
+  as does :class:`local.LocalEntityStorage`.
+"""
+
+from azure.core import MatchConditions
+from azure.data.tables import TableEntity, UpdateMode
+from azure.storage.blob import BlobBlock, ContentSettings
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from datetime import datetime
+from typing import IO, Any, Protocol, TypeVar
+
+T = TypeVar("T", covariant=True)
+
+
+class Paged(Protocol[T]):
+    """
+    Lazy listing, like ``ItemPaged``. Iterates items, or pages of items with :meth:`by_page`.
+    """
+
+    def __iter__(self) -> Iterator[T]: ...
+
+    def __next__(self) -> T: ...
+
+    def by_page(self, continuation_token: str | None = None) -> Iterator[Iterator[T]]: ...
+
+
+class BlobProperties(Protocol):
+    """
+    What the app reads of a blob's properties.
+    """
+
+    name: str
+    size: int
+    metadata: dict[str, str]
+    content_settings: ContentSettings
+    last_modified: datetime
+    etag: str
+
+
+class BlobDownload(Protocol):
+    """
+    A blob being downloaded, like ``StorageStreamDownloader``.
+    """
+
+    properties: BlobProperties
+    size: int
+    """Bytes in the downloaded range"""
+
+    def readall(self) -> bytes: ...
+
+    def readinto(self, stream: IO[bytes]) -> int: ...
+
+    def chunks(self) -> Iterator[bytes]: ...
+
+
+class BatchResponse(Protocol):
+    """
+    Outcome of deleting one blob of a batch.
+    """
+
+    status_code: int
+    reason: str | None
+
+
+class BlobHandle(Protocol):
+    """
+    One blob, like ``BlobClient``. Used for uploads staged in blocks.
+    """
+
+    blob_name: str
+
+    def exists(self, **kwargs: Any) -> bool: ...
+
+    def get_blob_properties(self, **kwargs: Any) -> BlobProperties: ...
+
+    def get_block_list(self, block_list_type: str = "committed", **kwargs: Any) -> tuple[list[BlobBlock], list[BlobBlock]]: ...
+
+    def stage_block(self, block_id: str, data: bytes | IO[bytes], length: int | None = None, **kwargs: Any) -> Any: ...
+
+    def commit_block_list(
+        self,
+        block_list: Sequence[Any],
+        metadata: dict[str, str] | None = None,
+        content_settings: ContentSettings | None = None,
+        match_condition: MatchConditions | None = None,
+        **kwargs: Any,
+    ) -> dict[str, Any]: ...
+
+    def upload_blob(self, data: bytes | IO[bytes], **kwargs: Any) -> dict[str, Any]: ...
+
+    def download_blob(self, **kwargs: Any) -> BlobDownload: ...
+
+    def delete_blob(self, **kwargs: Any) -> None: ...
+
+
+class BlobStore(Protocol):
+    """
+    One container of blobs, like ``ContainerClient``.
+    """
+
+    container_name: str
+
+    def get_blob_client(self, blob: str) -> BlobHandle: ...
+
+    def get_container_properties(self, **kwargs: Any) -> Any: ...
+
+    def upload_blob(
+        self,
+        name: str,
+        data: bytes | IO[bytes],
+        overwrite: bool = False,
+        metadata: dict[str, str] | None = None,
+        content_settings: ContentSettings | None = None,
+        **kwargs: Any,
+    ) -> dict[str, Any]: ...
+
+    def download_blob(self, blob: str, offset: int | None = None, length: int | None = None, **kwargs: Any) -> BlobDownload: ...
+
+    def delete_blob(self, blob: str, **kwargs: Any) -> None: ...
+
+    def delete_blobs(self, *blobs: str, **kwargs: Any) -> Iterator[BatchResponse]: ...
+
+    def list_blobs(self, name_starts_with: str | None = None, include: Any = None, **kwargs: Any) -> Paged[BlobProperties]: ...
+
+
+class BlobStorage(Protocol):
+    """
+    Every container of a backend.
+    """
+
+    def get_container_client(self, container: str) -> BlobStore: ...
+
+    def blob_url(self, container_name: str, blob_name: str) -> str:
+        """
+        URL a browser can read a blob from without going through the app's own views.
+        Must be stable within a signing window. See :obj:`storage_helper.SAS_WINDOW`.
+        """
+        ...
+
+
+class EntityStore(Protocol):
+    """
+    One table of entities, like ``TableClient``.
+    """
+
+    table_name: str
+
+    def create_entity(self, entity: Mapping[str, Any], **kwargs: Any) -> dict[str, Any]: ...
+
+    def upsert_entity(self, entity: Mapping[str, Any], mode: UpdateMode = UpdateMode.MERGE, **kwargs: Any) -> dict[str, Any]: ...
+
+    def update_entity(
+        self,
+        entity: Mapping[str, Any],
+        mode: UpdateMode = UpdateMode.MERGE,
+        **kwargs: Any,
+    ) -> dict[str, Any]: ...
+
+    def get_entity(self, partition_key: str, row_key: str, **kwargs: Any) -> TableEntity: ...
+
+    def delete_entity(self, *args: Any, **kwargs: Any) -> None: ...
+
+    def query_entities(self, query_filter: str, **kwargs: Any) -> Paged[TableEntity]: ...
+
+    def list_entities(self, **kwargs: Any) -> Paged[TableEntity]: ...
+
+    def submit_transaction(self, operations: Iterable[tuple[Any, ...]], **kwargs: Any) -> list[Mapping[str, Any]]: ...
+
+
+class EntityStorage(Protocol):
+    """
+    Every table of a backend.
+    """
+
+    def get_table_client(self, table_name: str) -> EntityStore: ...
+
+    def create_table_if_not_exists(self, table_name: str, **kwargs: Any) -> Any: ...
+
+
+class TieredBlobStorage:
+    """
+    Keeps some containers in another backend, e.g. thumbnails on local disk and everything else in Azure.
+    """
+
+    def __init__(self, default: BlobStorage, tiers: Mapping[str, BlobStorage]) -> None:
+        """
+        :param default: Backend of every container not in ``tiers``
+        :param tiers: Backend of each container kept somewhere else, by container name
+        """
+
+        self.default = default
+        self.tiers = dict(tiers)
+
+    def get_container_client(self, container: str) -> BlobStore:
+        return self.tiers.get(container, self.default).get_container_client(container)
+
+    def blob_url(self, container_name: str, blob_name: str) -> str:
+        return self.tiers.get(container_name, self.default).blob_url(container_name, blob_name)
+
+
+class TieredEntityStorage:
+    """
+    Keeps some tables in another backend, e.g. the albums table on local disk and everything else in Azure.
+    """
+
+    def __init__(self, default: EntityStorage, tiers: Mapping[str, EntityStorage]) -> None:
+        """
+        :param default: Backend of every table not in ``tiers``
+        :param tiers: Backend of each table kept somewhere else, by table name
+        """
+
+        self.default = default
+        self.tiers = dict(tiers)
+
+    def get_table_client(self, table_name: str) -> EntityStore:
+        return self.tiers.get(table_name, self.default).get_table_client(table_name)
+
+    def create_table_if_not_exists(self, table_name: str, **kwargs: Any) -> Any:
+        return self.tiers.get(table_name, self.default).create_table_if_not_exists(table_name, **kwargs)
@@ -0,0 +1,913 @@
+"""
+Blob and entity stores on local disk, for running the app offline and for keeping hot data on a local SSD.
+
+Both keep their index in SQLite in WAL mode, so every worker process on the machine can share one directory.
+Writes take the database's write lock for as long as they check and change anything, which makes them atomic across processes.
+
+- Blobs are files named by the hash of their container and name. Their properties are rows of an index.
+  Files are written to a temporary name first and moved into place while the write lock is held,
+  so readers only ever see whole blobs.
+- Each entity table is a SQL table keyed by partition and row key, with the other properties as JSON.
+  Query filters are evaluated by :mod:`odata`, and filters on one partition only read that partition.
+
+Like the Azure SDK, these raise ``azure.core`` exceptions, so the app handles both the same way.
+"""
+
+import base64
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import IO, Any, Callable, Generic, TypeVar
+from uuid import uuid4
+
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from azure.data.tables import TableEntity, TableTransactionError, UpdateMode
+from azure.storage.blob import BlobBlock, ContentSettings
+from flask import url_for
+
+from . import odata
+
+T = TypeVar("T")
+
+MAX_PAGE_SIZE = 1000
+"""
+Most entities in one page of a query, like Azure Tables
+"""
+
+MAX_BLOB_PAGE_SIZE = 5000
+"""
+Most blobs in one page of a listing, like Azure Blob Storage
+"""
+
+MAX_TRANSACTION_SIZE = 100
+
+COPY_CHUNK_SIZE = 4 * 1024 * 1024
+
+_TABLE_NAME = re.compile(r"^[A-Za-z][A-Za-z0-9]{2,62}$")
+
+
+def _new_etag() -> str:
+    return f'"0x{uuid4().hex[:16].upper()}"'
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _hash(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+class _Database:
+    """
+    SQLite database with a connection per thread.
+    """
+
+    def __init__(self, path: str, schema: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        _ = self.connection.executescript(schema)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection: sqlite3.Connection | None = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit, so transactions are only what transaction() starts
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            _ = connection.execute("PRAGMA journal_mode=WAL")
+            _ = connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Hold the write lock until the block exits, then commit, or roll back if it raised.
+        """
+
+        connection = self.connection
+        _ = connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            _ = connection.execute("ROLLBACK")
+            raise
+        _ = connection.execute("COMMIT")
+
+
+class _Paged(Generic[T]):
+    """
+    Lazy listing, like ``ItemPaged``. Pages are fetched as they are iterated.
+    """
+
+    def __init__(self, fetch: Callable[[Any, int], tuple[list[T], Any]], page_size: int) -> None:
+        """
+        :param fetch: Gets at most ``page_size`` items after a continuation token, or from the start if it is None,
+            and the token of the next page, or None after the last page
+        """
+
+        self._fetch = fetch
+        self._page_size = page_size
+        self._items: Iterator[T] | None = None
+        self.continuation_token: Any = None
+
+    def _pages(self, continuation_token: Any) -> Iterator[Iterator[T]]:
+        while True:
+            items, continuation_token = self._fetch(continuation_token, self._page_size)
+            self.continuation_token = continuation_token
+            yield iter(items)
+            if continuation_token is None:
+                return
+
+    def by_page(self, continuation_token: Any = None) -> "_Pager[T]":
+        return _Pager(self._pages(continuation_token), self)
+
+    def __iter__(self) -> Iterator[T]:
+        return self
+
+    def __next__(self) -> T:
+        if self._items is None:
+            self._items = itertools.chain.from_iterable(self._pages(None))
+        return next(self._items)
+
+
+class _Pager(Generic[T]):
+    """
+    Pages of a :class:`_Paged`, with the token to resume after the last page fetched.
+    """
+
+    def __init__(self, pages: Iterator[Iterator[T]], paged: _Paged[T]) -> None:
+        self._pages = pages
+        self._paged = paged
+
+    @property
+    def continuation_token(self) -> Any:
+        return self._paged.continuation_token
+
+    def __iter__(self) -> Iterator[Iterator[T]]:
+        return self
+
+    def __next__(self) -> Iterator[T]:
+        return next(self._pages)
+
+
+# Blobs
+
+_BLOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    container TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    metadata TEXT NOT NULL,
+    content_type TEXT,
+    cache_control TEXT,
+    etag TEXT NOT NULL,
+    last_modified TEXT NOT NULL,
+    PRIMARY KEY (container, name)
+) WITHOUT ROWID;
+"""
+
+_BLOB_COLUMNS = "name, size, metadata, content_type, cache_control, etag, last_modified"
+
+
+@dataclass
+class LocalBlobProperties:
+    """
+    Properties of a local blob, like ``BlobProperties``.
+    """
+
+    name: str
+    container: str
+    size: int
+    metadata: dict[str, str]
+    content_settings: ContentSettings
+    last_modified: datetime
+    etag: str
+
+
+@dataclass(frozen=True)
+class LocalBatchResponse:
+    status_code: int
+    reason: str
+
+
+class LocalDownload:
+    """
+    A local blob being read, like ``StorageStreamDownloader``.
+    The file is opened when the download starts, so a blob overwritten meanwhile is still read whole.
+    """
+
+    def __init__(self, file: IO[bytes], offset: int, size: int, properties: LocalBlobProperties) -> None:
+        self._file = file
+        self._offset = offset
+        self.size = size
+        self.properties = properties
+        self.name = properties.name
+
+    def chunks(self) -> Iterator[bytes]:
+        with self._file:
+            _ = self._file.seek(self._offset)
+            remaining = self.size
+            while remaining > 0 and (chunk := self._file.read(min(COPY_CHUNK_SIZE, remaining))):
+                remaining -= len(chunk)
+                yield chunk
+
+    def readall(self) -> bytes:
+        return b"".join(self.chunks())
+
+    def readinto(self, stream: IO[bytes]) -> int:
+        size = 0
+        for chunk in self.chunks():
+            size += stream.write(chunk)
+        return size
+
+
+def _read(data: bytes | str | IO[bytes], length: int | None = None) -> Iterator[bytes]:
+    if isinstance(data, str):
+        data = data.encode()
+    if isinstance(data, bytes):
+        yield data
+        return
+
+    remaining = length
+    while remaining is None or remaining > 0:
+        chunk = data.read(COPY_CHUNK_SIZE if remaining is None else min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            return
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
+class LocalBlobStorage:
+    """
+    Blob storage in a local directory.
+    Containers exist as soon as they are asked for.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        :param directory: Where blobs and their index are kept. Created if it doesn't exist.
+        """
+
+        self.directory = directory
+        self._files_directory = os.path.join(directory, "blobs")
+        self._blocks_directory = os.path.join(directory, "blocks")
+        os.makedirs(self._files_directory, exist_ok=True)
+        os.makedirs(self._blocks_directory, exist_ok=True)
+        self._database = _Database(os.path.join(directory, "blobs.sqlite3"), _BLOB_SCHEMA)
+
+    def get_container_client(self, container: str) -> "LocalContainerClient":
+        return LocalContainerClient(self, container)
+
+    def blob_url(self, container_name: str, blob_name: str) -> str:
+        # Served by this app, which answers conditional requests, so the URL doesn't need to change with the blob
+        return url_for("api_local_storage_controller.blob", container_name=container_name, blob_name=blob_name)
+
+    def open(self, container_name: str, blob_name: str) -> tuple[IO[bytes], LocalBlobProperties]:
+        """
+        Open a blob for reading, e.g. to serve it.
+
+        :raises ResourceNotFoundError: when the blob doesn't exist
+        """
+
+        download = self.get_container_client(container_name).download_blob(blob_name)
+        return download._file, download.properties
+
+    # Files
+
+    def _file_path(self, container: str, name: str) -> str:
+        digest = _hash(container, name)
+        return os.path.join(self._files_directory, digest[:2], digest)
+
+    def _blocks_path(self, container: str, name: str) -> str:
+        return os.path.join(self._blocks_directory, _hash(container, name))
+
+    def _write_temp(self, chunks: Iterable[bytes]) -> tuple[str, int]:
+        """
+        Write a file next to the blobs, so it can be moved into place.
+        """
+
+        fd, path = tempfile.mkstemp(dir=self._files_directory, suffix=".tmp")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in chunks:
+                    size += file.write(chunk)
+        except BaseException:
+            os.unlink(path)
+            raise
+        return path, size
+
+    # Index
+
+    def _properties(self, container: str, row: tuple[Any, ...]) -> LocalBlobProperties:
+        name, size, metadata, content_type, cache_control, etag, last_modified = row
+        return LocalBlobProperties(
+            name,
+            container,
+            size,
+            json.loads(metadata),
+            ContentSettings(content_type=content_type, cache_control=cache_control),
+            datetime.fromisoformat(last_modified),
+            etag,
+        )
+
+    def _get(self, container: str, name: str) -> LocalBlobProperties | None:
+        row = self._database.connection.execute(
+            f"SELECT {_BLOB_COLUMNS} FROM blobs WHERE container = ? AND name = ?", (container, name)
+        ).fetchone()
+        return None if row is None else self._properties(container, row)
+
+    def _commit(
+        self,
+        container: str,
+        name: str,
+        temp_path: str,
+        size: int,
+        metadata: dict[str, str] | None,
+        content_settings: ContentSettings | None,
+        exists_error: type[Exception] | None,
+    ) -> dict[str, Any]:
+        """
+        Move a written file into place as a blob.
+
+        :param exists_error: Raised if the blob already exists, or None to overwrite it
+        """
+
+        content_settings = content_settings or ContentSettings()
+        etag, last_modified = _new_etag(), _now()
+        path = self._file_path(container, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with self._database.transaction() as connection:
+                if exists_error is not None and connection.execute(
+                    "SELECT 1 FROM blobs WHERE container = ? AND name = ?", (container, name)
+                ).fetchone():
+                    raise exists_error(f"The specified blob {name} already exists")
+
+                _ = connection.execute(
+                    f"INSERT OR REPLACE INTO blobs (container, {_BLOB_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        container,
+                        name,
+                        size,
+                        json.dumps(metadata or {}),
+                        content_settings.content_type,
+                        content_settings.cache_control,
+                        etag,
+                        last_modified.isoformat(),
+                    ),
+                )
+                # Moved while the lock is held, so the file and its row change together
+                os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+        return {"etag": etag, "last_modified": last_modified}
+
+    def _delete(self, container: str, name: str) -> bool:
+        with self._database.transaction() as connection:
+            deleted = connection.execute("DELETE FROM blobs WHERE container = ? AND name = ?", (container, name)).rowcount
+            if deleted:
+                try:
+                    os.unlink(self._file_path(container, name))
+                except FileNotFoundError:
+                    pass
+        return bool(deleted)
+
+    def _list(self, container: str, prefix: str, after: str | None, limit: int) -> list[LocalBlobProperties]:
+        rows = self._database.connection.execute(
+            f"""
+            SELECT {_BLOB_COLUMNS} FROM blobs
+            WHERE container = ? AND name > ? AND substr(name, 1, ?) = ?
+            ORDER BY name LIMIT ?
+            """,
+            (container, after if after is not None else prefix[:0], len(prefix), prefix, limit),
+        ).fetchall()
+        return [self._properties(container, row) for row in rows]
+
+    def ping(self) -> None:
+        _ = self._database.connection.execute("SELECT 1 FROM blobs LIMIT 1").fetchall()
+
+
+class LocalContainerClient:
+    """
+    One container of a :class:`LocalBlobStorage`, like ``ContainerClient``.
+    """
+
+    def __init__(self, storage: LocalBlobStorage, container_name: str) -> None:
+        self._storage = storage
+        self.container_name = container_name
+
+    def get_blob_client(self, blob: str) -> "LocalBlobClient":
+        return LocalBlobClient(self, blob)
+
+    def get_container_properties(self, **kwargs: Any) -> dict[str, Any]:
+        self._storage.ping()
+        return {"name": self.container_name}
+
+    def upload_blob(
+        self,
+        name: str,
+        data: bytes | str | IO[bytes],
+        overwrite: bool = False,
+        metadata: dict[str, str] | None = None,
+        content_settings: ContentSettings | None = None,
+        length: int | None = None,
+        **kwargs: Any,
+    ) -> dict[str, Any]:
+        temp_path, size = self._storage._write_temp(_read(data, length))
+        return self._storage._commit(
+            self.container_name, name, temp_path, size, metadata, content_settings, None if overwrite else ResourceExistsError
+        )
+
+    def download_blob(self, blob: str, offset: int | None = None, length: int | None = None, **kwargs: Any) -> LocalDownload:
+        # The row and file can't change between reading one and opening the other while the lock is held
+        with self._storage._database.transaction():
+            properties = self._storage._get(self.container_name, blob)
+            if properties is None:
+                raise ResourceNotFoundError(f"The specified blob {blob} does not exist")
+            file = open(self._storage._file_path(self.container_name, blob), "rb")
+
+        offset = offset or 0
+        size = max(properties.size - offset, 0)
+        if length is not None:
+            size = min(size, length)
+        return LocalDownload(file, offset, size, properties)
+
+    def get_blob_properties(self, blob: str, **kwargs: Any) -> LocalBlobProperties:
+        properties = self._storage._get(self.container_name, blob)
+        if properties is None:
+            raise ResourceNotFoundError(f"The specified blob {blob} does not exist")
+        return properties
+
+    def delete_blob(self, blob: str, **kwargs: Any) -> None:
+        """
+        Delete a blob and any blocks staged for it.
+        Azure discards staged blocks on its own after a week, but nothing else would discard them here.
+
+        :raises ResourceNotFoundError: when the blob wasn't committed, like Azure, even if staged blocks were discarded
+        """
+
+        shutil.rmtree(self._storage._blocks_path(self.container_name, blob), ignore_errors=True)
+        if not self._storage._delete(self.container_name, blob):
+            raise ResourceNotFoundError(f"The specified blob {blob} does not exist")
+
+    def delete_blobs(self, *blobs: str, raise_on_any_failure: bool = True, **kwargs: Any) -> Iterator[LocalBatchResponse]:
+        responses = [
+            LocalBatchResponse(202, "Accepted") if self._storage._delete(self.container_name, blob)
+            else LocalBatchResponse(404, "The specified blob does not exist.")
+            for blob in blobs
+        ]
+        if raise_on_any_failure and any(response.status_code >= 300 for response in responses):
+            raise ResourceNotFoundError("There is a partial failure in the batch operation.")
+        return iter(responses)
+
+    def list_blobs(
+        self,
+        name_starts_with: str | None = None,
+        include: Sequence[str] | str | None = None,
+        results_per_page: int | None = None,
+        **kwargs: Any,
+    ) -> _Paged[LocalBlobProperties]:
+        # Metadata is always included, since it is in the same row
+        prefix = name_starts_with or ""
+
+        def fetch(after: str | None, page_size: int) -> tuple[list[LocalBlobProperties], str | None]:
+            # One extra, so the last page is known to be last without fetching an empty one
+            blobs = self._storage._list(self.container_name, prefix, after, page_size + 1)
+            if len(blobs) > page_size:
+                return blobs[:page_size], blobs[page_size - 1].name
+            return blobs, None
+
+        return _Paged(fetch, min(results_per_page or MAX_BLOB_PAGE_SIZE, MAX_BLOB_PAGE_SIZE))
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "LocalContainerClient":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+
+class LocalBlobClient:
+    """
+    One blob of a :class:`LocalContainerClient`, like ``BlobClient``.
+    Staged blocks are kept as files until the block list is committed.
+    """
+
+    def __init__(self, container: LocalContainerClient, blob_name: str) -> None:
+        self._container = container
+        self._storage = container._storage
+        self.container_name = container.container_name
+        self.blob_name = blob_name
+
+    def upload_blob(self, data: bytes | str | IO[bytes], **kwargs: Any) -> dict[str, Any]:
+        return self._container.upload_blob(self.blob_name, data, **kwargs)
+
+    def download_blob(self, **kwargs: Any) -> LocalDownload:
+        return self._container.download_blob(self.blob_name, **kwargs)
+
+    def get_blob_properties(self, **kwargs: Any) -> LocalBlobProperties:
+        return self._container.get_blob_properties(self.blob_name)
+
+    def delete_blob(self, **kwargs: Any) -> None:
+        self._container.delete_blob(self.blob_name)
+
+    def _block_path(self, block_id: str) -> str:
+        # Reversible, so staged blocks can be listed by ID
+        name = base64.urlsafe_b64encode(block_id.encode()).decode()
+        return os.path.join(self._storage._blocks_path(self.container_name, self.blob_name), name)
+
+    def exists(self, **kwargs: Any) -> bool:
+        return self._storage._get(self.container_name, self.blob_name) is not None
+
+    def get_block_list(self, block_list_type: str = "committed", **kwargs: Any) -> tuple[list[BlobBlock], list[BlobBlock]]:
+        """
+        Blocks that are staged, as the second list. Committed blocks aren't kept, so the first list is empty.
+
+        :raises ResourceNotFoundError: when neither the blob nor any staged blocks exist, like Azure
+        """
+
+        blocks_directory = self._storage._blocks_path(self.container_name, self.blob_name)
+        try:
+            names = sorted(os.listdir(blocks_directory))
+        except FileNotFoundError:
+            names = []
+        if not names and not self.exists():
+            raise ResourceNotFoundError(f"The specified blob {self.blob_name} does not exist")
+
+        uncommitted = list[BlobBlock]()
+        for name in names:
+            if name.endswith(".tmp"):
+                continue
+            block = BlobBlock(block_id=base64.urlsafe_b64decode(name).decode())
+            block.size = os.path.getsize(os.path.join(blocks_directory, name))
+            uncommitted.append(block)
+        return [], uncommitted
+
+    def stage_block(self, block_id: str, data: bytes | str | IO[bytes], length: int | None = None, **kwargs: Any) -> None:
+        path = self._block_path(block_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path, _ = self._storage._write_temp(_read(data, length))
+        try:
+            os.replace(temp_path, path)
+        except FileNotFoundError:
+            # The block list was committed meanwhile, which removed the directory
+            os.unlink(temp_path)
+            raise
+
+    def commit_block_list(
+        self,
+        block_list: Sequence[Any],
+        metadata: dict[str, str] | None = None,
+        content_settings: ContentSettings | None = None,
+        match_condition: MatchConditions | None = None,
+        **kwargs: Any,
+    ) -> dict[str, Any]:
+        block_paths = [self._block_path(block.id) for block in block_list]
+        for block, path in zip(block_list, block_paths):
+            if not os.path.exists(path):
+                # Azure answers 400 InvalidBlockList, which the SDK raises as a plain HttpResponseError
+                error = HttpResponseError(message=f"The specified block list is invalid: block {block.id} is not staged")
+                error.status_code = 400
+                error.error_code = "InvalidBlockList"  # type: ignore[attr-defined]
+                raise error
+
+        def chunks() -> Iterator[bytes]:
+            for path in block_paths:
+                with open(path, "rb") as block_file:
+                    while chunk := block_file.read(COPY_CHUNK_SIZE):
+                        yield chunk
+
+        temp_path, size = self._storage._write_temp(chunks())
+        exists_error = ResourceModifiedError if match_condition == MatchConditions.IfMissing else None
+        result = self._storage._commit(
+            self.container_name, self.blob_name, temp_path, size, metadata, content_settings, exists_error
+        )
+
+        # Uncommitted blocks are discarded on commit, like Azure
+        shutil.rmtree(self._storage._blocks_path(self.container_name, self.blob_name), ignore_errors=True)
+        return result
+
+    def close(self) -> None:
+        pass
+
+
+# Tables
+
+_TABLE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS "{table_name}" (
+    PartitionKey TEXT NOT NULL,
+    RowKey TEXT NOT NULL,
+    Properties TEXT NOT NULL,
+    ETag TEXT NOT NULL,
+    Timestamp TEXT NOT NULL,
+    PRIMARY KEY (PartitionKey, RowKey)
+) WITHOUT ROWID;
+"""
+
+
+def _encode(value: Any) -> Any:
+    # JSON has no dates or bytes, so they are tagged
+    if isinstance(value, datetime):
+        # The SDK sends naive datetimes as UTC
+        return {"$datetime": (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()}
+    if isinstance(value, bytes):
+        return {"$binary": base64.b64encode(value).decode()}
+    return value
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "$datetime" in value:
+            return datetime.fromisoformat(value["$datetime"])
+        if "$binary" in value:
+            return base64.b64decode(value["$binary"])
+    return value
+
+
+def _select(select: Sequence[str] | str | None) -> Sequence[str] | None:
+    if isinstance(select, str):
+        return [key.strip() for key in select.split(",")]
+    return select
+
+
+@dataclass
+class _Row:
+    properties: dict[str, Any]
+    """Every property, including the partition and row keys"""
+    etag: str
+    timestamp: datetime
+
+    def entity(self, select: Sequence[str] | None = None) -> TableEntity:
+        entity = TableEntity()
+        if select is None:
+            entity.update(self.properties)
+        else:
+            entity.update((key, self.properties[key]) for key in select if key in self.properties)
+        entity._metadata = {"etag": self.etag, "timestamp": self.timestamp}  # type: ignore[typeddict-item]
+        return entity
+
+
+def _check_etag(row: _Row, etag: str | None, match_condition: MatchConditions | None) -> None:
+    if match_condition == MatchConditions.IfNotModified and etag != row.etag:
+        raise ResourceModifiedError("The update condition specified in the request was not satisfied.")
+
+
+class LocalEntityStorage:
+    """
+    Table storage in a local SQLite database.
+    Tables are created as soon as they are asked for.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        :param directory: Where the database is kept. Created if it doesn't exist.
+        """
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._database = _Database(os.path.join(directory, "tables.sqlite3"), "")
+        self._created = set[str]()
+        self._lock = threading.Lock()
+
+    def create_table_if_not_exists(self, table_name: str, **kwargs: Any) -> "LocalTableClient":
+        if not _TABLE_NAME.match(table_name):
+            raise ValueError(f"Invalid table name {table_name!r}")
+
+        with self._lock:
+            if table_name not in self._created:
+                with self._database.transaction() as connection:
+                    _ = connection.execute(_TABLE_SCHEMA.format(table_name=table_name))
+                self._created.add(table_name)
+
+        return LocalTableClient(self._database, table_name)
+
+    def get_table_client(self, table_name: str) -> "LocalTableClient":
+        return self.create_table_if_not_exists(table_name)
+
+
+class LocalTableClient:
+    """
+    One table of a :class:`LocalEntityStorage`, like ``TableClient``.
+    """
+
+    def __init__(self, database: _Database, table_name: str) -> None:
+        self._database = database
+        self.table_name = table_name
+        # Validated by LocalEntityStorage, so safe to use as an identifier
+        self._table = f'"{table_name}"'
+
+    def _get_row(self, connection: sqlite3.Connection, partition_key: str, row_key: str) -> _Row | None:
+        row = connection.execute(
+            f"SELECT PartitionKey, RowKey, Properties, ETag, Timestamp FROM {self._table} WHERE PartitionKey = ? AND RowKey = ?",
+            (partition_key, row_key),
+        ).fetchone()
+        return None if row is None else self._row(row)
+
+    def _row(self, row: tuple[str, str, str, str, str]) -> _Row:
+        partition_key, row_key, properties, etag, timestamp = row
+        return _Row(
+            {"PartitionKey": partition_key, "RowKey": row_key, **{key: _decode(value) for key, value in json.loads(properties).items()}},
+            etag,
+            datetime.fromisoformat(timestamp),
+        )
+
+    def _set_row(self, connection: sqlite3.Connection, entity: Mapping[str, Any]) -> dict[str, Any]:
+        etag, timestamp = _new_etag(), _now()
+        properties = {key: _encode(value) for key, value in entity.items() if key not in ("PartitionKey", "RowKey")}
+        _ = connection.execute(
+            f"INSERT OR REPLACE INTO {self._table} (PartitionKey, RowKey, Properties, ETag, Timestamp) VALUES (?, ?, ?, ?, ?)",
+            (entity["PartitionKey"], entity["RowKey"], json.dumps(properties), etag, timestamp.isoformat()),
+        )
+        return {"etag": etag, "date": timestamp}
+
+    def _delete_row(self, connection: sqlite3.Connection, partition_key: str, row_key: str) -> None:
+        _ = connection.execute(f"DELETE FROM {self._table} WHERE PartitionKey = ? AND RowKey = ?", (partition_key, row_key))
+
+    def create_entity(self, entity: Mapping[str, Any], **kwargs: Any) -> dict[str, Any]:
+        with self._database.transaction() as connection:
+            if self._get_row(connection, entity["PartitionKey"], entity["RowKey"]) is not None:
+                raise ResourceExistsError("The specified entity already exists.")
+            return self._set_row(connection, entity)
+
+    def upsert_entity(self, entity: Mapping[str, Any], mode: UpdateMode = UpdateMode.MERGE, **kwargs: Any) -> dict[str, Any]:
+        with self._database.transaction() as connection:
+            existing = self._get_row(connection, entity["PartitionKey"], entity["RowKey"])
+            if existing is not None and mode == UpdateMode.MERGE:
+                return self._set_row(connection, {**existing.properties, **entity})
+            return self._set_row(connection, entity)
+
+    def update_entity(
+        self,
+        entity: Mapping[str, Any],
+        mode: UpdateMode = UpdateMode.MERGE,
+        etag: str | None = None,
+        match_condition: MatchConditions | None = None,
+        **kwargs: Any,
+    ) -> dict[str, Any]:
+        with self._database.transaction() as connection:
+            existing = self._get_row(connection, entity["PartitionKey"], entity["RowKey"])
+            if existing is None:
+                raise ResourceNotFoundError("The specified resource does not exist.")
+            _check_etag(existing, etag, match_condition)
+            return self._set_row(connection, {**existing.properties, **entity} if mode == UpdateMode.MERGE else entity)
+
+    def get_entity(self, partition_key: str, row_key: str, select: Sequence[str] | str | None = None, **kwargs: Any) -> TableEntity:
+        row = self._get_row(self._database.connection, partition_key, row_key)
+        if row is None:
+            raise ResourceNotFoundError("The specified resource does not exist.")
+        return row.entity(_select(select))
+
+    def delete_entity(self, *args: Any, etag: str | None = None, match_condition: MatchConditions | None = None, **kwargs: Any) -> None:
+        # Either (partition_key, row_key) or (entity,), positionally or by keyword, like the SDK
+        if args and isinstance(args[0], Mapping):
+            partition_key, row_key = args[0]["PartitionKey"], args[0]["RowKey"]
+        elif "entity" in kwargs:
+            partition_key, row_key = kwargs["entity"]["PartitionKey"], kwargs["entity"]["RowKey"]
+        else:
+            partition_key = args[0] if args else kwargs["partition_key"]
+            row_key = args[1] if len(args) > 1 else kwargs["row_key"]
+
+        with self._database.transaction() as connection:
+            row = self._get_row(connection, partition_key, row_key)
+            if row is None:
+                # The SDK ignores entities that are already gone
+                return
+            _check_etag(row, etag, match_condition)
+            self._delete_row(connection, partition_key, row_key)
+
+    def _paged(
+        self,
+        query_filter: str | None,
+        parameters: Mapping[str, Any] | None,
+        select: Sequence[str] | str | None,
+        results_per_page: int | None,
+    ) -> _Paged[TableEntity]:
+        parsed = odata.parse(query_filter) if query_filter else None
+        parameters = dict(parameters or {})
+        columns = _select(select)
+        partition_key = parsed.partition_key({}, parameters) if parsed and parsed.partition_key else None
+
+        def scan(after: tuple[str, str] | None, limit: int) -> list[_Row]:
+            # Keyset paging, so each batch is an index range scan however deep it is
+            conditions, arguments = list[str](), list[Any]()
+            if partition_key is not None:
+                conditions.append("PartitionKey = ?")
+                arguments.append(partition_key)
+            if after is not None:
+                conditions.append("(PartitionKey, RowKey) > (?, ?)")
+                arguments += after
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            rows = self._database.connection.execute(
+                f"SELECT PartitionKey, RowKey, Properties, ETag, Timestamp FROM {self._table} {where} "
+                "ORDER BY PartitionKey, RowKey LIMIT ?",
+                (*arguments, limit),
+            ).fetchall()
+            return [self._row(row) for row in rows]
+
+        def fetch(token: dict[str, str] | None, page_size: int) -> tuple[list[TableEntity], dict[str, str] | None]:
+            after = None if token is None else (token["PartitionKey"], token["RowKey"])
+            page = list[TableEntity]()
+            last = after
+            # Scan until the page is full, since the filter may skip any number of rows
+            while True:
+                rows = scan(after, page_size + 1)
+                for row in rows:
+                    if len(page) == page_size:
+                        # There is more after this page. Resume after the last entity on it.
+                        assert last is not None
+                        return page, {"PartitionKey": last[0], "RowKey": last[1]}
+                    after = (row.properties["PartitionKey"], row.properties["RowKey"])
+                    if parsed is None or parsed.matches(row.properties, parameters):
+                        page.append(row.entity(columns))
+                        last = after
+
+                if len(rows) <= page_size:
+                    return page, None
+
+        return _Paged(fetch, min(results_per_page or MAX_PAGE_SIZE, MAX_PAGE_SIZE))
+
+    def query_entities(
+        self,
+        query_filter: str,
+        parameters: Mapping[str, Any] | None = None,
+        select: Sequence[str] | str | None = None,
+        results_per_page: int | None = None,
+        **kwargs: Any,
+    ) -> _Paged[TableEntity]:
+        return self._paged(query_filter, parameters, select, results_per_page)
+
+    def list_entities(
+        self,
+        select: Sequence[str] | str | None = None,
+        results_per_page: int | None = None,
+        **kwargs: Any,
+    ) -> _Paged[TableEntity]:
+        return self._paged(None, None, select, results_per_page)
+
+    def submit_transaction(self, operations: Iterable[tuple[Any, ...]], **kwargs: Any) -> list[dict[str, Any]]:
+        """
+        Apply every operation or none of them, like an entity group transaction.
+        """
+
+        operations = list(operations)
+        if len({operation[1]["PartitionKey"] for operation in operations}) > 1:
+            raise ValueError("All operations in a transaction must be in the same partition")
+        if len(operations) > MAX_TRANSACTION_SIZE:
+            raise ValueError(f"A transaction can hold at most {MAX_TRANSACTION_SIZE} operations")
+
+        results = list[dict[str, Any]]()
+        # Any error rolls back every operation before it
+        with self._database.transaction() as connection:
+            for index, operation in enumerate(operations):
+                kind, entity = str(operation[0]).lower(), operation[1]
+                options: dict[str, Any] = operation[2] if len(operation) > 2 else {}
+                existing = self._get_row(connection, entity["PartitionKey"], entity["RowKey"])
+                if kind == "create" and existing is not None:
+                    raise TableTransactionError(message=f"{index}:The specified entity already exists.", index=index)
+                if kind in ("update", "delete"):
+                    if existing is None:
+                        raise TableTransactionError(message=f"{index}:The specified resource does not exist.", index=index)
+                    try:
+                        _check_etag(existing, options.get("etag"), options.get("match_condition"))
+                    except ResourceModifiedError as e:
+                        raise TableTransactionError(message=f"{index}:{e.message}", index=index) from e
+
+                match kind:
+                    case "delete":
+                        self._delete_row(connection, entity["PartitionKey"], entity["RowKey"])
+                        results.append({})
+                    case "upsert" | "update" if existing is not None and options.get("mode", UpdateMode.MERGE) == UpdateMode.MERGE:
+                        results.append(self._set_row(connection, {**existing.properties, **entity}))
+                    case "create" | "upsert" | "update":
+                        results.append(self._set_row(connection, entity))
+                    case _:
+                        raise ValueError(f"Unsupported transaction operation {kind!r}")
+
+        return results
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "LocalTableClient":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
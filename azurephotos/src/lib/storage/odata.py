@@ -0,0 +1,207 @@
+"""
+Evaluator for the subset of OData filters the app sends to Azure Tables, for entity stores that are not Azure.
+
+Supports ``eq``, ``ne``, ``gt``, ``ge``, ``lt``, ``le``, ``and``, ``or``, ``not``, parentheses,
+string, number, boolean, and ``datetime'...'`` literals, and ``@name`` parameters.
+Like Azure Tables, a comparison against a property an entity doesn't have is false.
+"""
+
+import operator
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Mapping
+
+Predicate = Callable[[Mapping[str, Any], Mapping[str, Any]], bool]
+"""
+Takes an entity and the query parameters
+"""
+
+Operand = Callable[[Mapping[str, Any], Mapping[str, Any]], Any]
+
+_COMPARISONS: dict[str, Callable[[Any, Any], bool]] = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "ge": operator.ge,
+    "lt": operator.lt,
+    "le": operator.le,
+}
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<paren>[()])
+      | (?P<datetime>datetime'[^']*')
+      | (?P<string>'(?:[^']|'')*')
+      | (?P<parameter>@\w+)
+      | (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<word>\w+)
+    )
+""", re.VERBOSE)
+
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class Filter:
+    """
+    A parsed filter.
+    """
+
+    predicate: Predicate
+    partition_key: Operand | None
+    """
+    Gets the partition key every match must have, when the filter requires ``PartitionKey eq <value>``,
+    so only that partition needs to be scanned
+    """
+
+    def matches(self, entity: Mapping[str, Any], parameters: Mapping[str, Any]) -> bool:
+        return self.predicate(entity, parameters)
+
+
+def _tokenize(text: str) -> list[tuple[str, str]]:
+    tokens = list[tuple[str, str]]()
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"Unexpected character at {position} in filter {text!r}")
+        kind = str(match.lastgroup)
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent parser. ``or`` binds loosest, then ``and``, then ``not``, then comparisons.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.position = 0
+
+    def _peek(self) -> tuple[str, str] | None:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _take(self) -> tuple[str, str]:
+        token = self._peek()
+        if token is None:
+            raise ValueError(f"Unexpected end of filter {self.text!r}")
+        self.position += 1
+        return token
+
+    def _accept_word(self, word: str) -> bool:
+        token = self._peek()
+        if token is not None and token[0] == "word" and token[1] == word:
+            self.position += 1
+            return True
+        return False
+
+    def parse(self) -> Filter:
+        predicate, partition_key = self._or()
+        if self._peek() is not None:
+            raise ValueError(f"Unexpected {self._peek()} in filter {self.text!r}")
+        return Filter(predicate, partition_key)
+
+    def _or(self) -> tuple[Predicate, Operand | None]:
+        predicate, partition_key = self._and()
+        alternatives = [predicate]
+        while self._accept_word("or"):
+            alternatives.append(self._and()[0])
+
+        if len(alternatives) == 1:
+            return predicate, partition_key
+        # Alternatives may be in any partition
+        return (lambda entity, parameters: any(p(entity, parameters) for p in alternatives)), None
+
+    def _and(self) -> tuple[Predicate, Operand | None]:
+        predicate, partition_key = self._not()
+        conjuncts = [predicate]
+        while self._accept_word("and"):
+            conjunct, conjunct_partition_key = self._not()
+            conjuncts.append(conjunct)
+            partition_key = partition_key or conjunct_partition_key
+
+        if len(conjuncts) == 1:
+            return predicate, partition_key
+        return (lambda entity, parameters: all(p(entity, parameters) for p in conjuncts)), partition_key
+
+    def _not(self) -> tuple[Predicate, Operand | None]:
+        if self._accept_word("not"):
+            predicate = self._not()[0]
+            return (lambda entity, parameters: not predicate(entity, parameters)), None
+        return self._primary()
+
+    def _primary(self) -> tuple[Predicate, Operand | None]:
+        token = self._peek()
+        if token == ("paren", "("):
+            self.position += 1
+            result = self._or()
+            if self._take() != ("paren", ")"):
+                raise ValueError(f"Unbalanced parentheses in filter {self.text!r}")
+            return result
+
+        left_token = self._take()
+        comparison = self._take()
+        right_token = self._take()
+        if comparison[0] != "word" or comparison[1] not in _COMPARISONS:
+            raise ValueError(f"Expected a comparison, got {comparison[1]!r} in filter {self.text!r}")
+
+        compare = _COMPARISONS[comparison[1]]
+        left, right = self._operand(left_token), self._operand(right_token)
+
+        def predicate(entity: Mapping[str, Any], parameters: Mapping[str, Any]) -> bool:
+            left_value, right_value = left(entity, parameters), right(entity, parameters)
+            if left_value is _MISSING or right_value is _MISSING:
+                return False
+            try:
+                return compare(left_value, right_value)
+            except TypeError:
+                # Azure Tables never matches values of different types
+                return False
+
+        partition_key = None
+        if comparison[1] == "eq" and left_token == ("word", "PartitionKey") and right_token[0] != "word":
+            partition_key = right
+
+        return predicate, partition_key
+
+    def _operand(self, token: tuple[str, str]) -> Operand:
+        kind, text = token
+        match kind:
+            case "word" if text in ("true", "false"):
+                value: Any = text == "true"
+                return lambda entity, parameters: value
+            case "word":
+                return lambda entity, parameters: entity.get(text, _MISSING)
+            case "parameter":
+                name = text[1:]
+                return lambda entity, parameters: parameters[name]
+            case "string":
+                string = text[1:-1].replace("''", "'")
+                return lambda entity, parameters: string
+            case "datetime":
+                moment = datetime.fromisoformat(text[len("datetime'"):-1].replace("Z", "+00:00"))
+                return lambda entity, parameters: moment
+            case "number":
+                number = float(text) if "." in text else int(text)
+                return lambda entity, parameters: number
+            case _:
+                raise ValueError(f"Unexpected {text!r} in filter {self.text!r}")
+
+
+@lru_cache(maxsize=256)
+def parse(text: str) -> Filter:
+    """
+    Parse a filter. Filters are parsed once and reused, since the app only varies their parameters.
+
+    :param text: The filter, e.g. ``"PartitionKey eq @album_name and RowKey ne ''"``
+    :raises ValueError: when the filter is malformed or uses something unsupported
+    """
+
+    return _Parser(text).parse()
@@ -1,29 +1,155 @@
+from base64 import b64encode
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta, timezone
 from flask import current_app
-from azure.storage.blob import (
-    ContainerSasPermissions,
-    generate_container_sas,
-    BlobServiceClient,
-)
-from .refresher import refreshed
-
-@refreshed(every=timedelta(minutes=15))
-def get_container_sas(container_name: str) -> str:
-    now = datetime.now(timezone.utc)
-    sas_start = now - timedelta(minutes=1)
-    sas_end = now + timedelta(minutes=30)
-
-    bsc: BlobServiceClient = current_app.config["blob_service_client"]
-    user_delegation_key = bsc.get_user_delegation_key(
-        key_start_time=sas_start,
-        key_expiry_time=sas_end
-    )
-
-    return generate_container_sas(
-        account_name=str(bsc.account_name),
-        container_name=container_name,
-        user_delegation_key=user_delegation_key,
-        permission=ContainerSasPermissions(read=True),
-        start=sas_start,
-        expiry=sas_end,
-    )
+from typing import IO, Protocol
+from uuid import uuid4
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError
+from azure.storage.blob import BlobBlock, ContentSettings
+from .storage.base import BlobStorage, BlobStore
+
+SAS_WINDOW = timedelta(minutes=15)
+"""
+Every URL signed within the same window is identical, so browsers can keep using what they cached for it.
+Each signature is valid until the end of the following window.
+"""
+
+SAS_CLOCK_SKEW = timedelta(minutes=5)
+"""
+How far before its window a signature is valid, in case storage's clock is behind ours
+"""
+
+
+def signing_window(now: datetime | None = None) -> datetime:
+    """
+    Start of the signing window a time falls in.
+
+    :param now: Time to find the window for. Defaults to the current time.
+    """
+
+    now = now or datetime.now(timezone.utc)
+    window_seconds = int(SAS_WINDOW.total_seconds())
+    return datetime.fromtimestamp(int(now.timestamp()) // window_seconds * window_seconds, timezone.utc)
+
+
+def blob_url(container_name: str, blob_name: str) -> str:
+    """
+    URL that reads a blob directly from wherever it is stored, without going through this app's views.
+    Stable within a signing window. See :obj:`SAS_WINDOW`.
+
+    :param container_name: Container holding the blob
+    :param blob_name: Name of the blob
+    """
+
+    blob_storage: BlobStorage = current_app.config["blob_storage"]
+    return blob_storage.blob_url(container_name, blob_name)
+
+
+class Writable(Protocol):
+    """
+    Anything bytes can be written to, like a file.
+    """
+
+    def write(self, data: bytes, /) -> int: ...
+
+
+MAX_BLOB_BATCH_SIZE = 256
+"""
+Most sub-requests Azure Blob Storage allows in one batch request
+"""
+
+def delete_blobs(container_client: BlobStore, names: list[str]) -> dict[str, str]:
+    """
+    Delete many blobs using batch requests.
+    Blobs that are already gone count as deleted.
+
+    :param container_client: Container holding the blobs
+    :param names: Blob names
+    :return: Error message for every blob that could not be deleted
+    """
+
+    errors = dict[str, str]()
+    for start in range(0, len(names), MAX_BLOB_BATCH_SIZE):
+        chunk = names[start:start + MAX_BLOB_BATCH_SIZE]
+        try:
+            responses = container_client.delete_blobs(*chunk, raise_on_any_failure=False)
+            for name, response in zip(chunk, responses):
+                # 404 means the blob was already deleted
+                if response.status_code >= 300 and response.status_code != 404:
+                    errors[name] = f"HTTP {response.status_code} {response.reason}"
+        except Exception as e:
+            for name in chunk:
+                errors[name] = str(e)
+
+    return errors
+
+
+def upload_stream(
+    container_client: BlobStore,
+    name: str,
+    stream: IO[bytes],
+    metadata: dict[str, str],
+    buffer_size: int,
+    max_concurrency: int = 4,
+    tee: Writable | None = None,
+    content_settings: ContentSettings | None = None,
+) -> int:
+    """
+    Upload a stream as a new block blob without reading all of it into memory.
+
+    The stream is read in blocks of ``buffer_size // max_concurrency`` bytes, which are staged in parallel,
+    so at most about ``buffer_size`` bytes of it are held in memory no matter how large it is.
+    The blob only appears once every block is staged and the block list is committed.
+
+    :param container_client: Container to upload to
+    :param name: Blob name
+    :param stream: Data to upload, read until exhausted
+    :param metadata: Blob metadata
+    :param buffer_size: Most bytes of the stream to hold in memory at once
+    :param max_concurrency: Max number of blocks being staged at once
+    :param tee: File that every block is also written to as it is read, e.g. to compute a thumbnail
+    :param content_settings: Blob content settings
+    :return: Size of the uploaded blob
+    :raises:
+        ResourceExistsError when blob with name already exists
+    """
+
+    blob_client = container_client.get_blob_client(name)
+    block_size = max(buffer_size // max_concurrency, 1)
+
+    # Block IDs must all be the same length. The random prefix keeps two concurrent uploads of the same name from mixing blocks.
+    upload_id = uuid4().hex
+    block_ids = list[str]()
+    size = 0
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        in_flight = set[Future[None]]()
+        while chunk := stream.read(block_size):
+            if tee is not None:
+                _ = tee.write(chunk)
+
+            if len(in_flight) >= max_concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+
+            block_id = b64encode(f"{upload_id}{len(block_ids):08d}".encode()).decode()
+            block_ids.append(block_id)
+            size += len(chunk)
+            in_flight.add(executor.submit(blob_client.stage_block, block_id, chunk, length=len(chunk)))
+
+        for future in wait(in_flight).done:
+            future.result()
+
+    try:
+        _ = blob_client.commit_block_list(
+            [BlobBlock(block_id=block_id) for block_id in block_ids],
+            metadata=metadata,
+            content_settings=content_settings,
+            match_condition=MatchConditions.IfMissing,
+        )
+    except ResourceModifiedError as e:
+        raise ResourceExistsError(f"Blob {name} already exists") from e
+
+    return size
@@ -0,0 +1,247 @@
+from azure.core.exceptions import ResourceNotFoundError
+from azure.data.tables import TableEntity, TableTransactionError, UpdateMode
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator, Mapping, Sequence, TypeVar
+from .storage.base import EntityStore
+
+T = TypeVar("T")
+
+MAX_BATCH_SIZE = 100
+"""
+Most operations Azure Table Storage allows in one entity group transaction
+"""
+
+MAX_FILTER_COMPARISONS = 15
+"""
+Most comparisons Azure Table Storage allows in one query filter
+"""
+
+DEFAULT_MAX_WORKERS = 8
+"""
+Number of transactions to have in flight at once
+"""
+
+
+@dataclass
+class BatchProgress:
+    """
+    Outcome of a batched table operation.
+    """
+
+    total: int = 0
+    """Number of entities the operation covers"""
+    completed: int = 0
+    """Number of entities the operation finished"""
+    batches: int = 0
+    """Number of batches the entities were split into"""
+    failed_batches: int = 0
+    """Number of batches that did not finish. Running the operation again resumes them."""
+    failed_row_keys: list[str] = field(default_factory=list)
+    """Row keys of the entities in failed batches"""
+    errors: list[str] = field(default_factory=list)
+
+    @property
+    def done(self) -> bool:
+        return self.failed_batches == 0
+
+
+def chunked(items: Iterable[T], size: int = MAX_BATCH_SIZE) -> Iterator[list[T]]:
+    """
+    Split items into lists of at most ``size`` items.
+    """
+
+    chunk = list[T]()
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = list[T]()
+    if chunk:
+        yield chunk
+
+
+def get_entities(
+    table_client: EntityStore,
+    row_keys: Iterable[str],
+    partition_key: str | None = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> list[TableEntity]:
+    """
+    Look up many entities by row key with as few queries as possible.
+
+    Row keys are OR-ed together into filters of at most :obj:`MAX_FILTER_COMPARISONS` comparisons, and the queries run in parallel.
+    Row keys that don't exist are left out of the result.
+
+    :param row_keys: Row keys to look up
+    :param partition_key: Partition to look in, or None to look in every partition
+    """
+
+    comparisons_per_query = MAX_FILTER_COMPARISONS - (partition_key is not None)
+    chunks = list(chunked(dict.fromkeys(row_keys), comparisons_per_query))
+    if not chunks:
+        return []
+
+    def query_chunk(chunk: list[str]) -> list[TableEntity]:
+        parameters: dict[str, Any] = {f"row_key{i}": row_key for i, row_key in enumerate(chunk)}
+        query = " or ".join(f"RowKey eq @row_key{i}" for i in range(len(chunk)))
+        if partition_key is not None:
+            query = f"PartitionKey eq @partition_key and ({query})"
+            parameters["partition_key"] = partition_key
+
+        return list(table_client.query_entities(query_filter=query, parameters=parameters))
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        return [entity for entities in executor.map(query_chunk, chunks) for entity in entities]
+
+
+def group_by_partition(entities: Iterable[Mapping[str, Any]]) -> dict[str, list[Mapping[str, Any]]]:
+    """
+    Group entities by partition key, since a transaction can only touch one partition.
+    """
+
+    partitions = dict[str, list[Mapping[str, Any]]]()
+    for entity in entities:
+        partitions.setdefault(entity["PartitionKey"], []).append(entity)
+
+    return partitions
+
+
+def delete_entities(table_client: EntityStore, entities: Sequence[Mapping[str, Any]]) -> None:
+    """
+    Delete entities that all share a partition in one transaction.
+    Entities that are already gone are ignored.
+    """
+
+    if not entities:
+        return
+
+    try:
+        _ = table_client.submit_transaction([
+            ("delete", {"PartitionKey": e["PartitionKey"], "RowKey": e["RowKey"]})
+            for e in entities
+        ])
+    except TableTransactionError:
+        # The whole transaction is rolled back if any entity is missing,
+        # e.g. because a single-file request removed it concurrently. Fall back to deleting one at a time.
+        for entity in entities:
+            try:
+                table_client.delete_entity(entity["PartitionKey"], entity["RowKey"])
+            except ResourceNotFoundError:
+                # Entry already deleted
+                pass
+
+
+def upsert_entities(table_client: EntityStore, entities: Sequence[Mapping[str, Any]]) -> None:
+    """
+    Insert or replace entities that all share a partition in one transaction.
+    """
+
+    if not entities:
+        return
+
+    _ = table_client.submit_transaction([
+        ("upsert", dict(e), {"mode": UpdateMode.REPLACE}) for e in entities
+    ])
+
+
+def move_entities(
+    table_client: EntityStore,
+    entities: Sequence[Mapping[str, Any]],
+    target_partition: str,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> BatchProgress:
+    """
+    Move entities from their partition into another one.
+
+    Entities are split into batches of :obj:`MAX_BATCH_SIZE`.
+    Each batch is one transaction inserting into the target partition followed by one transaction deleting from the source partition.
+    Independent batches run in parallel.
+    An entity is only deleted from its source after it has been written to the target,
+    so running the move again after an interruption picks up where it left off.
+
+    :param entities: Entities to move. Batches must not mix source partitions, so pass entities from a single partition.
+    :param target_partition: Partition key to move the entities to
+    :param max_workers: Max number of batches in flight at once
+    """
+
+    chunks = list(chunked(entities))
+
+    def move_chunk(chunk: list[Mapping[str, Any]]) -> int:
+        upsert_entities(table_client, [{**e, "PartitionKey": target_partition} for e in chunk])
+        delete_entities(table_client, chunk)
+        return len(chunk)
+
+    return _run_batches(chunks, move_chunk, max_workers)
+
+
+def upsert_all_entities(
+    table_client: EntityStore,
+    entities: Sequence[Mapping[str, Any]],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> BatchProgress:
+    """
+    Insert or replace entities in any number of partitions.
+    Entities are grouped by partition and split into batches of :obj:`MAX_BATCH_SIZE`, which run in parallel.
+    """
+
+    chunks = [
+        chunk
+        for partition in group_by_partition(entities).values()
+        for chunk in chunked(partition)
+    ]
+
+    def upsert_chunk(chunk: list[Mapping[str, Any]]) -> int:
+        upsert_entities(table_client, chunk)
+        return len(chunk)
+
+    return _run_batches(chunks, upsert_chunk, max_workers)
+
+
+def delete_all_entities(
+    table_client: EntityStore,
+    entities: Sequence[Mapping[str, Any]],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> BatchProgress:
+    """
+    Delete entities from any number of partitions.
+    Entities are grouped by partition and split into batches of :obj:`MAX_BATCH_SIZE`, which run in parallel.
+    """
+
+    chunks = [
+        chunk
+        for partition in group_by_partition(entities).values()
+        for chunk in chunked(partition)
+    ]
+
+    def delete_chunk(chunk: list[Mapping[str, Any]]) -> int:
+        delete_entities(table_client, chunk)
+        return len(chunk)
+
+    return _run_batches(chunks, delete_chunk, max_workers)
+
+
+def _run_batches(
+    chunks: list[list[Mapping[str, Any]]],
+    action: Callable[[list[Mapping[str, Any]]], int],
+    max_workers: int,
+) -> BatchProgress:
+    """
+    Run an action on every batch in parallel, collecting which batches failed.
+    """
+
+    progress = BatchProgress(total=sum(len(chunk) for chunk in chunks), batches=len(chunks))
+    if not chunks:
+        return progress
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        futures = {executor.submit(action, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                progress.completed += future.result()
+            except Exception as e:
+                progress.failed_batches += 1
+                progress.failed_row_keys.extend(entity["RowKey"] for entity in futures[future])
+                progress.errors.append(str(e))
+
+    return progress
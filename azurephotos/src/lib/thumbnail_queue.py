@@ -0,0 +1,224 @@
+"""
+Durable queue of thumbnails waiting to be generated.
+
+Jobs are entities in the ``ThumbnailJobs`` table, keyed by the filename of the original.
+A worker claims a job by setting a lease on it with an ETag-conditional update, so two workers never process the same job at once.
+Failed jobs are retried with exponential backoff, and moved to a dead-letter partition after :obj:`MAX_ATTEMPTS` attempts.
+Pages show a placeholder for pending thumbnails, and a different one for dead-lettered thumbnails.
+"""
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError, ResourceModifiedError
+from azure.data.tables import TableEntity, UpdateMode
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from typing import Iterable
+
+from .models.media import MediaType
+from .refresher import cached
+from .storage.base import EntityStore
+from .table_batch import BatchProgress, delete_all_entities, get_entities
+
+PENDING_PARTITION: str = "pending"
+"""
+Partition of jobs waiting to be processed or retried
+"""
+
+DEAD_LETTER_PARTITION: str = "deadletter"
+"""
+Partition of jobs that failed too many times. Inspect these by hand, or regenerate with ``flask thumbnails backfill``.
+"""
+
+MAX_ATTEMPTS = 5
+"""
+Number of times a job is tried before it is dead-lettered
+"""
+
+LEASE_DURATION = timedelta(minutes=5)
+"""
+How long a worker has to finish a job before another worker may claim it
+"""
+
+RETRY_BACKOFF = timedelta(seconds=15)
+"""
+Delay before the first retry. Doubles with each attempt.
+"""
+
+
+def enqueue(filename: str, media_type: MediaType) -> None:
+    """
+    Queue a thumbnail to be generated for an uploaded original.
+
+    :param filename: Name of the original blob
+    :param media_type: Whether the original is a photo or a video
+    """
+
+    table_client: EntityStore = current_app.config["thumbnail_jobs_table_client"]
+    _ = table_client.upsert_entity({
+        "PartitionKey": PENDING_PARTITION,
+        "RowKey": filename,
+        "MediaType": media_type.value,
+        "Attempts": 0,
+        "LeaseUntil": datetime.now(timezone.utc),
+        "Enqueued": datetime.now(timezone.utc),
+    }, mode=UpdateMode.REPLACE)
+    try:
+        # A file uploaded again under the name of one whose thumbnail failed gets a fresh start
+        table_client.delete_entity(DEAD_LETTER_PARTITION, filename)
+    except ResourceNotFoundError:
+        pass
+
+    # This worker should see its own upload as pending right away
+    pending_thumbnails.invalidate()
+    failed_thumbnails.invalidate()
+
+
+def discard_jobs(filenames: Iterable[str]) -> BatchProgress:
+    """
+    Remove the pending and dead-lettered jobs of deleted originals, so they are neither processed nor shown as failed.
+    A job a worker already claimed fails, and is dropped rather than dead-lettered. See :func:`fail`.
+
+    :param filenames: Names of the deleted originals
+    :return: Outcome of removing the jobs that existed
+    """
+
+    table_client: EntityStore = current_app.config["thumbnail_jobs_table_client"]
+
+    filenames = list(filenames)
+    jobs = [
+        *get_entities(table_client, filenames, partition_key=PENDING_PARTITION),
+        *get_entities(table_client, filenames, partition_key=DEAD_LETTER_PARTITION),
+    ]
+    progress = delete_all_entities(table_client, jobs)
+
+    pending_thumbnails.invalidate()
+    failed_thumbnails.invalidate()
+    return progress
+
+
+@cached(ttl=timedelta(seconds=5), refresh_after=timedelta(seconds=4), max_size=1)
+def pending_thumbnails() -> frozenset[str]:
+    """
+    Filenames whose thumbnail is queued, and so doesn't exist yet.
+    Reads only the pending partition, which the worker keeps short.
+    """
+
+    return _partition_row_keys(PENDING_PARTITION)
+
+
+@cached(ttl=timedelta(minutes=5), refresh_after=timedelta(minutes=4), max_size=1)
+def failed_thumbnails() -> frozenset[str]:
+    """
+    Filenames whose thumbnail was dead-lettered, and so won't exist until it is regenerated.
+    Changes rarely, so it is read far less often than :func:`pending_thumbnails`.
+    """
+
+    return _partition_row_keys(DEAD_LETTER_PARTITION)
+
+
+def _partition_row_keys(partition: str) -> frozenset[str]:
+    table_client: EntityStore = current_app.config["thumbnail_jobs_table_client"]
+    entities = table_client.query_entities(
+        query_filter="PartitionKey eq @partition",
+        parameters={"partition": partition},
+        select=["RowKey"],
+    )
+    return frozenset(entity["RowKey"] for entity in entities)
+
+
+def claim(limit: int) -> list[TableEntity]:
+    """
+    Lease up to ``limit`` jobs that are due.
+
+    :return: The claimed jobs. Each must be passed to :func:`complete` or :func:`fail`.
+    """
+
+    table_client: EntityStore = current_app.config["thumbnail_jobs_table_client"]
+
+    now = datetime.now(timezone.utc)
+    query = "PartitionKey eq @pending and LeaseUntil le @now"
+    parameters = {"pending": PENDING_PARTITION, "now": now}
+    candidates = table_client.query_entities(query_filter=query, parameters=parameters, results_per_page=limit)
+
+    claimed = list[TableEntity]()
+    for job in candidates:
+        job["LeaseUntil"] = now + LEASE_DURATION
+        job["Attempts"] = int(job.get("Attempts", 0)) + 1
+        try:
+            metadata = table_client.update_entity(
+                job,
+                mode=UpdateMode.REPLACE,
+                etag=job.metadata["etag"],
+                match_condition=MatchConditions.IfNotModified,
+            )
+        except (ResourceModifiedError, ResourceNotFoundError):
+            # Another worker claimed or finished it first
+            continue
+
+        job.metadata["etag"] = metadata["etag"]
+        claimed.append(job)
+        if len(claimed) >= limit:
+            break
+
+    return claimed
+
+
+def complete(job: TableEntity) -> None:
+    """
+    Remove a job whose thumbnail was generated.
+    """
+
+    table_client: EntityStore = current_app.config["thumbnail_jobs_table_client"]
+    try:
+        # Only delete if nobody re-enqueued the file since we claimed it
+        table_client.delete_entity(
+            job["PartitionKey"],
+            job["RowKey"],
+            etag=job.metadata["etag"],
+            match_condition=MatchConditions.IfNotModified,
+        )
+    except (ResourceModifiedError, ResourceNotFoundError):
+        pass
+
+
+def fail(job: TableEntity, error: BaseException) -> None:
+    """
+    Record that a job failed. It is retried later, or dead-lettered if it is out of attempts.
+    """
+
+    table_client: EntityStore = current_app.config["thumbnail_jobs_table_client"]
+
+    attempts = int(job.get("Attempts", 1))
+    job["LastError"] = str(error)[:4096]
+    if attempts >= MAX_ATTEMPTS:
+        # Deleting an entity that is already gone succeeds, so check that the job is still ours first
+        try:
+            current = table_client.get_entity(job["PartitionKey"], job["RowKey"])
+            if current.metadata["etag"] != job.metadata["etag"]:
+                raise ResourceModifiedError("Job changed since it was claimed")
+            table_client.delete_entity(
+                job["PartitionKey"],
+                job["RowKey"],
+                etag=job.metadata["etag"],
+                match_condition=MatchConditions.IfNotModified,
+            )
+        except (ResourceModifiedError, ResourceNotFoundError):
+            # Original deleted or uploaded again since we claimed it. Nothing to dead-letter.
+            return
+
+        dead_letter = dict(job)
+        dead_letter["PartitionKey"] = DEAD_LETTER_PARTITION
+        _ = table_client.upsert_entity(dead_letter, mode=UpdateMode.REPLACE)
+        failed_thumbnails.invalidate()
+        return
+
+    job["LeaseUntil"] = datetime.now(timezone.utc) + RETRY_BACKOFF * (2 ** (attempts - 1))
+    try:
+        _ = table_client.update_entity(
+            job,
+            mode=UpdateMode.REPLACE,
+            etag=job.metadata["etag"],
+            match_condition=MatchConditions.IfNotModified,
+        )
+    except (ResourceModifiedError, ResourceNotFoundError):
+        pass
@@ -1,19 +1,30 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from flask import current_app
 from io import BytesIO
 from PIL import Image, ImageFile, ImageOps
 from PIL.Image import DecompressionBombError
-from typing import IO
+from typing import IO, Iterable
 
 import os
 import shutil
 import subprocess
 import tempfile
+from threading import Lock
+
+from . import metrics
 
 WIDTH = 384
 HEIGHT = 384
 SIZE = (WIDTH, HEIGHT)
 OUTPUT_FORMAT = "WEBP"
 
+THUMBNAIL_VERSION = "2"
+"""
+Stored in the metadata of every thumbnail and preview. Bump whenever the size, quality, crop, or previews change,
+then run ``flask thumbnails backfill`` to regenerate what is out of date.
+"""
+THUMBNAIL_VERSION_METADATA_KEY = "thumbnailVersion"
+
 # Protect against maliciously large images
 # TODO: Should this be enforced before the call to thumbnail in upload logic?
 # Maybe also a frontend size limit?
@@ -43,6 +54,85 @@ except ImportError:
 
 SUPPORTED_FORMATS = frozenset(_supported_formats)
 
+_process_pool: ProcessPoolExecutor | None = None
+_process_pool_lock = Lock()
+
+
+def process_pool(max_workers: int | None = None) -> ProcessPoolExecutor:
+    """
+    Shared pool for CPU bound thumbnail encoding, so encodes aren't serialized on the GIL.
+    Created on first use, so each gunicorn worker gets its own pool after forking.
+
+    :param max_workers: Size of the pool if it needs to be created. Defaults to the number of CPUs.
+    """
+
+    global _process_pool
+
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=max_workers)
+        return _process_pool
+
+
+def _decode(img: Image.Image, draft_size: tuple[int, int]) -> Image.Image:
+    """
+    Validate and normalize an opened image so derivatives can be made from it.
+    """
+
+    # Validate format if known
+    img_format = img.format.upper() if img.format else None
+    if img_format and img_format not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported image format {img_format}")
+
+    # Faster decoding for large JPEGs
+    img.draft("RGB", draft_size)
+
+    # Maintain EXIF orientation
+    ImageOps.exif_transpose(img, in_place=True)
+
+    # Ensure only first frame for animated or multiframe images
+    if getattr(img, "n_frames", 1) > 1:
+        img.seek(0)
+
+    # Normalize color mode
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    return img
+
+
+def _crop_thumbnail(img: Image.Image) -> Image.Image:
+    # Early downscale for very large images
+    img = img.copy()
+    img.thumbnail(
+        (SIZE[0] * 4, SIZE[1] * 4),
+        Image.Resampling.BOX
+    )
+
+    # Crop and resize
+    return ImageOps.fit(
+        img,
+        SIZE,
+        method=Image.Resampling.LANCZOS,
+        centering=(0.5, 0.45)
+    )
+
+
+def _encode(img: Image.Image) -> BytesIO:
+    buffer = BytesIO()
+    img.save(
+        buffer,
+        OUTPUT_FORMAT,
+        quality=82,
+        method=6, # encoder effort
+        exact=False # ok with losing RGB data in transparent pixels
+    )
+
+    buffer.seek(0)
+    return buffer
+
+
+@metrics.timed(metrics.THUMBNAIL_ENCODE_DURATION, kind="photo_thumbnail")
 def thumbnail(photo_bytes: IO[bytes]) -> BytesIO:
     """
     Create a compressed thumbnail of an image.
@@ -56,55 +146,143 @@ def thumbnail(photo_bytes: IO[bytes]) -> BytesIO:
     
     try:
         with Image.open(photo_bytes) as img:
-            # Validate format if known
-            img_format = img.format.upper() if img.format else None
-            if img_format and img_format not in SUPPORTED_FORMATS:
-                raise ValueError(f"Unsupported image format {img_format}")
-            
-            # Faster decoding for large JPEGs
-            img.draft("RGB", SIZE)
-
-            # Maintain EXIF orientation
-            ImageOps.exif_transpose(img, in_place=True)
-
-            # Ensure only first frame for animated or multiframe images
-            if getattr(img, "n_frames", 1) > 1:
-                img.seek(0)
-
-            # Normalize color mode
-            if img.mode not in ("RGB", "L"):
-                img = img.convert("RGB")
-
-            # Early downscale for very large images
-            img.thumbnail(
-                (SIZE[0] * 4, SIZE[1] * 4),
-                Image.Resampling.BOX
-            )
+            return _encode(_crop_thumbnail(_decode(img, SIZE)))
+    except DecompressionBombError:
+        raise ValueError("Image is too large")
 
-            # Crop and resize
-            img = ImageOps.fit(
-                img,
-                SIZE,
-                method=Image.Resampling.LANCZOS,
-                centering=(0.5, 0.45)
-            )
+def thumbnail_bytes(photo_bytes: bytes) -> bytes:
+    """
+    Same as :func:`thumbnail`, but takes and returns plain bytes so it can be sent to a process pool.
+    """
 
-            # Save to buffer
-            buffer = BytesIO()
-            img.save(
-                buffer,
-                OUTPUT_FORMAT,
-                quality=82,
-                method=6, # encoder effort
-                exact=False # ok with losing RGB data in transparent pixels
-            )
+    return thumbnail(BytesIO(photo_bytes)).getvalue()
+
+@metrics.timed(metrics.THUMBNAIL_ENCODE_DURATION, kind="photo_renditions")
+def renditions(photo_bytes: IO[bytes], preview_widths: Iterable[int]) -> tuple[bytes, dict[int, bytes]]:
+    """
+    Create a thumbnail and display-sized previews of an image, all from a single decode.
+
+    Previews keep the aspect ratio and are at most the given size on their long edge. Images are never upscaled,
+    so a small image's larger previews are all the same size as the original.
+
+    NOTE: photo_bytes stream may be advanced/consumed by this method
+
+    :param photo_bytes: The image
+    :param preview_widths: Long edge of each preview, in pixels
+    :return: The thumbnail, and each preview by its width
+    """
 
-            buffer.seek(0)
-            return buffer
+    widths = sorted(set(preview_widths), reverse=True)
+    try:
+        with Image.open(photo_bytes) as img:
+            # Draft decodes just big enough for the largest preview
+            largest = widths[0] if widths else max(SIZE)
+            img = _decode(img, (largest, largest))
+
+            # Each preview is scaled down from the one above it, which is cheaper than going from the original each time
+            previews = dict[int, bytes]()
+            source = img
+            thumbnail_source = img
+            for width in widths:
+                preview = source.copy()
+                preview.thumbnail((width, width), Image.Resampling.LANCZOS)
+                previews[width] = _encode(preview).getvalue()
+                source = preview
+
+                # Crop the thumbnail from the smallest preview that still covers it, e.g. not from a panorama's short edge
+                if min(preview.size) >= max(SIZE):
+                    thumbnail_source = preview
+
+            return _encode(_crop_thumbnail(thumbnail_source)).getvalue(), previews
     except DecompressionBombError:
         raise ValueError("Image is too large")
 
-def video_thumbnail(video_path: str) -> bytes:
+def renditions_bytes(photo_bytes: bytes, preview_widths: tuple[int, ...]) -> tuple[bytes, dict[int, bytes]]:
+    """
+    Same as :func:`renditions`, but takes plain bytes so it can be sent to a process pool.
+    """
+
+    return renditions(BytesIO(photo_bytes), preview_widths)
+
+
+_HALF_WIDTH = WIDTH // 2
+_HALF_HEIGHT = HEIGHT // 2
+MOSAIC_LAYOUTS: dict[int, tuple[tuple[int, int, int, int], ...]] = {
+    1: ((0, 0, WIDTH, HEIGHT),),
+    2: ((0, 0, _HALF_WIDTH, HEIGHT), (_HALF_WIDTH, 0, WIDTH, HEIGHT)),
+    3: (
+        (0, 0, _HALF_WIDTH, HEIGHT),
+        (_HALF_WIDTH, 0, WIDTH, _HALF_HEIGHT),
+        (_HALF_WIDTH, _HALF_HEIGHT, WIDTH, HEIGHT),
+    ),
+    4: (
+        (0, 0, _HALF_WIDTH, _HALF_HEIGHT),
+        (_HALF_WIDTH, 0, WIDTH, _HALF_HEIGHT),
+        (0, _HALF_HEIGHT, _HALF_WIDTH, HEIGHT),
+        (_HALF_WIDTH, _HALF_HEIGHT, WIDTH, HEIGHT),
+    ),
+}
+"""
+Boxes of the tiles of an album cover, by number of tiles. The first tile is the largest.
+"""
+
+
+@metrics.timed(metrics.THUMBNAIL_ENCODE_DURATION, kind="album_mosaic")
+def mosaic(thumbnails: list[bytes]) -> bytes:
+    """
+    Compose thumbnails into one album cover the size of a thumbnail.
+    Four thumbnails make a 2x2 grid. Fewer fill the cover with larger tiles.
+
+    :param thumbnails: Between 1 and 4 thumbnails, most prominent first
+    """
+
+    layout = MOSAIC_LAYOUTS[len(thumbnails)]
+    cover = Image.new("RGB", SIZE)
+    for thumbnail_data, (left, top, right, bottom) in zip(thumbnails, layout):
+        with Image.open(BytesIO(thumbnail_data)) as tile:
+            tile = ImageOps.fit(tile.convert("RGB"), (right - left, bottom - top), method=Image.Resampling.LANCZOS)
+            cover.paste(tile, (left, top))
+
+    return _encode(cover).getvalue()
+
+def _find_ffmpeg() -> str:
+    ffmpeg_path = shutil.which("ffmpeg")
+    if ffmpeg_path is None:
+        raise Exception("Cannot find ffmpeg")
+    return ffmpeg_path
+
+
+def _find_video_icon(video_icon_path: str | None) -> str:
+    if video_icon_path is None:
+        video_icon_path = os.path.join(str(current_app.static_folder), "video_icon.png")
+    if not os.path.exists(video_icon_path):
+        raise Exception("Cannot find video icon")
+    return video_icon_path
+
+
+def _video_thumbnail_args(ffmpeg_path: str, video_input: str, video_icon_path: str, seek_seconds: int) -> list[str]:
+    return [
+        ffmpeg_path,
+        "-hide_banner",
+        "-loglevel", "error",
+        "-ss", str(seek_seconds),
+        "-i", video_input,
+        "-i", video_icon_path,
+        "-frames:v", "1",
+        "-filter_complex",
+        f"[0:v]scale={WIDTH}:{HEIGHT}:force_original_aspect_ratio=increase," # extending string over multiple lines
+            f"crop={WIDTH}:{HEIGHT}[thumb];"
+            "[1:v]format=rgba,scale=64:-1:flags=lanczos[icon];"
+            "[thumb][icon]overlay=10:10", # top-left corner
+        "-vcodec", "libwebp",
+        "-quality", "82",
+        "-compression_level", "6",
+        "-f", "image2",
+        "pipe:1",
+    ]
+
+@metrics.timed(metrics.THUMBNAIL_ENCODE_DURATION, kind="video_thumbnail")
+def video_thumbnail(video_path: str, video_icon_path: str | None = None) -> bytes:
     """
     Create a compressed thumbnail of a video.
 
@@ -113,39 +291,17 @@ def video_thumbnail(video_path: str) -> bytes:
     - Appends a play button icon to the top-left of the thumbnail to differentiate it from photo thumbnails
 
     NOTE: Caller owns :obj:`video_path` and is responsible for cleaning it up after this method returns
+
+    :param video_path: Path to the video file
+    :param video_icon_path: Path to the play button icon. Defaults to the one in the app's static folder.
     """
     
-    # find ffmpeg
-    ffmpeg_path = shutil.which("ffmpeg")
-    if ffmpeg_path is None:
-        raise Exception("Cannot find ffmpeg")
-    
-    # find video icon
-    video_icon_path = os.path.join(str(current_app.static_folder), "video_icon.png")
-    if not os.path.exists(video_icon_path):
-        raise Exception("Cannot find video icon")
+    ffmpeg_path = _find_ffmpeg()
+    video_icon_path = _find_video_icon(video_icon_path)
 
     # Use ffmpeg to compute thumbnail
     def run_ffmpeg(seek_seconds: int = 1) -> bytes:
-        cmd = [
-            ffmpeg_path,
-            "-hide_banner",
-            "-loglevel", "error",
-            "-ss", str(seek_seconds),
-            "-i", video_path,
-            "-i", video_icon_path,
-            "-frames:v", "1",
-            "-filter_complex",
-            f"[0:v]scale={WIDTH}:{HEIGHT}:force_original_aspect_ratio=increase," # extending string over multiple lines
-                f"crop={WIDTH}:{HEIGHT}[thumb];"
-                "[1:v]format=rgba,scale=64:-1:flags=lanczos[icon];"
-                "[thumb][icon]overlay=10:10", # top-left corner
-            "-vcodec", "libwebp",
-            "-quality", "82",
-            "-compression_level", "6",
-            "-f", "image2",
-            "pipe:1",
-        ]
+        cmd = _video_thumbnail_args(ffmpeg_path, video_path, video_icon_path, seek_seconds)
         try:
             process = subprocess.run(
                 args = cmd,
@@ -168,3 +324,114 @@ def video_thumbnail(video_path: str) -> bytes:
         return process.stdout
 
     return run_ffmpeg()
+
+
+VIDEO_PROBE_SIZE = 64 * 1024
+"""
+Bytes from the start of a video read to decide whether it can be thumbnailed while it streams in
+"""
+
+# Top-level MP4/QuickTime boxes that may come before the movie header
+_MP4_LEADING_BOXES = frozenset({b"ftyp", b"free", b"skip", b"wide", b"pdin", b"uuid", b"styp"})
+
+
+def is_streamable_video(head: bytes) -> bool:
+    """
+    Whether ffmpeg can decode a video from its first bytes alone, without seeking.
+
+    MP4 and QuickTime files need their ``moov`` box to decode anything. Cameras and phones often write it at the end, after the ``mdat`` box.
+    Other containers, like WebM, can always be read front to back.
+
+    :param head: First bytes of the video, ideally :obj:`VIDEO_PROBE_SIZE` of them
+    """
+
+    if head[4:8] not in _MP4_LEADING_BOXES and head[4:8] not in (b"moov", b"mdat"):
+        # Not an MP4 family container
+        return True
+
+    offset = 0
+    while offset + 8 <= len(head):
+        size = int.from_bytes(head[offset:offset + 4], "big")
+        box_type = head[offset + 4:offset + 8]
+        if box_type == b"moov":
+            return True
+        if box_type == b"mdat" or box_type not in _MP4_LEADING_BOXES:
+            return False
+
+        if size == 1:
+            # 64 bit size follows the type
+            if offset + 16 > len(head):
+                return False
+            size = int.from_bytes(head[offset + 8:offset + 16], "big")
+        if size < 8:
+            # Box runs to the end of the file, or is malformed
+            return False
+        offset += size
+
+    # Didn't find the movie header in the probe
+    return False
+
+
+class VideoThumbnailPipe:
+    """
+    Compute a video thumbnail from bytes written to it as they arrive, e.g. while the video is also being uploaded.
+
+    ffmpeg reads the video from stdin and exits once it has a frame. Writes after that are dropped, so the writer never has to wait on ffmpeg again.
+    Only works for videos where :func:`is_streamable_video` is true.
+    """
+
+    def __init__(self, video_icon_path: str | None = None) -> None:
+        cmd = _video_thumbnail_args(_find_ffmpeg(), "pipe:0", _find_video_icon(video_icon_path), seek_seconds=1)
+        self._process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._feeding = True
+
+        # Drain output on other threads so ffmpeg never blocks writing while this side blocks writing to it
+        self._output = ThreadPoolExecutor(max_workers=2)
+        assert self._process.stdout is not None and self._process.stderr is not None
+        self._stdout = self._output.submit(self._process.stdout.read)
+        self._stderr = self._output.submit(self._process.stderr.read)
+
+    def write(self, data: bytes) -> int:
+        if self._feeding:
+            assert self._process.stdin is not None
+            try:
+                _ = self._process.stdin.write(data)
+            except (BrokenPipeError, OSError):
+                # ffmpeg has its frame, or gave up
+                self._feeding = False
+        return len(data)
+
+    def result(self) -> bytes:
+        """
+        Wait for ffmpeg to finish and get the thumbnail.
+
+        :raises RuntimeError: if ffmpeg failed or found no frame, e.g. because the video is shorter than a second
+        """
+
+        try:
+            if self._process.stdin is not None:
+                self._process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+        returncode = self._process.wait()
+        stdout = self._stdout.result()
+        stderr = self._stderr.result()
+        self._output.shutdown()
+
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg failed:\n{stderr.decode(errors='ignore')}")
+        if not stdout:
+            raise RuntimeError("No output from ffmpeg process")
+
+        return stdout
+
+    def close(self) -> None:
+        """
+        Stop ffmpeg without waiting for a thumbnail.
+        """
+
+        self._feeding = False
+        self._process.kill()
+        _ = self._process.wait()
+        self._output.shutdown()
@@ -0,0 +1,137 @@
+from azure.core.exceptions import ResourceNotFoundError
+from datetime import datetime, timedelta, timezone
+from flask import current_app, g, has_request_context
+from threading import Lock
+from typing import Callable
+from .storage.base import EntityStore
+
+VERSION_PARTITION: str = "version"
+"""
+Partition of the meta table holding one version stamp entity per scope
+"""
+
+MEDIA_SCOPE: str = "media"
+"""
+Scope bumped whenever the set of files not in an album changes
+"""
+
+ALBUMS_SCOPE: str = "albums"
+"""
+Scope bumped whenever any album or its contents change
+"""
+
+
+class VersionStamps:
+    """
+    Cheap cross-worker and cross-instance change detection.
+
+    Each scope has one tiny entity in the meta table. Every mutation upserts it, which gives it a new ETag.
+    Readers compare the ETag against the one their caches were built from, and only rebuild when it differs.
+    The ETag is read with a point query at most once per ``poll_interval`` per scope.
+    """
+
+    def __init__(self, table_client: EntityStore, poll_interval: timedelta) -> None:
+        """
+        :param table_client: Meta table
+        :param poll_interval: How long a version stamp read from storage is trusted
+        """
+
+        self.table_client = table_client
+        self.poll_interval = poll_interval
+
+        self._lock = Lock()
+        self._stamps = dict[str, tuple[str, datetime]]()
+        self._listeners = dict[str, list[Callable[[str], None]]]()
+
+    def current(self, scope: str) -> str:
+        """
+        Get the current version stamp of a scope.
+        An empty string means the scope has never been bumped.
+
+        :param scope: Scope name, e.g. :obj:`MEDIA_SCOPE`
+        """
+
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            entry = self._stamps.get(scope)
+            if entry is not None and now - entry[1] < self.poll_interval:
+                return entry[0]
+
+        try:
+            entity = self.table_client.get_entity(partition_key=VERSION_PARTITION, row_key=scope)
+            stamp = str(entity.metadata["etag"])
+        except ResourceNotFoundError:
+            stamp = ""
+
+        with self._lock:
+            self._stamps[scope] = (stamp, now)
+
+        return stamp
+
+    def bump(self, scope: str) -> str:
+        """
+        Give a scope a new version stamp, telling every other worker that its caches are stale.
+
+        :param scope: Scope name, e.g. :obj:`MEDIA_SCOPE`
+        :return: The new version stamp
+        """
+
+        now = datetime.now(timezone.utc)
+        metadata = self.table_client.upsert_entity({
+            "PartitionKey": VERSION_PARTITION,
+            "RowKey": scope,
+            "Bumped": now,
+        })
+        stamp = str(metadata["etag"])
+
+        with self._lock:
+            self._stamps[scope] = (stamp, now)
+            listeners = list(self._listeners.get(scope, ()))
+
+        for listener in listeners:
+            listener(stamp)
+
+        return stamp
+
+    def subscribe(self, scope: str, listener: Callable[[str], None]) -> None:
+        """
+        Call ``listener`` with the new version stamp whenever this process bumps a scope.
+        Lets caches that were already updated in place adopt their own change instead of rebuilding.
+        """
+
+        with self._lock:
+            self._listeners.setdefault(scope, []).append(listener)
+
+
+def mark_changed(scope: str) -> None:
+    """
+    Record that a scope changed.
+    During a request, the bump is deferred until the request ends so that a request touching many entities bumps once.
+    """
+
+    if has_request_context():
+        changed_scopes: set[str] = g.setdefault("changed_scopes", set[str]())
+        changed_scopes.add(scope)
+        return
+
+    version_stamps: VersionStamps = current_app.config["version_stamps"]
+    version_stamps.bump(scope)
+
+
+def flush_changed_scopes(_: BaseException | None = None) -> None:
+    """
+    Bump every scope marked changed during the current request.
+    Registered as a teardown handler.
+    """
+
+    changed_scopes: set[str] = g.pop("changed_scopes", set[str]())
+    if not changed_scopes:
+        return
+
+    version_stamps: VersionStamps = current_app.config["version_stamps"]
+    for scope in changed_scopes:
+        try:
+            version_stamps.bump(scope)
+        except Exception:
+            # Other workers will still pick the change up once their caches reach their max age
+            current_app.logger.exception(f"Failed to bump version stamp for {scope=}")
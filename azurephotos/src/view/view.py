@@ -1,9 +1,19 @@
-from concurrent.futures import ThreadPoolExecutor
-from flask import Blueprint, render_template, Response, current_app
+from concurrent.futures import Executor, Future
+from datetime import datetime
+from flask import Blueprint, render_template, stream_template, Response, current_app, url_for
 from flask.ctx import AppContext
+from markupsafe import Markup
+from typing import Callable, Iterator
 
-from ..api.albums import list_albums, list_album
+from ..api.albums import list_albums, list_album, album_cover_urls, album_exists, is_valid_album_name
 from ..api.media_cache import all_media
+from ..lib.conditional import conditional_on
+from ..lib.models.media import MediaRecord
+from ..lib.pagination import page_after, DEFAULT_PAGE_SIZE
+from ..lib.refresher import cached
+from ..lib.storage_helper import SAS_WINDOW, signing_window
+from ..lib.thumbnail_queue import failed_thumbnails, pending_thumbnails
+from ..lib.versioning import VersionStamps, ALBUMS_SCOPE, MEDIA_SCOPE
 
 landing_view_controller = Blueprint(
     "landing_view_controller",
@@ -26,43 +36,100 @@ blueprints = {
     albums_view_controller,
 }
 
+
+def _executor() -> Executor:
+    """
+    Executor for listings that outlive the view function, since they are only waited on once the template streams up to the grid.
+    """
+
+    return current_app.config["view_executor"]
+
+
+@cached(ttl=SAS_WINDOW, max_size=4096)
+def _media_card(filename: str, has_albums: bool, albums_version: str, window_start: datetime, pending: bool, failed: bool) -> Markup:
+    """
+    Rendered grid card for a file.
+    Cards embed signed URLs and the pending and failed placeholders, so the signing window and thumbnail state are part of the key.
+    """
+
+    return Markup(render_template("partials/thumbnail.html", filename=filename, has_albums=has_albums))
+
+
+@landing_view_controller.app_template_global()
+def media_card(media: MediaRecord, albums: list[str]) -> Markup:
+    """
+    Grid card for a file, only rendered again when the file's thumbnail or the set of albums changes.
+
+    :param media: File to render
+    :param albums: All album names
+    """
+
+    version_stamps: VersionStamps = current_app.config["version_stamps"]
+    return _media_card(
+        media.filename,
+        len(albums) > 0,
+        version_stamps.current(ALBUMS_SCOPE),
+        signing_window(),
+        media.filename in pending_thumbnails(),
+        media.filename in failed_thumbnails(),
+    )
+
+
+def _first_page(media_future: Future[list[MediaRecord] | Response]) -> Callable[[], tuple[list[MediaRecord], str | None]]:
+    """
+    Defer waiting for a listing until the template needs it, so everything above the grid is sent first.
+    """
+
+    def first_page() -> tuple[list[MediaRecord], str | None]:
+        media = media_future.result()
+        if isinstance(media, Response):
+            # Album was deleted after the page started. Show it as empty.
+            return [], None
+        return page_after(media, None, DEFAULT_PAGE_SIZE)
+
+    return first_page
+
+
 @landing_view_controller.route("/", methods=["GET"])
-def main() -> str:
+@conditional_on(MEDIA_SCOPE, ALBUMS_SCOPE, signed_urls=True)
+def main() -> Iterator[str]:
     def all_media_threaded(app_context: AppContext):
         with app_context:
             return all_media()
-        
-    def list_albums_threaded(app_context: AppContext):
-        with app_context:
-            return list_albums()
 
-    with ThreadPoolExecutor() as executor:
-        all_media_future = executor.submit(all_media_threaded, current_app.app_context())
-        list_albums_future = executor.submit(list_albums_threaded, current_app.app_context())
-        
-        media = all_media_future.result()
-        album_names = list_albums_future.result()
-    
-    return render_template("photos.html", medias=media, albums=album_names)
+    # Start the slow listing first, and render the header and albums while it runs
+    all_media_future = _executor().submit(all_media_threaded, current_app.app_context())
+    album_names = list_albums()
+
+    return stream_template(
+        "photos.html",
+        media_page=_first_page(all_media_future),
+        albums=album_names,
+        album_covers=album_cover_urls(album_names),
+        page_url=url_for("api_media_controller.list_media"),
+    )
 
 @albums_view_controller.route("/<album_name>", methods=["GET"])
-def album(album_name: str) -> str | Response:
+@conditional_on(ALBUMS_SCOPE, signed_urls=True)
+def album(album_name: str) -> Iterator[str] | Response:
+    # The status can't change once streaming starts, so check the album up front
+    if not is_valid_album_name(album_name):
+        return Response(f"{album_name=} is not allowed due to length or charset restrictions", status=422)
+    if not album_exists(album_name):
+        return Response("Album does not exist", status=404)
+
     def list_album_threaded(app_context: AppContext):
         with app_context:
             return list_album(album_name)
-    
-    def list_albums_threaded(app_context: AppContext):
-        with app_context:
-            return list_albums()
-        
-    with ThreadPoolExecutor() as executor:
-        files_in_album_future = executor.submit(list_album_threaded, current_app.app_context())
-        list_albums_future = executor.submit(list_albums_threaded, current_app.app_context())
-
-        files_in_album = files_in_album_future.result()
-        album_names = list_albums_future.result()
-
-    if isinstance(files_in_album, Response):
-        return files_in_album
-    
-    return render_template("album.html", medias=files_in_album, albums=album_names, album=album_name)
+
+    files_in_album_future = _executor().submit(list_album_threaded, current_app.app_context())
+    album_names = list_albums()
+
+    return stream_template(
+        "album.html",
+        media_page=_first_page(files_in_album_future),
+        albums=album_names,
+        album_covers=album_cover_urls(album_names),
+        album=album_name,
+        page_url=url_for("api_albums_controller.list_album_page", album_name=album_name),
+    )
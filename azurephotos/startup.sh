@@ -18,8 +18,49 @@ fi
 
 ffmpeg -version
 
+echo "----- Starting thumbnail worker in the background -----"
+
+# Restarted whenever it exits, so a crash doesn't leave uploads without thumbnails until the next deploy
+(
+    while true; do
+        flask thumbnails worker || echo "Thumbnail worker exited with status $?" >&2
+        echo "Restarting thumbnail worker in 5 seconds" >&2
+        sleep 5
+    done
+) &
+
+echo "----- Sizing gunicorn workers -----"
+
+# Requests mostly wait on storage, which releases the GIL, so each worker serves many at once on threads.
+# More workers add CPU for rendering and inline thumbnails, but each holds its own caches, so memory limits them too.
+# app.py reads the same variable to size its storage connection pool and view executor, so change it here and both follow.
+export THREADS_PER_WORKER="${THREADS_PER_WORKER:-32}"
+WORKER_MEMORY_MB=384
+
+CORES=$(nproc)
+MEMORY_MB=$(awk '/^MemAvailable:/ { print int($2 / 1024) }' /proc/meminfo)
+# A container's memory limit may be lower than what the machine has
+if [ -r /sys/fs/cgroup/memory.max ] && [ "$(cat /sys/fs/cgroup/memory.max)" != "max" ]; then
+    CGROUP_MEMORY_MB=$(( $(cat /sys/fs/cgroup/memory.max) / 1024 / 1024 ))
+    if [ "$CGROUP_MEMORY_MB" -lt "$MEMORY_MB" ]; then
+        MEMORY_MB=$CGROUP_MEMORY_MB
+    fi
+fi
+
+WORKERS=$(( CORES * 2 + 1 ))
+# One worker's worth is left for the thumbnail worker
+MEMORY_WORKERS=$(( MEMORY_MB / WORKER_MEMORY_MB - 1 ))
+if [ "$MEMORY_WORKERS" -lt "$WORKERS" ]; then
+    WORKERS=$MEMORY_WORKERS
+fi
+if [ "$WORKERS" -lt 1 ]; then
+    WORKERS=1
+fi
+
+echo "$CORES cores and $MEMORY_MB MB available: $WORKERS workers with $THREADS_PER_WORKER threads each"
+
 echo "----- Starting Flask app with gunicorn command -----"
 
-# This should be the default command for startup.
+# Based on the default command for startup, with threaded workers.
 # See: https://learn.microsoft.com/en-us/azure/app-service/configure-language-python#container-startup-process
-gunicorn --bind=0.0.0.0 --timeout 600 app:app
+gunicorn --bind=0.0.0.0 --timeout 600 --worker-class gthread --workers "$WORKERS" --threads "$THREADS_PER_WORKER" app:app
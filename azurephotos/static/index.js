@@ -105,6 +105,27 @@ function isValidAlbumName(albumName, existingAlbumNames) {
     return true;
 }
 
+/**
+ * Show progress of an operation in the progress bar.
+ * 
+ * @param {number} successCount Number of items that succeeded
+ * @param {number} failureCount Number of items that failed
+ * @param {number} totalCount Number of items in the operation
+ */
+function updateProgressBar(successCount, failureCount, totalCount) {
+    const successPercent = Math.round((successCount / totalCount) * 100);
+    const failurePercent = Math.round((failureCount / totalCount) * 100);
+
+    $("#successProgress")
+        .css("width", successPercent + "%")
+        .attr("aria-valuenow", successPercent)
+        .text(`${successCount} / ${totalCount}`)
+    $("#failureProgress")
+        .css("width", failurePercent + "%")
+        .attr("aria-valuenow", failurePercent)
+        .text(`${failureCount} / ${totalCount}`)
+}
+
 /**
  * Perform an action on a collection of items
  * Update the progress bar as actions are successful or failed
@@ -133,20 +154,6 @@ function doWithProgressBarWithConcurrency(items, action, concurrency) {
     let failureCount = 0;
     const errors = [];
 
-    function updateProgressBar() {
-        const successPercent = Math.round((successCount / totalCount) * 100);
-        const failurePercent = Math.round((failureCount / totalCount) * 100);
-
-        $("#successProgress")
-            .css("width", successPercent + "%")
-            .attr("aria-valuenow", successPercent)
-            .text(`${successCount} / ${totalCount}`)
-        $("#failureProgress")
-            .css("width", failurePercent + "%")
-            .attr("aria-valuenow", failurePercent)
-            .text(`${failureCount} / ${totalCount}`)
-    }
-
     return new Promise((resolve) => {
         function next() {
             if (index === totalCount && active === 0) {
@@ -176,25 +183,41 @@ function doWithProgressBarWithConcurrency(items, action, concurrency) {
                     })
                     .finally(() =>{
                         active--;
-                        updateProgressBar();
+                        updateProgressBar(successCount, failureCount, totalCount);
                         next();
                     })
             }
         }
 
-        updateProgressBar();
+        updateProgressBar(successCount, failureCount, totalCount);
         next();
     })
 }
 
+/**
+ * Files at least this large are sent with the resumable upload API instead of one POST.
+ */
+const RESUMABLE_UPLOAD_THRESHOLD = 32 * 1024 * 1024;
+
+/**
+ * Times a chunk of a resumable upload is retried before giving up on the file.
+ */
+const RESUMABLE_UPLOAD_RETRIES = 5;
+
 /**
  * Upload a single file by HTTP POSTing to a particular path.
+ * Large files are uploaded in resumable chunks instead.
  * 
  * @param {File} file File to upload
  * @param {string} path API path to send request
+ * @param {string | undefined} albumName Album to upload to, if any
  * @returns {Promise<void>}
  */
-function uploadFile(file, path) {
+function uploadFile(file, path, albumName) {
+    if (file.size >= RESUMABLE_UPLOAD_THRESHOLD) {
+        return uploadFileResumable(file, albumName);
+    }
+
     return new Promise((resolve, reject) => {
         const formData = new FormData();
         formData.append("upload", file);
@@ -206,7 +229,15 @@ function uploadFile(file, path) {
         xhr.open("POST", path);
 
         xhr.onload = () => {
-            if (xhr.status >= 200 && xhr.status < 300) {
+            if (xhr.status === 207) {
+                // Outcome of every file in the request. Fail if any of them failed.
+                const failed = JSON.parse(xhr.responseText).find(result => result.status_code >= 300);
+                if (failed) {
+                    reject(failed.status_code);
+                } else {
+                    resolve();
+                }
+            } else if (xhr.status >= 200 && xhr.status < 300) {
                 resolve();
             } else {
                 reject(xhr.status);
@@ -221,69 +252,267 @@ function uploadFile(file, path) {
 }
 
 /**
- * Delete a single file by HTTP DELETEing to a particular path.
+ * Send a request to the resumable upload API.
  * 
- * @param {string} file File name with extension
+ * @param {string} method HTTP method
  * @param {string} path API path to send request
+ * @param {BodyInit | undefined} body Request body
+ * @returns {Promise<any>} Parsed JSON response, if any
+ */
+async function sendUploadRequest(method, path, body) {
+    const headers = (typeof body === "string") ? { "Content-Type": "application/json" } : {};
+    const response = await fetch(path, { method, headers, body });
+    if (!response.ok) {
+        throw response.status;
+    }
+
+    const contentType = response.headers.get("Content-Type") || "";
+    return contentType.includes("application/json") ? response.json() : undefined;
+}
+
+/**
+ * Upload a large file in chunks that are individually retried.
+ * The session is remembered in local storage, so uploading the same file again after a reload resumes it.
+ * 
+ * @param {File} file File to upload
+ * @param {string | undefined} albumName Album to upload to, if any
  * @returns {Promise<void>}
  */
-function deleteFile(file, path) {
-    return new Promise((resolve, reject) => {
-        const xhr = new XMLHttpRequest();
-        xhr.open("DELETE", path);
+async function uploadFileResumable(file, albumName) {
+    const sessionKey = `upload:${albumName || ""}:${file.name}:${file.size}:${file.lastModified}`;
 
-        xhr.onload = () => {
-            if (xhr.status >= 200 && xhr.status < 300) {
-                const thumbnailQuery = `[src="/thumbnail/${file}"]`;
-                const deletedThumbnail = document.querySelector(thumbnailQuery);
-                if (deletedThumbnail) {
-                    deletedThumbnail.closest(".col").remove();
-                }
+    let session;
+    const savedSessionId = localStorage.getItem(sessionKey);
+    if (savedSessionId) {
+        session = await sendUploadRequest("GET", `/api/uploads/${savedSessionId}`).catch(() => undefined);
+    }
+    if (!session) {
+        const description = {
+            filename: file.name,
+            size: file.size,
+            dateTaken: new Date(file.lastModified).toISOString(),
+        };
+        if (albumName !== undefined) {
+            description.album = albumName;
+        }
 
-                resolve();
-            } else {
-                reject(xhr.status);
+        session = await sendUploadRequest("POST", "/api/uploads/", JSON.stringify(description));
+        localStorage.setItem(sessionKey, session.id);
+    }
+
+    const received = new Set(session.received);
+    for (let index = 0; index < session.chunks; index++) {
+        if (received.has(index)) {
+            continue;
+        }
+
+        const start = index * session.chunkSize;
+        const chunk = file.slice(start, Math.min(start + session.chunkSize, file.size));
+        for (let attempt = 1; ; attempt++) {
+            try {
+                await sendUploadRequest("PUT", `/api/uploads/${session.id}/chunks/${index}`, chunk);
+                break;
+            } catch (error) {
+                if (attempt >= RESUMABLE_UPLOAD_RETRIES) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
             }
-        };
-        xhr.onerror = () => {
-            reject("network error");
-        };
+        }
+    }
 
-        xhr.send();
-    });
+    await sendUploadRequest("POST", `/api/uploads/${session.id}/commit`);
+    localStorage.removeItem(sessionKey);
 }
 
 /**
- * Move a single file to an album by HTTP POSTing to a particular path.
+ * Max number of files named in one bulk request.
+ * Should not exceed src.api.bulk.MAX_BULK_ITEMS
+ */
+const BULK_CHUNK_SIZE = 250;
+
+/**
+ * Send a bulk request naming many files.
  * 
- * @param {string} file File name with extension
+ * @param {string} method HTTP method
  * @param {string} path API path to send request
- * @returns {Promise<void>}
+ * @param {object} body JSON body, including a `filenames` list
+ * @returns {Promise<Array<{
+ *  filename: string;
+ *  status_code: number;
+ *  message: string;
+ * }>>} Outcome for every file
  */
-function moveToAlbum(file, path) {
-    return new Promise((resolve, reject) => {
-        const xhr = new XMLHttpRequest();
-        xhr.open("POST", path);
+function sendBulkRequest(method, path, body) {
+    return fetch(path, {
+        method,
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(body),
+    }).then(response => {
+        if (response.status !== 207) {
+            throw response.status;
+        }
 
-        xhr.onload = () => {
-            if (xhr.status >= 200 && xhr.status < 300) {
-                const thumbnailQuery = `[src="/thumbnail/${file}"]`;
-                const movedThumbnail = document.querySelector(thumbnailQuery);
-                if (movedThumbnail) {
-                    movedThumbnail.closest(".col").remove();
-                }
+        return response.json();
+    });
+}
 
-                resolve();
-            } else {
-                reject(xhr.status);
+/**
+ * Perform a bulk action on a collection of files, a chunk at a time.
+ * Update the progress bar as each file succeeds or fails.
+ * 
+ * @param {Iterable<string>} filenames Files to act upon
+ * @param {(chunk: Array<string>) => ReturnType<typeof sendBulkRequest>} action Bulk request for one chunk of files
+ * @returns {Promise<{
+ *  successCount: number;
+ *  failureCount: number;
+ *  totalCount: number;
+ *  succeeded: Array<string>;
+ *  errors: Array<{
+ *      item: string;
+ *      error: unknown
+ *  }>;
+ * }>}
+ */
+async function doBulkWithProgressBar(filenames, action) {
+    filenames = Array.from(filenames);
+    const totalCount = filenames.length;
+
+    let successCount = 0;
+    let failureCount = 0;
+    const succeeded = [];
+    const errors = [];
+
+    updateProgressBar(successCount, failureCount, totalCount);
+    for (let start = 0; start < totalCount; start += BULK_CHUNK_SIZE) {
+        const chunk = filenames.slice(start, start + BULK_CHUNK_SIZE);
+        try {
+            const results = await action(chunk);
+            for (const result of results) {
+                if (result.status_code >= 200 && result.status_code < 300) {
+                    successCount++;
+                    succeeded.push(result.filename);
+                } else {
+                    failureCount++;
+                    errors.push({
+                        item: result.filename,
+                        error: result
+                    });
+                }
             }
-        };
-        xhr.onerror = () => {
-            reject("network error");
+        } catch (error) {
+            failureCount += chunk.length;
+            errors.push(...chunk.map(item => ({ item, error })));
         }
 
-        xhr.send();
-    });
+        updateProgressBar(successCount, failureCount, totalCount);
+    }
+
+    return {
+        successCount,
+        failureCount,
+        totalCount,
+        succeeded,
+        errors
+    };
+}
+
+/**
+ * Remove the grid card for a file, if it is rendered.
+ * 
+ * @param {string} file File name with extension
+ */
+function removeMediaCard(file) {
+    const card = document.querySelector(`#mediaGrid [data-filename="${CSS.escape(file)}"]`);
+    if (card) {
+        // Keep the shared album menu if it is attached to this card
+        const albumMenu = card.querySelector("#albumMenu");
+        if (albumMenu) {
+            document.getElementById("mediaGrid").before(albumMenu);
+        }
+        card.remove();
+    }
+}
+
+/**
+ * Build a grid card for a file.
+ * This should match templates/partials/thumbnail.html
+ * 
+ * @param {{
+ *  filename: string;
+ *  thumbnail: string;
+ *  srcset: string;
+ * }} item File as listed by the paging APIs, with signed URLs for its thumbnail and previews
+ * @param {boolean} hasAlbums Whether there are any albums to move the file to
+ * @returns {JQuery<HTMLElement>}
+ */
+function renderMediaCard(item, hasAlbums) {
+    const filename = item.filename;
+    const col = $("<div>")
+        .addClass("col")
+        .attr("data-filename", filename);
+    const photoCard = $("<div>")
+        .addClass("photo-card position-relative");
+
+    const img = $("<img>")
+        .addClass("img-fluid img-thumbnail")
+        .attr("src", item.thumbnail)
+        .attr("title", filename)
+        .attr("loading", "lazy")
+        .attr("data-bs-toggle", "modal")
+        .attr("data-bs-target", "#fullsizeModal")
+        .attr("data-full", `/fullsize/${filename}`)
+        .attr("data-srcset", item.srcset)
+        .prop("draggable", false);
+    const checkbox = $("<input>")
+        .addClass("form-check-input photo-checkbox")
+        .attr("type", "checkbox")
+        .attr("name", "selected_photos")
+        .val(filename);
+    const deleteButton = $("<button>")
+        .addClass("btn btn-sm btn-danger photo-action delete-btn")
+        .attr("type", "button")
+        .attr("data-selected", filename)
+        .append($("<i>").addClass("bi bi-trash"));
+
+    photoCard.append(img, checkbox, deleteButton);
+
+    if (hasAlbums) {
+        // Opens the shared #albumMenu
+        const albumButton = $("<button>")
+            .addClass("btn btn-sm btn-secondary dropdown-toggle photo-action album-btn")
+            .attr("type", "button")
+            .attr("data-name", filename)
+            .attr("aria-expanded", "false")
+            .append($("<i>").addClass("bi bi-journal-album"));
+
+        photoCard.append(albumButton);
+    }
+
+    col.append(photoCard);
+    return col;
+}
+
+/**
+ * Fetch one page of media from a listing endpoint.
+ * 
+ * @param {string} pageUrl API path of the listing endpoint
+ * @param {string} cursor Cursor returned with the previous page
+ * @returns {Promise<{
+ *  items: Array<{ filename: string; type: string; }>;
+ *  next: string?;
+ * }>}
+ */
+function fetchMediaPage(pageUrl, cursor) {
+    const queryString = new URLSearchParams({ cursor }).toString();
+    return fetch(`${pageUrl}?${queryString}`)
+        .then(response => {
+            if (!response.ok) {
+                throw response.status;
+            }
+
+            return response.json();
+        });
 }
 
 /**
@@ -361,10 +590,24 @@ $(document).ready(() => {
         } else {
             const img = document.createElement("img");
             img.className = "img-fluid";
-            img.src = fullSrc;
             img.alt = modalPhotoName;
             img.draggable = false;
 
+            // Let the browser pick a preview for the screen instead of downloading the original
+            const srcset = trigger.getAttribute("data-srcset");
+            if (srcset) {
+                // Matches the max-width of modal images in index.css
+                img.sizes = "90vw";
+                img.srcset = srcset;
+                // Previews may not exist yet, e.g. for photos uploaded before they were added
+                img.onerror = () => {
+                    img.onerror = null;
+                    img.removeAttribute("srcset");
+                    img.src = fullSrc;
+                };
+            }
+            img.src = fullSrc;
+
             fullsizeModalBody.appendChild(img);
         }
     });
@@ -562,7 +805,7 @@ $(document).ready(() => {
 
         doWithProgressBarWithConcurrency(
             validFiles,
-            (file) => uploadFile(file, path),
+            (file) => uploadFile(file, path, isAlbum ? album : undefined),
             2
         )
             .then(({ successCount, failureCount, totalCount, errors }) => {
@@ -585,9 +828,9 @@ $(document).ready(() => {
     });
 
     // Delete photos and videos
-    $(".photo-action.delete-btn").click(function (event) {
+    // Handlers are delegated from the document since cards are added as more pages load
+    $(document).on("click", ".photo-action.delete-btn", function (event) {
         const isAlbum = (typeof album) !== "undefined";
-        const basePath = isAlbum ? `/api/albums/${album}` : `/delete`;
 
         // If we clicked the delete button on an unchecked item, add it to selected items
         const selected = event.currentTarget.dataset.selected;
@@ -603,19 +846,23 @@ $(document).ready(() => {
         $("#operationProgress .progress-bar").addClass("progress-bar-animated");
         $("#operationProgress").show();
 
-        doWithProgressBarWithConcurrency(
+        doBulkWithProgressBar(
             checkedItems,
-            (file) => deleteFile(file, `${basePath}/${file}`),
-            4
+            (filenames) => isAlbum
+                ? sendBulkRequest("DELETE", `/api/albums/${album}/bulk`, { filenames })
+                : sendBulkRequest("POST", "/delete", { filenames })
         )
-            .then(({ successCount, failureCount, totalCount, errors }) => {
+            .then(({ successCount, failureCount, totalCount, succeeded, errors }) => {
+                for (const file of succeeded) {
+                    removeMediaCard(file);
+                    checkedItems.delete(file);
+                }
+
                 if (failureCount) {
                     console.warn("Some deletes failed:", errors);
                     alert(`${successCount}/${totalCount} deletes succeeded`);
                     return;
                 }
-
-                checkedItems.clear();
             })
             .finally(() => {
                 $("#operationProgress .progress-bar").removeClass("progress-bar-animated");
@@ -625,65 +872,72 @@ $(document).ready(() => {
             });
     });
 
+    // Every card shares one album menu, so move it next to the clicked card's button before opening it
+    $(document).on("click", ".photo-action.album-btn", function () {
+        const albumMenu = $("#albumMenu");
+        if (!albumMenu.prev().is(this)) {
+            $(this).after(albumMenu);
+        }
+
+        bootstrap.Dropdown.getOrCreateInstance(this).toggle();
+    });
+
     // Place photos and videos in album
-    $(".photo-action.album-btn").siblings("ul").find("li .dropdown-item").each(function () {
+    $(document).on("click", "#albumMenu .dropdown-item", function (event) {
+        event.preventDefault();
+
         const li = $(this);
         const targetAlbum = li.text()
         const inAlbum = (typeof album) !== "undefined"
 
-        li.click((_) => {
-            const name = li.closest("ul.dropdown-menu")
-                .siblings(".photo-action.album-btn")
-                .data("name")
+        const name = $("#albumMenu")
+            .prev(".photo-action.album-btn")
+            .data("name")
 
-            // Add photo to selection
-            $(`.photo-checkbox[value='${name}']`)
-                .prop("checked", true)
-                .trigger("change")
+        // Add photo to selection
+        $(`.photo-checkbox[value='${name}']`)
+            .prop("checked", true)
+            .trigger("change")
 
-            if (!confirm(`Are you sure you want to move ${checkedItems.size} items to '${targetAlbum}?'`)) {
-                return;
-            }
+        if (!confirm(`Are you sure you want to move ${checkedItems.size} items to '${targetAlbum}?'`)) {
+            return;
+        }
 
-            $("#operationProgress .progress-bar").addClass("progress-bar-animated");
-            $("#operationProgress").show();
-
-            const basePath = `/api/albums/${targetAlbum}`;
-            const queryString = inAlbum 
-                ? new URLSearchParams({
-                    "currentAlbum": album
-                }).toString()
-                : "";
-            doWithProgressBarWithConcurrency(
-                checkedItems,
-                (file) => moveToAlbum(file, `${basePath}/${file}?${queryString}`),
-                4
-            )
-                .then(({ successCount, failureCount, totalCount, errors }) => {
-                    if (failureCount) {
-                        console.warn("Some moves failed:", errors);
-                        alert(`${successCount}/${totalCount} moves succeeded`);
-                        return;
-                    }
-                    
-                    if (modalPhotoName !== null) {
-                        bootstrap.Modal.getInstance(fullsizeModal).hide();
-                        modalPhotoName = null;
-                    }
-
-                    checkedItems.clear();
-                })
-                .finally(() => {
-                    $("#operationProgress .progress-bar").removeClass("progress-bar-animated");
-                    setTimeout(() => { 
-                        $("#operationProgress").hide(); 
-                    }, 500);
-                });
-        });
+        $("#operationProgress .progress-bar").addClass("progress-bar-animated");
+        $("#operationProgress").show();
+
+        const currentAlbum = inAlbum ? album : undefined;
+        doBulkWithProgressBar(
+            checkedItems,
+            (filenames) => sendBulkRequest("POST", `/api/albums/${targetAlbum}/bulk`, { filenames, currentAlbum })
+        )
+            .then(({ successCount, failureCount, totalCount, succeeded, errors }) => {
+                for (const file of succeeded) {
+                    removeMediaCard(file);
+                    checkedItems.delete(file);
+                }
+
+                if (failureCount) {
+                    console.warn("Some moves failed:", errors);
+                    alert(`${successCount}/${totalCount} moves succeeded`);
+                    return;
+                }
+                
+                if (modalPhotoName !== null) {
+                    bootstrap.Modal.getInstance(fullsizeModal).hide();
+                    modalPhotoName = null;
+                }
+            })
+            .finally(() => {
+                $("#operationProgress .progress-bar").removeClass("progress-bar-animated");
+                setTimeout(() => { 
+                    $("#operationProgress").hide(); 
+                }, 500);
+            });
     });
 
     // Select photos and videos
-    $(".photo-checkbox").on("change", function (_) {
+    $(document).on("change", ".photo-checkbox", function (_) {
         const selected = $(this).val()
         if (this.checked) {
             checkedItems.add(selected)
@@ -707,6 +961,37 @@ $(document).ready(() => {
         }
     });
 
+    // Load more media as the user scrolls to the bottom of the grid
+    const mediaGrid = $("#mediaGrid");
+    let loadingNextPage = false;
+    function loadNextPage() {
+        const cursor = mediaGrid.attr("data-next-cursor");
+        if (!cursor || loadingNextPage) {
+            return;
+        }
+
+        loadingNextPage = true;
+        fetchMediaPage(mediaGrid.attr("data-page-url"), cursor)
+            .then(({ items, next }) => {
+                for (const item of items) {
+                    mediaGrid.append(renderMediaCard(item, albums.length > 0));
+                }
+                mediaGrid.attr("data-next-cursor", next || "");
+            })
+            .catch(console.error)
+            .finally(() => {
+                loadingNextPage = false;
+            });
+    }
+    const mediaGridSentinel = document.getElementById("mediaGridSentinel");
+    if (mediaGridSentinel) {
+        new IntersectionObserver((entries) => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadNextPage();
+            }
+        }, { rootMargin: "1000px" }).observe(mediaGridSentinel);
+    }
+
     // Show create album form
     $("#createAlbumCard").click(function() {
         $("#createAlbumFormContainer").removeClass("d-none");
@@ -0,0 +1,28 @@
+"""
+Fixtures for running the app against the in-memory storage fakes the benchmarks use.
+
+Run from the ``azurephotos`` directory with ``python -m pytest``.
+"""
+
+from datetime import timedelta
+from typing import TYPE_CHECKING, Iterator
+
+import pytest
+
+if TYPE_CHECKING:
+    from flask import Flask
+    from flask.testing import FlaskClient
+
+
+@pytest.fixture
+def app() -> Iterator["Flask"]:
+    from app import create_app
+    from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+
+    no_latency = Latency(timedelta())
+    yield create_app(FakeBlobServiceClient("test", no_latency), FakeTableServiceClient("test", no_latency), account_name="test")
+
+
+@pytest.fixture
+def client(app: "Flask") -> "FlaskClient":
+    return app.test_client()
@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask
+from flask.testing import FlaskClient
+
+from src.api import catalog
+from src.api.albums import NONE_ALBUM_NAME
+from src.lib.album_index import AlbumIndex
+from src.lib.models.media import MediaRecord
+
+
+def _add_file(app: Flask, client: FlaskClient, album_name: str, filename: str) -> None:
+    """
+    Put a file in the "none" album, then move it into an album.
+    """
+
+    app.config["albums_table_client"].create_entity(
+        {"PartitionKey": NONE_ALBUM_NAME, "RowKey": filename, "Created": datetime.now(timezone.utc)}
+    )
+    assert client.post(f"/api/albums/{album_name}/{filename}").status_code == 201
+
+
+def _filenames(client: FlaskClient, album_name: str) -> set[str]:
+    response = client.get(f"/api/albums/{album_name}")
+    assert response.status_code == 200
+    return {record["filename"] for record in response.get_json()}
+
+
+def test_rename_clears_marker(app: Flask, client: FlaskClient) -> None:
+    assert client.post("/api/albums/A").status_code == 200
+    _add_file(app, client, "A", "first.jpg")
+    assert client.put("/api/albums/A/rename/B").status_code == 200
+
+    album_row = app.config["albums_table_client"].get_entity("B", "")
+    assert "RenamedFrom" not in album_row
+
+
+def test_rename_again_to_same_name_conflicts(app: Flask, client: FlaskClient) -> None:
+    assert client.post("/api/albums/A").status_code == 200
+    _add_file(app, client, "A", "first.jpg")
+    assert client.put("/api/albums/A/rename/B").status_code == 200
+
+    # A new album with the old name must not merge into the renamed one
+    assert client.post("/api/albums/A").status_code == 200
+    _add_file(app, client, "A", "second.jpg")
+    assert client.put("/api/albums/A/rename/B").status_code == 409
+
+    assert _filenames(client, "B") == {"first.jpg"}
+    assert _filenames(client, "A") == {"second.jpg"}
+
+
+def test_resumed_rename_merges_index() -> None:
+    now = datetime.now(timezone.utc)
+    moved = MediaRecord.from_filename(now, "moved.jpg")
+    remaining = MediaRecord.from_filename(now - timedelta(days=1), "remaining.jpg")
+    assert moved is not None and remaining is not None
+
+    index = AlbumIndex(max_albums=8, max_age=timedelta(minutes=5))
+    index.set_album("B", [moved])
+    index.set_album("A", [remaining])
+    index.rename_album("A", "B", merge=True)
+
+    assert index.album("A") is None
+    assert index.album("B") == (moved, remaining)
+
+
+def test_resumed_rename_drops_partial_index() -> None:
+    moved = MediaRecord.from_filename(datetime.now(timezone.utc), "moved.jpg")
+    assert moved is not None
+
+    index = AlbumIndex(max_albums=8, max_age=timedelta(minutes=5))
+    index.set_album("B", [moved])
+    index.rename_album("A", "B", merge=True)
+
+    # What moved from A isn't known, so B is loaded from storage again
+    assert index.album("B") is None
+
+
+def test_move_fails_when_membership_is_not_recorded(app: Flask, client: FlaskClient, monkeypatch) -> None:
+    from azure.core.exceptions import ServiceRequestError
+
+    assert client.post("/api/albums/A").status_code == 200
+    _add_file(app, client, "A", "first.jpg")
+    assert client.post("/api/albums/B").status_code == 200
+
+    def unavailable(*args, **kwargs):
+        raise ServiceRequestError("Membership table unavailable")
+
+    monkeypatch.setattr(app.config["membership_table_client"], "submit_transaction", unavailable)
+    response = client.post("/api/albums/B/first.jpg?currentAlbum=A")
+
+    assert response.status_code == 503
+    assert _filenames(client, "A") == {"first.jpg"}
+    assert _filenames(client, "B") == set()
+
+
+def test_bulk_move_of_file_already_in_album_keeps_count(app: Flask, client: FlaskClient) -> None:
+    assert client.post("/api/albums/A").status_code == 200
+    assert client.post("/api/albums/B").status_code == 200
+    _add_file(app, client, "B", "first.jpg")
+    # The same file also listed in A, e.g. left behind by an interrupted move
+    app.config["albums_table_client"].create_entity(
+        {"PartitionKey": "A", "RowKey": "first.jpg", "Created": datetime.now(timezone.utc)}
+    )
+
+    response = client.post("/api/albums/B/bulk", json={"filenames": ["first.jpg"], "currentAlbum": "A"})
+    assert response.status_code == 207
+
+    with app.app_context():
+        album = catalog.get_album("B")
+    assert album is not None and album[0].count == 1
+    assert _filenames(client, "B") == {"first.jpg"}
@@ -0,0 +1,107 @@
+from datetime import datetime, timezone
+
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+
+from src.api.albums import NONE_ALBUM_NAME
+from src.api.bulk import MAX_BULK_ITEMS
+
+
+def _add_unsorted(app: Flask, *filenames: str) -> None:
+    for filename in filenames:
+        app.config["albums_table_client"].create_entity(
+            {"PartitionKey": NONE_ALBUM_NAME, "RowKey": filename, "Created": datetime.now(timezone.utc)}
+        )
+
+
+def _statuses(response) -> dict[str, int]:
+    assert response.status_code == 207
+    return {result["filename"]: result["status_code"] for result in response.get_json()}
+
+
+def _filenames(client: FlaskClient, album_name: str) -> set[str]:
+    response = client.get(f"/api/albums/{album_name}")
+    assert response.status_code == 200
+    return {record["filename"] for record in response.get_json()}
+
+
+def test_bulk_move_reports_every_file(app: Flask, client: FlaskClient) -> None:
+    assert client.post("/api/albums/A").status_code == 200
+    _add_unsorted(app, "a.jpg", "b.mp4")
+
+    response = client.post("/api/albums/A/bulk", json={"filenames": ["a.jpg", "missing.jpg", "b.mp4", "a.jpg"]})
+
+    # Duplicates are reported once
+    assert _statuses(response) == {"a.jpg": 201, "missing.jpg": 404, "b.mp4": 201}
+    assert [result["filename"] for result in response.get_json()] == ["a.jpg", "missing.jpg", "b.mp4"]
+    assert _filenames(client, "A") == {"a.jpg", "b.mp4"}
+    assert client.get("/api/albums/containing/a.jpg").get_json() == ["A"]
+
+
+def test_bulk_move_between_albums(app: Flask, client: FlaskClient) -> None:
+    assert client.post("/api/albums/A").status_code == 200
+    assert client.post("/api/albums/B").status_code == 200
+    _add_unsorted(app, "a.jpg", "b.jpg")
+    _ = client.post("/api/albums/A/bulk", json={"filenames": ["a.jpg", "b.jpg"]})
+
+    response = client.post("/api/albums/B/bulk", json={"filenames": ["a.jpg"], "currentAlbum": "A"})
+
+    assert _statuses(response) == {"a.jpg": 201}
+    assert _filenames(client, "A") == {"b.jpg"}
+    assert _filenames(client, "B") == {"a.jpg"}
+
+
+def test_bulk_move_to_missing_album_is_404(app: Flask, client: FlaskClient) -> None:
+    _add_unsorted(app, "a.jpg")
+    assert client.post("/api/albums/Missing/bulk", json={"filenames": ["a.jpg"]}).status_code == 404
+
+
+def test_bulk_remove_reports_every_file(app: Flask, client: FlaskClient) -> None:
+    assert client.post("/api/albums/A").status_code == 200
+    _add_unsorted(app, "a.jpg", "b.jpg")
+    _ = client.post("/api/albums/A/bulk", json={"filenames": ["a.jpg", "b.jpg"]})
+
+    response = client.delete("/api/albums/A/bulk", json={"filenames": ["a.jpg", "not-in-album.jpg"]})
+
+    assert _statuses(response) == {"a.jpg": 204, "not-in-album.jpg": 404}
+    assert _filenames(client, "A") == {"b.jpg"}
+    assert client.get("/api/albums/containing/a.jpg").get_json() == []
+
+
+def test_failed_batch_is_reported_per_file(app: Flask, client: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    from azure.core.exceptions import ServiceRequestError
+
+    assert client.post("/api/albums/A").status_code == 200
+    _add_unsorted(app, "a.jpg", "b.jpg")
+
+    def unavailable(*args, **kwargs):
+        raise ServiceRequestError("Albums table unavailable")
+
+    monkeypatch.setattr(app.config["albums_table_client"], "submit_transaction", unavailable)
+    response = client.post("/api/albums/A/bulk", json={"filenames": ["a.jpg", "b.jpg"]})
+    monkeypatch.undo()
+
+    assert _statuses(response) == {"a.jpg": 500, "b.jpg": 500}
+    assert _filenames(client, "A") == set()
+
+
+def test_bulk_delete_reports_every_file(app: Flask, client: FlaskClient) -> None:
+    _add_unsorted(app, "a.jpg")
+
+    response = client.post("/delete", json={"filenames": ["a.jpg", "notes.txt"]})
+
+    assert _statuses(response) == {"a.jpg": 204, "notes.txt": 422}
+    remaining = app.config["albums_table_client"].query_entities("RowKey eq @r", parameters={"r": "a.jpg"})
+    assert list(remaining) == []
+
+
+@pytest.mark.parametrize("body", [None, {}, {"filenames": "a.jpg"}, {"filenames": ["a.jpg", 1]}, {"filenames": [""]}])
+def test_malformed_body_is_422(client: FlaskClient, body) -> None:
+    assert client.post("/api/albums/A").status_code == 200
+    assert client.post("/api/albums/A/bulk", json=body).status_code == 422
+
+
+def test_too_many_files_is_413(client: FlaskClient) -> None:
+    filenames = [f"{i}.jpg" for i in range(MAX_BULK_ITEMS + 1)]
+    assert client.post("/delete", json={"filenames": filenames}).status_code == 413
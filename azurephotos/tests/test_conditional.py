@@ -0,0 +1,60 @@
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+
+from src.api import albums
+
+
+def test_unchanged_listing_is_304(client: FlaskClient) -> None:
+    assert client.post("/api/albums/A").status_code == 200
+    first = client.get("/api/albums/albums")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    again = client.get("/api/albums/albums", headers={"If-None-Match": etag})
+
+    assert again.status_code == 304
+    assert again.data == b""
+    assert again.headers["ETag"] == etag
+
+
+def test_304_does_not_run_the_view(client: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    assert client.post("/api/albums/A").status_code == 200
+    etag = client.get("/api/albums/albums").headers["ETag"]
+
+    def unavailable():
+        raise AssertionError("The view ran for a matching ETag")
+
+    monkeypatch.setattr(albums, "list_albums", unavailable)
+    assert client.get("/api/albums/albums", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_change_gives_new_etag(client: FlaskClient) -> None:
+    assert client.post("/api/albums/A").status_code == 200
+    etag = client.get("/api/albums/albums").headers["ETag"]
+
+    assert client.post("/api/albums/B").status_code == 200
+    changed = client.get("/api/albums/albums", headers={"If-None-Match": etag})
+
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert set(changed.get_json()) == {"A", "B"}
+
+
+def test_album_listing_changes_with_any_album(app: Flask, client: FlaskClient) -> None:
+    assert client.post("/api/albums/A").status_code == 200
+    assert client.post("/api/albums/B").status_code == 200
+    etag = client.get("/api/albums/A").headers["ETag"]
+    assert client.get("/api/albums/A", headers={"If-None-Match": etag}).status_code == 304
+
+    # Album listings share one scope, so a change to another album changes this one's ETag too
+    assert client.delete("/api/albums/B").status_code == 200
+    assert client.get("/api/albums/A", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_errors_have_no_etag(client: FlaskClient) -> None:
+    response = client.get("/api/albums/Missing")
+    assert response.status_code == 404
+    assert "ETag" not in response.headers
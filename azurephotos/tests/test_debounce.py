@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta, timezone
+from threading import Event
+from time import sleep
+
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+
+from src.api import album_covers, catalog
+from src.api.albums import NONE_ALBUM_NAME
+from src.api.media_urls import thumbnail_blob_name
+from src.lib.debounce import Debouncer
+
+
+def test_burst_runs_once() -> None:
+    debouncer = Debouncer(delay=timedelta(milliseconds=50), max_delay=timedelta(seconds=5))
+    calls = list[int]()
+    done = Event()
+
+    def record(i: int) -> None:
+        calls.append(i)
+        done.set()
+
+    for i in range(5):
+        debouncer.call("album", lambda i=i: record(i))
+    assert done.wait(2)
+    sleep(0.1)
+
+    # Only the last call of the burst runs
+    assert calls == [4]
+
+
+def test_keys_run_separately() -> None:
+    debouncer = Debouncer(delay=timedelta(milliseconds=20), max_delay=timedelta(seconds=5))
+    ran = {"A": Event(), "B": Event()}
+    debouncer.call("A", ran["A"].set)
+    debouncer.call("B", ran["B"].set)
+    assert ran["A"].wait(2) and ran["B"].wait(2)
+
+
+def test_max_delay_bounds_repeated_calls() -> None:
+    debouncer = Debouncer(delay=timedelta(milliseconds=100), max_delay=timedelta(milliseconds=150))
+    ran = Event()
+
+    # Calls keep coming faster than the delay, so only the max delay lets it run
+    for _ in range(20):
+        debouncer.call("album", ran.set)
+        if ran.wait(0.03):
+            break
+    assert ran.is_set()
+
+
+def test_replaced_timer_does_not_run() -> None:
+    debouncer = Debouncer(delay=timedelta(minutes=5), max_delay=timedelta(minutes=5))
+    calls = list[str]()
+    debouncer.call("album", lambda: calls.append("pending"))
+
+    # A timer that fired just as a newer call replaced it
+    debouncer._run("album", lambda: calls.append("stale"), None)  # pyright: ignore[reportPrivateUsage]
+    assert calls == []
+
+
+def _album_with_thumbnail(app: Flask, client: FlaskClient, album_name: str, filename: str) -> None:
+    assert client.post(f"/api/albums/{album_name}").status_code == 200
+    app.config["albums_table_client"].create_entity(
+        {"PartitionKey": NONE_ALBUM_NAME, "RowKey": filename, "Created": datetime.now(timezone.utc)}
+    )
+    assert client.post(f"/api/albums/{album_name}/{filename}").status_code == 201
+
+    blob_name = thumbnail_blob_name(filename)
+    assert blob_name is not None
+    app.config["thumbnails_container_client"].upload_blob(blob_name, b"thumbnail", overwrite=True)
+
+
+def _covers(app: Flask, album_name: str) -> list[str]:
+    container = app.config["thumbnails_container_client"]
+    return [blob.name for blob in container.list_blobs(name_starts_with=f"{album_covers.COVER_PREFIX}{album_name}/")]
+
+
+@pytest.fixture
+def no_scheduling(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Mosaics are made by the tests, not on timers
+    monkeypatch.setattr(album_covers, "schedule_mosaic", lambda album_name: None)
+    monkeypatch.setattr(album_covers, "mosaic", lambda thumbnails: b"".join(thumbnails))
+
+
+@pytest.mark.usefixtures("no_scheduling")
+def test_mosaic_losing_race_is_deleted(app: Flask, client: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    _album_with_thumbnail(app, client, "A", "first.jpg")
+    monkeypatch.setattr(catalog, "set_mosaic", lambda album_name, mosaic_version, etag: False)
+
+    with app.app_context():
+        album_covers.make_mosaic("A")
+
+    assert _covers(app, "A") == []
+
+
+@pytest.mark.usefixtures("no_scheduling")
+def test_mosaic_losing_race_to_same_mosaic_is_kept(app: Flask, client: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    _album_with_thumbnail(app, client, "A", "first.jpg")
+    with app.app_context():
+        album_covers.make_mosaic("A")
+        current = catalog.get_album("A")
+    assert current is not None and current[0].mosaic_version is not None
+    recorded = album_covers.cover_blob_name("A", current[0].mosaic_version)
+    assert _covers(app, "A") == [recorded]
+
+    # Another worker recorded the same mosaic first
+    monkeypatch.setattr(catalog, "set_mosaic", lambda album_name, mosaic_version, etag: False)
+    with app.app_context():
+        album_covers.make_mosaic("A")
+
+    assert _covers(app, "A") == [recorded]
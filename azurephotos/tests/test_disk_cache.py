@@ -0,0 +1,78 @@
+import os
+import threading
+
+from src.lib.disk_cache import DiskCache
+
+
+def test_size_limit_holds_across_instances(tmp_path) -> None:
+    # Two instances on one directory stand in for two workers
+    first = DiskCache(str(tmp_path), max_bytes=300)
+    second = DiskCache(str(tmp_path), max_bytes=300)
+
+    for i in range(5):
+        cache = first if i % 2 else second
+        assert cache.get(f"key{i}", lambda: b"x" * 100) is not None
+
+    entries = [name for name in os.listdir(tmp_path) if not name.startswith(".")]
+    assert len(entries) == 3
+    # The least recently used entries are gone for both
+    assert first.get("key0", lambda: None) is None
+    assert second.get("key4", lambda: None) is not None
+
+
+def test_discard_tag_removes_every_version(tmp_path) -> None:
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    assert cache.get("a.jpg@1", lambda: b"old", tag="a.jpg") is not None
+    assert cache.get("a.jpg@2", lambda: b"new", tag="a.jpg") is not None
+    assert cache.get("b.jpg@1", lambda: b"other", tag="b.jpg") is not None
+
+    cache.discard_tag("a.jpg")
+
+    assert cache.get("a.jpg@1", lambda: None) is None
+    assert cache.get("a.jpg@2", lambda: None) is None
+    assert cache.get("b.jpg@1", lambda: None) is not None
+
+
+def test_newest_key_is_last_stored_version(tmp_path) -> None:
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    assert cache.newest_key("a.jpg") is None
+
+    assert cache.get("a.jpg@1", lambda: b"old", tag="a.jpg") is not None
+    assert cache.get("a.jpg@2", lambda: b"new", tag="a.jpg") is not None
+    # Hits don't make an older version the newest again
+    assert cache.get("a.jpg@1", lambda: None) is not None
+
+    assert cache.newest_key("a.jpg") == "a.jpg@2"
+    # Shared with other instances on the same directory
+    assert DiskCache(str(tmp_path), max_bytes=1000).newest_key("a.jpg") == "a.jpg@2"
+
+    cache.discard_tag("a.jpg")
+    assert cache.newest_key("a.jpg") is None
+
+
+def test_unindexed_files_are_removed(tmp_path) -> None:
+    (tmp_path / "left-over").write_bytes(b"x" * 100)
+
+    _ = DiskCache(str(tmp_path), max_bytes=1000)
+
+    assert not (tmp_path / "left-over").exists()
+
+
+def test_concurrent_misses_share_one_fetch(tmp_path) -> None:
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    fetches = list[int]()
+    started = threading.Event()
+
+    def fetch() -> bytes:
+        fetches.append(1)
+        _ = started.wait(1)
+        return b"x" * 10
+
+    threads = [threading.Thread(target=cache.get, args=("key", fetch)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    started.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(fetches) == 1
@@ -0,0 +1,109 @@
+import threading
+from datetime import timedelta
+
+from src.lib.health_prober import HealthProber
+
+TIMEOUT = timedelta(milliseconds=100)
+
+
+def _by_name(prober: HealthProber) -> dict[str, tuple[bool, str | None]]:
+    return {status.name: (status.healthy, status.error) for status in prober.statuses()}
+
+
+def test_timed_out_check_is_not_ready() -> None:
+    release = threading.Event()
+    prober = HealthProber({"fast": lambda: None, "stuck": lambda: release.wait(5) and None}, timedelta(minutes=1), TIMEOUT)
+    prober._started = True  # Probed by hand
+
+    prober.probe()
+    release.set()
+
+    statuses = _by_name(prober)
+    assert statuses["fast"] == (True, None)
+    assert statuses["stuck"][0] is False
+    assert "Timed out" in str(statuses["stuck"][1])
+    assert not prober.is_ready(max_age=timedelta(minutes=1))
+
+
+def test_stuck_check_is_not_started_again() -> None:
+    release = threading.Event()
+    calls = list[None]()
+
+    def stuck() -> None:
+        calls.append(None)
+        _ = release.wait(5)
+
+    prober = HealthProber({"stuck": stuck}, timedelta(minutes=1), TIMEOUT)
+    prober._started = True
+    prober.probe()
+    prober.probe()
+    release.set()
+
+    assert len(calls) == 1
+
+
+def test_slow_check_that_finishes_late_stays_unhealthy_until_a_fast_round() -> None:
+    release = threading.Event()
+    slow = [True]
+
+    def check() -> None:
+        if slow[0]:
+            _ = release.wait(5)
+
+    prober = HealthProber({"slow": check}, timedelta(minutes=1), TIMEOUT)
+    prober._started = True
+    prober.probe()
+
+    # Finishes after its round gave up on it, taking longer than the timeout
+    release.set()
+    prober.probe()
+    healthy, error = _by_name(prober)["slow"]
+    assert not healthy and "longer than" in str(error)
+
+    slow[0] = False
+    prober.probe()
+    assert _by_name(prober)["slow"] == (True, None)
+    assert prober.is_ready(max_age=timedelta(minutes=1))
+
+
+def test_failed_check_reports_its_error() -> None:
+    def failing() -> None:
+        raise ConnectionError("Connection refused")
+
+    prober = HealthProber({"table": failing}, timedelta(minutes=1), TIMEOUT)
+    prober._started = True
+    prober.probe()
+
+    assert _by_name(prober)["table"] == (False, "ConnectionError: Connection refused")
+    assert not prober.is_ready(max_age=timedelta(minutes=1))
+
+
+def test_unchecked_or_old_results_are_not_ready() -> None:
+    prober = HealthProber({"blob": lambda: None}, timedelta(minutes=1), TIMEOUT)
+    prober._started = True
+    assert not prober.is_ready(max_age=timedelta(minutes=1))
+
+    prober.probe()
+    assert prober.is_ready(max_age=timedelta(minutes=1))
+    # The prober may be stuck, so a passing check that is too old doesn't count
+    assert not prober.is_ready(max_age=timedelta(0))
+
+
+def test_ready_endpoint_fails_while_a_dependency_times_out(app, client) -> None:
+    release = threading.Event()
+    app.config["health_prober"] = HealthProber(
+        {"blob:photos": lambda: None, "table:Albums2": lambda: release.wait(5) and None}, timedelta(minutes=1), TIMEOUT
+    )
+
+    try:
+        assert client.get("/api/health/live").status_code == 200
+        assert client.get("/api/health/ready").status_code == 503
+
+        response = client.get("/api/health/")
+        assert response.status_code == 503
+        dependencies = response.get_json()["dependencies"]
+        assert dependencies["blob:photos"]["healthy"]
+        assert not dependencies["table:Albums2"]["healthy"]
+        assert dependencies["table:Albums2"]["latencyMs"] is None
+    finally:
+        release.set()
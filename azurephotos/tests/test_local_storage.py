@@ -0,0 +1,117 @@
+import pytest
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceModifiedError
+from azure.data.tables import TableTransactionError, UpdateMode
+from azure.storage.blob import BlobBlock
+
+from src.lib.storage.local import LocalBlobStorage, LocalEntityStorage, LocalTableClient
+
+
+@pytest.fixture
+def table(tmp_path) -> LocalTableClient:
+    return LocalEntityStorage(str(tmp_path)).get_table_client("Albums")
+
+
+def _row_keys(table: LocalTableClient, partition_key: str) -> set[str]:
+    entities = table.query_entities("PartitionKey eq @p", parameters={"p": partition_key})
+    return {entity["RowKey"] for entity in entities}
+
+
+def test_update_if_not_modified_conflicts_after_a_change(table: LocalTableClient) -> None:
+    _ = table.create_entity({"PartitionKey": "A", "RowKey": "1", "Count": 1})
+    stale = table.get_entity("A", "1").metadata["etag"]
+    _ = table.update_entity({"PartitionKey": "A", "RowKey": "1", "Count": 2})
+
+    with pytest.raises(ResourceModifiedError):
+        _ = table.update_entity(
+            {"PartitionKey": "A", "RowKey": "1", "Count": 3},
+            etag=stale,
+            match_condition=MatchConditions.IfNotModified,
+        )
+    with pytest.raises(ResourceModifiedError):
+        table.delete_entity("A", "1", etag=stale, match_condition=MatchConditions.IfNotModified)
+
+    current = table.get_entity("A", "1")
+    assert current["Count"] == 2
+    _ = table.update_entity(
+        {"PartitionKey": "A", "RowKey": "1", "Count": 3},
+        etag=current.metadata["etag"],
+        match_condition=MatchConditions.IfNotModified,
+    )
+    assert table.get_entity("A", "1")["Count"] == 3
+
+
+def test_create_conflicts_with_existing_entity(table: LocalTableClient) -> None:
+    _ = table.create_entity({"PartitionKey": "A", "RowKey": "1"})
+    with pytest.raises(ResourceExistsError):
+        _ = table.create_entity({"PartitionKey": "A", "RowKey": "1"})
+
+
+def test_merge_keeps_other_properties(table: LocalTableClient) -> None:
+    _ = table.create_entity({"PartitionKey": "A", "RowKey": "1", "Kept": "yes", "Count": 1})
+    _ = table.upsert_entity({"PartitionKey": "A", "RowKey": "1", "Count": 2}, mode=UpdateMode.MERGE)
+    assert table.get_entity("A", "1")["Kept"] == "yes"
+
+    _ = table.upsert_entity({"PartitionKey": "A", "RowKey": "1", "Count": 3}, mode=UpdateMode.REPLACE)
+    assert "Kept" not in table.get_entity("A", "1")
+
+
+def test_failed_transaction_rolls_back_earlier_operations(table: LocalTableClient) -> None:
+    _ = table.create_entity({"PartitionKey": "A", "RowKey": "existing"})
+
+    with pytest.raises(TableTransactionError):
+        _ = table.submit_transaction([
+            ("upsert", {"PartitionKey": "A", "RowKey": "new"}),
+            ("delete", {"PartitionKey": "A", "RowKey": "existing"}),
+            ("update", {"PartitionKey": "A", "RowKey": "missing"}),
+        ])
+
+    assert _row_keys(table, "A") == {"existing"}
+
+
+def test_transaction_with_stale_etag_rolls_back(table: LocalTableClient) -> None:
+    _ = table.create_entity({"PartitionKey": "A", "RowKey": "1", "Count": 1})
+    stale = table.get_entity("A", "1").metadata["etag"]
+    _ = table.update_entity({"PartitionKey": "A", "RowKey": "1", "Count": 2})
+
+    with pytest.raises(TableTransactionError):
+        _ = table.submit_transaction([
+            ("create", {"PartitionKey": "A", "RowKey": "2"}),
+            ("update", {"PartitionKey": "A", "RowKey": "1", "Count": 3}, {"etag": stale, "match_condition": MatchConditions.IfNotModified}),
+        ])
+
+    assert _row_keys(table, "A") == {"1"}
+    assert table.get_entity("A", "1")["Count"] == 2
+
+
+def test_transaction_rejects_mixed_partitions(table: LocalTableClient) -> None:
+    with pytest.raises(ValueError):
+        _ = table.submit_transaction([
+            ("create", {"PartitionKey": "A", "RowKey": "1"}),
+            ("create", {"PartitionKey": "B", "RowKey": "1"}),
+        ])
+    assert _row_keys(table, "A") == set()
+
+
+def test_commit_of_unstaged_block_is_invalid_block_list(tmp_path) -> None:
+    blob_client = LocalBlobStorage(str(tmp_path)).get_container_client("photos").get_blob_client("a.jpg")
+    blob_client.stage_block("block-0", b"first")
+
+    with pytest.raises(HttpResponseError) as raised:
+        _ = blob_client.commit_block_list([BlobBlock(block_id="block-0"), BlobBlock(block_id="block-1")])
+
+    assert raised.value.status_code == 400
+    assert raised.value.error_code == "InvalidBlockList"  # type: ignore[attr-defined]
+    assert not blob_client.exists()
+
+
+def test_commit_if_missing_conflicts_with_existing_blob(tmp_path) -> None:
+    container = LocalBlobStorage(str(tmp_path)).get_container_client("photos")
+    _ = container.upload_blob("a.jpg", b"original")
+    blob_client = container.get_blob_client("a.jpg")
+    blob_client.stage_block("block-0", b"replacement")
+
+    with pytest.raises(ResourceModifiedError):
+        _ = blob_client.commit_block_list([BlobBlock(block_id="block-0")], match_condition=MatchConditions.IfMissing)
+
+    assert container.download_blob("a.jpg").readall() == b"original"
@@ -0,0 +1,53 @@
+import json
+import os
+import subprocess
+import sys
+
+from src.lib import metrics
+
+
+def _exited_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    _ = process.wait()
+    return process.pid
+
+
+def _write(directory: str, name: str, amount: float) -> None:
+    snapshot = {metrics.STORAGE_CALLS.name: [[[["operation", "get"]], amount]]}
+    with open(os.path.join(directory, name), "w") as snapshot_file:
+        json.dump(snapshot, snapshot_file)
+
+
+def _total() -> float:
+    series = metrics._aggregate()[metrics.STORAGE_CALLS.name]
+    return series[(("operation", "get"),)]  # type: ignore[return-value]
+
+
+def test_exited_snapshots_are_retired(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    _write(str(tmp_path), f"{os.getpid()}-1.json", 1)
+    _write(str(tmp_path), f"{_exited_pid()}-2.json", 2)
+    _write(str(tmp_path), f"{_exited_pid()}-3.json", 4)
+
+    assert _total() == 7
+    snapshots = sorted(name for name in os.listdir(tmp_path) if not name.startswith("."))
+    assert snapshots == sorted([f"{os.getpid()}-1.json", metrics.RETIRED_SNAPSHOT_NAME])
+
+    # Retiring more later keeps what was retired before
+    _write(str(tmp_path), f"{_exited_pid()}-4.json", 8)
+    assert _total() == 15
+    assert _total() == 15
+
+
+def test_interrupted_retirement_is_not_counted_twice(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    name = f"{_exited_pid()}-1.json"
+    _write(str(tmp_path), name, 2)
+    # As if the process retiring it stopped before deleting it
+    retired = {"merged": [name], "metrics": {metrics.STORAGE_CALLS.name: [[[["operation", "get"]], 2]]}}
+    with open(os.path.join(tmp_path, metrics.RETIRED_SNAPSHOT_NAME), "w") as retired_file:
+        json.dump(retired, retired_file)
+
+    assert _total() == 2
+    assert not os.path.exists(os.path.join(tmp_path, name))
+    assert _total() == 2
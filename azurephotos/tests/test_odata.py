@@ -0,0 +1,81 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from src.lib.storage import odata
+
+ENTITY = {
+    "PartitionKey": "Trip",
+    "RowKey": "a.jpg",
+    "Attempts": 2,
+    "Ready": True,
+    "Name": "O'Brien",
+    "Created": datetime(2024, 5, 1, tzinfo=timezone.utc),
+}
+
+
+@pytest.mark.parametrize(("text", "expected"), [
+    ("RowKey eq 'a.jpg'", True),
+    ("RowKey ne 'a.jpg'", False),
+    ("Attempts gt 1", True),
+    ("Attempts ge 3", False),
+    ("Attempts lt 2.5", True),
+    ("Attempts le 1", False),
+    ("Ready eq true", True),
+    ("Name eq 'O''Brien'", True),
+    ("Created lt datetime'2024-06-01T00:00:00Z'", True),
+    ("PartitionKey eq 'Trip' and RowKey eq 'b.jpg'", False),
+    ("RowKey eq 'b.jpg' or RowKey eq 'a.jpg'", True),
+    ("not RowKey eq 'a.jpg'", False),
+    ("not (RowKey eq 'b.jpg' or Attempts gt 5)", True),
+    # "and" binds tighter than "or"
+    ("RowKey eq 'a.jpg' or RowKey eq 'b.jpg' and Attempts gt 5", True),
+    ("(RowKey eq 'a.jpg' or RowKey eq 'b.jpg') and Attempts gt 5", False),
+])
+def test_evaluation(text: str, expected: bool) -> None:
+    assert odata.parse(text).matches(ENTITY, {}) is expected
+
+
+def test_missing_property_never_matches() -> None:
+    assert not odata.parse("Missing eq 'x'").matches(ENTITY, {})
+    assert not odata.parse("Missing ne 'x'").matches(ENTITY, {})
+
+
+def test_different_types_never_match() -> None:
+    assert not odata.parse("Attempts lt 'x'").matches(ENTITY, {})
+
+
+def test_parameters_are_bound_at_evaluation() -> None:
+    parsed = odata.parse("PartitionKey eq @album and Created le @now")
+    now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    assert parsed.matches(ENTITY, {"album": "Trip", "now": now})
+    assert not parsed.matches(ENTITY, {"album": "Other", "now": now})
+    assert not parsed.matches(ENTITY, {"album": "Trip", "now": datetime(2020, 1, 1, tzinfo=timezone.utc)})
+
+
+@pytest.mark.parametrize(("text", "partition_key"), [
+    ("PartitionKey eq @album", "Trip"),
+    ("PartitionKey eq @album and RowKey ne ''", "Trip"),
+    ("RowKey ne '' and PartitionKey eq 'Trip'", "Trip"),
+    ("PartitionKey eq @album or RowKey eq 'a.jpg'", None),
+    ("not PartitionKey eq @album", None),
+    ("PartitionKey ne @album", None),
+])
+def test_partition_key_is_only_found_when_required(text: str, partition_key: str | None) -> None:
+    parsed = odata.parse(text)
+    found = parsed.partition_key({}, {"album": "Trip"}) if parsed.partition_key else None
+    assert found == partition_key
+
+
+@pytest.mark.parametrize("text", [
+    "RowKey eq",
+    "RowKey is 'a.jpg'",
+    "(RowKey eq 'a.jpg'",
+    "RowKey eq 'a.jpg' RowKey",
+    "RowKey eq 'a.jpg' and",
+    "RowKey eq $",
+])
+def test_malformed_filters_are_rejected(text: str) -> None:
+    with pytest.raises(ValueError):
+        odata.parse(text)
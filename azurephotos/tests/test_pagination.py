@@ -0,0 +1,78 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.lib.models.media import MediaRecord
+from src.lib.pagination import decode_cursor, encode_cursor, page_after, parse_page_size, MAX_PAGE_SIZE
+
+
+def _records(count: int) -> list[MediaRecord]:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    records = [MediaRecord.from_filename(start + timedelta(hours=i), f"a{i}.jpg") for i in range(count)]
+    return sorted((record for record in records if record is not None), reverse=True)
+
+
+def _cursor(payload: object) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def test_pages_cover_every_record_once() -> None:
+    records = _records(10)
+
+    seen = list[MediaRecord]()
+    cursor = None
+    while True:
+        page, cursor = page_after(records, cursor, 3)
+        seen.extend(page)
+        if cursor is None:
+            break
+
+    assert seen == records
+
+
+def test_cursor_survives_insertions_before_it() -> None:
+    records = _records(6)
+    first, cursor = page_after(records, None, 2)
+
+    # A newer upload lands at the front of the list between requests
+    newer = MediaRecord.from_filename(records[0].last_modified + timedelta(days=1), "new.jpg")
+    assert newer is not None
+    second, _ = page_after([newer, *records], cursor, 2)
+
+    assert second == records[2:4]
+
+
+def test_last_page_has_no_cursor() -> None:
+    records = _records(4)
+
+    page, cursor = page_after(records, None, 4)
+
+    assert page == records
+    assert cursor is None
+
+
+def test_cursor_round_trips() -> None:
+    record = _records(1)[0]
+
+    assert decode_cursor(encode_cursor(record)) == (record.last_modified, record.filename)
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", _cursor(["2024-01-02T00:00:00+00:00"]), _cursor(["yesterday", "a.jpg"])])
+def test_malformed_cursor_is_rejected(cursor: str) -> None:
+    with pytest.raises(ValueError):
+        _ = page_after(_records(3), cursor, 2)
+
+
+def test_cursor_without_timezone_is_rejected() -> None:
+    cursor = _cursor(["2024-01-02T00:00:00", "a2.jpg"])
+
+    with pytest.raises(ValueError):
+        _ = page_after(_records(3), cursor, 2)
+
+
+def test_page_size_is_clamped() -> None:
+    assert parse_page_size(str(MAX_PAGE_SIZE * 2)) == MAX_PAGE_SIZE
+    with pytest.raises(ValueError):
+        _ = parse_page_size("0")
@@ -0,0 +1,85 @@
+import threading
+from datetime import timedelta
+
+import pytest
+
+from src.lib import metrics
+from src.lib.refresher import cached
+
+
+def test_invalidate_starts_a_new_computation() -> None:
+    started = threading.Event()
+    release = threading.Event()
+    values = iter(["stale", "fresh"])
+
+    @cached(ttl=timedelta(minutes=1))
+    def compute() -> str:
+        value = next(values)
+        if value == "stale":
+            started.set()
+            _ = release.wait(5)
+        return value
+
+    results = list[str]()
+    first = threading.Thread(target=lambda: results.append(compute()))
+    first.start()
+    assert started.wait(5)
+
+    # The value being computed is outdated, so a call after this must not wait for it or get it
+    compute.invalidate()
+    assert compute() == "fresh"
+
+    release.set()
+    first.join()
+    assert results == ["stale"]
+    # The outdated computation finishing late doesn't replace the fresh value
+    assert compute() == "fresh"
+
+
+def test_clear_starts_new_computations() -> None:
+    started = threading.Event()
+    release = threading.Event()
+    calls = list[int]()
+
+    @cached(ttl=timedelta(minutes=1))
+    def compute(n: int) -> int:
+        calls.append(n)
+        if len(calls) == 1:
+            started.set()
+            _ = release.wait(5)
+        return len(calls)
+
+    first = threading.Thread(target=compute, args=(1,))
+    first.start()
+    assert started.wait(5)
+
+    compute.clear()
+    assert compute(1) == 2
+
+    release.set()
+    first.join()
+    assert compute(1) == 2
+
+
+def test_events_are_counted_in_metrics(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+
+    @cached(ttl=timedelta(minutes=1), max_size=1)
+    def square(x: int) -> int:
+        if x < 0:
+            raise ValueError(x)
+        return x * x
+
+    _ = square(2)
+    _ = square(2)
+    _ = square(3)
+    with pytest.raises(ValueError):
+        _ = square(-1)
+
+    cache = f"{__name__}.test_events_are_counted_in_metrics.<locals>.square"
+    counts = {
+        dict(labels)["event"]: value
+        for labels, value in metrics._current_registry().values[metrics.CACHE_EVENTS.name].items()
+        if dict(labels)["cache"] == cache
+    }
+    assert counts == {"hit": 1, "miss": 3, "eviction": 1, "error": 1}
@@ -0,0 +1,38 @@
+from flask import Flask
+
+from src.lib import thumbnail_queue
+from src.lib.models.media import MediaType
+
+
+def _jobs(app: Flask) -> set[tuple[str, str]]:
+    table_client = app.config["thumbnail_jobs_table_client"]
+    return {(job["PartitionKey"], job["RowKey"]) for job in table_client.list_entities()}
+
+
+def test_discard_removes_pending_and_dead_lettered_jobs(app: Flask) -> None:
+    with app.app_context():
+        thumbnail_queue.enqueue("pending.jpg", MediaType.PHOTO)
+        thumbnail_queue.enqueue("failed.jpg", MediaType.PHOTO)
+        thumbnail_queue.enqueue("kept.jpg", MediaType.PHOTO)
+        [job] = [job for job in thumbnail_queue.claim(limit=3) if job["RowKey"] == "failed.jpg"]
+        job["Attempts"] = thumbnail_queue.MAX_ATTEMPTS
+        thumbnail_queue.fail(job, RuntimeError("Corrupt"))
+        assert thumbnail_queue.failed_thumbnails() == {"failed.jpg"}
+
+        progress = thumbnail_queue.discard_jobs(["pending.jpg", "failed.jpg", "never-queued.jpg"])
+
+        assert progress.done
+        assert thumbnail_queue.pending_thumbnails() == {"kept.jpg"}
+        assert thumbnail_queue.failed_thumbnails() == frozenset()
+
+
+def test_claimed_job_of_deleted_file_is_not_dead_lettered(app: Flask) -> None:
+    with app.app_context():
+        thumbnail_queue.enqueue("deleted.jpg", MediaType.PHOTO)
+        [job] = thumbnail_queue.claim(limit=1)
+        job["Attempts"] = thumbnail_queue.MAX_ATTEMPTS
+
+        _ = thumbnail_queue.discard_jobs(["deleted.jpg"])
+        thumbnail_queue.fail(job, FileNotFoundError("Original was deleted"))
+
+    assert _jobs(app) == set()
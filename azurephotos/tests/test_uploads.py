@@ -0,0 +1,127 @@
+from typing import Iterator
+
+import pytest
+from azure.core.exceptions import ResourceNotFoundError
+from flask import Flask, Response
+from flask.testing import FlaskClient
+
+import src.api.uploads as uploads
+
+
+@pytest.fixture
+def local_app(tmp_path) -> Iterator[Flask]:
+    # Resumable uploads stage blocks, which the in-memory fakes don't support
+    from app import create_app
+
+    yield create_app(offline=True, local_storage_dir=str(tmp_path))
+
+
+def _open_session(client: FlaskClient, data: bytes) -> str:
+    response = client.post("/api/uploads/", json={
+        "filename": "a.jpg", "size": len(data), "dateTaken": "2024-01-01T00:00:00+00:00", "album": "A",
+    })
+    assert response.status_code == 201
+    session_id: str = response.get_json()["id"]
+    assert client.put(f"/api/uploads/{session_id}/chunks/0", data=data).status_code == 204
+    return session_id
+
+
+def test_commit_can_be_resumed_after_album_write_fails(local_app: Flask, monkeypatch) -> None:
+    client = local_app.test_client()
+    assert client.post("/api/albums/A").status_code == 200
+    session_id = _open_session(client, b"photo")
+
+    monkeypatch.setattr(uploads, "upload_to_album", lambda *args: Response("Storage unavailable", status=503))
+    assert client.post(f"/api/uploads/{session_id}/commit").status_code == 503
+    # The session survives, though its blocks were committed
+    assert client.get(f"/api/uploads/{session_id}").status_code == 200
+
+    monkeypatch.undo()
+    assert client.post(f"/api/uploads/{session_id}/commit").status_code == 201
+    assert client.get(f"/api/uploads/{session_id}").status_code == 404
+    assert [record["filename"] for record in client.get("/api/albums/A").get_json()] == ["a.jpg"]
+
+
+def test_sweep_removes_expired_sessions(local_app: Flask, monkeypatch) -> None:
+    client = local_app.test_client()
+    assert client.post("/api/albums/A").status_code == 200
+    session_id = _open_session(client, b"photo")
+
+    monkeypatch.setattr(uploads, "SESSION_LIFETIME", uploads.SESSION_LIFETIME * 0)
+    meta_table_client = local_app.config["meta_table_client"]
+    session = meta_table_client.get_entity(uploads.UPLOAD_PARTITION, session_id)
+    session["Expires"] = session["Created"]
+    _ = meta_table_client.update_entity(session)
+
+    with local_app.app_context():
+        expired = list(uploads.expired_sessions())
+        assert [session["RowKey"] for session in expired] == [session_id]
+        assert uploads.discard_session(expired[0]) is False
+        staged = local_app.config["photos_container_client"].get_blob_client("a.jpg")
+        with pytest.raises(ResourceNotFoundError):
+            staged.get_block_list("uncommitted")
+
+    assert client.get(f"/api/uploads/{session_id}").status_code == 404
+
+
+@pytest.fixture
+def fake_originals(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Skip storing originals, which needs image and video codecs, so only the per-file outcomes are tested.
+    """
+
+    from azure.core.exceptions import ResourceExistsError
+
+    import src.api.photos as photos
+    import src.api.videos as videos
+
+    def store(file, date_taken) -> str:
+        if file.filename.startswith("existing"):
+            raise ResourceExistsError(f"{file.filename} already exists")
+        if file.filename.startswith("broken"):
+            raise RuntimeError("ffmpeg failed")
+        return file.filename
+
+    monkeypatch.setattr(photos, "upload", store)
+    monkeypatch.setattr(videos, "upload", store)
+
+
+def _upload(client: FlaskClient, url: str, *files: tuple[str, str]) -> dict[str, int]:
+    from io import BytesIO
+
+    response = client.post(url, data={
+        "upload": [(BytesIO(b"data"), filename) for filename, _ in files],
+        "dateTaken": [date for _, date in files],
+    }, content_type="multipart/form-data")
+    assert response.status_code == 207
+    return {result["filename"]: result["status_code"] for result in response.get_json()}
+
+
+@pytest.mark.usefixtures("fake_originals")
+def test_upload_reports_every_file(app: Flask, client: FlaskClient) -> None:
+    assert client.post("/api/albums/A").status_code == 200
+    date = "2024-01-01T00:00:00+00:00"
+
+    statuses = _upload(
+        client, "/upload/A",
+        ("a.jpg", date), ("b.mp4", date), ("existing.jpg", date), ("broken.mp4", date), ("notes.txt", date), ("c.jpg", "yesterday"),
+    )
+
+    assert statuses == {"a.jpg": 201, "b.mp4": 201, "existing.jpg": 409, "broken.mp4": 500, "notes.txt": 422, "c.jpg": 422}
+    assert {record["filename"] for record in client.get("/api/albums/A").get_json()} == {"a.jpg", "b.mp4"}
+
+
+@pytest.mark.usefixtures("fake_originals")
+def test_upload_to_missing_album_fails_each_file(client: FlaskClient) -> None:
+    date = "2024-01-01T00:00:00+00:00"
+    assert _upload(client, "/upload/Missing", ("a.jpg", date), ("b.jpg", date)) == {"a.jpg": 404, "b.jpg": 404}
+
+
+@pytest.mark.usefixtures("fake_originals")
+def test_upload_without_album_lists_files(client: FlaskClient) -> None:
+    date = "2024-01-01T00:00:00+00:00"
+    assert _upload(client, "/upload", ("a.jpg", date), ("b.jpg", date)) == {"a.jpg": 201, "b.jpg": 201}
+
+    response = client.get("/api/media/")
+    assert response.status_code == 200
+    assert {record["filename"] for record in response.get_json()["items"]} == {"a.jpg", "b.jpg"}
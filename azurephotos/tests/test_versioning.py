@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+import pytest
+from flask import Flask
+
+from app import create_app
+from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+from src.api.albums import NONE_ALBUM_NAME
+from src.api.media_cache import _media_at, all_media, invalidate_media_cache
+from src.lib.versioning import MEDIA_SCOPE, VersionStamps
+
+
+@pytest.fixture
+def workers() -> Iterator[tuple[Flask, Flask]]:
+    """
+    Two workers of one instance, sharing storage but not caches.
+    """
+
+    no_latency = Latency(timedelta())
+    blob_service_client = FakeBlobServiceClient("test", no_latency)
+    table_service_client = FakeTableServiceClient("test", no_latency)
+    apps = tuple(create_app(blob_service_client, table_service_client, account_name="test") for _ in range(2))
+    for app in apps:
+        app.config["version_stamps"].poll_interval = timedelta()
+
+    # Entries are keyed by version stamp, which other tests' storage may have used too
+    _media_at.clear()
+    yield apps  # type: ignore[misc]
+    _media_at.clear()
+
+
+def _stamps(app: Flask, poll_interval: timedelta) -> VersionStamps:
+    return VersionStamps(app.config["meta_table_client"], poll_interval)
+
+
+def test_bump_is_seen_by_other_workers(workers: tuple[Flask, Flask]) -> None:
+    first, second = workers
+    writer, reader = _stamps(first, timedelta()), _stamps(second, timedelta())
+
+    before = reader.current(MEDIA_SCOPE)
+    after = writer.bump(MEDIA_SCOPE)
+
+    assert after != before
+    assert reader.current(MEDIA_SCOPE) == after
+
+
+def test_stamp_is_trusted_for_poll_interval(workers: tuple[Flask, Flask]) -> None:
+    first, second = workers
+    writer, reader = _stamps(first, timedelta()), _stamps(second, timedelta(minutes=5))
+
+    before = reader.current(MEDIA_SCOPE)
+    _ = writer.bump(MEDIA_SCOPE)
+
+    assert reader.current(MEDIA_SCOPE) == before
+
+
+def test_only_the_bumping_worker_notifies_its_listeners(workers: tuple[Flask, Flask]) -> None:
+    first, second = workers
+    writer, reader = _stamps(first, timedelta()), _stamps(second, timedelta())
+    written, read = list[str](), list[str]()
+    writer.subscribe(MEDIA_SCOPE, written.append)
+    reader.subscribe(MEDIA_SCOPE, read.append)
+
+    stamp = writer.bump(MEDIA_SCOPE)
+
+    assert written == [stamp]
+    assert read == []
+
+
+def test_media_change_reaches_other_workers(workers: tuple[Flask, Flask]) -> None:
+    first, second = workers
+    with second.app_context():
+        assert list(all_media()) == []
+
+    with first.app_context():
+        first.config["albums_table_client"].create_entity(
+            {"PartitionKey": NONE_ALBUM_NAME, "RowKey": "new.jpg", "Created": datetime.now(timezone.utc)}
+        )
+        invalidate_media_cache()
+
+    with second.app_context():
+        assert [media.filename for media in all_media()] == ["new.jpg"]
+
+
+def test_request_bumps_once_when_it_ends(workers: tuple[Flask, Flask]) -> None:
+    first, second = workers
+    bumps = list[str]()
+    first.config["version_stamps"].subscribe(MEDIA_SCOPE, bumps.append)
+    with second.app_context():
+        before = second.config["version_stamps"].current(MEDIA_SCOPE)
+
+    with first.test_request_context():
+        invalidate_media_cache()
+        invalidate_media_cache()
+        # Deferred until the request ends
+        assert bumps == []
+
+    assert len(bumps) == 1
+    with second.app_context():
+        assert second.config["version_stamps"].current(MEDIA_SCOPE) not in ("", before)